@@ -0,0 +1,166 @@
+"""
+Benchmarks of the RPC layer
+Runs every blockchain function against the fake bitcoind (tests/fake_bitcoind.py) with each transport and reports
+calls per second, p50 and p99 latency, and memory allocated per call.
+Usage: python benchmarks/bench_rpc.py [--calls 200] [--latency 0] [--transports cli,http,batch,aio] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'src'), ROOT]
+
+from bitcaviar import aio, blockchain  # noqa: E402
+from tests.fake_bitcoind import FakeBitcoind  # noqa: E402
+
+
+def cases(bitcoin):
+    """Name, function and keyword arguments of every benchmarked call"""
+    block_hash = blockchain.get_block_hash(bitcoin=bitcoin, height=100)
+    block = blockchain.get_block(bitcoin=bitcoin, blockhash=block_hash)
+    txid = blockchain.get_raw_mempool(bitcoin=bitcoin)[3]
+    proof = blockchain.get_tx_out_proof(bitcoin=bitcoin, txids=[block['tx'][1]], blockhash=block_hash)
+
+    return [
+        ('get_best_block_hash', 'get_best_block_hash', {}),
+        ('get_block(verbosity=0)', 'get_block', {'blockhash': block_hash, 'verbosity': 0}),
+        ('get_block(verbosity=1)', 'get_block', {'blockhash': block_hash}),
+        ('get_block(verbosity=2)', 'get_block', {'blockhash': block_hash, 'verbosity': 2}),
+        ('get_blockchain_info', 'get_blockchain_info', {}),
+        ('get_block_count', 'get_block_count', {}),
+        ('get_block_filter', 'get_block_filter', {'block_hash': block_hash}),
+        ('get_block_hash', 'get_block_hash', {'height': 100}),
+        ('get_block_header', 'get_block_header', {'block_hash': block_hash}),
+        ('get_block_stats', 'get_block_stats', {'hash_or_height': '100'}),
+        ('get_chain_tips', 'get_chain_tips', {}),
+        ('get_chain_tx_stats', 'get_chain_tx_stats', {'nblocks': 10}),
+        ('get_difficulty', 'get_difficulty', {}),
+        ('get_mempool_ancestors', 'get_mempool_ancestors', {'txid': txid}),
+        ('get_mempool_descendants', 'get_mempool_descendants', {'txid': txid}),
+        ('get_mempool_entry', 'get_mempool_entry', {'txid': txid}),
+        ('get_mempool_info', 'get_mempool_info', {}),
+        ('get_raw_mempool', 'get_raw_mempool', {}),
+        ('get_raw_mempool(verbose=True)', 'get_raw_mempool', {'verbose': True}),
+        ('get_tx_out', 'get_tx_out', {'txid': block['tx'][1], 'n': 0}),
+        ('get_tx_out_proof', 'get_tx_out_proof', {'txids': [block['tx'][1]], 'blockhash': block_hash}),
+        ('get_tx_out_set_info', 'get_tx_out_set_info', {}),
+        ('get_precious_block', 'get_precious_block', {'blockhash': block_hash}),
+        ('save_mempool', 'save_mempool', {}),
+        ('verify_chain', 'verify_chain', {}),
+        ('verify_tx_out_proof', 'verify_tx_out_proof', {'proof': proof}),
+        # prune_blockchain is left out: the fake node is not in prune mode, so it would only time the error
+    ]
+
+
+def sequential(bitcoin, function, kwargs, calls):
+    latencies = []
+
+    for _ in range(calls):
+        start = time.perf_counter()
+        function(bitcoin, **kwargs)
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def batched(bitcoin, function, kwargs, calls):
+    start = time.perf_counter()
+
+    with blockchain.batch(bitcoin, size=None) as b:
+        for _ in range(calls):
+            b.add(function, **kwargs)
+
+    return [(time.perf_counter() - start) / calls] * calls
+
+
+def concurrent(bitcoin, function, kwargs, calls):
+    async def call():
+        start = time.perf_counter()
+        await function(bitcoin, **kwargs)
+        return time.perf_counter() - start
+
+    async def main():
+        return await asyncio.gather(*[call() for _ in range(calls)])
+
+    return asyncio.run(main())
+
+
+TRANSPORTS = {
+    'cli': ('cli', blockchain, sequential),
+    'http': ('http', blockchain, sequential),
+    'batch': ('http', blockchain, batched),
+    'aio': ('http', aio, concurrent),
+}
+
+
+def allocated(run, bitcoin, function, kwargs):
+    """Peak bytes allocated by one call"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    run(bitcoin, function, kwargs, 1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak
+
+
+def bench(transports, calls, latency):
+    results = []
+
+    with FakeBitcoind(latency=latency) as fake:
+        for transport in transports:
+            kind, module, run = TRANSPORTS[transport]
+            bitcoin = fake.bitcoin(kind)
+            n = max(1, calls // 20) if transport == 'cli' else calls
+
+            for name, function_name, kwargs in cases(bitcoin):
+                function = getattr(module, function_name)
+                run(bitcoin, function, kwargs, 1)  # Warm up connections
+                start = time.perf_counter()
+                latencies = sorted(run(bitcoin, function, kwargs, n))
+                elapsed = time.perf_counter() - start
+                results.append({
+                    'transport': transport,
+                    'call': name,
+                    'calls': n,
+                    'calls_per_second': n / elapsed,
+                    'p50_ms': statistics.median(latencies) * 1000,
+                    'p99_ms': latencies[min(n - 1, int(n * 0.99))] * 1000,
+                    'allocated_kb': allocated(run, bitcoin, function, kwargs) / 1024,
+                })
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--calls', type=int, default=200, help='calls per function (cli runs 1/20 of them)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added by the fake node per request')
+    parser.add_argument('--transports', default='cli,http,batch,aio')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+    results = bench(args.transports.split(','), args.calls, args.latency)
+
+    print('{:<8} {:<32} {:>10} {:>10} {:>10} {:>12}'.format(
+        'transport', 'call', 'calls/s', 'p50 ms', 'p99 ms', 'alloc KiB'))
+
+    for result in results:
+        print('{transport:<8} {call:<32} {calls_per_second:>10.0f} {p50_ms:>10.3f} {p99_ms:>10.3f} '
+              '{allocated_kb:>12.1f}'.format(**result))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'time': time.time(), 'latency': args.latency, 'results': results}, f, indent=2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,233 @@
 """Helper functions"""
 
+import functools
 import subprocess
+import threading
+import time
+from bitcaviar import decoder
+from bitcaviar import metrics
 
+_local = threading.local()  # RPC method of the last command run by the current thread, while metrics are enabled
 
-def __run(command):
+
+def __run(command, bitcoin=None):
     """
     Execute shell command
+    If bitcoin has a transport, the command is sent through it instead of running bitcoin-cli
+    If bitcoin coalesces calls, the command shares the run of an identical one already in flight
     :param command: list, required
-    :return: string
+    :param bitcoin: src.bitcaviar.config.Bitcoin, optional
+    :return: string, or dict or list if the transport already decoded the output
     """
 
-    output = subprocess.run(command, capture_output=True, text=True)
+    transport = getattr(bitcoin, 'transport', None)
+    flights = getattr(bitcoin, 'flights', None)
+
+    if metrics.enabled:
+        _local.method = command[2]
+
+    if flights is not None:  # Identical concurrent commands share one run
+        return flights.run(command, lambda: _execute(command, transport))
+
+    return _execute(command, transport)
+
+
+def _execute(command, transport):
+    if transport is not None:
+        return transport.run(command)
+
+    if metrics.enabled:
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        spawned = time.perf_counter()
+        stdout, stderr = process.communicate()
+        output = subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+        metrics.observe(command[2], 'spawn', spawned - start)
+        metrics.observe(command[2], 'wire', time.perf_counter() - spawned)
+        metrics.observe(command[2], 'bytes', len(output.stdout))
+    else:
+        output = subprocess.run(command, capture_output=True, text=True)
 
     if output.returncode != 0:  # An error occurred
         raise ValueError(output.stderr)
     else:
         return output.stdout
+
+
+def __stream(command, bitcoin=None, chunk_size=1 << 16):
+    """
+    Execute shell command and yield its output in chunks as it is written
+    If bitcoin has a transport, the command is sent through it and the JSON-RPC response is yielded instead
+    :param command: list, required
+    :param bitcoin: src.bitcaviar.config.Bitcoin, optional
+    :param chunk_size: int, optional, default=65536 bytes
+    :return: generator of bytes
+    """
+
+    transport = getattr(bitcoin, 'transport', None)
+
+    if transport is not None:
+        yield from transport.stream(command, chunk_size)
+        return
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+
+            if not chunk:
+                break
+
+            yield chunk
+
+        stderr = process.stderr.read()
+
+        if process.wait() != 0:  # An error occurred
+            raise ValueError(stderr.decode())
+    finally:
+        if process.poll() is None:  # The caller stopped reading
+            process.kill()
+            process.wait()
+
+        process.stdout.close()
+        process.stderr.close()
+
+
+def __decode(output, fields=None):
+    """
+    Decode JSON output of a command
+    :param output: string, dict or list, or msgspec.Raw left undecoded by the transport, required
+    :param fields: iterable of strings, optional, default=all fields, see src.bitcaviar.decoder
+    :return: dict or list
+    """
+
+    if isinstance(output, (dict, list)):  # Already decoded by the transport
+        return decoder.select(output, fields) if fields else output
+
+    if metrics.enabled:
+        start = time.perf_counter()
+        output = decoder.loads(output, fields)
+        metrics.observe(getattr(_local, 'method', None), 'parse', time.perf_counter() - start)
+        return output
+
+    return decoder.loads(output, fields)
+
+
+def __instrumented(function):
+    """
+    Decorator for blockchain functions that records their total time and errors while metrics are enabled
+    Calls made to split a function with __prepare are not recorded, the caller records them.
+    Calls made while another one is recorded (e.g. by a block cache on a miss) count as part of it.
+    :param function: function or src.bitcaviar.client.Client method, required
+    :return: function
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not metrics.enabled:  # Nothing else on the hot path
+            return function(*args, **kwargs)
+
+        bitcoin = kwargs.get('bitcoin', args[0] if args else None)
+        bitcoin = getattr(bitcoin, 'config', bitcoin)  # Config of a client
+
+        if getattr(_local, 'recording', False) or isinstance(bitcoin, _Proxy):
+            return function(*args, **kwargs)
+
+        _local.method = None
+        _local.recording = True
+        start = time.perf_counter()
+
+        try:
+            return function(*args, **kwargs)
+        except ValueError:
+            metrics.error(_local.method or function.__name__)
+            raise
+        finally:
+            _local.recording = False
+            metrics.observe(_local.method or function.__name__, 'total', time.perf_counter() - start)
+
+    return wrapper
+
+
+def __run_many(commands, bitcoin=None):
+    """
+    Execute many shell commands
+    If bitcoin has a transport that supports batches, all commands are sent in a single request
+    :param commands: list of lists, required
+    :param bitcoin: src.bitcaviar.config.Bitcoin, optional
+    :return: list of outputs, with a ValueError in place of each command that failed
+    """
+
+    transport = getattr(bitcoin, 'transport', None)
+
+    if transport is not None and hasattr(transport, 'run_many'):
+        return transport.run_many(commands)
+
+    outputs = []
+
+    for command in commands:
+        try:
+            outputs.append(__run(command, bitcoin))
+        except ValueError as error:
+            if metrics.enabled:
+                metrics.error(command[2])
+
+            outputs.append(error)
+
+    return outputs
+
+
+class _Captured(Exception):
+    """Raised by _Recorder to stop a blockchain function right before it runs its command"""
+    def __init__(self, command):
+        super().__init__(command)
+        self.command = command
+
+
+class _Recorder:
+    """Transport that captures the command instead of running it"""
+    def run(self, command):
+        raise _Captured(command)
+
+
+class _Replayer:
+    """Transport that returns an output received before, or raises the error received instead"""
+    def __init__(self, output):
+        self.output = output
+
+    def run(self, command):
+        if isinstance(self.output, Exception):
+            raise self.output
+
+        return self.output
+
+
+class _Proxy:
+    """Stand-in for src.bitcaviar.config.Bitcoin with a different transport"""
+    def __init__(self, bitcoin, transport):
+        self.cli_dir = getattr(bitcoin, 'cli_dir', None)
+        self.data_dir = getattr(bitcoin, 'data_dir', None)
+        self.transport = transport
+
+
+def __prepare(function, bitcoin, *args, **kwargs):
+    """
+    Split a call to a blockchain function into the command it runs and the parsing of its output,
+    so the command can be sent some other way (in a batch, asynchronously...)
+    :param function: function of src.bitcaviar.blockchain, required
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :return: tuple (list command, function that takes the command output and returns the function result)
+    """
+
+    try:
+        function(_Proxy(bitcoin, _Recorder()), *args, **kwargs)
+    except _Captured as captured:
+        command = captured.command
+    else:
+        raise ValueError('{} does not run any command'.format(function.__name__))
+
+    def finish(output):
+        return function(_Proxy(bitcoin, _Replayer(output)), *args, **kwargs)
+
+    return command, finish
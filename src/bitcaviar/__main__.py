@@ -0,0 +1,81 @@
+"""
+Command line
+bitcaviar export PATH exports the chain as tables of blocks, transactions, inputs and outputs, see
+src.bitcaviar.export. Run it again with the same options to resume an interrupted export.
+"""
+
+import argparse
+import sys
+from bitcaviar import export
+
+
+def _config(args):
+    """Parameters of src.bitcaviar.config.Bitcoin from the command line"""
+
+    config = {'cli_dir': args.cli_dir, 'data_dir': args.data_dir, 'rpc_host': args.rpc_host,
+              'rpc_port': args.rpc_port, 'rpc_user': args.rpc_user, 'rpc_password': args.rpc_password,
+              'rpc_cookie_file': args.rpc_cookie_file}
+
+    return {key: value for key, value in config.items() if value is not None}
+
+
+def _export(args):
+    def progress(start, stop):
+        print('Exported heights {} to {}'.format(start, stop - 1), file=sys.stderr)
+
+    shards = export.export(_config(args), args.path, start=args.start, stop=args.stop, shard_size=args.shard_size,
+                           file_format=args.format, workers=args.workers, threads=args.threads, progress=progress)
+    print('Exported {} shards to {}'.format(shards, args.path), file=sys.stderr)
+
+
+def parser():
+    """
+    Get the parser of the command line
+    :return: argparse.ArgumentParser
+    """
+
+    main_parser = argparse.ArgumentParser(prog='bitcaviar')
+    commands = main_parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='export the chain for analytics')
+    export_parser.add_argument('path', help='directory of the export')
+    export_parser.add_argument('--start', type=int, default=0, help='first height (default: 0)')
+    export_parser.add_argument('--stop', type=int, help='height not included (default: up to the tip)')
+    export_parser.add_argument('--shard-size', type=int, default=1000, help='heights per file (default: 1000)')
+    export_parser.add_argument('--format', choices=sorted(export.FORMATS),
+                               help='default: parquet if pyarrow is installed, else ndjson')
+    export_parser.add_argument('--workers', type=int, help='worker processes (default: number of CPUs)')
+    export_parser.add_argument('--threads', type=int, default=8, help='blocks fetched at a time by each worker')
+
+    node = export_parser.add_argument_group('node')
+    node.add_argument('--cli-dir', help='bitcoin-cli, if --rpc-host is not set')
+    node.add_argument('--data-dir')
+    node.add_argument('--rpc-host')
+    node.add_argument('--rpc-port', type=int)
+    node.add_argument('--rpc-user')
+    node.add_argument('--rpc-password')
+    node.add_argument('--rpc-cookie-file')
+    export_parser.set_defaults(run=_export)
+
+    return main_parser
+
+
+def main(argv=None):
+    """
+    Run the command line
+    :param argv: list of strings, optional, default=sys.argv[1:]
+    :return: int, exit status
+    """
+
+    args = parser().parse_args(argv)
+
+    try:
+        args.run(args)
+    except (ValueError, OSError) as error:
+        print('bitcaviar: {}'.format(error), file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,510 @@
+"""
+Asyncio versions of the blockchain RPCs
+Every function of src.bitcaviar.blockchain is available here as a coroutine with the same parameters and results.
+Calls go through a pool of keep-alive connections to bitcoind (or bitcoin-cli processes) with a concurrency limit,
+so one event loop can keep many RPCs in flight.
+"""
+
+import asyncio
+import json
+import time
+import weakref
+from bitcaviar import blockchain
+from bitcaviar import decoder
+from bitcaviar import metrics
+from bitcaviar.__helpers import __prepare as _prepare
+from bitcaviar.rpc import HTTPTransport, convert_params, format_error, format_result
+
+_pools = weakref.WeakKeyDictionary()
+
+
+class AsyncHTTPTransport:
+    """
+    Send commands to bitcoind over JSON-RPC from an event loop.
+    Reuses idle keep-alive connections and keeps at most limit requests in flight.
+    Each request times out after the timeout of the HTTP transport, like a call made with it.
+    """
+    def __init__(self, transport, limit=100):
+        """
+        :param transport: src.bitcaviar.rpc.HTTPTransport with the node settings, required
+        :param limit: int, optional, default=100
+        """
+        self.transport = transport
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+        self._idle = []
+        self._ids = 0
+
+    async def run(self, command):
+        """
+        Send a bitcoin-cli command and return its output
+        :param command: list, required, [cli_dir, data_dir, method, *args]
+        :return: string, dict or list
+        """
+
+        method, args = command[2], command[3:]
+        self._ids += 1
+        request = {'jsonrpc': '1.0', 'id': self._ids, 'method': method, 'params': convert_params(method, args)}
+        start = time.perf_counter()
+        data = await self.post(json.dumps(request).encode())
+        received = time.perf_counter()
+        response = decoder.loads_response(data)
+
+        if metrics.enabled:
+            metrics.observe(method, 'wire', received - start)
+            metrics.observe(method, 'parse', time.perf_counter() - received)
+            metrics.observe(method, 'bytes', len(data))
+
+        if response.get('error'):
+            raise ValueError(format_error(response['error']))
+
+        return format_result(response['result'])
+
+    async def post(self, body):
+        """
+        Send a JSON-RPC request body and return the response body
+        :param body: bytes, required
+        :return: bytes
+        """
+
+        async with self._semaphore:
+            status, data = await self.request(body)
+
+            if status == 401:
+                self.transport._authorization = None  # The cookie changes every time bitcoind restarts
+                status, data = await self.request(body)
+
+                if status == 401:
+                    raise ValueError('error: Authorization failed: Incorrect rpcuser or rpcpassword\n')
+
+        if status != 200 and not data:
+            raise ValueError('error: server returned HTTP error {}\n'.format(status))
+
+        return data
+
+    async def request(self, body):
+        """
+        Send an HTTP POST request over an idle connection, or a new one if there is none
+        Retry once on a new connection if the idle one was closed by the server
+        :param body: bytes, required
+        :return: tuple (int status, bytes data)
+        """
+
+        head = (
+            'POST / HTTP/1.1\r\n'
+            'Host: {}:{}\r\n'
+            'Authorization: {}\r\n'
+            'Content-Type: application/json\r\n'
+            'Content-Length: {}\r\n\r\n'
+        ).format(self.transport.host, self.transport.port, self.transport.authorization(), len(body)).encode()
+
+        if self._idle:
+            reader, writer = self._idle.pop()
+
+            try:
+                return await self.exchange(reader, writer, head + body)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.transport.host, self.transport.port),
+                                                self.transport.timeout)
+
+        return await self.exchange(reader, writer, head + body)
+
+    async def exchange(self, reader, writer, data):
+        """
+        Write a request and read the response, handing the connection back to the pool if it is kept alive
+        :param reader: asyncio.StreamReader, required
+        :param writer: asyncio.StreamWriter, required
+        :param data: bytes, required
+        :return: tuple (int status, bytes data)
+        """
+
+        try:
+            return await asyncio.wait_for(self._exchange(reader, writer, data), self.transport.timeout)
+        except asyncio.TimeoutError:
+            writer.close()  # A response may still come, the connection can't be reused
+            raise
+
+    async def _exchange(self, reader, writer, data):
+        writer.write(data)
+        await writer.drain()
+
+        status_line = await reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = {}
+
+        while True:
+            line = await reader.readuntil(b'\r\n')
+
+            if line == b'\r\n':
+                break
+
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunks.append(await reader.readexactly(size + 2))
+
+                if size == 0:
+                    break
+
+            body = b''.join(chunk[:-2] for chunk in chunks)
+        else:
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+        if headers.get('connection') == 'close':
+            writer.close()
+        else:
+            self._idle.append((reader, writer))
+
+        return status, body
+
+    def close(self):
+        """
+        Close all idle connections
+        :return: None
+        """
+
+        while self._idle:
+            reader, writer = self._idle.pop()
+            writer.close()
+
+        return None
+
+
+class AsyncCLITransport:
+    """
+    Run bitcoin-cli as asyncio subprocesses, with at most limit processes at a time
+    """
+    def __init__(self, limit=100):
+        """
+        :param limit: int, optional, default=100
+        """
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def run(self, command):
+        """
+        Execute shell command
+        :param command: list, required
+        :return: string
+        """
+
+        async with self._semaphore:
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            spawned = time.perf_counter()
+            stdout, stderr = await process.communicate()
+
+        if metrics.enabled:
+            metrics.observe(command[2], 'spawn', spawned - start)
+            metrics.observe(command[2], 'wire', time.perf_counter() - spawned)
+            metrics.observe(command[2], 'bytes', len(stdout))
+
+        if process.returncode != 0:  # An error occurred
+            raise ValueError(stderr.decode())
+        else:
+            return stdout.decode()
+
+    def close(self):
+        return None
+
+
+class AsyncThreadTransport:
+    """
+    Run the commands of a blocking transport, like src.bitcaviar.cluster.ClusterTransport, in the default executor,
+    with at most limit commands at a time
+    """
+    def __init__(self, transport, limit=100):
+        """
+        :param transport: object with a run(command) method, required
+        :param limit: int, optional, default=100
+        """
+        self.transport = transport
+        self.limit = limit
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def run(self, command):
+        """
+        Send a bitcoin-cli command through the transport and return its output
+        :param command: list, required
+        :return: string, dict or list
+        """
+
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(None, self.transport.run, command)
+
+    def close(self):
+        return None
+
+
+def pool(bitcoin, limit=100):
+    """
+    Get the pool used for calls with this config in the running event loop, creating it if needed
+    Call it before any other function to set the concurrency limit.
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param limit: int, optional, default=100 requests in flight
+    :return: src.bitcaviar.aio.AsyncHTTPTransport, AsyncThreadTransport or AsyncCLITransport
+    """
+
+    loop = asyncio.get_running_loop()
+    pools = _pools.setdefault(bitcoin, weakref.WeakKeyDictionary())
+
+    if loop not in pools:
+        transport = getattr(bitcoin, 'transport', None)
+
+        if isinstance(transport, HTTPTransport):
+            pools[loop] = AsyncHTTPTransport(transport, limit)
+        elif transport is not None:
+            pools[loop] = AsyncThreadTransport(transport, limit)
+        else:
+            pools[loop] = AsyncCLITransport(limit)
+
+    return pools[loop]
+
+
+async def _call(function, bitcoin, *args, **kwargs):
+    """
+    Run the command of a blockchain function through the pool and parse its output the same way
+    """
+
+    command, finish = _prepare(function, bitcoin, *args, **kwargs)
+
+    if not metrics.enabled:
+        return finish(await pool(bitcoin).run(command))
+
+    start = time.perf_counter()
+
+    try:
+        return finish(await pool(bitcoin).run(command))
+    except ValueError:
+        metrics.error(command[2])
+        raise
+    finally:
+        metrics.observe(command[2], 'total', time.perf_counter() - start)
+
+
+async def get_best_block_hash(bitcoin):
+    """
+    Get the hash of the best (tip) block in the most-work fully-validated chain
+    See src.bitcaviar.blockchain.get_best_block_hash
+    """
+
+    return await _call(blockchain.get_best_block_hash, bitcoin)
+
+
+async def get_block(bitcoin, blockhash, verbosity=1, typed=False, fields=None):
+    """
+    Get block data
+    See src.bitcaviar.blockchain.get_block
+    """
+
+    return await _call(blockchain.get_block, bitcoin, blockhash=blockhash, verbosity=verbosity, typed=typed,
+                       fields=fields)
+
+
+async def get_blockchain_info(bitcoin):
+    """
+    Get an object containing various state info regarding blockchain processing
+    See src.bitcaviar.blockchain.get_blockchain_info
+    """
+
+    return await _call(blockchain.get_blockchain_info, bitcoin)
+
+
+async def get_block_count(bitcoin):
+    """
+    Get the height of the most-work fully-validated chain
+    See src.bitcaviar.blockchain.get_block_count
+    """
+
+    return await _call(blockchain.get_block_count, bitcoin)
+
+
+async def get_block_filter(bitcoin, block_hash, filter_type='basic'):
+    """
+    Get a BIP 157 content filter for a particular block.
+    See src.bitcaviar.blockchain.get_block_filter
+    """
+
+    return await _call(blockchain.get_block_filter, bitcoin, block_hash=block_hash, filter_type=filter_type)
+
+
+async def get_block_hash(bitcoin, height):
+    """
+    Get hash of block in best-block-chain at height provided
+    See src.bitcaviar.blockchain.get_block_hash
+    """
+
+    return await _call(blockchain.get_block_hash, bitcoin, height=height)
+
+
+async def get_block_header(bitcoin, block_hash, verbose=True, typed=False, fields=None):
+    """
+    Get block header information
+    See src.bitcaviar.blockchain.get_block_header
+    """
+
+    return await _call(blockchain.get_block_header, bitcoin, block_hash=block_hash, verbose=verbose, typed=typed,
+                       fields=fields)
+
+
+async def get_block_stats(bitcoin, hash_or_height, stats='all'):
+    """
+    Compute per block statistics for a given window. All amounts are in satoshis.
+    See src.bitcaviar.blockchain.get_block_stats
+    """
+
+    return await _call(blockchain.get_block_stats, bitcoin, hash_or_height=hash_or_height, stats=stats)
+
+
+async def get_chain_tips(bitcoin):
+    """
+    Get information about all known tips in the block tree, including the main chain as well as orphaned branches
+    See src.bitcaviar.blockchain.get_chain_tips
+    """
+
+    return await _call(blockchain.get_chain_tips, bitcoin)
+
+
+async def get_chain_tx_stats(bitcoin, nblocks=None):
+    """
+    Get statistics about the total number and rate of transactions in the chain
+    See src.bitcaviar.blockchain.get_chain_tx_stats
+    """
+
+    return await _call(blockchain.get_chain_tx_stats, bitcoin, nblocks=nblocks)
+
+
+async def get_difficulty(bitcoin):
+    """
+    Get the proof-of-work difficulty as a multiple of the minimum difficulty
+    See src.bitcaviar.blockchain.get_difficulty
+    """
+
+    return await _call(blockchain.get_difficulty, bitcoin)
+
+
+async def get_mempool_ancestors(bitcoin, txid, verbose=False):
+    """
+    Get all in-mempool ancestors if txid is in the mempool
+    See src.bitcaviar.blockchain.get_mempool_ancestors
+    """
+
+    return await _call(blockchain.get_mempool_ancestors, bitcoin, txid=txid, verbose=verbose)
+
+
+async def get_mempool_descendants(bitcoin, txid, verbose=False):
+    """
+    Get all in-mempool descendants if txid is in the mempool
+    See src.bitcaviar.blockchain.get_mempool_descendants
+    """
+
+    return await _call(blockchain.get_mempool_descendants, bitcoin, txid=txid, verbose=verbose)
+
+
+async def get_mempool_entry(bitcoin, txid, typed=False, fields=None):
+    """
+    Get mempool data for given transaction
+    See src.bitcaviar.blockchain.get_mempool_entry
+    """
+
+    return await _call(blockchain.get_mempool_entry, bitcoin, txid=txid, typed=typed, fields=fields)
+
+
+async def get_mempool_info(bitcoin):
+    """
+    Get details on the active state of the TX memory pool
+    See src.bitcaviar.blockchain.get_mempool_info
+    """
+
+    return await _call(blockchain.get_mempool_info, bitcoin)
+
+
+async def get_raw_mempool(bitcoin, verbose=False, mempool_sequence=False, typed=False, fields=None):
+    """
+    Get all transaction ids in memory pool
+    See src.bitcaviar.blockchain.get_raw_mempool
+    """
+
+    return await _call(blockchain.get_raw_mempool, bitcoin, verbose=verbose, mempool_sequence=mempool_sequence,
+                       typed=typed, fields=fields)
+
+
+async def get_tx_out(bitcoin, txid, n, include_mempool=True):
+    """
+    Get details about an unspent transaction output
+    See src.bitcaviar.blockchain.get_tx_out
+    """
+
+    return await _call(blockchain.get_tx_out, bitcoin, txid=txid, n=n, include_mempool=include_mempool)
+
+
+async def get_tx_out_proof(bitcoin, txids, blockhash=None):
+    """
+    Get a hex-encoded proof that “txid” was included in a block
+    See src.bitcaviar.blockchain.get_tx_out_proof
+    """
+
+    return await _call(blockchain.get_tx_out_proof, bitcoin, txids=txids, blockhash=blockhash)
+
+
+async def get_tx_out_set_info(bitcoin, hash_type=None):
+    """
+    Get statistics about the unspent transaction output set
+    See src.bitcaviar.blockchain.get_tx_out_set_info
+    """
+
+    return await _call(blockchain.get_tx_out_set_info, bitcoin, hash_type=hash_type)
+
+
+async def get_precious_block(bitcoin, blockhash):
+    """
+    Treats a block as if it were received before others with the same work.
+    See src.bitcaviar.blockchain.get_precious_block
+    """
+
+    return await _call(blockchain.get_precious_block, bitcoin, blockhash=blockhash)
+
+
+async def prune_blockchain(bitcoin, height):
+    """
+    Get prune blockchain height
+    See src.bitcaviar.blockchain.prune_blockchain
+    """
+
+    return await _call(blockchain.prune_blockchain, bitcoin, height=height)
+
+
+async def save_mempool(bitcoin):
+    """
+    Dumps the mempool to disk. It will fail until the previous dump is fully loaded
+    See src.bitcaviar.blockchain.save_mempool
+    """
+
+    return await _call(blockchain.save_mempool, bitcoin)
+
+
+async def verify_chain(bitcoin, checklevel=3, nblocks=6):
+    """
+    Verifies blockchain database
+    See src.bitcaviar.blockchain.verify_chain
+    """
+
+    return await _call(blockchain.verify_chain, bitcoin, checklevel=checklevel, nblocks=nblocks)
+
+
+async def verify_tx_out_proof(bitcoin, proof):
+    """
+    Get the txid(s) which the proof commits to
+    See src.bitcaviar.blockchain.verify_tx_out_proof
+    """
+
+    return await _call(blockchain.verify_tx_out_proof, bitcoin, proof=proof)
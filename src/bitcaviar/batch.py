@@ -0,0 +1,125 @@
+"""
+Batches of blockchain RPCs
+Queue calls to the blockchain functions and send them to bitcoind in a single JSON-RPC batch request
+More info: https://www.jsonrpc.org/specification#batch
+"""
+
+from bitcaviar.__helpers import __prepare as _prepare, __run_many as _run_many
+
+
+class Call:
+    """
+    Pending result of a call queued in a batch
+    """
+    def __init__(self, finish):
+        """
+        :param finish: function that turns the command output into the result, required
+        """
+        self._finish = finish
+        self.done = False
+        self.value = None
+        self.error = None
+
+    def set_output(self, output):
+        """
+        Parse the command output, or keep the error received instead
+        :param output: string, dict, list or ValueError, required
+        :return: None
+        """
+
+        try:
+            self.value = self._finish(output)
+        except ValueError as error:
+            self.error = error
+
+        self.done = True
+
+        return None
+
+    def result(self):
+        """
+        Get the result of the call
+        Raises the error of this call if it failed
+        :return: same as the blockchain function
+        """
+
+        if not self.done:
+            raise ValueError('The batch has not been sent yet')
+
+        if self.error is not None:
+            raise self.error
+
+        return self.value
+
+
+class Batch:
+    """
+    Queue calls to blockchain functions and send them in batches of size calls.
+    Any blockchain function is available as a method, without the bitcoin parameter.
+    With bitcoin-cli, each command is still run on its own, but errors are also reported per call.
+    """
+    def __init__(self, bitcoin, functions, size=100):
+        """
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :param functions: module with the functions to queue, required
+        :param size: int, optional, default=100, None=everything in one request
+        """
+        self.bitcoin = bitcoin
+        self.functions = functions
+        self.size = size
+        self.calls = []
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+
+    def __getattr__(self, name):
+        function = getattr(self.functions, name)
+
+        def queue(*args, **kwargs):
+            return self.add(function, *args, **kwargs)
+
+        return queue
+
+    def add(self, function, *args, **kwargs):
+        """
+        Queue a call to a blockchain function
+        :param function: function of src.bitcaviar.blockchain, required
+        :return: src.bitcaviar.batch.Call
+        """
+
+        command, finish = _prepare(function, self.bitcoin, *args, **kwargs)
+        call = Call(finish)
+        self.calls.append(call)
+        self._pending.append((command, call))
+
+        return call
+
+    def send(self):
+        """
+        Send every queued call that has not been sent yet
+        :return: list, results of all calls in order, with a ValueError in place of each call that failed
+        """
+
+        size = self.size or len(self._pending) or 1
+
+        while self._pending:
+            chunk, self._pending = self._pending[:size], self._pending[size:]
+            outputs = _run_many([command for command, call in chunk], self.bitcoin)
+
+            for (command, call), output in zip(chunk, outputs):
+                call.set_output(output)
+
+        return self.results()
+
+    def results(self):
+        """
+        Get the results of all calls in order
+        :return: list, with a ValueError in place of each call that failed
+        """
+
+        return [call.error if call.error is not None else call.value for call in self.calls]
@@ -1,10 +1,28 @@
 """
 Blockchain RPCs
+Every function runs on the default src.bitcaviar.client.Client of the config passed as bitcoin, or on the client
+itself if one is passed instead.
 More info: https://developer.bitcoin.org/reference/rpc/
 """
 
-import json
-from bitcaviar.__helpers import __run
+import sys
+from bitcaviar.batch import Batch
+from bitcaviar.client import default_client
+
+
+def batch(bitcoin, size=100):
+    """
+    Queue calls to the functions of this module and send them in JSON-RPC batches when the with block ends
+    Example:
+        with blockchain.batch(bitcoin) as b:
+            block_hash = b.get_block_hash(height=1000)
+        block_hash.result()
+    :param bitcoin: src.bitcaviar.config.Bitcoin or src.bitcaviar.client.Client, required
+    :param size: int, optional, default=100 calls per request, None=all calls in one request
+    :return: src.bitcaviar.batch.Batch
+    """
+
+    return Batch(bitcoin, sys.modules[__name__], size)
 
 
 def get_best_block_hash(bitcoin):
@@ -15,30 +33,23 @@ def get_best_block_hash(bitcoin):
     :return: string
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getbestblockhash']
-    best_block_hash = __run(command)
-    best_block_hash = best_block_hash.rstrip()
-
-    return best_block_hash
+    return default_client(bitcoin).get_best_block_hash()
 
 
-def get_block(bitcoin, blockhash, verbosity=1):
+def get_block(bitcoin, blockhash, verbosity=1, typed=False, fields=None):
     """
     Get block data
     More info: https://developer.bitcoin.org/reference/rpc/getblock.html
     :param blockhash: string, required
     :param verbosity: int, optional, default=1
     :param bitcoin: src.bitcaviar.config.Bitcoin, required
-    :return: if verbosity=0 returns string, else returns dict
+    :param typed: boolean, optional, default=False, not with fields
+    :param fields: iterable of strings, optional, default=all fields, e.g. ('height', 'tx.txid') to decode only those,
+        see src.bitcaviar.decoder
+    :return: if verbosity=0 returns string, else returns dict, or src.bitcaviar.results.Block if typed=True
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getblock', blockhash, str(verbosity)]
-    block = __run(command)
-
-    if verbosity == 1 or verbosity == 2:
-        block = json.loads(block)
-
-    return block
+    return default_client(bitcoin).get_block(blockhash, verbosity, typed, fields)
 
 
 def get_blockchain_info(bitcoin):
@@ -49,11 +60,7 @@ def get_blockchain_info(bitcoin):
     :return: dict
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getblockchaininfo']
-    blockchain_info = __run(command)
-    blockchain_info = json.loads(blockchain_info)
-
-    return blockchain_info
+    return default_client(bitcoin).get_blockchain_info()
 
 
 def get_block_count(bitcoin):
@@ -64,11 +71,7 @@ def get_block_count(bitcoin):
     :return: int
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getblockcount']
-    block_count = __run(command)
-    block_count = int(block_count)
-
-    return block_count
+    return default_client(bitcoin).get_block_count()
 
 
 def get_block_filter(bitcoin, block_hash, filter_type='basic'):
@@ -83,11 +86,7 @@ def get_block_filter(bitcoin, block_hash, filter_type='basic'):
     :return: dict
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getblockfilter', block_hash, filter_type]
-    block_filter = __run(command)
-    block_filter = json.loads(block_filter)
-
-    return block_filter
+    return default_client(bitcoin).get_block_filter(block_hash, filter_type)
 
 
 def get_block_hash(bitcoin, height):
@@ -99,30 +98,22 @@ def get_block_hash(bitcoin, height):
     :return: string
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getblockhash', str(height)]
-    block_hash = __run(command)
-    block_hash = block_hash.rstrip()
+    return default_client(bitcoin).get_block_hash(height)
 
-    return block_hash
 
-
-def get_block_header(bitcoin, block_hash, verbose=True):
+def get_block_header(bitcoin, block_hash, verbose=True, typed=False, fields=None):
     """
     Get block header information
     More info: https://developer.bitcoin.org/reference/rpc/getblockheader.html
     :param bitcoin: src.bitcaviar.config.Bitcoin, required
     :param block_hash: string, required
     :param verbose: boolean, optional, default=True
-    :return: if verbose=false returns string, else returns dict
+    :param typed: boolean, optional, default=False, not with fields
+    :param fields: iterable of strings, optional, default=all fields, see src.bitcaviar.decoder
+    :return: if verbose=false returns string, else returns dict, or src.bitcaviar.results.BlockHeader if typed=True
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getblockheader', block_hash, str(verbose).lower()]
-    block_header = __run(command)
-
-    if verbose:
-        block_header = json.loads(block_header)
-
-    return block_header
+    return default_client(bitcoin).get_block_header(block_hash, verbose, typed, fields)
 
 
 def get_block_stats(bitcoin, hash_or_height, stats='all'):
@@ -136,19 +127,7 @@ def get_block_stats(bitcoin, hash_or_height, stats='all'):
     :return: dict
     """
 
-    if len(hash_or_height) == 64:  # It's a hash
-        hash_or_height = json.dumps(hash_or_height)
-
-    if stats == 'all':
-        command = [bitcoin.cli_dir, bitcoin.data_dir, 'getblockstats', hash_or_height]
-    else:
-        stats = json.dumps(stats)
-        command = [bitcoin.cli_dir, bitcoin.data_dir, 'getblockstats', hash_or_height, stats]
-
-    block_stats = __run(command)
-    block_stats = json.loads(block_stats)
-
-    return block_stats
+    return default_client(bitcoin).get_block_stats(hash_or_height, stats)
 
 
 def get_chain_tips(bitcoin):
@@ -159,11 +138,7 @@ def get_chain_tips(bitcoin):
     :return: list of dicts
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getchaintips']
-    chain_tips = __run(command)
-    chain_tips = json.loads(chain_tips)
-
-    return chain_tips
+    return default_client(bitcoin).get_chain_tips()
 
 
 # noinspection PyIncorrectDocstring
@@ -178,15 +153,7 @@ def get_chain_tx_stats(bitcoin, nblocks=None):
         :return: dict
         """
 
-    if nblocks:
-        command = [bitcoin.cli_dir, bitcoin.data_dir, 'getchaintxstats', str(nblocks)]
-    else:
-        command = [bitcoin.cli_dir, bitcoin.data_dir, 'getchaintxstats']
-
-    chain_tx_stats = __run(command)
-    chain_tx_stats = json.loads(chain_tx_stats)
-
-    return chain_tx_stats
+    return default_client(bitcoin).get_chain_tx_stats(nblocks)
 
 
 def get_difficulty(bitcoin):
@@ -197,10 +164,7 @@ def get_difficulty(bitcoin):
     :return: string
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getdifficulty']
-    difficulty = __run(command)
-
-    return difficulty
+    return default_client(bitcoin).get_difficulty()
 
 
 def get_mempool_ancestors(bitcoin, txid, verbose=False):
@@ -213,11 +177,7 @@ def get_mempool_ancestors(bitcoin, txid, verbose=False):
     :return: if verbose=False returns list of dicts, else dict
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getmempoolancestors', txid, str(verbose).lower()]
-    mempool_ancestors = __run(command)
-    mempool_ancestors = json.loads(mempool_ancestors)
-
-    return mempool_ancestors
+    return default_client(bitcoin).get_mempool_ancestors(txid, verbose)
 
 
 def get_mempool_descendants(bitcoin, txid, verbose=False):
@@ -230,28 +190,22 @@ def get_mempool_descendants(bitcoin, txid, verbose=False):
     :return: if verbose=False returns list, else dict
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getmempooldescendants', txid, str(verbose).lower()]
-    mempool_descendants = __run(command)
-    mempool_descendants = json.loads(mempool_descendants)
-
-    return mempool_descendants
+    return default_client(bitcoin).get_mempool_descendants(txid, verbose)
 
 
-def get_mempool_entry(bitcoin, txid):
+def get_mempool_entry(bitcoin, txid, typed=False, fields=None):
     """
     Get mempool data for given transaction
     The transaction id must be in mempool
     More info: https://developer.bitcoin.org/reference/rpc/getmempoolentry.html
     :param bitcoin: src.bitcaviar.config.Bitcoin, required
     :param txid: string, required
-    :return: dict
+    :param typed: boolean, optional, default=False, not with fields
+    :param fields: iterable of strings, optional, default=all fields, see src.bitcaviar.decoder
+    :return: dict, or src.bitcaviar.results.MempoolEntry if typed=True
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getmempoolentry', txid]
-    mempool_entry = __run(command)
-    mempool_entry = json.loads(mempool_entry)
-
-    return mempool_entry
+    return default_client(bitcoin).get_mempool_entry(txid, typed, fields)
 
 
 def get_mempool_info(bitcoin):
@@ -261,28 +215,23 @@ def get_mempool_info(bitcoin):
     :return: dict
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getmempoolinfo']
-    mempool_info = __run(command)
-    mempool_info = json.loads(mempool_info)
-
-    return mempool_info
+    return default_client(bitcoin).get_mempool_info()
 
 
-def get_raw_mempool(bitcoin, verbose=False, mempool_sequence=False):
+def get_raw_mempool(bitcoin, verbose=False, mempool_sequence=False, typed=False, fields=None):
     """
     Get all transaction ids in memory pool
     More info: https://developer.bitcoin.org/reference/rpc/getrawmempool.html
     :param bitcoin: src.bitcaviar.config.Bitcoin, required
     :param verbose: boolean, optional, default=False
     :param mempool_sequence: boolean, optional, default=False
-    :return: if verbose=False returns list, else dict
+    :param typed: boolean, optional, default=False, only with verbose=True and not with fields
+    :param fields: iterable of strings, optional, default=all fields, fields of each entry to decode with verbose=True,
+        e.g. ('vsize', 'fees.base'), see src.bitcaviar.decoder
+    :return: if verbose=False returns list, else dict, with src.bitcaviar.results.MempoolEntry values if typed=True
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getrawmempool', str(verbose).lower(), str(mempool_sequence).lower()]
-    raw_mempool = __run(command)
-    raw_mempool = json.loads(raw_mempool)
-
-    return raw_mempool
+    return default_client(bitcoin).get_raw_mempool(verbose, mempool_sequence, typed, fields)
 
 
 def get_tx_out(bitcoin, txid, n, include_mempool=True):
@@ -296,15 +245,7 @@ def get_tx_out(bitcoin, txid, n, include_mempool=True):
     :return: dict
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'gettxout', txid, str(n), str(include_mempool).lower()]
-    tx_out = __run(command)
-
-    if tx_out:
-        tx_out = json.loads(tx_out)
-    else:
-        tx_out = {'message': 'no unspent transaction'}
-
-    return tx_out
+    return default_client(bitcoin).get_tx_out(txid, n, include_mempool)
 
 
 def get_tx_out_proof(bitcoin, txids, blockhash=None):
@@ -312,7 +253,8 @@ def get_tx_out_proof(bitcoin, txids, blockhash=None):
     Get a hex-encoded proof that “txid” was included in a block
     NOTE: By default this function only works sometimes. This is when there is an unspent output in the utxo for
     this transaction. To make it always work, you need to maintain a transaction index, using the -txindex command
-    line option or specify the block in which the transaction is included manually (by blockhash)
+    line option or specify the block in which the transaction is included manually (by blockhash), e.g. from
+    src.bitcaviar.indexer.Indexer.get
     More info: https://developer.bitcoin.org/reference/rpc/gettxoutproof.html
     :param bitcoin: src.bitcaviar.config.Bitcoin, required
     :param txids: list, required
@@ -320,17 +262,7 @@ def get_tx_out_proof(bitcoin, txids, blockhash=None):
     :return: string
     """
 
-    txids = json.dumps(txids)  # Convert list to json array
-
-    if blockhash:
-        command = [bitcoin.cli_dir, bitcoin.data_dir, 'gettxoutproof', txids, blockhash]
-    else:
-        command = [bitcoin.cli_dir, bitcoin.data_dir, 'gettxoutproof', txids]
-
-    tx_out_proof = __run(command)
-    tx_out_proof = tx_out_proof.rstrip()
-
-    return tx_out_proof
+    return default_client(bitcoin).get_tx_out_proof(txids, blockhash)
 
 
 def get_tx_out_set_info(bitcoin, hash_type=None):
@@ -343,15 +275,7 @@ def get_tx_out_set_info(bitcoin, hash_type=None):
     :return: dict
     """
 
-    if hash_type:
-        command = [bitcoin.cli_dir, bitcoin.data_dir, 'gettxoutsetinfo', hash_type]
-    else:
-        command = [bitcoin.cli_dir, bitcoin.data_dir, 'gettxoutsetinfo']
-
-    tx_out_set_info = __run(command)
-    tx_out_set_info = json.loads(tx_out_set_info)
-
-    return tx_out_set_info
+    return default_client(bitcoin).get_tx_out_set_info(hash_type)
 
 
 def get_precious_block(bitcoin, blockhash):
@@ -365,10 +289,7 @@ def get_precious_block(bitcoin, blockhash):
     :return: None
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'preciousblock', blockhash]
-    precious_block = __run(command)
-
-    return precious_block
+    return default_client(bitcoin).get_precious_block(blockhash)
 
 
 def prune_blockchain(bitcoin, height):
@@ -381,11 +302,7 @@ def prune_blockchain(bitcoin, height):
     :return: string
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'pruneblockchain', str(height)]
-    prune_blockchain_height = __run(command)
-    prune_blockchain_height = int(prune_blockchain_height)
-
-    return prune_blockchain_height
+    return default_client(bitcoin).prune_blockchain(height)
 
 
 def save_mempool(bitcoin):
@@ -396,20 +313,19 @@ def save_mempool(bitcoin):
     :return: None
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'savemempool']
-    __run(command)
-
-    return None
+    return default_client(bitcoin).save_mempool()
 
 
 """
 Currently not supported scantxoutset: https://developer.bitcoin.org/reference/rpc/scantxoutset.html
+Use src.bitcaviar.utxo.UTXOSet.scan on a local UTXO set instead.
 """
 
 
 def verify_chain(bitcoin, checklevel=3, nblocks=6):
     """
     Verifies blockchain database
+    To check only the headers, and find the first one that fails, see src.bitcaviar.validation.validate_store
     More info: https://developer.bitcoin.org/reference/rpc/verifychain.html
     :param bitcoin: src.bitcaviar.config.Bitcoin, required
     :param checklevel: int, optional, default=3, range=0-4
@@ -417,15 +333,7 @@ def verify_chain(bitcoin, checklevel=3, nblocks=6):
     :return: boolean
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'verifychain', str(checklevel), str(nblocks)]
-    verification = __run(command).rstrip()
-
-    if verification == 'true':
-        verification = True
-    elif verification == 'false':
-        verification = False
-
-    return verification
+    return default_client(bitcoin).verify_chain(checklevel, nblocks)
 
 
 def verify_tx_out_proof(bitcoin, proof):
@@ -439,8 +347,4 @@ def verify_tx_out_proof(bitcoin, proof):
     :return: list
     """
 
-    command = [bitcoin.cli_dir, bitcoin.data_dir, 'verifytxoutproof', proof]
-    txids = __run(command)
-    txids = json.loads(txids)
-
-    return txids
+    return default_client(bitcoin).verify_tx_out_proof(proof)
@@ -0,0 +1,211 @@
+"""
+Block streams
+Fetch ranges of blocks from the node concurrently and yield them in height order, and keep local stores of
+blocks on the active chain of the node
+"""
+
+import collections
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from bitcaviar import blockchain
+from bitcaviar import raw
+from bitcaviar import streaming
+from bitcaviar.__helpers import __stream
+from bitcaviar.rpc import format_error
+
+
+def get_block_at(bitcoin, height, verbosity=1):
+    """
+    Get block data by height
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param height: int, required
+    :param verbosity: int, optional, default=1
+    :return: if verbosity=0 returns string, else returns dict
+    """
+
+    block_hash = blockchain.get_block_hash(bitcoin=bitcoin, height=height)
+    block = blockchain.get_block(bitcoin=bitcoin, blockhash=block_hash, verbosity=verbosity)
+
+    return block
+
+
+def get_raw_block(bitcoin, blockhash, rest=False):
+    """
+    Get the serialized block as bytes, to be read with src.bitcaviar.raw.Block
+    With rest=True the block is fetched from the REST interface in binary, skipping the hex encoding
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param blockhash: string, required
+    :param rest: boolean, optional, default=False, needs rpc_host and bitcoind running with -rest
+    :return: bytes
+    """
+
+    if rest:
+        block = bitcoin.transport.get('/rest/block/{}.bin'.format(blockhash))
+    else:
+        block = blockchain.get_block(bitcoin=bitcoin, blockhash=blockhash, verbosity=0)
+        block = bytes.fromhex(block.rstrip())
+
+    return block
+
+
+def get_raw_block_at(bitcoin, height, rest=False):
+    """
+    Get the serialized block at height as bytes
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param height: int, required
+    :param rest: boolean, optional, default=False
+    :return: bytes
+    """
+
+    block_hash = blockchain.get_block_hash(bitcoin=bitcoin, height=height)
+    block = get_raw_block(bitcoin=bitcoin, blockhash=block_hash, rest=rest)
+
+    return block
+
+
+def iter_block_transactions(bitcoin, blockhash, fields=None, chunk_size=1 << 16):
+    """
+    Yield the transactions of a block one at a time, as in the tx list of get_block with verbosity=2
+    The response is parsed while it is read, so memory is bounded by the largest transaction instead of the block.
+    Stopping early closes the connection (or kills bitcoin-cli) without reading the rest.
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param blockhash: string, required
+    :param fields: iterable of strings, optional, default=all fields, e.g. ('txid', 'vout.value'),
+        see src.bitcaviar.decoder
+    :param chunk_size: int, optional, default=65536 bytes read at a time
+    :return: generator of dicts
+    """
+
+    command = [bitcoin.cli_dir, bitcoin.data_dir, 'getblock', blockhash, '2']
+    over_rpc = getattr(bitcoin, 'transport', None) is not None
+    stream = streaming.ArrayStream(__stream(command, bitcoin, chunk_size), ('result', 'tx') if over_rpc else ('tx',),
+                                   fields)
+
+    yield from stream
+
+    if over_rpc and stream.rest and stream.rest.get('error'):
+        raise ValueError(format_error(stream.rest['error']))
+
+
+def iter_blocks(bitcoin, start, stop, verbosity=2, workers=8, prefetch=None, fetch=get_block_at):
+    """
+    Yield the blocks from height start to stop (not included) in order, fetching up to prefetch of them ahead
+    with workers threads. Nothing more is fetched while the consumer is behind, so memory stays bounded.
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param start: int, required
+    :param stop: int, required
+    :param verbosity: int, optional, default=2
+    :param workers: int, optional, default=8
+    :param prefetch: int, optional, default=2 * workers
+    :param fetch: function (bitcoin, height, verbosity) that returns a block, optional, default=get_block_at
+    :return: generator of blocks, as returned by fetch
+    """
+
+    prefetch = prefetch or 2 * workers
+    heights = iter(range(start, stop))
+    pending = collections.deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    try:
+        for height in itertools.islice(heights, prefetch):
+            pending.append(executor.submit(fetch, bitcoin, height, verbosity))
+
+        while pending:
+            block = pending.popleft().result()
+            height = next(heights, None)
+
+            if height is not None:  # Refill the window only as blocks are consumed
+                pending.append(executor.submit(fetch, bitcoin, height, verbosity))
+
+            yield block
+    finally:
+        for future in pending:
+            future.cancel()
+
+        executor.shutdown(wait=True)
+
+
+def iter_raw_blocks(bitcoin, start, stop, workers=8, prefetch=None, rest=False):
+    """
+    Yield the blocks from height start to stop (not included) in order, parsed lazily from their serialization
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param start: int, required
+    :param stop: int, required
+    :param workers: int, optional, default=8
+    :param prefetch: int, optional, default=2 * workers
+    :param rest: boolean, optional, default=False
+    :return: generator of src.bitcaviar.raw.Block
+    """
+
+    def fetch(bitcoin_, height, verbosity):
+        return get_raw_block_at(bitcoin=bitcoin_, height=height, rest=rest)
+
+    for block in iter_blocks(bitcoin, start, stop, verbosity=0, workers=workers, prefetch=prefetch, fetch=fetch):
+        yield raw.Block(block)
+
+
+def fork_height(bitcoin, height, first, block_hash, block_count=None):
+    """
+    Walk back from the highest stored height to the last one where the store still has the block of the active chain
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param height: int, required, highest stored height
+    :param first: int, required, lowest stored height
+    :param block_hash: function (height) that returns the stored block hash of a height, as a hex string
+    :param block_count: int, optional, default=asked to the node
+    :return: int, height of the last block in common, first - 1 if there is none
+    """
+
+    if block_count is None:
+        block_count = blockchain.get_block_count(bitcoin=bitcoin)
+
+    height = min(height, block_count)
+
+    while height >= first and blockchain.get_block_hash(bitcoin=bitcoin, height=height) != block_hash(height):
+        height -= 1
+
+    return height
+
+
+def sync_raw_blocks(bitcoin, store, stop=None, workers=8, commit_every=100, rest=False):
+    """
+    Roll a store back to the active chain and apply the new blocks, fetched as raw blocks, starting over when the
+    chain changes while syncing
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param store: object with height, tip, rollback(bitcoin), apply(block, height, commit) and commit(),
+        e.g. src.bitcaviar.utxo.UTXOSet
+    :param stop: int, optional, default=up to the tip, height not included
+    :param workers: int, optional, default=8 blocks fetched at a time
+    :param commit_every: int, optional, default=100 blocks per transaction
+    :param rest: boolean, optional, default=False, fetch blocks from the REST interface
+    :return: int, number of blocks applied
+    """
+
+    applied = 0
+
+    while True:
+        store.rollback(bitcoin)
+        block_count = blockchain.get_block_count(bitcoin=bitcoin)
+        end = block_count + 1 if stop is None else min(stop, block_count + 1)
+        height = store.height + 1
+        raw_blocks = iter_raw_blocks(bitcoin, height, end, workers=workers, rest=rest)
+        reorganized = False
+
+        try:
+            for block in raw_blocks:
+                if height and block.header.previous_block_hash != store.tip:  # The chain changed while syncing
+                    reorganized = True
+                    break
+
+                store.apply(block, height, commit=False)
+                height += 1
+                applied += 1
+
+                if applied % commit_every == 0:
+                    store.commit()
+
+            store.commit()
+        finally:
+            raw_blocks.close()
+
+        if not reorganized:
+            return applied
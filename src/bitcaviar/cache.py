@@ -0,0 +1,267 @@
+"""
+Block cache
+LRU cache in front of the blockchain functions that return block data.
+Results looked up by block hash never expire, because a block with a given hash never changes
+(except for fields like confirmations and nextblockhash, which are kept as they were when fetched).
+Height to hash mappings are checked against the node every time the cache sees a new tip, and the ones
+that belong to a chain that is no longer active are dropped.
+"""
+
+import collections
+import threading
+from bitcaviar import blockchain
+
+
+def sizeof(value):
+    """
+    Estimate how many bytes a result takes, counting the length of strings and a fixed overhead for other values
+    :param value: any result, required
+    :return: int
+    """
+
+    if isinstance(value, (str, bytes)):
+        return 49 + len(value)
+    elif isinstance(value, dict):
+        return 64 + sum(sizeof(key) + sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple)):
+        return 56 + sum(sizeof(item) for item in value)
+    elif hasattr(value, '__slots__'):
+        return 64 + sum(sizeof(getattr(value, name, None)) for name in dir(value) if not name.startswith('_'))
+    else:
+        return 32
+
+
+class BlockCache:
+    """
+    Cache for get_block_hash, get_block_header, get_block and get_block_filter, bounded by number of entries and bytes.
+    Call get_best_block_hash or get_chain_tips through the cache (or check_tip) to keep height mappings up to date.
+    """
+    def __init__(self, max_entries=100000, max_bytes=256 * 1024 * 1024):
+        """
+        :param max_entries: int, optional, default=100000
+        :param max_bytes: int, optional, default=256 MB
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self.tip = None
+        self._entries = collections.OrderedDict()
+        self._heights = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Get a cached result
+        :param key: tuple, required
+        :return: result, or None if it is not cached
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Cache a result, evicting the least recently used ones if needed
+        :param key: tuple, required
+        :param value: any result, required
+        :return: None
+        """
+
+        size = sizeof(value)
+
+        if size > self.max_bytes:
+            return None
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (value, size)
+            self.size += size
+
+            if key[0] == 'getblockhash':
+                self._heights.add(key[1])
+
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+        return None
+
+    def discard(self, key):
+        """
+        Remove a result from the cache
+        :param key: tuple, required
+        :return: None
+        """
+
+        with self._lock:
+            self._discard(key)
+
+        return None
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= entry[1]
+
+            if key[0] == 'getblockhash':
+                self._heights.discard(key[1])
+
+    def clear(self):
+        """
+        Remove all results
+        :return: None
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._heights.clear()
+            self.size = 0
+            self.tip = None
+
+        return None
+
+    def stats(self):
+        """
+        Get cache counters
+        :return: dict
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self.size
+        }
+
+    def _cached(self, key, function, bitcoin, *args, **kwargs):
+        value = self.get(key)
+
+        if value is None:
+            value = function(bitcoin, *args, **kwargs)
+            self.put(key, value)
+
+        return value
+
+    def get_block_hash(self, bitcoin, height):
+        """
+        Get hash of block in best-block-chain at height provided
+        See src.bitcaviar.blockchain.get_block_hash
+        """
+
+        return self._cached(('getblockhash', int(height)), blockchain.get_block_hash, bitcoin, height=height)
+
+    def get_block_header(self, bitcoin, block_hash, verbose=True, typed=False):
+        """
+        Get block header information
+        See src.bitcaviar.blockchain.get_block_header
+        """
+
+        key = ('getblockheader', block_hash, verbose, typed)
+
+        return self._cached(key, blockchain.get_block_header, bitcoin, block_hash=block_hash, verbose=verbose,
+                            typed=typed)
+
+    def get_block(self, bitcoin, blockhash, verbosity=1, typed=False):
+        """
+        Get block data
+        See src.bitcaviar.blockchain.get_block
+        """
+
+        key = ('getblock', blockhash, verbosity, typed)
+
+        return self._cached(key, blockchain.get_block, bitcoin, blockhash=blockhash, verbosity=verbosity, typed=typed)
+
+    def get_block_filter(self, bitcoin, block_hash, filter_type='basic'):
+        """
+        Get a BIP 157 content filter for a particular block
+        See src.bitcaviar.blockchain.get_block_filter
+        """
+
+        key = ('getblockfilter', block_hash, filter_type)
+
+        return self._cached(key, blockchain.get_block_filter, bitcoin, block_hash=block_hash, filter_type=filter_type)
+
+    def get_best_block_hash(self, bitcoin):
+        """
+        Get the hash of the best (tip) block, never cached, and check the height mappings if the tip changed
+        See src.bitcaviar.blockchain.get_best_block_hash
+        """
+
+        best_block_hash = blockchain.get_best_block_hash(bitcoin=bitcoin)
+        self.update_tip(bitcoin, best_block_hash)
+
+        return best_block_hash
+
+    def get_chain_tips(self, bitcoin):
+        """
+        Get information about all known tips, never cached, and check the height mappings if the active tip changed
+        See src.bitcaviar.blockchain.get_chain_tips
+        """
+
+        chain_tips = blockchain.get_chain_tips(bitcoin=bitcoin)
+
+        for chain_tip in chain_tips:
+            if chain_tip['status'] == 'active':
+                self.update_tip(bitcoin, chain_tip['hash'], chain_tip['height'])
+
+        return chain_tips
+
+    def check_tip(self, bitcoin):
+        """
+        Ask the node for its tip and drop the height mappings of blocks that are no longer in the active chain
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :return: string, hash of the tip
+        """
+
+        return self.get_best_block_hash(bitcoin)
+
+    def update_tip(self, bitcoin, tip, height=None):
+        """
+        Record the tip of the active chain. If it changed, check cached height mappings from the highest down
+        and drop the ones that changed, until one still matches the node (blocks below it can't have changed).
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :param tip: string, hash of the tip, required
+        :param height: int, optional, height of the tip
+        :return: None
+        """
+
+        with self._lock:
+            if tip == self.tip:
+                return None
+
+        if height is None:
+            height = self.get_block_header(bitcoin, tip)['height']
+
+        with self._lock:  # Held while checking, so lookups don't get mappings of the old chain with the new tip
+            for cached_height in sorted(self._heights, reverse=True):
+                key = ('getblockhash', cached_height)
+                entry = self._entries.get(key)
+
+                if entry is None:
+                    continue
+
+                if cached_height > height:
+                    self._discard(key)
+                    continue
+
+                block_hash = tip if cached_height == height else blockchain.get_block_hash(bitcoin, cached_height)
+
+                if block_hash == entry[0]:
+                    break
+
+                self._discard(key)
+
+            self.tip = tip
+
+        return None
@@ -0,0 +1,570 @@
+"""
+Client
+Holds what calls to one node share: the config with its transport (and connections), and optionally a block cache.
+Every function of src.bitcaviar.blockchain is available as a method, without the bitcoin parameter.
+A client is safe to share between threads, and creating one does no I/O.
+The functions of src.bitcaviar.blockchain run on a default client for each config.
+"""
+
+import json
+import threading
+import weakref
+from bitcaviar import config
+from bitcaviar import results
+from bitcaviar.__helpers import __run as _run, __decode as _decode, __instrumented as _instrumented
+
+_defaults = weakref.WeakKeyDictionary()
+_defaults_lock = threading.Lock()
+
+
+def default_client(bitcoin):
+    """
+    Get the client used for calls with this config, creating it if needed
+    :param bitcoin: src.bitcaviar.config.Bitcoin or src.bitcaviar.client.Client, required
+    :return: src.bitcaviar.client.Client, the same one if bitcoin is already a client
+    """
+
+    if isinstance(bitcoin, Client):
+        return bitcoin
+
+    client = _defaults.get(bitcoin)
+
+    if client is None:
+        with _defaults_lock:
+            client = _defaults.get(bitcoin)
+
+            if client is None:
+                client = _defaults[bitcoin] = Client(bitcoin)
+
+    return client
+
+
+def _check_typed(typed, fields):
+    # Typed results read every field of the result, which a partial decode leaves out
+    if typed and fields is not None:
+        raise ValueError('typed=True needs all fields, it cannot be combined with fields')
+
+    return None
+
+
+class Client:
+    """
+    Send blockchain RPCs to a node.
+    bitcoin-cli and the data directory are read from the config once, the transport is the one of the config.
+    With a src.bitcaviar.cache.BlockCache, get_block_hash, get_block_header, get_block and get_block_filter
+    are answered from it, and get_best_block_hash and get_chain_tips keep it up to date.
+    """
+    def __init__(self, bitcoin=None, cache=None, **kwargs):
+        """
+        :param bitcoin: src.bitcaviar.config.Bitcoin, optional, default=a new one with kwargs
+        :param cache: src.bitcaviar.cache.BlockCache, optional
+        :param kwargs: parameters of src.bitcaviar.config.Bitcoin, if bitcoin is not given
+        """
+        self.config = bitcoin if bitcoin is not None else config.Bitcoin(**kwargs)
+        self.cache = cache
+        self.cli_dir = getattr(self.config, 'cli_dir', None)
+        self.data_dir = getattr(self.config, 'data_dir', None)
+
+    @property
+    def transport(self):
+        """Transport of the config, None to run bitcoin-cli"""
+        return getattr(self.config, 'transport', None)
+
+    @property
+    def flights(self):
+        """src.bitcaviar.singleflight.SingleFlight of the config, None if calls are not coalesced"""
+        return getattr(self.config, 'flights', None)
+
+    def batch(self, size=100):
+        """
+        Queue calls and send them in JSON-RPC batches when the with block ends, see src.bitcaviar.blockchain.batch
+        :param size: int, optional, default=100 calls per request, None=all calls in one request
+        :return: src.bitcaviar.batch.Batch
+        """
+
+        from bitcaviar import blockchain
+
+        return blockchain.batch(self, size)
+
+    def pool(self, limit=100):
+        """
+        Get the pool for asyncio calls with this client in the running event loop, see src.bitcaviar.aio.pool
+        Pass the client to the functions of src.bitcaviar.aio to use it.
+        :param limit: int, optional, default=100 requests in flight
+        :return: src.bitcaviar.aio.AsyncHTTPTransport, AsyncThreadTransport or AsyncCLITransport
+        """
+
+        from bitcaviar import aio
+
+        return aio.pool(self, limit)
+
+    def close(self):
+        """
+        Close the connections of the current thread
+        :return: None
+        """
+
+        if hasattr(self.transport, 'close'):
+            self.transport.close()
+
+        return None
+
+    @_instrumented
+    def get_best_block_hash(self):
+        """
+        Get the hash of the best (tip) block in the most-work fully-validated chain
+        More info: https://developer.bitcoin.org/reference/rpc/getbestblockhash.html
+        :return: string
+        """
+
+        if self.cache is not None:
+            return self.cache.get_best_block_hash(self.config)
+
+        command = [self.cli_dir, self.data_dir, 'getbestblockhash']
+        best_block_hash = _run(command, self)
+        best_block_hash = best_block_hash.rstrip()
+
+        return best_block_hash
+
+    @_instrumented
+    def get_block(self, blockhash, verbosity=1, typed=False, fields=None):
+        """
+        Get block data
+        More info: https://developer.bitcoin.org/reference/rpc/getblock.html
+        :param blockhash: string, required
+        :param verbosity: int, optional, default=1
+        :param typed: boolean, optional, default=False, not with fields
+        :param fields: iterable of strings, optional, default=all fields, e.g. ('height', 'tx.txid') to decode only
+            those, see src.bitcaviar.decoder
+        :return: if verbosity=0 returns string, else returns dict, or src.bitcaviar.results.Block if typed=True
+        """
+
+        _check_typed(typed, fields)
+
+        if self.cache is not None and fields is None:
+            return self.cache.get_block(self.config, blockhash, verbosity, typed)
+
+        command = [self.cli_dir, self.data_dir, 'getblock', blockhash, str(verbosity)]
+        block = _run(command, self)
+
+        if verbosity == 1 or verbosity == 2:
+            block = _decode(block, fields)
+
+            if typed:
+                block = results.Block(block)
+
+        return block
+
+    @_instrumented
+    def get_blockchain_info(self):
+        """
+        Get an object containing various state info regarding blockchain processing
+        More info: https://developer.bitcoin.org/reference/rpc/getblockchaininfo.html
+        :return: dict
+        """
+
+        command = [self.cli_dir, self.data_dir, 'getblockchaininfo']
+        blockchain_info = _run(command, self)
+        blockchain_info = _decode(blockchain_info)
+
+        return blockchain_info
+
+    @_instrumented
+    def get_block_count(self):
+        """
+        Get the height of the most-work fully-validated chain
+        More info: https://developer.bitcoin.org/reference/rpc/getblockcount.html
+        :return: int
+        """
+
+        command = [self.cli_dir, self.data_dir, 'getblockcount']
+        block_count = _run(command, self)
+        block_count = int(block_count)
+
+        return block_count
+
+    @_instrumented
+    def get_block_filter(self, block_hash, filter_type='basic'):
+        """
+        Get a BIP 157 content filter for a particular block.
+        To enable the compact block filter, you need to start bitcoind with the -blockfilterindex=basic
+        (or simply -blockfilterindex) command line option, or put that option in your bitcoin.conf file
+        More info: https://developer.bitcoin.org/reference/rpc/getblockfilter.html
+        :param block_hash: string, required
+        :param filter_type: string, optional, default=basic
+        :return: dict
+        """
+
+        if self.cache is not None:
+            return self.cache.get_block_filter(self.config, block_hash, filter_type)
+
+        command = [self.cli_dir, self.data_dir, 'getblockfilter', block_hash, filter_type]
+        block_filter = _run(command, self)
+        block_filter = _decode(block_filter)
+
+        return block_filter
+
+    @_instrumented
+    def get_block_hash(self, height):
+        """
+        Get hash of block in best-block-chain at height provided
+        More info: https://developer.bitcoin.org/reference/rpc/getblockhash.html
+        :param height: int, required
+        :return: string
+        """
+
+        if self.cache is not None:
+            return self.cache.get_block_hash(self.config, height)
+
+        command = [self.cli_dir, self.data_dir, 'getblockhash', str(height)]
+        block_hash = _run(command, self)
+        block_hash = block_hash.rstrip()
+
+        return block_hash
+
+    @_instrumented
+    def get_block_header(self, block_hash, verbose=True, typed=False, fields=None):
+        """
+        Get block header information
+        More info: https://developer.bitcoin.org/reference/rpc/getblockheader.html
+        :param block_hash: string, required
+        :param verbose: boolean, optional, default=True
+        :param typed: boolean, optional, default=False, not with fields
+        :param fields: iterable of strings, optional, default=all fields, see src.bitcaviar.decoder
+        :return: if verbose=false returns string, else returns dict, or src.bitcaviar.results.BlockHeader if typed=True
+        """
+
+        _check_typed(typed, fields)
+
+        if self.cache is not None and fields is None:
+            return self.cache.get_block_header(self.config, block_hash, verbose, typed)
+
+        command = [self.cli_dir, self.data_dir, 'getblockheader', block_hash, str(verbose).lower()]
+        block_header = _run(command, self)
+
+        if verbose:
+            block_header = _decode(block_header, fields)
+
+            if typed:
+                block_header = results.BlockHeader(block_header)
+
+        return block_header
+
+    @_instrumented
+    def get_block_stats(self, hash_or_height, stats='all'):
+        """
+        Compute per block statistics for a given window. All amounts are in satoshis.
+        It won’t work for some heights with pruning.
+        More info: https://developer.bitcoin.org/reference/rpc/getblockstats.html
+        :param hash_or_height: string, required
+        :param stats: list of strings, optional, default=all values
+        :return: dict
+        """
+
+        if len(hash_or_height) == 64:  # It's a hash
+            hash_or_height = json.dumps(hash_or_height)
+
+        if stats == 'all':
+            command = [self.cli_dir, self.data_dir, 'getblockstats', hash_or_height]
+        else:
+            stats = json.dumps(stats)
+            command = [self.cli_dir, self.data_dir, 'getblockstats', hash_or_height, stats]
+
+        block_stats = _run(command, self)
+        block_stats = _decode(block_stats)
+
+        return block_stats
+
+    @_instrumented
+    def get_chain_tips(self):
+        """
+        Get information about all known tips in the block tree, including the main chain as well as orphaned branches
+        More info: https://developer.bitcoin.org/reference/rpc/getchaintips.html
+        :return: list of dicts
+        """
+
+        if self.cache is not None:
+            return self.cache.get_chain_tips(self.config)
+
+        command = [self.cli_dir, self.data_dir, 'getchaintips']
+        chain_tips = _run(command, self)
+        chain_tips = _decode(chain_tips)
+
+        return chain_tips
+
+    # noinspection PyIncorrectDocstring
+    @_instrumented
+    def get_chain_tx_stats(self, nblocks=None):
+        # noinspection PyUnresolvedReferences
+        """
+            Get statistics about the total number and rate of transactions in the chain
+            More info: https://developer.bitcoin.org/reference/rpc/getchaintxstats.html
+            :param nblocks: int, optional, default=one month
+            :param blockhash: currently not supported
+            :return: dict
+            """
+
+        if nblocks:
+            command = [self.cli_dir, self.data_dir, 'getchaintxstats', str(nblocks)]
+        else:
+            command = [self.cli_dir, self.data_dir, 'getchaintxstats']
+
+        chain_tx_stats = _run(command, self)
+        chain_tx_stats = _decode(chain_tx_stats)
+
+        return chain_tx_stats
+
+    @_instrumented
+    def get_difficulty(self):
+        """
+        Get the proof-of-work difficulty as a multiple of the minimum difficulty
+        More info: https://developer.bitcoin.org/reference/rpc/getdifficulty.html
+        :return: string
+        """
+
+        command = [self.cli_dir, self.data_dir, 'getdifficulty']
+        difficulty = _run(command, self)
+
+        return difficulty
+
+    @_instrumented
+    def get_mempool_ancestors(self, txid, verbose=False):
+        """
+        Get all in-mempool ancestors if txid is in the mempool
+        More info: https://developer.bitcoin.org/reference/rpc/getmempoolancestors.html
+        :param txid: string, required
+        :param verbose: boolean, optional, default=False
+        :return: if verbose=False returns list of dicts, else dict
+        """
+
+        command = [self.cli_dir, self.data_dir, 'getmempoolancestors', txid, str(verbose).lower()]
+        mempool_ancestors = _run(command, self)
+        mempool_ancestors = _decode(mempool_ancestors)
+
+        return mempool_ancestors
+
+    @_instrumented
+    def get_mempool_descendants(self, txid, verbose=False):
+        """
+        Get all in-mempool descendants if txid is in the mempool
+        More info: https://developer.bitcoin.org/reference/rpc/getmempooldescendants.html
+        :param txid: string, required
+        :param verbose: boolean, optional, default=False
+        :return: if verbose=False returns list, else dict
+        """
+
+        command = [self.cli_dir, self.data_dir, 'getmempooldescendants', txid, str(verbose).lower()]
+        mempool_descendants = _run(command, self)
+        mempool_descendants = _decode(mempool_descendants)
+
+        return mempool_descendants
+
+    @_instrumented
+    def get_mempool_entry(self, txid, typed=False, fields=None):
+        """
+        Get mempool data for given transaction
+        The transaction id must be in mempool
+        More info: https://developer.bitcoin.org/reference/rpc/getmempoolentry.html
+        :param txid: string, required
+        :param typed: boolean, optional, default=False, not with fields
+        :param fields: iterable of strings, optional, default=all fields, see src.bitcaviar.decoder
+        :return: dict, or src.bitcaviar.results.MempoolEntry if typed=True
+        """
+
+        _check_typed(typed, fields)
+
+        command = [self.cli_dir, self.data_dir, 'getmempoolentry', txid]
+        mempool_entry = _run(command, self)
+        mempool_entry = _decode(mempool_entry, fields)
+
+        if typed:
+            mempool_entry = results.MempoolEntry(mempool_entry)
+
+        return mempool_entry
+
+    @_instrumented
+    def get_mempool_info(self):
+        """
+        Get details on the active state of the TX memory pool
+        :param bitcoin:
+        :return: dict
+        """
+
+        command = [self.cli_dir, self.data_dir, 'getmempoolinfo']
+        mempool_info = _run(command, self)
+        mempool_info = _decode(mempool_info)
+
+        return mempool_info
+
+    @_instrumented
+    def get_raw_mempool(self, verbose=False, mempool_sequence=False, typed=False, fields=None):
+        """
+        Get all transaction ids in memory pool
+        More info: https://developer.bitcoin.org/reference/rpc/getrawmempool.html
+        :param verbose: boolean, optional, default=False
+        :param mempool_sequence: boolean, optional, default=False
+        :param typed: boolean, optional, default=False, only with verbose=True and not with fields
+        :param fields: iterable of strings, optional, default=all fields, fields of each entry to decode with
+            verbose=True, e.g. ('vsize', 'fees.base'), see src.bitcaviar.decoder
+        :return: if verbose=False returns list, else dict, with src.bitcaviar.results.MempoolEntry values if typed=True
+        """
+
+        _check_typed(verbose and typed, fields)
+
+        command = [self.cli_dir, self.data_dir, 'getrawmempool', str(verbose).lower(), str(mempool_sequence).lower()]
+        raw_mempool = _run(command, self)
+        raw_mempool = _decode(raw_mempool, ['*.' + field for field in fields] if verbose and fields else None)
+
+        if verbose and typed:
+            raw_mempool = results.to_mempool(raw_mempool)
+
+        return raw_mempool
+
+    @_instrumented
+    def get_tx_out(self, txid, n, include_mempool=True):
+        """
+        Get details about an unspent transaction output
+        More info: https://developer.bitcoin.org/reference/rpc/gettxout.html
+        :param txid: string, required
+        :param n: int, required
+        :param include_mempool: boolean, optional, default=true
+        :return: dict
+        """
+
+        command = [self.cli_dir, self.data_dir, 'gettxout', txid, str(n), str(include_mempool).lower()]
+        tx_out = _run(command, self)
+
+        if tx_out:
+            tx_out = _decode(tx_out)
+        else:
+            tx_out = {'message': 'no unspent transaction'}
+
+        return tx_out
+
+    @_instrumented
+    def get_tx_out_proof(self, txids, blockhash=None):
+        """
+        Get a hex-encoded proof that “txid” was included in a block
+        NOTE: By default this function only works sometimes. This is when there is an unspent output in the utxo for
+        this transaction. To make it always work, you need to maintain a transaction index, using the -txindex command
+        line option or specify the block in which the transaction is included manually (by blockhash)
+        More info: https://developer.bitcoin.org/reference/rpc/gettxoutproof.html
+        :param txids: list, required
+        :param blockhash: string, optional
+        :return: string
+        """
+
+        txids = json.dumps(txids)  # Convert list to json array
+
+        if blockhash:
+            command = [self.cli_dir, self.data_dir, 'gettxoutproof', txids, blockhash]
+        else:
+            command = [self.cli_dir, self.data_dir, 'gettxoutproof', txids]
+
+        tx_out_proof = _run(command, self)
+        tx_out_proof = tx_out_proof.rstrip()
+
+        return tx_out_proof
+
+    @_instrumented
+    def get_tx_out_set_info(self, hash_type=None):
+        """
+        Get statistics about the unspent transaction output set
+        Note this call may take some time
+        More info: https://developer.bitcoin.org/reference/rpc/gettxoutsetinfo.html
+        :param hash_type: string, optional, default=hash_serialized_2
+        :return: dict
+        """
+
+        if hash_type:
+            command = [self.cli_dir, self.data_dir, 'gettxoutsetinfo', hash_type]
+        else:
+            command = [self.cli_dir, self.data_dir, 'gettxoutsetinfo']
+
+        tx_out_set_info = _run(command, self)
+        tx_out_set_info = _decode(tx_out_set_info)
+
+        return tx_out_set_info
+
+    @_instrumented
+    def get_precious_block(self, blockhash):
+        """
+        Treats a block as if it were received before others with the same work.
+        A later precious block call can override the effect of an earlier one.
+        The effects of precious block are not retained across restarts.
+        More info: https://developer.bitcoin.org/reference/rpc/preciousblock.html
+        :param blockhash: string, required
+        :return: None
+        """
+
+        command = [self.cli_dir, self.data_dir, 'preciousblock', blockhash]
+        precious_block = _run(command, self)
+
+        return precious_block
+
+    @_instrumented
+    def prune_blockchain(self, height):
+        """
+        Get prune blockchain height
+        You have to set your node into prune mode to make this call work.
+        More info: https://developer.bitcoin.org/reference/rpc/pruneblockchain.html
+        :param height: int, required
+        :return: string
+        """
+
+        command = [self.cli_dir, self.data_dir, 'pruneblockchain', str(height)]
+        prune_blockchain_height = _run(command, self)
+        prune_blockchain_height = int(prune_blockchain_height)
+
+        return prune_blockchain_height
+
+    @_instrumented
+    def save_mempool(self):
+        """
+        Dumps the mempool to disk. It will fail until the previous dump is fully loaded
+        More info: https://developer.bitcoin.org/reference/rpc/savemempool.html
+        :return: None
+        """
+
+        command = [self.cli_dir, self.data_dir, 'savemempool']
+        _run(command, self)
+
+        return None
+
+    @_instrumented
+    def verify_chain(self, checklevel=3, nblocks=6):
+        """
+        Verifies blockchain database
+        More info: https://developer.bitcoin.org/reference/rpc/verifychain.html
+        :param checklevel: int, optional, default=3, range=0-4
+        :param nblocks: int, optional, default=6, 0=all
+        :return: boolean
+        """
+
+        command = [self.cli_dir, self.data_dir, 'verifychain', str(checklevel), str(nblocks)]
+        verification = _run(command, self).rstrip()
+
+        if verification == 'true':
+            verification = True
+        elif verification == 'false':
+            verification = False
+
+        return verification
+
+    @_instrumented
+    def verify_tx_out_proof(self, proof):
+        """
+        Get the txid(s) which the proof commits to
+        Verifies that a proof points to a transaction in a block, returning the transaction it commits to and throwing
+        an RPC error if the block is not in our best chain
+        More info: https://developer.bitcoin.org/reference/rpc/verifytxoutproof.html
+        :param proof: string, required
+        :return: list
+        """
+
+        command = [self.cli_dir, self.data_dir, 'verifytxoutproof', proof]
+        txids = _run(command, self)
+        txids = _decode(txids)
+
+        return txids
+
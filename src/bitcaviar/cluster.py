@@ -0,0 +1,356 @@
+"""
+Node clusters
+Spread calls over several nodes: read-only calls go to the healthy node with the fewest requests in flight,
+and calls that depend on the state of one node (its mempool, or that change it) stay pinned to one node.
+Nodes that fail or fall behind the others are left out until they pass a health check again, run in the background.
+A read-only call for a block or transaction a node does not have yet is retried on another node.
+"""
+
+import http.client
+import threading
+import time
+import weakref
+from bitcaviar.__helpers import __run as _run
+
+# Methods whose result depends on the mempool of the node, or that change the node
+PINNED_METHODS = frozenset((
+    'getmempoolancestors',
+    'getmempooldescendants',
+    'getmempoolentry',
+    'getmempoolinfo',
+    'getrawmempool',
+    'preciousblock',
+    'pruneblockchain',
+    'savemempool',
+))
+
+
+def is_pinned(command):
+    """
+    Check if a command must stay on the pinned node
+    :param command: list, required, [cli_dir, data_dir, method, *args]
+    :return: boolean
+    """
+
+    method, args = command[2], command[3:]
+
+    if method == 'gettxout':  # include_mempool defaults to true
+        return len(args) < 3 or args[2] != 'false'
+
+    return method in PINNED_METHODS
+
+
+class _CLITransport:
+    """Run bitcoin-cli with the directories of one node, whatever the command was built with"""
+    def __init__(self, cli_dir, data_dir):
+        self.cli_dir = cli_dir
+        self.data_dir = data_dir
+
+    def run(self, command):
+        return _run([self.cli_dir, self.data_dir] + list(command[2:]))
+
+
+class Node:
+    """
+    One node of a cluster, with its own transport (and connections) and health
+    """
+    def __init__(self, bitcoin):
+        """
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required, config of this node
+        """
+        self.bitcoin = bitcoin
+        self.transport = bitcoin.transport or _CLITransport(bitcoin.cli_dir, bitcoin.data_dir)
+        self.outstanding = 0
+        self.healthy = True
+        self.retry_at = 0
+        self.failures = 0
+        self.blocks = None
+
+    def __repr__(self):
+        name = getattr(self.transport, 'host', None) or self.bitcoin.data_dir
+        return '<Node {} outstanding={} healthy={}>'.format(name, self.outstanding, self.healthy)
+
+
+def _is_not_found(error):
+    # Error -5 (RPC_INVALID_ADDRESS_OR_KEY), e.g. a block or transaction a lagging node does not have yet
+    return isinstance(error, ValueError) and str(error).startswith('error code: -5\n')
+
+
+def _check_health(reference, interval, stopped):
+    """Health checks of a cluster every interval seconds, until it is stopped or garbage collected"""
+
+    while not stopped.wait(interval):
+        transport = reference()
+
+        if transport is None:
+            return
+
+        try:
+            transport.check()
+        except Exception:  # Not a connection error, the next call on that node raises it
+            pass
+
+        del transport
+
+
+def _is_connection_error(error):
+    if isinstance(error, (OSError, http.client.HTTPException)):
+        return True
+
+    # bitcoin-cli reports connection failures on stderr
+    return isinstance(error, ValueError) and 'Could not connect to the server' in str(error)
+
+
+class ClusterTransport:
+    """
+    Send commands to several nodes: read-only commands to the healthy node with the fewest requests in flight,
+    failing over to the next one on connection errors and on "not found" errors from nodes that lag behind,
+    and pinned commands (see is_pinned) to one node, the first healthy one, until it fails.
+    Failed nodes are retried after retry_delay seconds. Every health_interval seconds, a background thread asks all
+    nodes for their height and those more than max_lag blocks behind the highest are left out for read-only calls.
+    """
+    def __init__(self, nodes, health_interval=30, max_lag=2, retry_delay=5):
+        """
+        :param nodes: list of src.bitcaviar.config.Bitcoin, required
+        :param health_interval: int, optional, default=30 seconds, None to disable health checks
+        :param max_lag: int, optional, default=2 blocks
+        :param retry_delay: int, optional, default=5 seconds
+        """
+        if not nodes:
+            raise ValueError('At least one node is required')
+
+        self.nodes = [Node(bitcoin) for bitcoin in nodes]
+        self.health_interval = health_interval
+        self.max_lag = max_lag
+        self.retry_delay = retry_delay
+        self.pinned = self.nodes[0]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._stopped = threading.Event()
+
+        if health_interval is not None:
+            threading.Thread(target=_check_health, args=(weakref.ref(self), health_interval, self._stopped),
+                             daemon=True).start()
+
+    def _available(self, node, now):
+        return node.healthy or now >= node.retry_at
+
+    def _lagging(self, node):
+        heights = [n.blocks for n in self.nodes if n.healthy and n.blocks is not None]
+        return node.blocks is not None and heights and node.blocks < max(heights) - self.max_lag
+
+    def choose(self, pinned=False, exclude=()):
+        """
+        Pick a node for a command and count it as in flight
+        :param pinned: boolean, optional, default=False
+        :param exclude: iterable of src.bitcaviar.cluster.Node, optional, nodes that already failed this command
+        :return: src.bitcaviar.cluster.Node
+        """
+
+        with self._lock:
+            now = time.monotonic()
+
+            if pinned:
+                if not self._available(self.pinned, now):
+                    candidates = [node for node in self.nodes if self._available(node, now)]
+                    self.pinned = candidates[0] if candidates else self.pinned
+
+                node = self.pinned
+            else:
+                candidates = [node for node in self.nodes if node not in exclude and self._available(node, now)]
+                candidates = [node for node in candidates if not self._lagging(node)] or candidates
+
+                if not candidates:
+                    raise ValueError('error: no node available\n')
+
+                # Least outstanding requests, rotating the start so ties are spread
+                self._next = (self._next + 1) % len(candidates)
+                candidates = candidates[self._next:] + candidates[:self._next]
+                node = min(candidates, key=lambda n: n.outstanding)
+
+            node.outstanding += 1
+
+        return node
+
+    def release(self, node, error=None):
+        """
+        Count a command as finished and update the health of its node
+        :param node: src.bitcaviar.cluster.Node, required
+        :param error: Exception, optional, raised by the command
+        :return: None
+        """
+
+        with self._lock:
+            node.outstanding -= 1
+
+            if error is not None and _is_connection_error(error):
+                node.healthy = False
+                node.failures += 1
+                node.retry_at = time.monotonic() + self.retry_delay
+            elif error is None:
+                node.healthy = True
+                node.failures = 0
+
+        return None
+
+    def _untried(self, tried):
+        with self._lock:
+            now = time.monotonic()
+            return any(node not in tried and self._available(node, now) for node in self.nodes)
+
+    def _send(self, pinned, function, tried=None):
+        tried = [] if tried is None else tried
+
+        while True:
+            node = self.choose(pinned, tried)
+            tried.append(node)
+
+            try:
+                result = function(node)
+            except Exception as error:
+                self.release(node, error)
+
+                if pinned or not (_is_connection_error(error) or _is_not_found(error)) or not self._untried(tried):
+                    raise
+
+                continue
+
+            self.release(node)
+
+            return result
+
+    def run(self, command):
+        """
+        Send a bitcoin-cli command to a node of the cluster and return its output
+        :param command: list, required, [cli_dir, data_dir, method, *args]
+        :return: string, dict or list
+        """
+
+        return self._send(is_pinned(command), lambda node: node.transport.run(command))
+
+    def run_many(self, commands):
+        """
+        Send bitcoin-cli commands to one node, in a single JSON-RPC batch if the node supports it
+        :param commands: list of lists, required
+        :return: list of outputs in the same order, with a ValueError in place of each command that failed
+        """
+
+        def run_many(node, commands):
+            if hasattr(node.transport, 'run_many'):
+                return node.transport.run_many(commands)
+
+            outputs = []
+
+            for command in commands:
+                try:
+                    outputs.append(node.transport.run(command))
+                except ValueError as error:
+                    if _is_connection_error(error):
+                        raise
+
+                    outputs.append(error)
+
+            return outputs
+
+        pinned = any(is_pinned(command) for command in commands)
+        tried = []
+        outputs = self._send(pinned, lambda node: run_many(node, commands), tried)
+        retry = [] if pinned else [i for i, output in enumerate(outputs) if _is_not_found(output)]
+
+        while retry and self._untried(tried):  # Commands another node may be far enough along for
+            again = self._send(pinned, lambda node: run_many(node, [commands[i] for i in retry]), tried)
+
+            for i, output in zip(retry, again):
+                outputs[i] = output
+
+            retry = [i for i in retry if _is_not_found(outputs[i])]
+
+        return outputs
+
+    def stream(self, command, chunk_size=1 << 16):
+        """
+        Send a command to a node over JSON-RPC and yield the response in chunks, see HTTPTransport.stream
+        :param command: list, required
+        :param chunk_size: int, optional, default=65536 bytes
+        :return: generator of bytes
+        """
+
+        node = self._http_node(is_pinned(command))
+        failure = None
+
+        try:
+            yield from node.transport.stream(command, chunk_size)
+        except Exception as error:
+            failure = error
+            raise
+        finally:  # Also when the caller stops reading early
+            self.release(node, failure)
+
+    def get(self, path):
+        """
+        Send a GET request to the REST interface of a node, see HTTPTransport.get
+        :param path: string, required
+        :return: bytes
+        """
+
+        return self._send(False, lambda node: node.transport.get(path))
+
+    def _http_node(self, pinned):
+        node = self.choose(pinned)
+
+        if not hasattr(node.transport, 'stream'):
+            self.release(node)
+            raise ValueError('error: streaming needs nodes with rpc_host\n')
+
+        return node
+
+    def check(self):
+        """
+        Ask every node for its height, marking the ones that fail as unhealthy
+        :return: dict, node to height, or None for nodes that failed
+        """
+
+        heights = {}
+
+        for node in self.nodes:
+            try:
+                blocks = int(node.transport.run([None, None, 'getblockcount']))
+            except Exception as error:
+                if not _is_connection_error(error):
+                    raise
+
+                with self._lock:
+                    node.healthy = False
+                    node.retry_at = time.monotonic() + self.retry_delay
+
+                blocks = None
+            else:
+                with self._lock:
+                    node.healthy = True
+
+            node.blocks = blocks
+            heights[node] = blocks
+
+        return heights
+
+    def stop(self):
+        """
+        Stop the background health checks
+        :return: None
+        """
+
+        self._stopped.set()
+
+        return None
+
+    def close(self):
+        """
+        Close the connections of the current thread to every node
+        :return: None
+        """
+
+        for node in self.nodes:
+            if hasattr(node.transport, 'close'):
+                node.transport.close()
+
+        return None
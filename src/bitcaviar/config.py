@@ -1,11 +1,53 @@
+import os
+from bitcaviar import rpc
+from bitcaviar.cluster import ClusterTransport
+from bitcaviar.singleflight import SingleFlight
+
+
 class Bitcoin:
     """
     Store the directory of bitcoin-cli and where the blockchain data is.
+    If rpc_host is set, commands are sent to bitcoind over JSON-RPC instead of running bitcoin-cli.
+    If endpoints is set, commands are spread over several nodes, see src.bitcaviar.cluster.ClusterTransport.
+    If coalesce is set, concurrent identical calls share one command, see src.bitcaviar.singleflight.SingleFlight.
     """
-    def __init__(self, cli_dir, data_dir):
+    def __init__(self, cli_dir=None, data_dir=None, rpc_host=None, rpc_port=8332, rpc_user=None, rpc_password=None,
+                 rpc_cookie_file=None, endpoints=None, health_interval=30, max_lag=2, coalesce=False,
+                 coalesce_ttl=None):
         """
-        :param cli_dir: string, required
-        :param data_dir: string, required
+        :param cli_dir: string, required unless rpc_host or endpoints is set
+        :param data_dir: string, required unless rpc_host is set with rpc_user and rpc_password
+        :param rpc_host: string, optional
+        :param rpc_port: int, optional, default=8332
+        :param rpc_user: string, optional
+        :param rpc_password: string, optional
+        :param rpc_cookie_file: string, optional, default=data_dir/.cookie
+        :param endpoints: list of dicts, optional, parameters of each node, as for this class
+        :param health_interval: int, optional, default=30 seconds between health checks of the endpoints
+        :param max_lag: int, optional, default=2, blocks an endpoint can be behind and still serve read-only calls
+        :param coalesce: boolean, optional, default=False
+        :param coalesce_ttl: dict, optional, RPC method to seconds its outputs are reused for, implies coalesce,
+        e.g. src.bitcaviar.singleflight.VOLATILE_TTL
         """
         self.cli_dir = cli_dir
-        self.data_dir = '-datadir=' + data_dir
+        self.data_dir = '-datadir=' + data_dir if data_dir else None
+        self.transport = None
+        self.flights = SingleFlight(coalesce_ttl) if coalesce or coalesce_ttl else None
+
+        if endpoints:
+            self.transport = ClusterTransport(
+                [Bitcoin(**endpoint) for endpoint in endpoints],
+                health_interval=health_interval,
+                max_lag=max_lag
+            )
+        elif rpc_host:
+            if rpc_cookie_file is None and data_dir:
+                rpc_cookie_file = os.path.join(data_dir, '.cookie')
+
+            self.transport = rpc.HTTPTransport(
+                host=rpc_host,
+                port=rpc_port,
+                user=rpc_user,
+                password=rpc_password,
+                cookie_file=rpc_cookie_file
+            )
@@ -0,0 +1,223 @@
+"""
+JSON decoding
+Decodes RPC output with msgspec or orjson if installed, else with the json module.
+Callers can select fields, e.g. ('height', 'tx.txid'), so only those are built into Python objects:
+- a dotted path goes into objects, and into every element of arrays
+- * stands for every value of an object with arbitrary keys, like the verbose mempool keyed by txid
+With msgspec, the fields are turned into a schema and everything else is skipped while parsing;
+over HTTP the JSON-RPC result is also kept undecoded until the function that called it decodes it.
+More info: https://jcristharif.com/msgspec/
+More info: https://github.com/ijl/orjson
+"""
+
+import json
+import typing
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ('msgspec', 'orjson', 'json')
+
+backend = 'msgspec' if msgspec is not None else 'orjson' if orjson is not None else 'json'
+
+_decoders = {}
+
+
+def use(name):
+    """
+    Choose the decoding backend
+    :param name: string, required, msgspec, orjson or json
+    :return: None
+    """
+
+    global backend
+
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend: {}'.format(name))
+
+    if (name == 'msgspec' and msgspec is None) or (name == 'orjson' and orjson is None):
+        raise ValueError('{} is not installed'.format(name))
+
+    backend = name
+
+    return None
+
+
+def loads(data, fields=None):
+    """
+    Decode JSON
+    :param data: string, bytes or msgspec.Raw, required
+    :param fields: iterable of strings, optional, default=all fields
+    :return: any JSON value
+    """
+
+    if backend == 'msgspec':
+        if not fields:
+            return _decoder(None).decode(data)
+
+        try:
+            return _to_builtins(_decoder(_tree(fields)).decode(data))
+        except msgspec.ValidationError:  # Not shaped like the fields, e.g. scalars where objects were expected
+            value = _decoder(None).decode(data)
+    elif backend == 'orjson':
+        value = orjson.loads(data)
+    else:
+        value = json.loads(data)
+
+    return select(value, fields) if fields else value
+
+
+def loads_response(data):
+    """
+    Decode a JSON-RPC response, or a list of them for a batch
+    With msgspec, results that are objects or arrays are left undecoded as msgspec.Raw; decode them with loads.
+    :param data: bytes, required
+    :return: dict or list of dicts
+    """
+
+    if backend == 'msgspec':
+        response = _decoder('response').decode(data)
+
+        if isinstance(response, list):
+            return [_response(item) for item in response]
+
+        return _response(response)
+    elif backend == 'orjson':
+        return orjson.loads(data)
+    else:
+        return json.loads(data)
+
+
+def is_raw(value):
+    """
+    Check if a value was left undecoded by loads_response
+    :param value: any, required
+    :return: boolean
+    """
+
+    return msgspec is not None and isinstance(value, msgspec.Raw)
+
+
+def select(value, fields):
+    """
+    Keep only some fields of an already decoded value
+    :param value: any JSON value, required
+    :param fields: iterable of strings, required
+    :return: any JSON value
+    """
+
+    return _select(value, _tree(fields))
+
+
+def _tree(fields):
+    """Turn dotted paths into nested tuples of (name, subtree) pairs, None for a whole value"""
+
+    tree = {}
+
+    for field in fields:
+        node = tree
+
+        for name in field.split('.'):
+            if None in node.get(name, {}):  # A shorter path already keeps the whole value
+                break
+
+            node = node.setdefault(name, {})
+        else:
+            node.clear()
+            node[None] = None
+
+    def freeze(node):
+        if None in node:
+            return None
+
+        return tuple(sorted((name, freeze(child)) for name, child in node.items()))
+
+    return freeze(tree)
+
+
+def _select(value, tree):
+    if tree is None:
+        return value
+    elif isinstance(value, list):
+        return [_select(item, tree) for item in value]
+    elif not isinstance(value, dict):
+        return value
+    elif tree[0][0] == '*':
+        return {key: _select(item, tree[0][1]) for key, item in value.items()}
+    else:
+        return {name: _select(value[name], child) for name, child in tree if name in value}
+
+
+def _decoder(schema):
+    """msgspec decoder for a tree of fields, 'response', or None for any value, cached by schema"""
+
+    decoder = _decoders.get(schema)
+
+    if decoder is None:
+        if schema is None:
+            decoder = msgspec.json.Decoder()
+        elif schema == 'response':
+            response = msgspec.defstruct('Response', [('result', msgspec.Raw, None),
+                                                      ('error', typing.Any, None), ('id', typing.Any, None)])
+            decoder = msgspec.json.Decoder(typing.Union[response, typing.List[response]])
+        else:
+            decoder = msgspec.json.Decoder(_schema(schema))
+
+        _decoders[schema] = decoder
+
+    return decoder
+
+
+def _schema(tree):
+    """msgspec type that matches an object with the fields of the tree, or an array of them"""
+
+    if tree is None:
+        return typing.Any
+
+    if tree[0][0] == '*':
+        mapping = typing.Dict[str, _schema(tree[0][1])]
+        return typing.Union[mapping, typing.List[mapping], None]
+
+    # Attribute names are generated since JSON keys are not always valid identifiers
+    struct = msgspec.defstruct(
+        'Fields', [('f{}'.format(i), _schema(child), msgspec.UNSET) for i, (name, child) in enumerate(tree)],
+        rename={'f{}'.format(i): name for i, (name, child) in enumerate(tree)},
+    )
+
+    return typing.Union[struct, typing.List[struct], None]
+
+
+def _to_builtins(value):
+    if isinstance(value, msgspec.Struct):
+        result = {}
+
+        for attribute, name in zip(value.__struct_fields__, value.__struct_encode_fields__):
+            item = getattr(value, attribute)
+
+            if item is not msgspec.UNSET:
+                result[name] = _to_builtins(item)
+
+        return result
+    elif isinstance(value, list) and value and isinstance(value[0], (msgspec.Struct, dict)):
+        return [_to_builtins(item) for item in value]
+    elif isinstance(value, dict) and value and isinstance(next(iter(value.values())), msgspec.Struct):
+        return {key: _to_builtins(item) for key, item in value.items()}
+    else:
+        return value
+
+
+def _response(response):
+    result = response.result
+
+    # Scalars are cheap, decode them now
+    if result is not None and bytes(memoryview(result)[:1]) not in (b'{', b'['):
+        result = msgspec.json.decode(result)
+
+    return {'result': result, 'error': response.error, 'id': response.id}
@@ -0,0 +1,304 @@
+"""
+Chain export
+Exports a range of heights as tables of blocks, transactions, inputs and outputs for analytics. The range is split
+in shards of consecutive heights that worker processes fetch as raw blocks, decode and stream a batch of blocks at a
+time into one file per table, Parquet if pyarrow is installed, else gzipped NDJSON. Finished shards are recorded in a
+checkpoint file, replaced atomically, so an interrupted export resumes with the shards that were not finished.
+More info: https://parquet.apache.org/docs/
+More info: https://github.com/ndjson/ndjson-spec
+"""
+
+import gzip
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from bitcaviar import blockchain
+from bitcaviar import blocks
+from bitcaviar.config import Bitcoin
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+CHECKPOINT = 'checkpoint.json'
+BATCH_SIZE = 100  # Blocks decoded before they are written, a row group in Parquet
+FORMATS = {'parquet': '.parquet', 'ndjson': '.ndjson.gz'}
+TABLES = {
+    'blocks': (('height', 'int64'), ('hash', 'string'), ('previous_block_hash', 'string'), ('version', 'int64'),
+               ('merkle_root', 'string'), ('time', 'int64'), ('bits', 'int64'), ('nonce', 'int64'),
+               ('size', 'int64'), ('tx_count', 'int64')),
+    'transactions': (('height', 'int64'), ('position', 'int64'), ('txid', 'string'), ('version', 'int64'),
+                     ('locktime', 'int64'), ('size', 'int64'), ('weight', 'int64'), ('input_count', 'int64'),
+                     ('output_count', 'int64')),
+    'inputs': (('height', 'int64'), ('txid', 'string'), ('n', 'int64'), ('previous_txid', 'string'),
+               ('previous_vout', 'int64'), ('script_sig', 'string'), ('sequence', 'int64')),
+    'outputs': (('height', 'int64'), ('txid', 'string'), ('n', 'int64'), ('value', 'int64'),
+                ('script_pubkey', 'string'))
+}
+
+
+def default_format():
+    """
+    Get the format used when none is given
+    :return: string, parquet if pyarrow is installed, else ndjson
+    """
+
+    return 'ndjson' if pyarrow is None else 'parquet'
+
+
+def decode(block, height):
+    """
+    Decode a block into rows
+    :param block: src.bitcaviar.raw.Block, required
+    :param height: int, required
+    :return: dict table name to dict column name to list of values
+    """
+
+    tables = {table: {column: [] for column, kind in columns} for table, columns in TABLES.items()}
+    header = block.header
+    rows = tables['blocks']
+
+    for column, value in (('height', height), ('hash', block.hash), ('previous_block_hash', header.previous_block_hash),
+                          ('version', header.version), ('merkle_root', header.merkle_root), ('time', header.time),
+                          ('bits', header.bits), ('nonce', header.nonce), ('size', len(block.data)),
+                          ('tx_count', block.tx_count)):
+        rows[column].append(value)
+
+    txs, inputs, outputs = tables['transactions'], tables['inputs'], tables['outputs']
+
+    for position, tx in enumerate(block):
+        txid = tx.txid
+        witness_size = tx.locktime_offset - tx.witness_offset + 2 if tx.segwit else 0
+        txs['height'].append(height)
+        txs['position'].append(position)
+        txs['txid'].append(txid)
+        txs['version'].append(tx.version)
+        txs['locktime'].append(tx.locktime)
+        txs['size'].append(tx.size)
+        txs['weight'].append((tx.size - witness_size) * 3 + tx.size)
+        txs['input_count'].append(tx.input_count)
+        txs['output_count'].append(tx.output_count)
+
+        for n, tx_in in enumerate(tx.inputs):
+            inputs['height'].append(height)
+            inputs['txid'].append(txid)
+            inputs['n'].append(n)
+            inputs['previous_txid'].append(tx_in.txid)
+            inputs['previous_vout'].append(tx_in.vout)
+            inputs['script_sig'].append(tx_in.script_sig.hex())
+            inputs['sequence'].append(tx_in.sequence)
+
+        for n, tx_out in enumerate(tx.outputs):
+            outputs['height'].append(height)
+            outputs['txid'].append(txid)
+            outputs['n'].append(n)
+            outputs['value'].append(tx_out.value)
+            outputs['script_pubkey'].append(tx_out.script_pubkey.hex())
+
+    return tables
+
+
+def _open(path, table, file_format):
+    """Open a writer of a table on the temporary file of path"""
+
+    if file_format == 'parquet':
+        schema = pyarrow.schema([(column, getattr(pyarrow, kind)()) for column, kind in TABLES[table]])
+        return pyarrow.parquet.ParquetWriter(path + '.tmp', schema)
+
+    return gzip.open(path + '.tmp', 'wt', compresslevel=6)
+
+
+def _write(writer, table, columns, file_format):
+    """Write a batch of rows of a table, one row group in Parquet"""
+
+    if file_format == 'parquet':
+        writer.write_table(pyarrow.Table.from_pydict(columns, schema=writer.schema))
+    else:
+        names = list(columns)
+
+        for row in zip(*columns.values()):
+            writer.write(json.dumps(dict(zip(names, row)), separators=(',', ':')))
+            writer.write('\n')
+
+    return None
+
+
+def shard_path(path, table, start, stop, file_format):
+    """
+    Get the file of a table for a shard
+    :param path: string, required, directory of the export
+    :param table: string, required
+    :param start: int, required
+    :param stop: int, required, not included
+    :param file_format: string, required, parquet or ndjson
+    :return: string
+    """
+
+    return os.path.join(path, table, 'part-{:09d}-{:09d}{}'.format(start, stop, FORMATS[file_format]))
+
+
+def export_shard(config, path, start, stop, file_format, threads=8, batch_size=BATCH_SIZE):
+    """
+    Export the blocks from height start to stop (not included) as one file per table, written batch_size blocks
+    at a time so a shard is never held in memory
+    :param config: dict, required, parameters of src.bitcaviar.config.Bitcoin
+    :param path: string, required, directory of the export
+    :param start: int, required
+    :param stop: int, required, not included
+    :param file_format: string, required, parquet or ndjson
+    :param threads: int, optional, default=8 blocks fetched at a time
+    :param batch_size: int, optional, default=100 blocks per batch, a row group in Parquet
+    :return: tuple (int start, int stop)
+    """
+
+    bitcoin = Bitcoin(**config)
+    paths = {table: shard_path(path, table, start, stop, file_format) for table in TABLES}
+    writers = {}
+
+    def flush(batch):
+        for table, columns in batch.items():
+            _write(writers[table], table, columns, file_format)
+
+    try:
+        for table in TABLES:
+            writers[table] = _open(paths[table], table, file_format)
+
+        batch = None
+
+        for height, block in enumerate(blocks.iter_raw_blocks(bitcoin, start, stop, workers=threads), start):
+            if batch is None:
+                batch = decode(block, height)
+            else:
+                for table, columns in decode(block, height).items():
+                    for column, values in columns.items():
+                        batch[table][column].extend(values)
+
+            if (height - start + 1) % batch_size == 0:
+                flush(batch)
+                batch = None
+
+        if batch is not None:
+            flush(batch)
+    except BaseException:
+        for table, writer in writers.items():
+            writer.close()
+            os.remove(paths[table] + '.tmp')
+
+        raise
+
+    for table, writer in writers.items():  # Each file is either complete or missing
+        writer.close()
+        os.replace(paths[table] + '.tmp', paths[table])
+
+    return start, stop
+
+
+def read_checkpoint(path):
+    """
+    Read the checkpoint of an export
+    :param path: string, required, directory of the export
+    :return: dict with format, start, shard_size and done (list of [start, stop] of the finished shards),
+        or None if there is none
+    """
+
+    try:
+        with open(os.path.join(path, CHECKPOINT)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_checkpoint(path, checkpoint):
+    checkpoint_path = os.path.join(path, CHECKPOINT)
+
+    with open(checkpoint_path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+
+def export(config, path, start=0, stop=None, shard_size=1000, file_format=None, workers=None, threads=8,
+           progress=None):
+    """
+    Export a range of heights, resuming from the checkpoint in path if there is one
+    :param config: dict, required, parameters of src.bitcaviar.config.Bitcoin, each worker makes its own
+    :param path: string, required, directory of the export, created if it does not exist
+    :param start: int, optional, default=0
+    :param stop: int, optional, default=up to the tip, height not included
+    :param shard_size: int, optional, default=1000 heights per file
+    :param file_format: string, optional, default=parquet if pyarrow is installed, else ndjson
+    :param workers: int, optional, default=number of CPUs, 1 to export in this process
+    :param threads: int, optional, default=8 blocks fetched at a time by each worker
+    :param progress: callable, optional, called with (start, stop) of each finished shard
+    :return: int, number of shards exported
+    """
+
+    file_format = file_format or default_format()
+
+    if file_format not in FORMATS:
+        raise ValueError('Unknown format: {}'.format(file_format))
+    elif file_format == 'parquet' and pyarrow is None:
+        raise ValueError('pyarrow is not installed')
+
+    if stop is None:
+        stop = blockchain.get_block_count(bitcoin=Bitcoin(**config)) + 1
+
+    for table in TABLES:
+        os.makedirs(os.path.join(path, table), exist_ok=True)
+
+    checkpoint = read_checkpoint(path) or {'format': file_format, 'start': start, 'shard_size': shard_size, 'done': []}
+    settings = (checkpoint['format'], checkpoint['start'], checkpoint['shard_size'])
+
+    if settings != (file_format, start, shard_size):
+        raise ValueError('{} was exported with format {}, start {} and shard_size {}'.format(path, *settings))
+
+    done = dict(checkpoint['done'])  # Shard start to stop, the last shard may have been cut at the tip
+    shards = [(first, min(first + shard_size, stop)) for first in range(start, stop, shard_size)]
+    shards = [(first, last) for first, last in shards if done.get(first, first) < last]
+    workers = workers or os.cpu_count() or 1
+
+    def record(shard):
+        first, last = shard
+
+        if first in done:  # Replaced by a longer one
+            for table in TABLES:
+                os.remove(shard_path(path, table, first, done[first], file_format))
+
+        done[first] = last
+        checkpoint['done'] = sorted(done.items())
+        _write_checkpoint(path, checkpoint)
+
+    def finished(shard):
+        record(shard)
+
+        if progress is not None:
+            progress(*shard)
+
+    if workers == 1:
+        for first, last in shards:
+            finished(export_shard(config, path, first, last, file_format, threads))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(export_shard, config, path, first, last, file_format, threads)
+                       for first, last in shards]
+            pending = set(futures)
+
+            try:
+                for future in as_completed(futures):
+                    pending.discard(future)
+                    finished(future.result())
+            except BaseException:
+                for future in pending:  # Leave the shards not started for the next run
+                    future.cancel()
+
+                for future in as_completed(pending):  # Checkpoint the ones that finish anyway
+                    if not future.cancelled() and future.exception() is None:
+                        record(future.result())
+
+                raise
+
+    return len(shards)
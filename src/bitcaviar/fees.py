@@ -0,0 +1,214 @@
+"""
+Fee estimation
+Local fee rate estimates from two kinds of state kept in memory: the fee rate percentiles of a rolling window of
+recent blocks, from getblockstats, and a histogram of the virtual size waiting in the mempool by fee rate bucket.
+Both are refreshed by update(), fetching only the blocks that are new since the last one, so estimate() is answered
+from memory with no RPC. Fee rates are in sat/vB.
+More info: https://developer.bitcoin.org/reference/rpc/getblockstats.html
+More info: https://developer.bitcoin.org/reference/rpc/estimatesmartfee.html
+"""
+
+import bisect
+import collections
+import threading
+from bitcaviar import blockchain
+from bitcaviar import stats
+from bitcaviar.blocks import fork_height
+
+MAX_BLOCK_VSIZE = 1000000  # Maximum block weight / 4
+MIN_FEERATE = 1
+MAX_FEERATE = 10000
+BUCKET_SPACING = 1.05
+FLOOR_STAT = 'feerate_percentiles_10'  # Fee rate a transaction needed to be in the block, give or take
+
+
+def bucket_edges(minimum=MIN_FEERATE, maximum=MAX_FEERATE, spacing=BUCKET_SPACING):
+    """
+    Get the lower fee rate of each bucket of the mempool histogram
+    :param minimum: float, optional, default=1 sat/vB
+    :param maximum: float, optional, default=10000 sat/vB
+    :param spacing: float, optional, default=1.05, each bucket starts 5% above the one before
+    :return: list of floats, ascending
+    """
+
+    edges = [float(minimum)]
+
+    while edges[-1] * spacing < maximum:
+        edges.append(edges[-1] * spacing)
+
+    return edges
+
+
+class FeeEstimator:
+    """
+    Fee rate estimates for a number of blocks to confirm within, kept up to date with update()
+    Estimates read an immutable snapshot that update() replaces, so they need no lock and no RPC.
+    """
+    def __init__(self, bitcoin, window=144, mirror=None, edges=None):
+        """
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :param window: int, optional, default=144 recent blocks
+        :param mirror: src.bitcaviar.mempool.MempoolMirror, optional, read the mempool from it instead of
+            get_raw_mempool(verbose=True)
+        :param edges: list of floats, optional, default=bucket_edges(), lower fee rate of each mempool bucket
+        """
+        self.bitcoin = bitcoin
+        self.window = window
+        self.mirror = mirror
+        self.edges = edges or bucket_edges()
+        self.blocks = collections.deque(maxlen=window)  # Tuples (height, blockhash, dict of stats)
+        self._lock = threading.Lock()
+        self._floors = []
+        self._histogram = [0] * len(self.edges)
+        self._above = []
+
+    @property
+    def height(self):
+        """Height of the last block in the window, -1 if it is empty"""
+        return self.blocks[-1][0] if self.blocks else -1
+
+    def _rollback(self, block_count):
+        """Drop the blocks that are no longer in the active chain of the node"""
+
+        if not self.blocks:
+            return None
+
+        first = self.blocks[0][0]
+        height = fork_height(self.bitcoin, self.height, first, lambda h: self.blocks[h - first][1], block_count)
+
+        while self.height > height:
+            self.blocks.pop()
+
+        return None
+
+    def update_blocks(self):
+        """
+        Add the stats of the blocks that are new since the last update, dropping the oldest ones
+        :return: int, number of blocks added
+        """
+
+        with self._lock:
+            block_count = blockchain.get_block_count(bitcoin=self.bitcoin)
+            self._rollback(block_count)
+            start = max(self.height + 1, block_count + 1 - self.window)
+
+            if start > block_count:
+                return 0
+
+            columns, hashes = stats.fetch(self.bitcoin, start, block_count + 1, stats=('feerate_percentiles',))
+
+            for i, block_hash in enumerate(hashes):
+                self.blocks.append((start + i, block_hash, {name: column[i] for name, column in columns.items()}))
+
+            self._floors = sorted(block[2][FLOOR_STAT] for block in self.blocks)
+
+        return len(hashes)
+
+    def update_mempool(self):
+        """
+        Take a new histogram of the mempool
+        :return: None
+        """
+
+        if self.mirror is not None:
+            entries = self.mirror.get_raw_mempool(verbose=True).values()
+        else:
+            entries = blockchain.get_raw_mempool(bitcoin=self.bitcoin, verbose=True,
+                                                 fields=('vsize', 'fees.modified')).values()
+
+        histogram = [0] * len(self.edges)
+
+        for entry in entries:
+            feerate = entry['fees']['modified'] * 100000000 / entry['vsize']
+            histogram[max(bisect.bisect_right(self.edges, feerate) - 1, 0)] += entry['vsize']
+
+        above = []  # Virtual size at or above each bucket, from the highest one down
+        total = 0
+
+        for vsize in reversed(histogram):
+            total += vsize
+            above.append(total)
+
+        self._histogram, self._above = histogram, above
+
+        return None
+
+    def update(self):
+        """
+        Add the new blocks and take a new histogram of the mempool
+        Call it on every new block, e.g. from a src.bitcaviar.notifications.Subscriber on hashblock.
+        :return: int, number of blocks added
+        """
+
+        added = self.update_blocks()
+        self.update_mempool()
+
+        return added
+
+    def histogram(self):
+        """
+        Get the mempool histogram, from the highest fee rate down, leaving out empty buckets
+        :return: list of tuples (float lower fee rate of the bucket, int virtual size)
+        """
+
+        histogram = self._histogram
+
+        return [(self.edges[i], histogram[i]) for i in range(len(histogram) - 1, -1, -1) if histogram[i]]
+
+    def from_blocks(self, blocks, confidence=0.95):
+        """
+        Estimate from recent blocks: the lowest fee rate that got into enough of them to confirm within blocks
+        A fee rate above the floor of a fraction q of the blocks misses each block with probability 1 - q,
+        so it confirms within blocks with probability 1 - (1 - q) ** blocks.
+        :param blocks: int, required
+        :param confidence: float, optional, default=0.95
+        :return: float, or None if there are no blocks yet
+        """
+
+        floors = self._floors
+
+        if not floors:
+            return None
+
+        missed = (1 - confidence) ** (1 / blocks)  # Fraction of blocks the fee rate can be below the floor of
+
+        return float(floors[min(int(len(floors) * (1 - missed)), len(floors) - 1)])
+
+    def from_mempool(self, blocks):
+        """
+        Estimate from the mempool: the fee rate that gets ahead of the bucket where blocks full blocks of waiting
+        transactions end
+        :param blocks: int, required
+        :return: float, the lowest bucket fee rate if everything in the mempool fits in blocks
+        """
+
+        above = self._above
+        i = bisect.bisect_left(above, blocks * MAX_BLOCK_VSIZE)
+
+        if i >= len(above):
+            return float(self.edges[0])
+
+        bucket = len(above) - 1 - i
+
+        return float(self.edges[min(bucket + 1, len(self.edges) - 1)])
+
+    def estimate(self, blocks, confidence=0.95):
+        """
+        Estimate the fee rate to confirm within blocks, the highest of the estimates from recent blocks and mempool
+        :param blocks: int, required, at least 1
+        :param confidence: float, optional, default=0.95, for the estimate from recent blocks
+        :return: dict with feerate, blocks, from_blocks and from_mempool, fee rates in sat/vB
+        """
+
+        if blocks < 1:
+            raise ValueError('blocks must be at least 1')
+
+        history = self.from_blocks(blocks, confidence)
+        mempool = self.from_mempool(blocks)
+
+        return {
+            'feerate': max(mempool, history or 0),
+            'blocks': blocks,
+            'from_blocks': history,
+            'from_mempool': mempool
+        }
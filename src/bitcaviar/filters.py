@@ -0,0 +1,615 @@
+"""
+Compact block filters
+Local store of BIP 158 basic filters, synced from getblockfilter, and a matcher for wallet rescans:
+the scripts are hashed and looked up in every filter locally, across processes, and only the blocks that
+match need to be fetched. bitcoind must run with -blockfilterindex=basic.
+More info: https://github.com/bitcoin/bips/blob/master/bip-0158.mediawiki
+More info: https://www.aumasson.jp/siphash/siphash.pdf
+"""
+
+import array
+import json
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from bitcaviar import blockchain
+from bitcaviar import blocks
+from bitcaviar import raw
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+P = 19  # Golomb-Rice parameter of basic filters
+M = 784931  # Inverse false positive rate of basic filters
+
+MASK = 0xffffffffffffffff
+
+
+def _rotate(x, b):
+    return ((x << b) | (x >> (64 - b))) & MASK
+
+
+def siphash(k0, k1, data):
+    """
+    SipHash-2-4
+    :param k0: int, required, first 8 bytes of the key, little endian
+    :param k1: int, required, last 8 bytes of the key, little endian
+    :param data: bytes, required
+    :return: int, 64 bits
+    """
+
+    v0 = k0 ^ 0x736f6d6570736575
+    v1 = k1 ^ 0x646f72616e646f6d
+    v2 = k0 ^ 0x6c7967656e657261
+    v3 = k1 ^ 0x7465646279746573
+    tail = len(data) & ~7
+    words = [int.from_bytes(data[i:i + 8], 'little') for i in range(0, tail, 8)]
+    words.append(int.from_bytes(data[tail:], 'little') | (len(data) & 0xff) << 56)
+
+    def rounds(v0, v1, v2, v3, count):
+        for _ in range(count):
+            v0 = (v0 + v1) & MASK
+            v1 = _rotate(v1, 13) ^ v0
+            v0 = _rotate(v0, 32)
+            v2 = (v2 + v3) & MASK
+            v3 = _rotate(v3, 16) ^ v2
+            v0 = (v0 + v3) & MASK
+            v3 = _rotate(v3, 21) ^ v0
+            v2 = (v2 + v1) & MASK
+            v1 = _rotate(v1, 17) ^ v2
+            v2 = _rotate(v2, 32)
+
+        return v0, v1, v2, v3
+
+    for word in words:
+        v3 ^= word
+        v0, v1, v2, v3 = rounds(v0, v1, v2, v3, 2)
+        v0 ^= word
+
+    v2 ^= 0xff
+    v0, v1, v2, v3 = rounds(v0, v1, v2, v3, 4)
+
+    return v0 ^ v1 ^ v2 ^ v3
+
+
+def _siphash_numpy(k0, k1, items):
+    """SipHash-2-4 of many messages of the same length at once, with numpy"""
+
+    length = len(items[0])
+    count = length // 8 + 1
+    padded = bytearray(b''.join(item + bytes(count * 8 - length) for item in items))
+    padded[count * 8 - 1::count * 8] = bytes([length & 0xff]) * len(items)
+    words = numpy.frombuffer(bytes(padded), dtype='<u8').reshape(len(items), count)
+
+    def rotate(x, b):
+        return (x << numpy.uint64(b)) | (x >> numpy.uint64(64 - b))
+
+    def rounds(v, n):
+        v0, v1, v2, v3 = v
+
+        for _ in range(n):
+            v0 += v1
+            v1 = rotate(v1, 13) ^ v0
+            v0 = rotate(v0, 32)
+            v2 += v3
+            v3 = rotate(v3, 16) ^ v2
+            v0 += v3
+            v3 = rotate(v3, 21) ^ v0
+            v2 += v1
+            v1 = rotate(v1, 17) ^ v2
+            v2 = rotate(v2, 32)
+
+        return [v0, v1, v2, v3]
+
+    v = [numpy.full(len(items), value, dtype=numpy.uint64) for value in
+         (k0 ^ 0x736f6d6570736575, k1 ^ 0x646f72616e646f6d, k0 ^ 0x6c7967656e657261, k1 ^ 0x7465646279746573)]
+
+    for i in range(count):
+        v[3] ^= words[:, i]
+        v = rounds(v, 2)
+        v[0] ^= words[:, i]
+
+    v[2] ^= numpy.uint64(0xff)
+    v = rounds(v, 4)
+
+    return v[0] ^ v[1] ^ v[2] ^ v[3]
+
+
+def _multiply_high(hashes, f):
+    """(hashes * f) >> 64 for uint64 arrays, in 32-bit halves since numpy has no 128-bit integers"""
+
+    low32 = numpy.uint64(0xffffffff)
+    shift = numpy.uint64(32)
+    h_high, h_low = hashes >> shift, hashes & low32
+    f_high, f_low = numpy.uint64(f >> 32), numpy.uint64(f & 0xffffffff)
+    low_high = h_low * f_high
+    high_low = h_high * f_low
+    middle = ((h_low * f_low) >> shift) + (low_high & low32) + (high_low & low32)
+
+    return h_high * f_high + (low_high >> shift) + (high_low >> shift) + (middle >> shift)
+
+
+def hash_to_range(k0, k1, items, f):
+    """
+    Map items to the range [0, f) of a filter, vectorized with numpy if installed
+    :param k0: int, required
+    :param k1: int, required
+    :param items: list of bytes, required
+    :param f: int, required, N * M
+    :return: set of ints
+    """
+
+    if numpy is None:
+        return {(siphash(k0, k1, item) * f) >> 64 for item in items}
+
+    by_length = {}
+
+    for item in items:
+        by_length.setdefault(len(item), []).append(item)
+
+    values = set()
+
+    with numpy.errstate(over='ignore'):
+        for group in by_length.values():
+            values.update(_multiply_high(_siphash_numpy(k0, k1, group), f).tolist())
+
+    return values
+
+
+def filter_key(block_hash):
+    """
+    Get the SipHash key of the filter of a block: the first 16 bytes of the block hash in internal byte order
+    :param block_hash: string, required
+    :return: tuple (int k0, int k1)
+    """
+
+    key = bytes.fromhex(block_hash)[::-1]
+
+    return int.from_bytes(key[:8], 'little'), int.from_bytes(key[8:16], 'little')
+
+
+def encode_filter(elements, block_hash):
+    """
+    Build a basic filter
+    :param elements: iterable of bytes, required, output scripts and scripts of the outputs spent
+    :param block_hash: string, required
+    :return: bytes, serialized filter: number of elements, then the Golomb-Rice coded set
+    """
+
+    elements = set(elements)
+    k0, k1 = filter_key(block_hash)
+    values = sorted(hash_to_range(k0, k1, list(elements), len(elements) * M)) if elements else []
+    bits = []
+    previous = 0
+
+    for value in values:
+        delta = value - previous
+        bits.append('1' * (delta >> P) + '0' + format(delta & ((1 << P) - 1), '0{}b'.format(P)))
+        previous = value
+
+    bits = ''.join(bits)
+    bits += '0' * (-len(bits) % 8)
+    data = int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b''
+
+    return _compact_size(len(elements)) + data
+
+
+def _compact_size(n):
+    if n < 0xfd:
+        return bytes([n])
+    elif n <= 0xffff:
+        return b'\xfd' + n.to_bytes(2, 'little')
+    elif n <= 0xffffffff:
+        return b'\xfe' + n.to_bytes(4, 'little')
+    else:
+        return b'\xff' + n.to_bytes(8, 'little')
+
+
+def decode_filter(data):
+    """
+    Decode a basic filter
+    :param data: bytes, required
+    :return: tuple (int number of elements, list of ints hashed values in ascending order)
+    """
+
+    n, offset = raw.read_varint(bytes(data[:9]), 0)
+
+    if not n:
+        return 0, []
+
+    bits = format(int.from_bytes(data[offset:], 'big'), '0{}b'.format((len(data) - offset) * 8))
+    values = []
+    position = 0
+    value = 0
+
+    for _ in range(n):
+        end = bits.index('0', position)  # Unary quotient: ones until a zero
+        value += (end - position) << P | int(bits[end + 1:end + 1 + P], 2)
+        values.append(value)
+        position = end + 1 + P
+
+    return n, values
+
+
+def match_any(data, block_hash, scripts):
+    """
+    Check if any script may be in a block
+    :param data: bytes, required, serialized filter
+    :param block_hash: string, required
+    :param scripts: list of bytes, required
+    :return: boolean, False positives happen once every M scripts
+    """
+
+    n, values = decode_filter(data)
+
+    if not n or not scripts:
+        return False
+
+    k0, k1 = filter_key(block_hash)
+
+    return not hash_to_range(k0, k1, scripts, n * M).isdisjoint(values)
+
+
+def filter_header(data, previous_header):
+    """
+    Get the header of a filter, which commits to all the filters of the chain up to it
+    :param data: bytes, required, serialized filter
+    :param previous_header: string, required, header of the filter of the previous block, zeros for genesis
+    :return: string
+    """
+
+    return raw.hash_to_hex(raw.double_sha256(raw.double_sha256(data) + bytes.fromhex(previous_header)[::-1]))
+
+
+class FilterStore:
+    """
+    Basic filters of a contiguous range of heights of the active chain, in a directory:
+    filters.bin with the filters one after the other, index.bin with the offset where each one ends,
+    hashes.bin and headers.bin with the 32-byte block hash and filter header of each height,
+    and meta.json with the first height and the number of heights, replaced last on every write.
+    Filters are read from a memory map.
+    """
+    def __init__(self, path, readonly=False):
+        """
+        :param path: string, required, directory, created if it does not exist
+        :param readonly: boolean, optional, default=False, leave the files as they are, e.g. while another process
+            appends to them
+        """
+        self.path = path
+        self.first = None
+        self.count = 0
+
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+
+        meta_path = os.path.join(path, 'meta.json')
+
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+            self.first = meta['first']
+            self.count = meta['count']
+
+        self._index = array.array('Q')
+        self._maps = {}
+
+        if self.count:
+            with open(os.path.join(path, 'index.bin'), 'rb') as f:
+                self._index.frombytes(f.read(self.count * self._index.itemsize))
+
+        if not readonly:
+            sizes = {'index.bin': self.count * self._index.itemsize, 'hashes.bin': self.count * 32,
+                     'headers.bin': self.count * 32, 'filters.bin': self._index[-1] if self.count else 0}
+
+            for name, size in sizes.items():  # Drop data of an interrupted write
+                file_path = os.path.join(path, name)
+
+                if not os.path.exists(file_path):
+                    open(file_path, 'wb').close()
+                elif os.path.getsize(file_path) > size:
+                    os.truncate(file_path, size)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def stop(self):
+        """Height after the last stored one, or None if the store is empty"""
+        return self.first + self.count if self.count else None
+
+    def _view(self, name, size):
+        view = self._maps.get(name)
+
+        if view is None or len(view) < size:
+            if view is not None:
+                view.close()
+
+            with open(os.path.join(self.path, name), 'rb') as f:
+                view = self._maps[name] = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+        return view
+
+    def _check(self, height):
+        if not self.count or not self.first <= height < self.stop:
+            raise IndexError('No filter at height {}'.format(height))
+
+        return height - self.first
+
+    def filter(self, height):
+        """
+        Get the serialized filter of the block at height
+        :param height: int, required
+        :return: bytes
+        """
+
+        i = self._check(height)
+        start = self._index[i - 1] if i else 0
+
+        return self._view('filters.bin', self._index[-1])[start:self._index[i]]
+
+    def block_hash(self, height):
+        """
+        Get the hash of the block at height
+        :param height: int, required
+        :return: string
+        """
+
+        i = self._check(height)
+
+        return raw.hash_to_hex(self._view('hashes.bin', self.count * 32)[i * 32:i * 32 + 32])
+
+    def header(self, height):
+        """
+        Get the filter header of the block at height
+        :param height: int, required
+        :return: string
+        """
+
+        i = self._check(height)
+
+        return raw.hash_to_hex(self._view('headers.bin', self.count * 32)[i * 32:i * 32 + 32])
+
+    def append(self, filters, hashes, headers, first=None, previous=None):
+        """
+        Append the filters of the heights right after the stored ones
+        Each filter header is checked against the filter and the previous header.
+        :param filters: list of bytes, required
+        :param hashes: list of strings, required, block hashes
+        :param headers: list of strings, required, filter headers
+        :param first: int, optional, first height of the filters, only needed if the store is empty
+        :param previous: string, optional, default=zeros at height 0, filter header of the height before first,
+            only needed if the store is empty, the first filter is not checked without it
+        :return: None
+        """
+
+        if not filters:
+            return None
+
+        if not self.count:
+            self.first = first
+        elif first is not None and first != self.stop:
+            raise ValueError('Filters at height {} do not follow the stored ones'.format(first))
+
+        if self.count:
+            previous = self.header(self.stop - 1)
+        elif self.first == 0:
+            previous = '00' * 32
+
+        for height, (data, header) in enumerate(zip(filters, headers), self.stop or self.first):
+            if previous is not None and filter_header(data, previous) != header:
+                raise ValueError('Filter at height {} does not match its header'.format(height))
+
+            previous = header
+
+        end = self._index[-1] if self.count else 0
+        offsets = array.array('Q')
+
+        for data in filters:
+            end += len(data)
+            offsets.append(end)
+
+        with open(os.path.join(self.path, 'filters.bin'), 'ab') as f:
+            f.write(b''.join(filters))
+
+        with open(os.path.join(self.path, 'index.bin'), 'ab') as f:
+            offsets.tofile(f)
+
+        with open(os.path.join(self.path, 'hashes.bin'), 'ab') as f:
+            f.write(b''.join(bytes.fromhex(block_hash)[::-1] for block_hash in hashes))
+
+        with open(os.path.join(self.path, 'headers.bin'), 'ab') as f:
+            f.write(b''.join(bytes.fromhex(header)[::-1] for header in headers))
+
+        self._index.extend(offsets)
+        self.count += len(filters)
+        self._save_meta()
+
+        return None
+
+    def _save_meta(self):
+        meta_path = os.path.join(self.path, 'meta.json')
+
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'first': self.first, 'count': self.count}, f)
+
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def truncate(self, count):
+        """
+        Drop every height from first + count up
+        :param count: int, required, number of heights to keep
+        :return: None
+        """
+
+        self.count = min(count, self.count)
+        self._save_meta()
+        del self._index[self.count:]
+
+        for view in self._maps.values():
+            view.close()
+
+        self._maps = {}
+        sizes = {'index.bin': self.count * self._index.itemsize, 'hashes.bin': self.count * 32,
+                 'headers.bin': self.count * 32, 'filters.bin': self._index[-1] if self.count else 0}
+
+        for name, size in sizes.items():
+            os.truncate(os.path.join(self.path, name), size)
+
+        return None
+
+    def rollback(self, bitcoin):
+        """
+        Drop the filters of blocks that are no longer in the active chain of the node
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :return: int, number of heights dropped
+        """
+
+        if not self.count:
+            return 0
+
+        height = blocks.fork_height(bitcoin, self.stop - 1, self.first, self.block_hash)
+        dropped = self.stop - (height + 1)
+
+        if dropped:
+            self.truncate(height + 1 - self.first)
+
+        return dropped
+
+    def sync(self, bitcoin, start=0, batch_size=1000, retries=10):
+        """
+        Roll back filters that were reorganized away and append the new ones, in JSON-RPC batches
+        A batch that fails because the chain changed while syncing is fetched again after rolling back, up to retries
+        times in a row. It fails right away if the chain did not change, as fetching it again would not help.
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :param start: int, optional, default=0, first height if the store is empty
+        :param batch_size: int, optional, default=1000 filters per round trip
+        :param retries: int, optional, default=10
+        :return: int, number of filters appended
+        """
+
+        self.rollback(bitcoin)
+        block_count = blockchain.get_block_count(bitcoin=bitcoin)
+        appended = 0
+        failures = 0
+
+        while (self.stop if self.count else start) <= block_count:
+            first = self.stop if self.count else start
+            heights = range(first, min(first + batch_size, block_count + 1))
+
+            linked = 1 if first and not self.count else 0  # The header before the first one, to check it against
+
+            with blockchain.batch(bitcoin, size=None) as b:
+                tip = b.get_best_block_hash()
+                hashes = [b.get_block_hash(height=height) for height in range(first - linked, heights.stop)]
+
+            try:
+                hashes = [block_hash.result() for block_hash in hashes]
+
+                with blockchain.batch(bitcoin, size=None) as b:
+                    block_filters = [b.get_block_filter(block_hash=block_hash) for block_hash in hashes]
+
+                block_filters = [block_filter.result() for block_filter in block_filters]
+                previous = block_filters[0]['header'] if linked else None
+                self.append([bytes.fromhex(f['filter']) for f in block_filters[linked:]], hashes[linked:],
+                            [f['header'] for f in block_filters[linked:]], first=first, previous=previous)
+            except ValueError:  # A hash reorganized away between the batches, or filters that no longer connect
+                failures += 1
+
+                if failures > retries or (not self.rollback(bitcoin)
+                                          and blockchain.get_best_block_hash(bitcoin=bitcoin) == tip.result()):
+                    raise
+
+                block_count = blockchain.get_block_count(bitcoin=bitcoin)
+                continue
+
+            failures = 0
+            appended += len(heights)
+
+        return appended
+
+    def match(self, height, scripts):
+        """
+        Check if any script may be in the block at height
+        :param height: int, required
+        :param scripts: list of bytes, required
+        :return: boolean
+        """
+
+        return match_any(self.filter(height), self.block_hash(height), scripts)
+
+    def scan(self, scripts, start=None, stop=None, workers=None, chunk_size=2000):
+        """
+        Find the blocks whose filter matches any script, splitting the heights across processes
+        :param scripts: list of bytes, required, output scripts
+        :param start: int, optional, default=first stored height
+        :param stop: int, optional, default=after the last stored height
+        :param workers: int, optional, default=number of CPUs, 1 to scan in this process
+        :param chunk_size: int, optional, default=2000 heights per task
+        :return: list of ints, heights in ascending order
+        """
+
+        if not self.count:
+            return []
+
+        start = self.first if start is None else max(start, self.first)
+        stop = self.stop if stop is None else min(stop, self.stop)
+        scripts = [bytes(script) for script in scripts]
+        workers = workers or os.cpu_count() or 1
+
+        if workers == 1:
+            return [height for height in range(start, stop) if self.match(height, scripts)]
+
+        chunks = [(self.path, scripts, height, min(height + chunk_size, stop))
+                  for height in range(start, stop, chunk_size)]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return [height for heights in executor.map(_scan, chunks) for height in heights]
+
+    def close(self):
+        """
+        Close the memory maps
+        :return: None
+        """
+
+        for view in self._maps.values():
+            view.close()
+
+        self._maps = {}
+
+        return None
+
+
+def _scan(task):
+    """Scan a range of heights of a store in a worker process"""
+
+    path, scripts, start, stop = task
+
+    with FilterStore(path, readonly=True) as store:
+        return [height for height in range(start, stop) if store.match(height, scripts)]
+
+
+def rescan(bitcoin, store, scripts, start=None, stop=None, workers=None, verbosity=2):
+    """
+    Find the blocks that may have transactions paying to or spending from the scripts, and fetch only those
+    False positives are possible, so the transactions in the blocks still have to be checked.
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param store: src.bitcaviar.filters.FilterStore, required, synced
+    :param scripts: list of bytes, required, output scripts
+    :param start: int, optional, default=first stored height
+    :param stop: int, optional, default=after the last stored height
+    :param workers: int, optional, default=number of CPUs
+    :param verbosity: int, optional, default=2
+    :return: generator of tuples (int height, block as returned by get_block)
+    """
+
+    for height in store.scan(scripts, start, stop, workers):
+        yield height, blockchain.get_block(bitcoin=bitcoin, blockhash=store.block_hash(height), verbosity=verbosity)
@@ -0,0 +1,242 @@
+"""
+Header store
+Local, append-only file of 80-byte block headers of the active chain, one after the other by height.
+It is memory-mapped for reads, so looking up a header or a hash is a local read instead of an RPC.
+"""
+
+import mmap
+import os
+from bitcaviar import blockchain
+from bitcaviar import blocks
+from bitcaviar import raw
+
+HEADER_SIZE = 80
+
+
+class HeaderStore:
+    """
+    Headers of the active chain stored in a file, kept in sync with the node with sync()
+    The hash to height index is built in memory the first time it is needed.
+    """
+    def __init__(self, path):
+        """
+        :param path: string, required, file where headers are stored, created if it does not exist
+        """
+        self.path = path
+
+        if not os.path.exists(path):
+            open(path, 'wb').close()
+
+        self._file = open(path, 'r+b')
+        self._map = None
+        self._index = None
+        self.count = os.path.getsize(path) // HEADER_SIZE
+
+        if self.count * HEADER_SIZE != os.path.getsize(path):  # Partial header from an interrupted write
+            self.truncate(self.count)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _view(self):
+        size = self.count * HEADER_SIZE
+
+        if self._map is None or len(self._map) < size:
+            if self._map is not None:
+                self._map.close()
+
+            self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) if size else None
+
+        return self._map
+
+    def header(self, height):
+        """
+        Get the raw header at height
+        :param height: int, required
+        :return: bytes
+        """
+
+        if not 0 <= height < self.count:
+            raise IndexError('No header at height {}'.format(height))
+
+        offset = height * HEADER_SIZE
+
+        return self._view()[offset:offset + HEADER_SIZE]
+
+    def read(self, start=0, stop=None):
+        """
+        Get the raw headers from height start to stop (not included), one after the other
+        :param start: int, optional, default=0
+        :param stop: int, optional, default=up to the last stored header
+        :return: bytes
+        """
+
+        stop = self.count if stop is None else min(stop, self.count)
+
+        if start >= stop:
+            return b''
+
+        return self._view()[start * HEADER_SIZE:stop * HEADER_SIZE]
+
+    def get(self, height):
+        """
+        Get the parsed header at height
+        :param height: int, required
+        :return: src.bitcaviar.raw.BlockHeader
+        """
+
+        return raw.BlockHeader(self.header(height))
+
+    def block_hash(self, height):
+        """
+        Get the hash of the block at height
+        :param height: int, required
+        :return: string
+        """
+
+        return raw.hash_to_hex(raw.double_sha256(self.header(height)))
+
+    def height(self, block_hash):
+        """
+        Get the height of a block in the stored chain
+        :param block_hash: string, required
+        :return: int, or None if the block is not stored
+        """
+
+        if self._index is None:
+            self._index = {raw.double_sha256(self.header(height)): height for height in range(self.count)}
+
+        return self._index.get(bytes.fromhex(block_hash)[::-1])
+
+    @property
+    def tip(self):
+        """Hash of the last stored header, or None if the store is empty"""
+        return self.block_hash(self.count - 1) if self.count else None
+
+    def append(self, headers):
+        """
+        Append raw headers, which must extend the stored chain
+        :param headers: list of bytes, required
+        :return: None
+        """
+
+        previous = raw.double_sha256(self.header(self.count - 1)) if self.count else bytes(32)
+
+        for header in headers:
+            if len(header) != HEADER_SIZE or header[4:36] != previous:
+                raise ValueError('Header at height {} does not extend the stored chain'.format(self.count))
+
+            previous = raw.double_sha256(header)
+
+        self._file.seek(self.count * HEADER_SIZE)
+        self._file.write(b''.join(headers))
+        self._file.flush()
+
+        if self._index is not None:
+            for height, header in enumerate(headers, self.count):
+                self._index[raw.double_sha256(header)] = height
+
+        self.count += len(headers)
+
+        return None
+
+    def truncate(self, count):
+        """
+        Drop every header from height count up
+        :param count: int, required, number of headers to keep
+        :return: None
+        """
+
+        if self._index is not None:
+            for height in range(count, self.count):
+                self._index.pop(raw.double_sha256(self.header(height)), None)
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        self._file.truncate(count * HEADER_SIZE)
+        self._file.flush()
+        self.count = count
+
+        return None
+
+    def rollback(self, bitcoin):
+        """
+        Drop the stored headers that are no longer in the active chain of the node
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :return: int, number of headers dropped
+        """
+
+        height = blocks.fork_height(bitcoin, self.count - 1, 0, self.block_hash)
+        dropped = self.count - (height + 1)
+
+        if dropped:
+            self.truncate(height + 1)
+
+        return dropped
+
+    def sync(self, bitcoin, batch_size=2000, retries=10):
+        """
+        Roll back headers that were reorganized away and append the new ones, in JSON-RPC batches
+        A batch that fails because the chain changed while syncing is fetched again after rolling back, up to retries
+        times in a row. It fails right away if the chain did not change, as fetching it again would not help.
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :param batch_size: int, optional, default=2000 headers per round trip
+        :param retries: int, optional, default=10
+        :return: int, number of headers appended
+        """
+
+        self.rollback(bitcoin)
+        block_count = blockchain.get_block_count(bitcoin=bitcoin)
+        appended = 0
+        failures = 0
+
+        while self.count <= block_count:
+            heights = range(self.count, min(self.count + batch_size, block_count + 1))
+
+            with blockchain.batch(bitcoin, size=None) as b:
+                tip = b.get_best_block_hash()
+                hashes = [b.get_block_hash(height=height) for height in heights]
+
+            try:
+                with blockchain.batch(bitcoin, size=None) as b:
+                    headers = [b.get_block_header(block_hash=block_hash.result(), verbose=False)
+                               for block_hash in hashes]
+
+                headers = [bytes.fromhex(header.result().rstrip()) for header in headers]
+                self.append(headers)
+            except ValueError:  # A hash reorganized away between the batches, or headers that no longer connect
+                failures += 1
+
+                if failures > retries or (not self.rollback(bitcoin)
+                                          and blockchain.get_best_block_hash(bitcoin=bitcoin) == tip.result()):
+                    raise
+
+                block_count = blockchain.get_block_count(bitcoin=bitcoin)
+                continue
+
+            failures = 0
+            appended += len(headers)
+
+        return appended
+
+    def close(self):
+        """
+        Close the file
+        :return: None
+        """
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        self._file.close()
+
+        return None
@@ -0,0 +1,301 @@
+"""
+Indexer
+Local transaction and script indexes built from raw blocks and kept in SQLite, for nodes running without -txindex:
+the block and position of a transaction, and the history of the transactions paying to or spending from a script,
+are looked up locally instead of walking blocks with get_block(verbosity=2). Blocks are indexed in order, and
+blocks that are reorganized away are removed, at any depth.
+More info: https://developer.bitcoin.org/reference/rpc/gettxoutproof.html
+More info: https://electrumx.readthedocs.io/en/latest/protocol-basics.html#script-hashes
+"""
+
+import hashlib
+import sqlite3
+import threading
+from bitcaviar import blocks
+from bitcaviar import raw
+from bitcaviar.utxo import descriptor_script
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blocks (
+    height INTEGER PRIMARY KEY,
+    hash BLOB NOT NULL,
+    tx_num INTEGER NOT NULL  -- number of the first transaction of the block
+);
+CREATE TABLE IF NOT EXISTS txs (
+    tx_num INTEGER PRIMARY KEY,  -- transactions are numbered in chain order
+    txid BLOB NOT NULL,  -- internal byte order
+    height INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS txs_txid ON txs (txid);
+CREATE TABLE IF NOT EXISTS outputs (
+    tx_num INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    scripthash BLOB NOT NULL,  -- SHA-256 of the script
+    PRIMARY KEY (tx_num, n)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS history (
+    script_key INTEGER NOT NULL,  -- first 8 bytes of scripthash
+    tx_num INTEGER NOT NULL,
+    scripthash BLOB NOT NULL,  -- checked on lookup, as script keys can collide
+    PRIMARY KEY (script_key, tx_num, scripthash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS history_tx_num ON history (tx_num);
+'''
+
+
+def scripthash_key(scripthash):
+    """
+    Get the key a script is indexed by from its Electrum script hash
+    :param scripthash: string, required, SHA-256 of the script, byte-reversed, as hex
+    :return: int
+    """
+
+    return _key(bytes.fromhex(scripthash)[::-1])
+
+
+def _key(digest):
+    return int.from_bytes(digest[:8], 'little', signed=True)
+
+
+class Indexer:
+    """
+    Transaction and script indexes in a SQLite database, kept in sync with the node with sync()
+    Writes are batched in transactions, so an interrupted sync resumes from the last committed block.
+    Scripts are indexed by the first 8 bytes of their SHA-256, see src.bitcaviar.utxo.script_key, and matched on the
+    whole hash.
+    """
+    def __init__(self, path):
+        """
+        :param path: string, required, database file, created if it does not exist
+        """
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def height(self):
+        """Height of the last indexed block, -1 if the index is empty"""
+        row = self._db.execute('SELECT MAX(height) FROM blocks').fetchone()
+        return -1 if row[0] is None else row[0]
+
+    def block_hash(self, height):
+        """
+        Get the hash of an indexed block
+        :param height: int, required
+        :return: string, or None if there is no block at height
+        """
+
+        row = self._db.execute('SELECT hash FROM blocks WHERE height = ?', (height,)).fetchone()
+
+        return None if row is None else raw.hash_to_hex(row[0])
+
+    @property
+    def tip(self):
+        """Hash of the last indexed block, or None if the index is empty"""
+        return self.block_hash(self.height)
+
+    def _next_tx_num(self):
+        row = self._db.execute('SELECT MAX(tx_num) FROM txs').fetchone()
+        return 0 if row[0] is None else row[0] + 1
+
+    def commit(self):
+        """
+        Commit the blocks indexed or removed with commit=False
+        :return: None
+        """
+
+        with self._lock:
+            self._db.commit()
+
+        return None
+
+    def apply(self, block, height, commit=True):
+        """
+        Index a block on top of the others
+        :param block: src.bitcaviar.raw.Block, required
+        :param height: int, required, must be the next height
+        :param commit: boolean, optional, default=True
+        :return: None
+        """
+
+        with self._lock:
+            tip_height = self.height
+
+            if height != tip_height + 1:
+                raise ValueError('Block at height {} does not follow height {}'.format(height, tip_height))
+            elif tip_height >= 0 and block.header.previous_block_hash != self.tip:
+                raise ValueError('Block {} does not extend {}'.format(block.hash, self.tip))
+
+            db = self._db
+            first = self._next_tx_num()
+            in_block = {}  # Transactions spent in the block that created them
+            txs = []
+            outputs = {}
+            history = set()
+
+            for tx_num, tx in enumerate(block, first):
+                txid = bytes.fromhex(tx.txid)[::-1]
+                txs.append((tx_num, txid, height))
+
+                if not tx.is_coinbase:
+                    for tx_in in tx.inputs:
+                        previous = bytes(tx_in.data[tx_in.offset:tx_in.offset + 32])
+
+                        if previous in in_block:
+                            digest = outputs.get((in_block[previous], tx_in.vout))
+                        else:
+                            row = db.execute(
+                                'SELECT scripthash FROM outputs WHERE n = ? AND tx_num = '
+                                '(SELECT MAX(tx_num) FROM txs WHERE txid = ?)', (tx_in.vout, previous)
+                            ).fetchone()
+                            digest = None if row is None else row[0]
+
+                        if digest is None:
+                            raise ValueError('Block {} spends {}:{}, which is not indexed'.format(
+                                block.hash, raw.hash_to_hex(previous), tx_in.vout))
+
+                        history.add((_key(digest), tx_num, digest))
+
+                for n, tx_out in enumerate(tx.outputs):
+                    digest = hashlib.sha256(tx_out.script_pubkey).digest()
+                    outputs[tx_num, n] = digest
+                    history.add((_key(digest), tx_num, digest))
+
+                in_block[txid] = tx_num
+
+            db.execute('INSERT INTO blocks VALUES (?, ?, ?)', (height, bytes.fromhex(block.hash)[::-1], first))
+            db.executemany('INSERT INTO txs VALUES (?, ?, ?)', txs)
+            db.executemany('INSERT INTO outputs VALUES (?, ?, ?)', ((k[0], k[1], v) for k, v in outputs.items()))
+            db.executemany('INSERT INTO history VALUES (?, ?, ?)', history)
+
+            if commit:
+                db.commit()
+
+        return None
+
+    def truncate(self, height, commit=True):
+        """
+        Remove the blocks from height up to the tip
+        :param height: int, required
+        :param commit: boolean, optional, default=True
+        :return: int, number of blocks removed
+        """
+
+        with self._lock:
+            db = self._db
+            row = db.execute('SELECT MIN(tx_num), COUNT(*) FROM blocks WHERE height >= ?', (height,)).fetchone()
+
+            if row[1]:
+                db.execute('DELETE FROM history WHERE tx_num >= ?', (row[0],))
+                db.execute('DELETE FROM outputs WHERE tx_num >= ?', (row[0],))
+                db.execute('DELETE FROM txs WHERE tx_num >= ?', (row[0],))
+                db.execute('DELETE FROM blocks WHERE height >= ?', (height,))
+
+            if commit:
+                db.commit()
+
+        return row[1]
+
+    def rollback(self, bitcoin):
+        """
+        Remove the blocks that are no longer in the active chain of the node
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :return: int, number of blocks removed
+        """
+
+        with self._lock:
+            return self.truncate(blocks.fork_height(bitcoin, self.height, 0, self.block_hash) + 1)
+
+    def sync(self, bitcoin, stop=None, workers=8, commit_every=100, rest=False):
+        """
+        Remove blocks that were reorganized away and index the new ones, fetched as raw blocks
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :param stop: int, optional, default=up to the tip, height not included
+        :param workers: int, optional, default=8 blocks fetched at a time
+        :param commit_every: int, optional, default=100 blocks per transaction
+        :param rest: boolean, optional, default=False, fetch blocks from the REST interface
+        :return: int, number of blocks indexed
+        """
+
+        # apply, commit and rollback lock on their own, so lookups only wait for the block being applied
+        return blocks.sync_raw_blocks(bitcoin, self, stop, workers, commit_every, rest)
+
+    def _tx(self, tx_num, txid, height, first):
+        return {'txid': raw.hash_to_hex(txid), 'height': height, 'position': tx_num - first}
+
+    def get(self, txid):
+        """
+        Get where a transaction is in the chain, e.g. the blockhash to pass to get_tx_out_proof
+        :param txid: string, required
+        :return: dict with txid, height, position and blockhash, or None if the transaction is not indexed
+        """
+
+        return self.get_many([txid])[0]
+
+    def get_many(self, txids, chunk_size=500):
+        """
+        Get where many transactions are in the chain in a few queries
+        :param txids: iterable of strings, required
+        :param chunk_size: int, optional, default=500 txids per query
+        :return: list of dicts, in the same order, with None in place of each transaction not indexed
+        """
+
+        keys = [bytes.fromhex(txid)[::-1] for txid in txids]
+        found = {}
+
+        with self._lock:
+            for i in range(0, len(keys), chunk_size):
+                chunk = keys[i:i + chunk_size]
+                rows = self._db.execute(
+                    'SELECT txs.tx_num, txs.txid, txs.height, blocks.tx_num, blocks.hash FROM txs '
+                    'JOIN blocks ON blocks.height = txs.height WHERE txs.txid IN ({}) ORDER BY txs.tx_num'.format(
+                        ','.join('?' * len(chunk))), chunk
+                ).fetchall()
+
+                for row in rows:  # The last one wins for duplicated txids (BIP30)
+                    found[row[1]] = dict(self._tx(*row[:4]), blockhash=raw.hash_to_hex(row[4]))
+
+        return [found.get(key) for key in keys]
+
+    def history(self, script, start=0, stop=None):
+        """
+        Get the transactions paying to or spending from a script, in chain order
+        :param script: bytes script, string raw() or addr() descriptor, or dict {'scripthash': string}, required
+        :param start: int, optional, default=0, first height
+        :param stop: int, optional, default=up to the tip, height not included
+        :return: list of dicts with txid, height and position
+        """
+
+        if isinstance(script, dict):
+            digest = bytes.fromhex(script['scripthash'])[::-1]
+        else:
+            digest = hashlib.sha256(descriptor_script(script) if isinstance(script, str) else bytes(script)).digest()
+
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT txs.tx_num, txs.txid, txs.height, blocks.tx_num FROM history '
+                'JOIN txs ON txs.tx_num = history.tx_num JOIN blocks ON blocks.height = txs.height '
+                'WHERE history.script_key = ? AND history.scripthash = ? AND txs.height >= ? AND txs.height < ? '
+                'ORDER BY history.tx_num', (_key(digest), digest, start, (1 << 62) if stop is None else stop)
+            ).fetchall()
+
+        return [self._tx(*row) for row in rows]
+
+    def close(self):
+        """
+        Close the database
+        :return: None
+        """
+
+        self._db.close()
+
+        return None
@@ -0,0 +1,250 @@
+"""
+Mempool mirror
+In-memory copy of the node mempool, updated with the txids that were added and removed since the last update
+instead of fetching the whole verbose mempool every time. Entries are fetched without holding the lock, so reads
+are not blocked by the round trips.
+More info: https://developer.bitcoin.org/reference/rpc/getrawmempool.html
+"""
+
+import threading
+from bitcaviar import blockchain
+
+
+class MempoolMirror:
+    """
+    Mirror of the node mempool, with the entries of all transactions and the links between them
+    Entries are kept as returned by get_mempool_entry when the transaction was first seen.
+    """
+    def __init__(self, bitcoin, batch_size=500):
+        """
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :param batch_size: int, optional, default=500 entries per round trip
+        """
+        self.bitcoin = bitcoin
+        self.batch_size = batch_size
+        self.sequence = None
+        self.entries = {}
+        self.parents = {}
+        self.children = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, txid):
+        return txid in self.entries
+
+    def _fetch(self, txids):
+        """Fetch the entries of transactions, without the lock, skipping the ones that left the mempool"""
+
+        with blockchain.batch(self.bitcoin, size=self.batch_size) as b:
+            calls = [(txid, b.get_mempool_entry(txid=txid)) for txid in txids]
+
+        return {txid: call.value for txid, call in calls if call.error is None}
+
+    def _link(self, entries):
+        """Add fetched entries and link them to their in-mempool parents and children, with the lock held"""
+
+        entries = {txid: entry for txid, entry in entries.items() if txid not in self.entries}
+        self.entries.update(entries)
+
+        for txid, entry in entries.items():
+            self.parents.setdefault(txid, set())
+            self.children.setdefault(txid, set())
+
+            for parent in entry['depends']:
+                if parent in self.entries:
+                    self.parents[txid].add(parent)
+                    self.children.setdefault(parent, set()).add(txid)
+
+            for child in entry['spentby']:
+                if child in self.entries:
+                    self.children[txid].add(child)
+                    self.parents.setdefault(child, set()).add(txid)
+
+        return set(entries)
+
+    def _applied(self, sequence):
+        """Whether the change with this mempool sequence is already in the mirror, with the lock held"""
+
+        return sequence is not None and self.sequence is not None and sequence <= self.sequence
+
+    def _advance(self, sequence):
+        if sequence is not None and (self.sequence is None or sequence > self.sequence):
+            self.sequence = sequence
+
+    def snapshot(self):
+        """
+        Drop everything and take the whole mempool from the node
+        :return: None
+        """
+
+        raw_mempool = blockchain.get_raw_mempool(bitcoin=self.bitcoin, mempool_sequence=True)
+        entries = self._fetch(raw_mempool['txids'])
+
+        with self._lock:
+            self.entries.clear()
+            self.parents.clear()
+            self.children.clear()
+            self._link(entries)
+            self.sequence = raw_mempool['mempool_sequence']
+
+        return None
+
+    def update(self):
+        """
+        Compare the txids in the node mempool with the mirror and apply the difference
+        Only the entries of new transactions are fetched, but the whole list of txids is, so when bitcoind publishes
+        the sequence topic prefer src.bitcaviar.notifications.follow_mempool, which applies each change as it comes.
+        :return: tuple (set of added txids, set of removed txids)
+        """
+
+        if self.sequence is None:
+            self.snapshot()
+            return set(self.entries), set()
+
+        raw_mempool = blockchain.get_raw_mempool(bitcoin=self.bitcoin, mempool_sequence=True)
+
+        if raw_mempool['mempool_sequence'] == self.sequence:
+            return set(), set()
+
+        txids = set(raw_mempool['txids'])
+
+        with self._lock:
+            removed = set(self.entries) - txids
+            added = txids - set(self.entries)
+            self.remove(removed)
+
+        entries = self._fetch(added)
+
+        with self._lock:
+            added = self._link(entries)
+            self._advance(raw_mempool['mempool_sequence'])
+
+        return added, removed
+
+    def add(self, txids, sequence=None):
+        """
+        Fetch the entries of new transactions and link them to their in-mempool parents and children
+        Transactions that left the mempool before their entry was fetched are skipped.
+        :param txids: iterable of strings, required
+        :param sequence: int, optional, mempool sequence of the addition, skipped if the mirror is already past it
+        :return: set of added txids
+        """
+
+        with self._lock:
+            if self._applied(sequence):
+                return set()
+
+            txids = [txid for txid in txids if txid not in self.entries]
+
+        entries = self._fetch(txids)
+
+        with self._lock:
+            added = self._link(entries)
+            self._advance(sequence)
+
+        return added
+
+    def remove(self, txids, sequence=None):
+        """
+        Drop transactions that left the mempool
+        :param txids: iterable of strings, required
+        :param sequence: int, optional, mempool sequence of the removal, skipped if the mirror is already past it
+        :return: None
+        """
+
+        with self._lock:
+            if self._applied(sequence):
+                return None
+
+            for txid in txids:
+                self.entries.pop(txid, None)
+
+                for parent in self.parents.pop(txid, ()):
+                    self.children.get(parent, set()).discard(txid)
+
+                for child in self.children.pop(txid, ()):
+                    self.parents.get(child, set()).discard(txid)
+
+            self._advance(sequence)
+
+        return None
+
+    def connect_block(self, blockhash):
+        """
+        Drop the transactions of a new block, which bitcoind does not announce one by one
+        :param blockhash: string, required
+        :return: set of removed txids
+        """
+
+        txids = blockchain.get_block(bitcoin=self.bitcoin, blockhash=blockhash, verbosity=1)['tx']
+
+        with self._lock:
+            removed = {txid for txid in txids if txid in self.entries}
+            self.remove(removed)
+
+        return removed
+
+    def _walk(self, txid, links, verbose):
+        with self._lock:
+            if txid not in self.entries:
+                raise ValueError('Transaction not in mempool')
+
+            found = set()
+            pending = list(links.get(txid, ()))
+
+            while pending:
+                related = pending.pop()
+
+                if related not in found:
+                    found.add(related)
+                    pending.extend(links.get(related, ()))
+
+            if verbose:
+                return {related: self.entries[related] for related in found}
+            else:
+                return list(found)
+
+    def get_raw_mempool(self, verbose=False):
+        """
+        Get all transaction ids in the mirror
+        :param verbose: boolean, optional, default=False
+        :return: if verbose=False returns list, else dict
+        """
+
+        with self._lock:
+            return dict(self.entries) if verbose else list(self.entries)
+
+    def get_mempool_entry(self, txid):
+        """
+        Get mempool data for given transaction, from the mirror
+        :param txid: string, required
+        :return: dict
+        """
+
+        with self._lock:
+            if txid not in self.entries:
+                raise ValueError('Transaction not in mempool')
+
+            return self.entries[txid]
+
+    def get_mempool_ancestors(self, txid, verbose=False):
+        """
+        Get all in-mempool ancestors of a transaction, from the mirror
+        :param txid: string, required
+        :param verbose: boolean, optional, default=False
+        :return: if verbose=False returns list, else dict
+        """
+
+        return self._walk(txid, self.parents, verbose)
+
+    def get_mempool_descendants(self, txid, verbose=False):
+        """
+        Get all in-mempool descendants of a transaction, from the mirror
+        :param txid: string, required
+        :param verbose: boolean, optional, default=False
+        :return: if verbose=False returns list, else dict
+        """
+
+        return self._walk(txid, self.children, verbose)
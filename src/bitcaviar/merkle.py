@@ -0,0 +1,210 @@
+"""
+Merkle proofs
+Local verification of the proofs returned by gettxoutproof (serialized CMerkleBlock): the partial merkle tree is
+rebuilt and its root checked against the block header, with no RPC. Many proofs can be verified at once across
+processes. A proof only shows that the transactions are in the block of its header: check the header against
+a trusted one, e.g. from get_block_header(verbose=False) or a src.bitcaviar.headers.HeaderStore.
+More info: https://github.com/bitcoin/bips/blob/master/bip-0037.mediawiki#partial-merkle-branch-format
+More info: https://developer.bitcoin.org/reference/rpc/gettxoutproof.html
+"""
+
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from bitcaviar import raw
+
+MAX_TRANSACTIONS = 4000000 // 240  # Maximum block weight / minimum transaction weight
+
+
+def _width(total, height):
+    return (total + (1 << height) - 1) >> height
+
+
+class MerkleBlock:
+    """
+    Serialized CMerkleBlock: a block header and a partial merkle tree of its transactions
+    """
+    __slots__ = ('data', 'header', 'total', 'hashes', 'flags')
+
+    def __init__(self, data):
+        """
+        :param data: bytes-like object or hex string, required
+        """
+        if isinstance(data, str):
+            data = bytes.fromhex(data)
+
+        self.data = memoryview(data)
+
+        try:
+            self.header = raw.BlockHeader(self.data)
+            self.total = struct.unpack_from('<I', self.data, 80)[0]
+            count, offset = raw.read_varint(self.data, 84)
+            self.hashes = [bytes(self.data[i:i + 32]) for i in range(offset, offset + 32 * count, 32)]
+            offset += 32 * count
+            size, offset = raw.read_varint(self.data, offset)
+            self.flags = bytes(self.data[offset:offset + size])
+        except (IndexError, struct.error):
+            raise ValueError('Truncated proof')
+
+        if len(self.hashes) != count or len(self.flags) != size:
+            raise ValueError('Truncated proof')
+        elif offset + size != len(self.data):
+            raise ValueError('Trailing data after proof')
+
+    @property
+    def block_hash(self):
+        return self.header.hash
+
+    def extract(self):
+        """
+        Rebuild the partial merkle tree, with the same checks as bitcoind
+        :return: tuple (bytes merkle root in internal byte order, list of string txids of the matched transactions)
+        """
+
+        total, hashes, flags = self.total, self.hashes, self.flags
+
+        if total == 0 or total > MAX_TRANSACTIONS:
+            raise ValueError('Invalid number of transactions: {}'.format(total))
+
+        if len(hashes) > total or len(flags) * 8 < len(hashes):
+            raise ValueError('Invalid partial merkle tree')
+
+        height = 0
+
+        while _width(total, height) > 1:
+            height += 1
+
+        bits_used = 0
+        hashes_used = 0
+        matches = []
+
+        def traverse(height, position):
+            nonlocal bits_used, hashes_used
+
+            if bits_used >= len(flags) * 8:
+                raise ValueError('Partial merkle tree uses more bits than it has')
+
+            parent_of_match = flags[bits_used >> 3] >> (bits_used & 7) & 1
+            bits_used += 1
+
+            if height == 0 or not parent_of_match:
+                if hashes_used >= len(hashes):
+                    raise ValueError('Partial merkle tree uses more hashes than it has')
+
+                node = hashes[hashes_used]
+                hashes_used += 1
+
+                if height == 0 and parent_of_match:
+                    matches.append(node)
+
+                return node
+
+            left = traverse(height - 1, position * 2)
+
+            if position * 2 + 1 < _width(total, height - 1):
+                right = traverse(height - 1, position * 2 + 1)
+
+                if right == left:  # CVE-2012-2459: a duplicated subtree would fake another transaction list
+                    raise ValueError('Invalid partial merkle tree: identical children')
+            else:
+                right = left
+
+            return raw.double_sha256(left, right)
+
+        root = traverse(height, 0)
+
+        if (bits_used + 7) // 8 != len(flags) or hashes_used != len(hashes):
+            raise ValueError('Partial merkle tree has unused bits or hashes')
+
+        return root, [raw.hash_to_hex(txid) for txid in matches]
+
+
+def _check(proof):
+    """Verify a proof against its own header, returning the header and the txids, or the error"""
+
+    try:
+        merkle_block = MerkleBlock(proof)
+        root, txids = merkle_block.extract()
+    except ValueError as error:
+        return error
+
+    if root != bytes(merkle_block.header.data[36:68]):
+        return ValueError('Merkle root of the proof does not match its header')
+
+    return bytes(merkle_block.header.data), txids
+
+
+def _trust(checked, headers=None, store=None):
+    """Check that the header of a verified proof is a trusted one"""
+
+    if isinstance(checked, ValueError):
+        return checked
+
+    header, txids = checked
+    block_hash = raw.hash_to_hex(raw.double_sha256(header))
+
+    if headers is not None:
+        expected = headers.get(block_hash)
+
+        if expected is None:
+            return ValueError('Block {} not in headers'.format(block_hash))
+        elif (bytes.fromhex(expected) if isinstance(expected, str) else bytes(expected)) != header:
+            return ValueError('Header of block {} does not match'.format(block_hash))
+
+    if store is not None and store.height(block_hash) is None:
+        return ValueError('Block {} not found in the header store'.format(block_hash))
+
+    return txids
+
+
+def verify_proof(proof, header=None, store=None):
+    """
+    Verify a proof locally, as verifytxoutproof does
+    :param proof: string or bytes, required, as returned by get_tx_out_proof
+    :param header: string or bytes, optional, trusted raw header of the block, e.g. get_block_header(verbose=False)
+    :param store: src.bitcaviar.headers.HeaderStore, optional, the block must be in it
+    :return: list of strings, txids the proof commits to
+    """
+
+    headers = None
+
+    if header is not None:
+        header = bytes.fromhex(header) if isinstance(header, str) else bytes(header)
+        headers = {raw.hash_to_hex(raw.double_sha256(header)): header}
+
+    result = _trust(_check(proof), headers, store)
+
+    if isinstance(result, ValueError):
+        raise result
+
+    return result
+
+
+def _check_many(proofs):
+    """Verify proofs in a worker process"""
+
+    return [_check(proof) for proof in proofs]
+
+
+def verify_proofs(proofs, headers=None, store=None, workers=None, chunk_size=500):
+    """
+    Verify many proofs locally, splitting them across processes
+    :param proofs: list of strings or bytes, required
+    :param headers: dict, optional, block hash to trusted raw header (string or bytes), the block must be in it
+    :param store: src.bitcaviar.headers.HeaderStore, optional, the block must be in it
+    :param workers: int, optional, default=number of CPUs, 1 to verify in this process
+    :param chunk_size: int, optional, default=500 proofs per task
+    :return: list of the txids of each proof, in the same order, with a ValueError in place of each invalid one
+    """
+
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(proofs) <= chunk_size:
+        checked = _check_many(proofs)
+    else:
+        chunks = [proofs[i:i + chunk_size] for i in range(0, len(proofs), chunk_size)]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            checked = [result for results in executor.map(_check_many, chunks) for result in results]
+
+    return [_trust(result, headers, store) for result in checked]
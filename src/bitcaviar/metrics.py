@@ -0,0 +1,235 @@
+"""
+RPC metrics
+Per-method histograms of where the time of each call goes, and how big responses are:
+- spawn: starting bitcoin-cli
+- wire: waiting for the response (network and node time)
+- parse: decoding JSON
+- total: the whole blockchain function call
+Disabled by default; while disabled, instrumented code only checks the enabled flag.
+Export with snapshot() as a dict or prometheus() in the Prometheus text format.
+"""
+
+import bisect
+import threading
+
+SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+                   60)
+BYTES_BUCKETS = tuple(64 * 4 ** i for i in range(13))  # 64 bytes to 1 GB
+
+enabled = False
+
+_lock = threading.Lock()
+_histograms = {}
+_errors = {}
+_hooks = []
+
+
+class Histogram:
+    """
+    Histogram with fixed bucket bounds
+    """
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        """
+        :param bounds: tuple of numbers, required, upper bounds of the buckets, sorted
+        """
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last bucket is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Get the number of values less than or equal to each bound
+        :return: list of tuples (bound, count), the last bound is inf
+        """
+
+        total = 0
+        buckets = []
+
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            buckets.append((bound, total))
+
+        return buckets
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket where it falls
+        :param q: float, required, between 0 and 1
+        :return: number, or None if there are no values
+        """
+
+        if not self.count:
+            return None
+
+        for bound, count in self.cumulative():
+            if count >= q * self.count:
+                return bound
+
+
+def enable():
+    """
+    Start recording metrics
+    :return: None
+    """
+
+    global enabled
+    enabled = True
+
+    return None
+
+
+def disable():
+    """
+    Stop recording metrics
+    :return: None
+    """
+
+    global enabled
+    enabled = False
+
+    return None
+
+
+def reset():
+    """
+    Drop all recorded metrics
+    :return: None
+    """
+
+    with _lock:
+        _histograms.clear()
+        _errors.clear()
+
+    return None
+
+
+def add_hook(hook):
+    """
+    Call hook(method, phase, value) for every value recorded, e.g. to forward them to another metrics system
+    Phase is spawn, wire, parse, total, bytes or error.
+    :param hook: function, required
+    :return: None
+    """
+
+    _hooks.append(hook)
+
+    return None
+
+
+def remove_hook(hook):
+    """
+    Stop calling a hook
+    :param hook: function, required
+    :return: None
+    """
+
+    _hooks.remove(hook)
+
+    return None
+
+
+def observe(method, phase, value):
+    """
+    Record a value
+    :param method: string, required, RPC method, e.g. getblock
+    :param phase: string, required, spawn, wire, parse, total or bytes
+    :param value: number, required, seconds, or bytes for phase bytes
+    :return: None
+    """
+
+    key = (method, phase)
+
+    with _lock:
+        histogram = _histograms.get(key)
+
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(BYTES_BUCKETS if phase == 'bytes' else SECONDS_BUCKETS)
+
+        histogram.observe(value)
+
+    for hook in _hooks:
+        hook(method, phase, value)
+
+    return None
+
+
+def error(method):
+    """
+    Count a failed call
+    :param method: string, required
+    :return: None
+    """
+
+    with _lock:
+        _errors[method] = _errors.get(method, 0) + 1
+
+    for hook in _hooks:
+        hook(method, 'error', 1)
+
+    return None
+
+
+def snapshot():
+    """
+    Get all metrics
+    :return: dict, method to {phase: {count, sum, p50, p99, buckets}, errors: int}
+    """
+
+    result = {}
+
+    with _lock:
+        for (method, phase), histogram in _histograms.items():
+            result.setdefault(method, {'errors': 0})[phase] = {
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'p50': histogram.quantile(0.5),
+                'p99': histogram.quantile(0.99),
+                'buckets': histogram.cumulative(),
+            }
+
+        for method, count in _errors.items():
+            result.setdefault(method, {'errors': 0})['errors'] = count
+
+    return result
+
+
+def prometheus(prefix='bitcaviar_rpc'):
+    """
+    Get all metrics in the Prometheus text exposition format
+    :param prefix: string, optional, default=bitcaviar_rpc
+    :return: string
+    """
+
+    seconds = []
+    sizes = []
+
+    with _lock:
+        for (method, phase), histogram in sorted(_histograms.items()):
+            if phase == 'bytes':
+                name, labels, lines = prefix + '_response_bytes', 'method="{}"'.format(method), sizes
+            else:
+                name, labels, lines = prefix + '_seconds', 'method="{}",phase="{}"'.format(method, phase), seconds
+
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, le, count))
+
+            lines.append('{}_sum{{{}}} {}'.format(name, labels, histogram.sum))
+            lines.append('{}_count{{{}}} {}'.format(name, labels, histogram.count))
+
+        errors = ['{}_errors_total{{method="{}"}} {}'.format(prefix, method, count)
+                  for method, count in sorted(_errors.items())]
+
+    output = ['# TYPE {}_seconds histogram'.format(prefix)] + seconds
+    output += ['# TYPE {}_response_bytes histogram'.format(prefix)] + sizes
+    output += ['# TYPE {}_errors_total counter'.format(prefix)] + errors
+
+    return '\n'.join(output) + '\n'
@@ -0,0 +1,421 @@
+"""
+ZMQ notifications
+Subscriber for the hashblock, hashtx, rawblock, rawtx and sequence topics that bitcoind publishes when started with
+-zmqpub<topic>=tcp://host:port. It speaks ZMTP 3.0 directly over TCP, so pyzmq is not needed.
+Each topic has its own sequence number; when one is skipped, the missed state is recovered with the RPCs.
+More info: https://github.com/bitcoin/bitcoin/blob/master/doc/zmq.md
+More info: https://rfc.zeromq.org/spec/23/
+"""
+
+import asyncio
+import selectors
+import socket
+import struct
+from bitcaviar import blockchain
+
+TOPICS = ('hashblock', 'hashtx', 'rawblock', 'rawtx', 'sequence')
+
+FLAG_MORE = 0x01
+FLAG_LONG = 0x02
+FLAG_COMMAND = 0x04
+
+
+def greeting(as_server=False):
+    """
+    Get the ZMTP 3.0 greeting for the NULL security mechanism
+    :param as_server: boolean, optional, default=False
+    :return: bytes
+    """
+
+    return b'\xff' + bytes(8) + b'\x7f' + bytes([3, 0]) + b'NULL'.ljust(20, b'\x00') + bytes([as_server]) + bytes(31)
+
+
+def encode_frame(body, more=False, command=False):
+    """
+    Encode a ZMTP frame
+    :param body: bytes, required
+    :param more: boolean, optional, default=False, more frames of the same message follow
+    :param command: boolean, optional, default=False
+    :return: bytes
+    """
+
+    flags = (FLAG_MORE if more else 0) | (FLAG_COMMAND if command else 0)
+
+    if len(body) > 255:
+        return bytes([flags | FLAG_LONG]) + struct.pack('>Q', len(body)) + body
+    else:
+        return bytes([flags, len(body)]) + body
+
+
+def ready_command(socket_type):
+    """
+    Encode the READY command sent after the greeting
+    :param socket_type: string, required, SUB or PUB
+    :return: bytes
+    """
+
+    body = b'\x05READY' + b'\x0bSocket-Type' + struct.pack('>I', len(socket_type)) + socket_type.encode()
+
+    return encode_frame(body, command=True)
+
+
+def decode_frames(buffer):
+    """
+    Decode all complete messages at the start of a buffer and remove them from it
+    :param buffer: bytearray, required
+    :return: list of tuples (boolean command, list of bytes frames)
+    """
+
+    messages = []
+    frames = []
+    position = 0
+    start = 0
+
+    while position + 2 <= len(buffer):
+        flags = buffer[position]
+
+        if flags & FLAG_LONG:
+            if position + 9 > len(buffer):
+                break
+
+            size = struct.unpack_from('>Q', buffer, position + 1)[0]
+            header = 9
+        else:
+            size = buffer[position + 1]
+            header = 2
+
+        if position + header + size > len(buffer):
+            break
+
+        frames.append(bytes(buffer[position + header:position + header + size]))
+        position += header + size
+
+        if not flags & FLAG_MORE:
+            messages.append((bool(flags & FLAG_COMMAND), frames))
+            frames = []
+            start = position
+
+    del buffer[:start]
+
+    return messages
+
+
+def parse_address(address):
+    """
+    Split a ZMQ TCP address
+    :param address: string, required, tcp://host:port
+    :return: tuple (string host, int port)
+    """
+
+    if not address.startswith('tcp://'):
+        raise ValueError('Only tcp:// addresses are supported: {}'.format(address))
+
+    host, _, port = address[len('tcp://'):].rpartition(':')
+
+    return host.strip('[]'), int(port)
+
+
+class Notification:
+    """
+    Message published by bitcoind
+    """
+    __slots__ = ('topic', 'body', 'sequence', 'recovered')
+
+    def __init__(self, topic, body, sequence=None, recovered=False):
+        """
+        :param topic: string, required
+        :param body: bytes, required
+        :param sequence: int, optional, None if recovered with the RPCs
+        :param recovered: boolean, optional, default=False, True if it was fetched with the RPCs after a gap
+        """
+        self.topic = topic
+        self.body = body
+        self.sequence = sequence
+        self.recovered = recovered
+
+    @property
+    def hash(self):
+        """Block or transaction hash as a hex string, for hashblock, hashtx and sequence"""
+        return self.body[:32].hex()
+
+    @property
+    def label(self):
+        """
+        Event of a sequence notification:
+        C block connected, D block disconnected, A transaction added to the mempool, R transaction removed
+        """
+        return chr(self.body[32])
+
+    @property
+    def mempool_sequence(self):
+        """Mempool sequence of a sequence notification with label A or R"""
+        return struct.unpack_from('<Q', self.body, 33)[0] if len(self.body) >= 41 else None
+
+    def __repr__(self):
+        return '<Notification {} sequence={}>'.format(self.topic, self.sequence)
+
+
+class _Connection:
+    """Subscription to the topics published on one address"""
+    def __init__(self, address, topics, timeout):
+        self.address = address
+        self.socket = socket.create_connection(parse_address(address), timeout=timeout)
+        self.buffer = bytearray()
+        self.socket.sendall(greeting())
+        self._receive_exactly(64)
+
+        if self.buffer[0] != 0xff or self.buffer[10] < 3:
+            raise ValueError('{} does not speak ZMTP 3'.format(address))
+
+        del self.buffer[:64]
+        self.socket.sendall(ready_command('SUB'))
+
+        while not self._ready():  # Wait for the READY command of the publisher
+            self._receive()
+
+        for topic in topics:
+            self.socket.sendall(encode_frame(b'\x01' + topic.encode()))
+
+        self.socket.settimeout(None)
+
+    def _ready(self):
+        return any(command and frames[0][1:6] == b'READY' for command, frames in decode_frames(self.buffer))
+
+    def _receive(self):
+        data = self.socket.recv(1 << 16)
+
+        if not data:
+            raise ConnectionError('{} closed the connection'.format(self.address))
+
+        self.buffer += data
+
+    def _receive_exactly(self, size):
+        while len(self.buffer) < size:
+            self._receive()
+
+    def receive(self):
+        self._receive()
+
+        return self.messages()
+
+    def messages(self):
+        return [frames for command, frames in decode_frames(self.buffer) if not command]
+
+    def close(self):
+        self.socket.close()
+
+
+class Subscriber:
+    """
+    Receive bitcoind notifications, as an iterator, an async iterator, or through callbacks with run().
+    With bitcoin set, a skipped hashblock or rawblock notification is replaced by one for the current tip,
+    fetched with the RPCs and marked as recovered. Gap callbacks are called for every gap in any topic.
+    """
+    def __init__(self, endpoints, bitcoin=None, timeout=10):
+        """
+        :param endpoints: dict, required, topic to address, e.g. {'hashblock': 'tcp://127.0.0.1:28332'}
+        :param bitcoin: src.bitcaviar.config.Bitcoin, optional, used to recover from gaps
+        :param timeout: int, optional, default=10 seconds to connect
+        """
+        for topic in endpoints:
+            if topic not in TOPICS:
+                raise ValueError('Unknown topic: {}'.format(topic))
+
+        self.endpoints = endpoints
+        self.bitcoin = bitcoin
+        self.timeout = timeout
+        self.sequences = {}
+        self.gaps = 0
+        self._callbacks = {}
+        self._gap_callbacks = []
+        self._connections = []
+        self._pending = []
+        self._selector = None
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def on(self, topic, callback):
+        """
+        Call callback(notification) for every notification of a topic received by run()
+        :param topic: string, required
+        :param callback: function, required
+        :return: None
+        """
+
+        self._callbacks.setdefault(topic, []).append(callback)
+
+        return None
+
+    def on_gap(self, callback):
+        """
+        Call callback(topic, expected sequence, received sequence) when notifications were missed
+        :param callback: function, required
+        :return: None
+        """
+
+        self._gap_callbacks.append(callback)
+
+        return None
+
+    def connect(self):
+        """
+        Connect to every address and subscribe to its topics
+        :return: None
+        """
+
+        addresses = {}
+
+        for topic, address in self.endpoints.items():
+            addresses.setdefault(address, []).append(topic)
+
+        self._selector = selectors.DefaultSelector()
+
+        for address, topics in addresses.items():
+            connection = _Connection(address, topics, self.timeout)
+            self._connections.append(connection)
+            self._selector.register(connection.socket, selectors.EVENT_READ, connection)
+
+        return None
+
+    def receive(self, timeout=None):
+        """
+        Wait for the next notification
+        :param timeout: float, optional, default=wait forever
+        :return: src.bitcaviar.notifications.Notification, or None on timeout
+        """
+
+        if self._selector is None:
+            self.connect()
+
+        while not self._pending:
+            events = self._selector.select(timeout)
+
+            if not events:
+                return None
+
+            for key, mask in events:
+                for frames in key.data.receive():
+                    self._pending.extend(self._check(frames))
+
+        return self._pending.pop(0)
+
+    def _check(self, frames):
+        topic = frames[0].decode()
+        body = frames[1] if len(frames) > 1 else b''
+        sequence = struct.unpack('<I', frames[2])[0] if len(frames) > 2 else None
+        notifications = []
+        last = self.sequences.get(topic)
+
+        if sequence is not None:
+            self.sequences[topic] = sequence
+
+        if last is not None and sequence is not None and sequence != (last + 1) & 0xffffffff:
+            self.gaps += 1
+
+            for callback in self._gap_callbacks:
+                callback(topic, (last + 1) & 0xffffffff, sequence)
+
+            notifications.extend(self.recover(topic))
+
+        notifications.append(Notification(topic, body, sequence))
+
+        return notifications
+
+    def recover(self, topic):
+        """
+        Fetch with the RPCs what a topic would have published for the current tip
+        :param topic: string, required
+        :return: list of src.bitcaviar.notifications.Notification, empty if the topic can't be recovered
+        """
+
+        if self.bitcoin is None or topic not in ('hashblock', 'rawblock'):
+            return []
+
+        tip = blockchain.get_best_block_hash(bitcoin=self.bitcoin)
+
+        if topic == 'hashblock':
+            body = bytes.fromhex(tip)
+        else:
+            body = bytes.fromhex(blockchain.get_block(bitcoin=self.bitcoin, blockhash=tip, verbosity=0).rstrip())
+
+        return [Notification(topic, body, recovered=True)]
+
+    def run(self, count=None):
+        """
+        Receive notifications and pass them to the callbacks of their topic
+        :param count: int, optional, default=run forever
+        :return: None
+        """
+
+        received = 0
+
+        while count is None or received < count:
+            notification = self.receive()
+
+            for callback in self._callbacks.get(notification.topic, ()):
+                callback(notification)
+
+            received += 1
+
+        return None
+
+    def __iter__(self):
+        while True:
+            yield self.receive()
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            yield await loop.run_in_executor(None, self.receive)
+
+    def close(self):
+        """
+        Close all connections
+        :return: None
+        """
+
+        for connection in self._connections:
+            connection.close()
+
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+
+        self._connections = []
+
+        return None
+
+
+def follow_mempool(subscriber, mirror):
+    """
+    Keep a src.bitcaviar.mempool.MempoolMirror up to date with the sequence topic
+    Added and removed transactions are applied one by one, skipping those the mirror is already past, connected
+    blocks drop their transactions, and a gap triggers a new snapshot. Transactions that return to the mempool when
+    a block is disconnected are announced as added.
+    :param subscriber: src.bitcaviar.notifications.Subscriber, required, subscribed to sequence
+    :param mirror: src.bitcaviar.mempool.MempoolMirror, required
+    :return: None
+    """
+
+    def on_sequence(notification):
+        if notification.label == 'A':
+            mirror.add([notification.hash], notification.mempool_sequence)
+        elif notification.label == 'R':
+            mirror.remove([notification.hash], notification.mempool_sequence)
+        elif notification.label == 'C':  # Transactions confirmed by a block are not announced one by one
+            mirror.connect_block(notification.hash)
+
+    def on_gap(topic, expected, received):
+        if topic == 'sequence':
+            mirror.snapshot()
+
+    subscriber.on('sequence', on_sequence)
+    subscriber.on_gap(on_gap)
+
+    return None
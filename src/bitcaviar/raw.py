@@ -0,0 +1,341 @@
+"""
+Raw block and transaction parser
+Reads the binary serialization returned by getblock with verbosity=0 or the REST .bin endpoints.
+Nothing is copied or decoded until it is accessed: objects keep a memoryview over the raw bytes and offsets into it.
+More info: https://developer.bitcoin.org/reference/block_chain.html
+"""
+
+import hashlib
+import struct
+
+
+def double_sha256(*data):
+    """
+    Hash data with SHA-256 twice
+    :param data: bytes-like objects, hashed as if they were concatenated
+    :return: bytes
+    """
+
+    sha256 = hashlib.sha256()
+
+    for chunk in data:
+        sha256.update(chunk)
+
+    return hashlib.sha256(sha256.digest()).digest()
+
+
+def read_varint(data, offset):
+    """
+    Read a CompactSize unsigned integer
+    :param data: memoryview, required
+    :param offset: int, required
+    :return: tuple (int value, int offset after it)
+    """
+
+    prefix = data[offset]
+
+    if prefix < 0xfd:
+        return prefix, offset + 1
+    elif prefix == 0xfd:
+        return struct.unpack_from('<H', data, offset + 1)[0], offset + 3
+    elif prefix == 0xfe:
+        return struct.unpack_from('<I', data, offset + 1)[0], offset + 5
+    else:
+        return struct.unpack_from('<Q', data, offset + 1)[0], offset + 9
+
+
+def hash_to_hex(data):
+    """
+    Convert a hash from its internal byte order to the hex string used by the RPCs
+    :param data: bytes-like object, required
+    :return: string
+    """
+
+    return bytes(data)[::-1].hex()
+
+
+class BlockHeader:
+    """
+    80-byte block header
+    """
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        """
+        :param data: bytes-like object, required
+        """
+        self.data = memoryview(data)[:80]
+
+    @property
+    def version(self):
+        return struct.unpack_from('<i', self.data, 0)[0]
+
+    @property
+    def previous_block_hash(self):
+        return hash_to_hex(self.data[4:36])
+
+    @property
+    def merkle_root(self):
+        return hash_to_hex(self.data[36:68])
+
+    @property
+    def time(self):
+        return struct.unpack_from('<I', self.data, 68)[0]
+
+    @property
+    def bits(self):
+        return struct.unpack_from('<I', self.data, 72)[0]
+
+    @property
+    def nonce(self):
+        return struct.unpack_from('<I', self.data, 76)[0]
+
+    @property
+    def hash(self):
+        return hash_to_hex(double_sha256(self.data))
+
+
+class TxIn:
+    """
+    Transaction input
+    """
+    __slots__ = ('data', 'offset', 'script_end')
+
+    def __init__(self, data, offset):
+        """
+        :param data: memoryview, required
+        :param offset: int, required, where the input starts
+        """
+        self.data = data
+        self.offset = offset
+        length, script_offset = read_varint(data, offset + 36)
+        self.script_end = script_offset + length
+
+    @property
+    def txid(self):
+        return hash_to_hex(self.data[self.offset:self.offset + 32])
+
+    @property
+    def vout(self):
+        return struct.unpack_from('<I', self.data, self.offset + 32)[0]
+
+    @property
+    def script_sig(self):
+        length, script_offset = read_varint(self.data, self.offset + 36)
+        return self.data[script_offset:self.script_end]
+
+    @property
+    def sequence(self):
+        return struct.unpack_from('<I', self.data, self.script_end)[0]
+
+    @property
+    def is_coinbase(self):
+        return self.vout == 0xffffffff and not any(self.data[self.offset:self.offset + 32])
+
+    @property
+    def size(self):
+        return self.script_end + 4 - self.offset
+
+
+class TxOut:
+    """
+    Transaction output
+    """
+    __slots__ = ('data', 'offset', 'script_offset', 'script_end')
+
+    def __init__(self, data, offset):
+        """
+        :param data: memoryview, required
+        :param offset: int, required, where the output starts
+        """
+        self.data = data
+        self.offset = offset
+        length, self.script_offset = read_varint(data, offset + 8)
+        self.script_end = self.script_offset + length
+
+    @property
+    def value(self):
+        """Amount in satoshis"""
+        return struct.unpack_from('<q', self.data, self.offset)[0]
+
+    @property
+    def script_pubkey(self):
+        return self.data[self.script_offset:self.script_end]
+
+    @property
+    def size(self):
+        return self.script_end - self.offset
+
+
+class Transaction:
+    """
+    Transaction, with or without witness data
+    Creating one only walks the serialization to find where each part starts.
+    """
+    __slots__ = ('data', 'offset', 'end', 'segwit', 'inputs_offset', 'input_count', 'outputs_offset',
+                 'output_count', 'witness_offset', 'locktime_offset')
+
+    def __init__(self, data, offset=0):
+        """
+        :param data: bytes-like object, required
+        :param offset: int, optional, default=0, where the transaction starts
+        """
+        data = memoryview(data)
+        self.data = data
+        self.offset = offset
+        position = offset + 4
+        self.segwit = data[position] == 0 and data[position + 1] != 0  # Marker and flag
+
+        if self.segwit:
+            position += 2
+
+        self.input_count, position = read_varint(data, position)
+        self.inputs_offset = position
+
+        for _ in range(self.input_count):
+            length, position = read_varint(data, position + 36)
+            position += length + 4
+
+        self.output_count, position = read_varint(data, position)
+        self.outputs_offset = position
+
+        for _ in range(self.output_count):
+            length, position = read_varint(data, position + 8)
+            position += length
+
+        self.witness_offset = position
+
+        if self.segwit:
+            for _ in range(self.input_count):
+                items, position = read_varint(data, position)
+
+                for _ in range(items):
+                    length, position = read_varint(data, position)
+                    position += length
+
+        self.locktime_offset = position
+        self.end = position + 4
+
+    @property
+    def version(self):
+        return struct.unpack_from('<i', self.data, self.offset)[0]
+
+    @property
+    def locktime(self):
+        return struct.unpack_from('<I', self.data, self.locktime_offset)[0]
+
+    @property
+    def size(self):
+        return self.end - self.offset
+
+    @property
+    def raw(self):
+        return self.data[self.offset:self.end]
+
+    @property
+    def txid(self):
+        if self.segwit:  # The txid does not commit to the marker, flag and witness
+            return hash_to_hex(double_sha256(
+                self.data[self.offset:self.offset + 4],
+                self.data[self.offset + 6:self.witness_offset],
+                self.data[self.locktime_offset:self.end]
+            ))
+        else:
+            return hash_to_hex(double_sha256(self.raw))
+
+    @property
+    def wtxid(self):
+        return hash_to_hex(double_sha256(self.raw))
+
+    @property
+    def inputs(self):
+        inputs = []
+        position = self.inputs_offset
+
+        for _ in range(self.input_count):
+            tx_in = TxIn(self.data, position)
+            inputs.append(tx_in)
+            position = tx_in.script_end + 4
+
+        return inputs
+
+    @property
+    def outputs(self):
+        outputs = []
+        position = self.outputs_offset
+
+        for _ in range(self.output_count):
+            tx_out = TxOut(self.data, position)
+            outputs.append(tx_out)
+            position = tx_out.script_end
+
+        return outputs
+
+    @property
+    def witnesses(self):
+        """List of witness stacks, one per input, each a list of memoryviews"""
+        witnesses = []
+        position = self.witness_offset
+
+        for _ in range(self.input_count if self.segwit else 0):
+            items, position = read_varint(self.data, position)
+            stack = []
+
+            for _ in range(items):
+                length, position = read_varint(self.data, position)
+                stack.append(self.data[position:position + length])
+                position += length
+
+            witnesses.append(stack)
+
+        return witnesses
+
+    @property
+    def is_coinbase(self):
+        return self.input_count == 1 and self.inputs[0].is_coinbase
+
+
+class Block:
+    """
+    Block with its header and transactions
+    Transactions are located the first time they are accessed.
+    """
+    __slots__ = ('data', 'header', 'tx_count', 'tx_offset', '_transactions')
+
+    def __init__(self, data):
+        """
+        :param data: bytes-like object, required
+        """
+        self.data = memoryview(data)
+        self.header = BlockHeader(self.data)
+        self.tx_count, self.tx_offset = read_varint(self.data, 80)
+        self._transactions = None
+
+    @property
+    def hash(self):
+        return self.header.hash
+
+    @property
+    def transactions(self):
+        if self._transactions is None:
+            transactions = []
+            position = self.tx_offset
+
+            for _ in range(self.tx_count):
+                transaction = Transaction(self.data, position)
+                transactions.append(transaction)
+                position = transaction.end
+
+            self._transactions = transactions
+
+        return self._transactions
+
+    @property
+    def txids(self):
+        return [transaction.txid for transaction in self.transactions]
+
+    def __iter__(self):
+        return iter(self.transactions)
+
+    def __len__(self):
+        return self.tx_count
@@ -0,0 +1,123 @@
+"""
+Typed results
+Compact alternatives to the dicts returned by some blockchain functions, selected with typed=True.
+Hashes are kept as 32-byte bytes (same byte order as their hex string) and amounts as integer satoshis.
+"""
+
+SATOSHIS_PER_BITCOIN = 100000000
+
+
+def to_satoshis(amount):
+    """
+    Convert an amount in bitcoins to satoshis
+    :param amount: float, required
+    :return: int
+    """
+
+    return round(amount * SATOSHIS_PER_BITCOIN)
+
+
+def to_hash(hex_hash):
+    """
+    Convert a hex hash to bytes
+    :param hex_hash: string or None, required
+    :return: bytes or None
+    """
+
+    return bytes.fromhex(hex_hash) if hex_hash is not None else None
+
+
+class BlockHeader:
+    """
+    Result of getblockheader with verbose=True
+    """
+    __slots__ = ('hash', 'confirmations', 'height', 'version', 'merkle_root', 'time', 'median_time', 'nonce', 'bits',
+                 'difficulty', 'chain_work', 'n_tx', 'previous_block_hash', 'next_block_hash')
+
+    def __init__(self, header):
+        """
+        :param header: dict, required, as returned by getblockheader
+        """
+        self.hash = bytes.fromhex(header['hash'])
+        self.confirmations = header['confirmations']
+        self.height = header['height']
+        self.version = header['version']
+        self.merkle_root = bytes.fromhex(header['merkleroot'])
+        self.time = header['time']
+        self.median_time = header['mediantime']
+        self.nonce = header['nonce']
+        self.bits = int(header['bits'], 16)
+        self.difficulty = header['difficulty']
+        self.chain_work = bytes.fromhex(header['chainwork'])
+        self.n_tx = header['nTx']
+        self.previous_block_hash = to_hash(header.get('previousblockhash'))
+        self.next_block_hash = to_hash(header.get('nextblockhash'))
+
+    def __repr__(self):
+        return '<BlockHeader {} height={}>'.format(self.hash.hex(), self.height)
+
+
+class Block(BlockHeader):
+    """
+    Result of getblock with verbosity=1 or 2
+    tx holds the txids as bytes with verbosity=1, and the transaction dicts with verbosity=2
+    """
+    __slots__ = ('size', 'stripped_size', 'weight', 'tx')
+
+    def __init__(self, block):
+        """
+        :param block: dict, required, as returned by getblock
+        """
+        super().__init__(block)
+        self.size = block['size']
+        self.stripped_size = block['strippedsize']
+        self.weight = block['weight']
+        self.tx = [bytes.fromhex(tx) if isinstance(tx, str) else tx for tx in block['tx']]
+
+    def __repr__(self):
+        return '<Block {} height={}>'.format(self.hash.hex(), self.height)
+
+
+class MempoolEntry:
+    """
+    Result of getmempoolentry, and of each entry of getrawmempool with verbose=True
+    """
+    __slots__ = ('vsize', 'weight', 'time', 'height', 'descendant_count', 'descendant_size', 'ancestor_count',
+                 'ancestor_size', 'wtxid', 'base_fee', 'modified_fee', 'ancestor_fees', 'descendant_fees', 'depends',
+                 'spent_by', 'bip125_replaceable', 'unbroadcast')
+
+    def __init__(self, entry):
+        """
+        :param entry: dict, required, as returned by getmempoolentry
+        """
+        fees = entry['fees']
+        self.vsize = entry['vsize']
+        self.weight = entry.get('weight')
+        self.time = entry['time']
+        self.height = entry['height']
+        self.descendant_count = entry['descendantcount']
+        self.descendant_size = entry['descendantsize']
+        self.ancestor_count = entry['ancestorcount']
+        self.ancestor_size = entry['ancestorsize']
+        self.wtxid = bytes.fromhex(entry['wtxid'])
+        self.base_fee = to_satoshis(fees['base'])
+        self.modified_fee = to_satoshis(fees['modified'])
+        self.ancestor_fees = to_satoshis(fees['ancestor'])
+        self.descendant_fees = to_satoshis(fees['descendant'])
+        self.depends = [bytes.fromhex(txid) for txid in entry['depends']]
+        self.spent_by = [bytes.fromhex(txid) for txid in entry['spentby']]
+        self.bip125_replaceable = entry.get('bip125-replaceable')
+        self.unbroadcast = entry.get('unbroadcast')
+
+    def __repr__(self):
+        return '<MempoolEntry vsize={} base_fee={}>'.format(self.vsize, self.base_fee)
+
+
+def to_mempool(raw_mempool):
+    """
+    Convert the result of getrawmempool with verbose=True
+    :param raw_mempool: dict, required
+    :return: dict, txid bytes to src.bitcaviar.results.MempoolEntry
+    """
+
+    return {bytes.fromhex(txid): MempoolEntry(entry) for txid, entry in raw_mempool.items()}
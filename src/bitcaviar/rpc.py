@@ -0,0 +1,353 @@
+"""
+JSON-RPC over HTTP transport
+Talks to bitcoind directly instead of spawning bitcoin-cli for every call
+More info: https://developer.bitcoin.org/reference/rpc/
+"""
+
+import base64
+import http.client
+import itertools
+import json
+import threading
+import time
+from bitcaviar import decoder
+from bitcaviar import metrics
+
+# Arguments that bitcoin-cli parses as JSON instead of sending them as strings, by method and position
+# More info: https://github.com/bitcoin/bitcoin/blob/master/src/rpc/client.cpp
+CONVERT_PARAMS = {
+    'getblock': (1,),
+    'getblockhash': (0,),
+    'getblockheader': (1,),
+    'getblockstats': (0, 1),
+    'getchaintxstats': (0,),
+    'getmempoolancestors': (1,),
+    'getmempooldescendants': (1,),
+    'getrawmempool': (0, 1),
+    'gettxout': (1, 2),
+    'gettxoutproof': (0,),
+    'pruneblockchain': (0,),
+    'verifychain': (0, 1),
+}
+
+
+def convert_params(method, args):
+    """
+    Convert bitcoin-cli string arguments into JSON-RPC params the same way bitcoin-cli does
+    :param method: string, required
+    :param args: list of strings, required
+    :return: list
+    """
+
+    positions = CONVERT_PARAMS.get(method, ())
+
+    return [json.loads(arg) if i in positions else arg for i, arg in enumerate(args)]
+
+
+def format_result(result):
+    """
+    Format a JSON-RPC result the way bitcoin-cli prints it, so the blockchain functions parse it as usual.
+    Objects and arrays are returned as they are, already decoded or left undecoded by the decoder,
+    to avoid encoding them again.
+    :param result: any JSON value, or msgspec.Raw, required
+    :return: string, dict, list or msgspec.Raw
+    """
+
+    if result is None:
+        return ''
+    elif isinstance(result, (str, dict, list)) or decoder.is_raw(result):
+        return result
+    else:  # Booleans and numbers
+        return json.dumps(result)
+
+
+def format_error(error):
+    """
+    Format a JSON-RPC error the way bitcoin-cli prints it on stderr
+    :param error: dict, required
+    :return: string
+    """
+
+    return 'error code: {}\nerror message:\n{}\n'.format(error.get('code'), error.get('message'))
+
+
+class HTTPTransport:
+    """
+    Send commands to bitcoind over JSON-RPC, keeping one keep-alive connection per thread.
+    Authenticate with rpc_user and rpc_password if given, else with the cookie file bitcoind writes on start.
+    """
+    def __init__(self, host='127.0.0.1', port=8332, user=None, password=None, cookie_file=None, timeout=900):
+        """
+        :param host: string, optional, default=127.0.0.1
+        :param port: int, optional, default=8332
+        :param user: string, optional
+        :param password: string, optional
+        :param cookie_file: string, optional, used if user and password are not set
+        :param timeout: int, optional, default=900 seconds
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.cookie_file = cookie_file
+        self.timeout = timeout
+        self._authorization = None
+        self._local = threading.local()
+        self._ids = itertools.count()
+
+    def run(self, command):
+        """
+        Send a bitcoin-cli command and return its output
+        :param command: list, required, [cli_dir, data_dir, method, *args]
+        :return: string, dict or list
+        """
+
+        method, args = command[2], command[3:]
+        result = self.call(method, convert_params(method, args), raw=True)
+
+        return format_result(result)
+
+    def run_many(self, commands):
+        """
+        Send bitcoin-cli commands in a single JSON-RPC batch
+        :param commands: list of lists, required
+        :return: list of outputs in the same order, with a ValueError in place of each command that failed
+        """
+
+        if not commands:
+            return []
+
+        requests = []
+
+        for command in commands:
+            method, args = command[2], command[3:]
+            requests.append({'jsonrpc': '1.0', 'id': next(self._ids), 'method': method,
+                             'params': convert_params(method, args)})
+
+        responses = self.exchange('batch', json.dumps(requests))
+
+        if isinstance(responses, dict):  # The whole batch was rejected
+            raise ValueError(format_error(responses.get('error') or {}))
+
+        responses = {response['id']: response for response in responses}
+        outputs = []
+
+        for request in requests:
+            response = responses.get(request['id'])
+
+            if response is None:
+                outputs.append(ValueError('error: no response for {}\n'.format(request['method'])))
+            elif response.get('error'):
+                outputs.append(ValueError(format_error(response['error'])))
+            else:
+                outputs.append(format_result(response['result']))
+                continue
+
+            if metrics.enabled:
+                metrics.error(request['method'])
+
+        return outputs
+
+    def call(self, method, params=(), raw=False):
+        """
+        Call an RPC method
+        :param method: string, required
+        :param params: list, optional
+        :param raw: boolean, optional, default=False, leave objects and arrays undecoded if the decoder supports it
+        :return: any JSON value
+        """
+
+        request = {'jsonrpc': '1.0', 'id': next(self._ids), 'method': method, 'params': list(params)}
+        response = self.exchange(method, json.dumps(request))
+
+        if response.get('error'):
+            raise ValueError(format_error(response['error']))
+
+        if not raw and decoder.is_raw(response['result']):
+            return decoder.loads(response['result'])
+
+        return response['result']
+
+    def exchange(self, method, body):
+        """
+        Post a JSON-RPC request body and decode the response, recording wire and parse time while metrics are enabled
+        :param method: string, required, RPC method, or batch, for metrics
+        :param body: string, required
+        :return: dict, or list for a batch
+        """
+
+        if not metrics.enabled:
+            return decoder.loads_response(self.post(body))
+
+        start = time.perf_counter()
+        data = self.post(body)
+        received = time.perf_counter()
+        response = decoder.loads_response(data)
+        metrics.observe(method, 'wire', received - start)
+        metrics.observe(method, 'parse', time.perf_counter() - received)
+        metrics.observe(method, 'bytes', len(data))
+
+        return response
+
+    def post(self, body, path='/'):
+        """
+        Send a JSON-RPC request body and return the response body
+        :param body: string, required
+        :param path: string, optional, default=/
+        :return: bytes
+        """
+
+        status, data = self.request('POST', path, body)
+
+        # bitcoind answers RPC errors with a JSON body too, so only empty or non-JSON answers are transport errors
+        if status == 401:
+            self._authorization = None  # The cookie changes every time bitcoind restarts
+            status, data = self.request('POST', path, body)
+
+            if status == 401:
+                raise ValueError('error: Authorization failed: Incorrect rpcuser or rpcpassword\n')
+
+        if status != 200 and not data:
+            raise ValueError('error: server returned HTTP error {}\n'.format(status))
+
+        return data
+
+    def stream(self, command, chunk_size=1 << 16):
+        """
+        Send a bitcoin-cli command and yield the JSON-RPC response body in chunks as it arrives
+        A separate connection is used, so other calls can be made while the response is read.
+        :param command: list, required, [cli_dir, data_dir, method, *args]
+        :param chunk_size: int, optional, default=65536 bytes
+        :return: generator of bytes
+        """
+
+        method, args = command[2], command[3:]
+        request = {'jsonrpc': '1.0', 'id': next(self._ids), 'method': method, 'params': convert_params(method, args)}
+        body = json.dumps(request)
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+        try:
+            connection.request('POST', '/', body, {'Authorization': self.authorization(),
+                                                   'Content-Type': 'application/json'})
+            response = connection.getresponse()
+
+            if response.status == 401:  # The cookie changes every time bitcoind restarts
+                response.read()
+                self._authorization = None
+                connection.request('POST', '/', body, {'Authorization': self.authorization(),
+                                                       'Content-Type': 'application/json'})
+                response = connection.getresponse()
+
+                if response.status == 401:
+                    raise ValueError('error: Authorization failed: Incorrect rpcuser or rpcpassword\n')
+
+            if response.status != 200 and not response.length:
+                raise ValueError('error: server returned HTTP error {}\n'.format(response.status))
+
+            while True:
+                chunk = response.read(chunk_size)
+
+                if not chunk:
+                    break
+
+                yield chunk
+        finally:
+            connection.close()
+
+    def get(self, path):
+        """
+        Send a GET request to the REST interface (bitcoind must run with -rest) and return the response body
+        More info: https://github.com/bitcoin/bitcoin/blob/master/doc/REST-interface.md
+        :param path: string, required
+        :return: bytes
+        """
+
+        status, data = self.request('GET', path)
+
+        if status != 200:
+            raise ValueError('error: server returned HTTP error {}\n{}'.format(status, data.decode(errors='replace')))
+
+        return data
+
+    def request(self, method, path, body=None):
+        """
+        Send an HTTP request over the connection of the current thread
+        Retry once on a fresh connection if the keep-alive one was closed by the server
+        :param method: string, required
+        :param path: string, required
+        :param body: string, optional
+        :return: tuple (int status, bytes data)
+        """
+
+        headers = {'Authorization': self.authorization(), 'Content-Type': 'application/json'}
+        connection = getattr(self._local, 'connection', None)
+        reused = connection is not None
+
+        if connection is None:
+            connection = self.connect()
+
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, ConnectionError):
+            connection.close()
+            self._local.connection = None
+
+            if not reused:
+                raise
+
+            connection = self.connect()
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            data = response.read()
+
+        if response.will_close:
+            connection.close()
+            self._local.connection = None
+
+        return response.status, data
+
+    def connect(self):
+        """
+        Open a new connection for the current thread
+        :return: http.client.HTTPConnection
+        """
+
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        self._local.connection = connection
+
+        return connection
+
+    def authorization(self):
+        """
+        Get the value of the Authorization header
+        :return: string
+        """
+
+        if self._authorization is None:
+            if self.user is not None and self.password is not None:
+                credentials = '{}:{}'.format(self.user, self.password)
+            elif self.cookie_file:
+                with open(self.cookie_file) as f:
+                    credentials = f.read().strip()
+            else:
+                raise ValueError('error: rpc_user and rpc_password or a cookie file are required\n')
+
+            self._authorization = 'Basic ' + base64.b64encode(credentials.encode()).decode()
+
+        return self._authorization
+
+    def close(self):
+        """
+        Close the connection of the current thread
+        :return: None
+        """
+
+        connection = getattr(self._local, 'connection', None)
+
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+        return None
@@ -0,0 +1,125 @@
+"""
+Request coalescing
+Concurrent identical commands share a single run: the first caller runs the command and the others wait for it
+and get the same output, or the same error. Optionally, outputs of volatile calls are kept for a short time,
+so callers right after it get them too.
+Outputs are shared, not copied: do not change returned dicts and lists in place.
+"""
+
+import threading
+import time
+
+# Time to live of outputs for calls that change often but where a slightly old answer is fine, in seconds
+VOLATILE_TTL = {
+    'getblockchaininfo': 1,
+    'getdifficulty': 1,
+    'getmempoolinfo': 1,
+}
+MAX_OUTPUTS = 1024  # Kept outputs before expired ones are dropped
+
+
+class _Flight:
+    """Command in flight"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.output = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Share runs of identical commands, keyed by the whole command
+    """
+    def __init__(self, ttl=None):
+        """
+        :param ttl: dict, optional, RPC method to seconds its outputs are kept after a run, default=none are kept,
+        see VOLATILE_TTL
+        """
+        self.ttl = dict(ttl or {})
+        self.runs = 0
+        self.shared = 0
+        self.hits = 0
+        self._flights = {}
+        self._outputs = {}
+        self._lock = threading.Lock()
+
+    def run(self, command, function):
+        """
+        Run a command, or wait for the identical command in flight, or get its output if it is still fresh
+        :param command: list, required, [cli_dir, data_dir, method, *args]
+        :param function: function, required, runs the command and returns its output
+        :return: output of function
+        """
+
+        key = tuple(command)
+        ttl = self.ttl.get(command[2])
+
+        with self._lock:
+            if ttl:
+                entry = self._outputs.get(key)
+
+                if entry is not None and entry[1] > time.monotonic():
+                    self.hits += 1
+                    return entry[0]
+
+            flight = self._flights.get(key)
+            leader = flight is None
+
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.runs += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            flight.done.wait()
+
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.output
+
+        try:
+            flight.output = function()
+        except BaseException as error:  # Waiters get it too, whatever it is
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+                if ttl and flight.error is None:
+                    now = time.monotonic()
+
+                    if len(self._outputs) >= MAX_OUTPUTS:  # Drop the expired ones
+                        self._outputs = {k: entry for k, entry in self._outputs.items() if entry[1] > now}
+
+                    self._outputs[key] = (flight.output, now + ttl)
+
+            flight.done.set()
+
+        return flight.output
+
+    def clear(self):
+        """
+        Drop kept outputs
+        :return: None
+        """
+
+        with self._lock:
+            self._outputs.clear()
+
+        return None
+
+    def stats(self):
+        """
+        Get counters: commands run, calls that shared a run in flight and calls answered with a kept output
+        :return: dict
+        """
+
+        return {
+            'runs': self.runs,
+            'shared': self.shared,
+            'hits': self.hits,
+            'in_flight': len(self._flights)
+        }
@@ -0,0 +1,362 @@
+"""
+Block statistics by height range
+Fetches getblockstats for many heights in concurrent JSON-RPC batches and returns one array per statistic,
+optionally keeping them in a local columnar store so later calls only fetch the new heights.
+More info: https://developer.bitcoin.org/reference/rpc/getblockstats.html
+"""
+
+import array
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from bitcaviar import blockchain
+from bitcaviar import blocks
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_STATS = ('avgfeerate', 'feerate_percentiles', 'time', 'total_size', 'total_weight', 'totalfee', 'txs')
+PERCENTILES = (10, 25, 50, 75, 90)
+TYPECODE = 'q'  # All statistics are integers: amounts in satoshis, feerates in sat/vB, sizes, counts and times
+
+
+def columns(stats):
+    """
+    Get the names of the columns for some statistics
+    feerate_percentiles becomes one column per percentile: feerate_percentiles_10 ... feerate_percentiles_90.
+    :param stats: iterable of strings, required
+    :return: list of strings
+    """
+
+    names = []
+
+    for stat in stats:
+        if stat == 'blockhash':
+            raise ValueError('blockhash is not numeric, use src.bitcaviar.headers.HeaderStore for hashes')
+        elif stat == 'feerate_percentiles':
+            names.extend('feerate_percentiles_{}'.format(p) for p in PERCENTILES)
+        else:
+            names.append(stat)
+
+    return names
+
+
+def fetch(bitcoin, start, stop, stats=DEFAULT_STATS, batch_size=100, workers=4):
+    """
+    Fetch the statistics of a range of heights
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param start: int, required
+    :param stop: int, required, not included
+    :param stats: iterable of strings, optional, default=DEFAULT_STATS
+    :param batch_size: int, optional, default=100 heights per JSON-RPC batch
+    :param workers: int, optional, default=4 batches in flight
+    :return: tuple (dict column name to array.array, list of string block hashes)
+    """
+
+    stats = list(stats)
+    names = columns(stats)
+    wanted = stats + ['blockhash']
+
+    def fetch_batch(heights):
+        with blockchain.batch(bitcoin, size=None) as b:
+            calls = [b.get_block_stats(hash_or_height=str(height), stats=wanted) for height in heights]
+
+        return [call.result() for call in calls]
+
+    result = {name: array.array(TYPECODE) for name in names}
+    hashes = []
+    chunks = [range(height, min(height + batch_size, stop)) for height in range(start, stop, batch_size)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for rows in executor.map(fetch_batch, chunks):
+            for row in rows:
+                for stat in stats:
+                    if stat == 'feerate_percentiles':
+                        for p, value in zip(PERCENTILES, row[stat]):
+                            result['feerate_percentiles_{}'.format(p)].append(int(value))
+                    else:
+                        result[stat].append(int(row[stat]))
+
+                hashes.append(row['blockhash'])
+
+    return result, hashes
+
+
+class StatsStore:
+    """
+    Columnar store of block statistics for a contiguous range of heights, in a directory:
+    one file per column with the values as 64-bit integers in height order, blockhash with 32 bytes per block,
+    and meta.json with the first height and the number of heights.
+    meta.json is replaced last on every write, so an interrupted write leaves the previous state. A prepend rewrites
+    the files through temporary ones and records them in meta.json first, so an interrupted one is finished on open.
+    """
+    def __init__(self, path, stats=DEFAULT_STATS):
+        """
+        :param path: string, required, directory, created if it does not exist
+        :param stats: iterable of strings, optional, default=DEFAULT_STATS, must match the stored ones
+        """
+        self.path = path
+        self.stats = list(stats)
+        self.columns = columns(self.stats)
+        self.first = None
+        self.count = 0
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+            if meta['stats'] != self.stats:
+                raise ValueError('{} stores other statistics: {}'.format(path, ', '.join(meta['stats'])))
+
+            self.first = meta['first']
+            self.count = meta['count']
+
+            if 'prepend' in meta:
+                self._finish_prepend(**meta['prepend'])
+
+        for name, size in self._files():  # Drop values of an interrupted write
+            file_path = os.path.join(path, name)
+
+            if os.path.exists(file_path) and os.path.getsize(file_path) > self.count * size:
+                os.truncate(file_path, self.count * size)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def stop(self):
+        """Height after the last stored one, or None if the store is empty"""
+        return self.first + self.count if self.count else None
+
+    def _files(self):
+        itemsize = array.array(TYPECODE).itemsize
+        return [(name + '.bin', itemsize) for name in self.columns] + [('blockhash.bin', 32)]
+
+    def _save_meta(self, prepend=None):
+        meta_path = os.path.join(self.path, 'meta.json')
+        meta = {'stats': self.stats, 'first': self.first, 'count': self.count}
+
+        if prepend is not None:
+            meta['prepend'] = prepend
+
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def read(self, start=None, stop=None):
+        """
+        Read stored statistics
+        :param start: int, optional, default=first stored height
+        :param stop: int, optional, default=after the last stored height
+        :return: dict column name to array.array
+        """
+
+        if not self.count:
+            return {name: array.array(TYPECODE) for name in self.columns}
+
+        start = self.first if start is None else max(start, self.first)
+        stop = self.stop if stop is None else min(stop, self.stop)
+        result = {}
+
+        for name in self.columns:
+            column = array.array(TYPECODE)
+
+            if stop > start:
+                with open(os.path.join(self.path, name + '.bin'), 'rb') as f:
+                    f.seek((start - self.first) * column.itemsize)
+                    column.frombytes(f.read((stop - start) * column.itemsize))
+
+            result[name] = column
+
+        return result
+
+    def block_hash(self, height):
+        """
+        Get the stored hash of the block at height
+        :param height: int, required
+        :return: string
+        """
+
+        if self.count == 0 or not self.first <= height < self.stop:
+            raise IndexError('No statistics at height {}'.format(height))
+
+        with open(os.path.join(self.path, 'blockhash.bin'), 'rb') as f:
+            f.seek((height - self.first) * 32)
+
+            return f.read(32).hex()
+
+    def append(self, values, hashes, first=None):
+        """
+        Append the statistics of the heights right after the stored ones
+        :param values: dict column name to array.array, required
+        :param hashes: list of strings, required
+        :param first: int, optional, first height of the values, only needed if the store is empty
+        :return: None
+        """
+
+        if not hashes:
+            return None
+
+        if self.count == 0:
+            self.first = first
+        elif first is not None and first != self.stop:
+            raise ValueError('Statistics at height {} do not follow the stored ones'.format(first))
+
+        for name in self.columns:
+            with open(os.path.join(self.path, name + '.bin'), 'ab') as f:
+                values[name].tofile(f)
+
+        with open(os.path.join(self.path, 'blockhash.bin'), 'ab') as f:
+            f.write(b''.join(bytes.fromhex(block_hash) for block_hash in hashes))
+
+        self.count += len(hashes)
+        self._save_meta()
+
+        return None
+
+    def prepend(self, values, hashes, first):
+        """
+        Insert the statistics of the heights right before the stored ones, rewriting the files
+        :param values: dict column name to array.array, required
+        :param hashes: list of strings, required
+        :param first: int, required, first height of the values
+        :return: None
+        """
+
+        if not hashes:
+            return None
+
+        if self.count == 0:
+            return self.append(values, hashes, first)
+        elif first + len(hashes) != self.first:
+            raise ValueError('Statistics at height {} do not precede the stored ones'.format(first))
+
+        for name, size in self._files():
+            file_path = os.path.join(self.path, name)
+
+            with open(file_path + '.tmp', 'wb') as f:
+                if name == 'blockhash.bin':
+                    f.write(b''.join(bytes.fromhex(block_hash) for block_hash in hashes))
+                else:
+                    values[name[:-len('.bin')]].tofile(f)
+
+                with open(file_path, 'rb') as stored:
+                    f.write(stored.read(self.count * size))
+
+        self._save_meta(prepend={'first': first, 'count': self.count + len(hashes)})
+        self._finish_prepend(first, self.count + len(hashes))
+
+        return None
+
+    def _finish_prepend(self, first, count):
+        """Move the rewritten files in place, those that are not yet, then record the new range"""
+
+        for name, size in self._files():
+            file_path = os.path.join(self.path, name)
+
+            if os.path.exists(file_path + '.tmp'):
+                os.replace(file_path + '.tmp', file_path)
+
+        self.first = first
+        self.count = count
+        self._save_meta()
+
+        return None
+
+    def truncate(self, count):
+        """
+        Drop every height from first + count up
+        :param count: int, required, number of heights to keep
+        :return: None
+        """
+
+        self.count = min(count, self.count)
+        self._save_meta()
+
+        for name, size in self._files():
+            file_path = os.path.join(self.path, name)
+
+            if os.path.exists(file_path):
+                os.truncate(file_path, self.count * size)
+
+        return None
+
+    def rollback(self, bitcoin):
+        """
+        Drop the statistics of blocks that are no longer in the active chain of the node
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :return: int, number of heights dropped
+        """
+
+        if not self.count:
+            return 0
+
+        height = blocks.fork_height(bitcoin, self.stop - 1, self.first, self.block_hash)
+        dropped = self.stop - (height + 1)
+
+        if dropped:
+            self.truncate(height + 1 - self.first)
+
+        return dropped
+
+
+def block_stats_range(bitcoin, start, stop, stats=DEFAULT_STATS, path=None, batch_size=100, workers=4,
+                      as_numpy=False):
+    """
+    Get block statistics for a range of heights as columns, value i of every column being for height start + i
+    Heights above the tip are left out. With path, statistics are kept in a src.bitcaviar.stats.StatsStore there:
+    stored heights are read from it, after dropping blocks that were reorganized away, and the missing ones are
+    prepended or appended. A range that does not touch the stored one is fetched and the store is left as it is.
+    :param bitcoin: src.bitcaviar.config.Bitcoin, required
+    :param start: int, required
+    :param stop: int, required, not included
+    :param stats: iterable of strings, optional, default=DEFAULT_STATS
+    :param path: string, optional, directory of the store
+    :param batch_size: int, optional, default=100 heights per JSON-RPC batch
+    :param workers: int, optional, default=4 batches in flight
+    :param as_numpy: boolean, optional, default=False, return numpy arrays (numpy must be installed)
+    :return: dict column name to array.array or numpy.ndarray, with a height column
+    """
+
+    if as_numpy and numpy is None:
+        raise ValueError('numpy is not installed')
+
+    stop = min(stop, blockchain.get_block_count(bitcoin=bitcoin) + 1)
+    stop = max(stop, start)
+
+    if path is None:
+        result, hashes = fetch(bitcoin, start, stop, stats, batch_size, workers)
+    else:
+        store = StatsStore(path, stats)
+        store.rollback(bitcoin)
+
+        if store.count and start < store.first <= stop:  # Overlaps or is right before the stored range
+            values, hashes = fetch(bitcoin, start, store.first, stats, batch_size, workers)
+            store.prepend(values, hashes, first=start)
+
+        if not store.count:
+            values, hashes = fetch(bitcoin, start, stop, stats, batch_size, workers)
+            store.append(values, hashes, first=start)
+            result = store.read(start, stop)
+        elif store.first <= start <= store.stop:
+            if stop > store.stop:
+                first = store.stop
+                values, hashes = fetch(bitcoin, first, stop, stats, batch_size, workers)
+                store.append(values, hashes, first=first)
+
+            result = store.read(start, stop)
+        else:  # The store would have a gap
+            result, hashes = fetch(bitcoin, start, stop, stats, batch_size, workers)
+
+    result['height'] = array.array(TYPECODE, range(start, stop))
+
+    if as_numpy:
+        result = {name: numpy.frombuffer(column, dtype=column.typecode) for name, column in result.items()}
+
+    return result
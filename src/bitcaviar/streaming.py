@@ -0,0 +1,195 @@
+"""
+Streaming JSON
+Reads a JSON document in chunks and yields the elements of one array in it as soon as each is complete,
+so only one element is held in memory at a time instead of the whole document.
+More info: https://www.rfc-editor.org/rfc/rfc8259
+"""
+
+import re
+from bitcaviar import decoder
+
+_TOKEN = re.compile(rb'[{}\[\]":]')
+_NESTED = re.compile(rb'[{}\[\]"]')
+_STRING_END = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+_SCALAR_END = re.compile(rb'[,\]}\s]')
+_ELEMENT = re.compile(rb'[^\s,]')
+
+_QUOTE, _COLON, _OPEN_OBJECT, _OPEN_ARRAY, _CLOSE_ARRAY = b'":{[]'
+_OPENERS = b'{['
+
+
+def element_end(buffer, start):
+    """
+    Find where the JSON value starting at start ends
+    :param buffer: bytes or bytearray, required
+    :param start: int, required
+    :return: int, index after the value, or None if the buffer ends before it
+    """
+
+    first = buffer[start]
+
+    if first == _QUOTE:
+        match = _STRING_END.match(buffer, start + 1)
+        return match.end() if match else None
+
+    if first not in _OPENERS:  # Numbers, true, false and null end at the next delimiter
+        match = _SCALAR_END.search(buffer, start)
+        return match.start() if match else None
+
+    depth = 0
+    position = start
+
+    while True:
+        match = _NESTED.search(buffer, position)
+
+        if match is None:
+            return None
+
+        if buffer[match.start()] == _QUOTE:  # Skip strings, they may contain brackets
+            string = _STRING_END.match(buffer, match.end())
+
+            if string is None:
+                return None
+
+            position = string.end()
+            continue
+
+        depth += 1 if buffer[match.start()] in _OPENERS else -1
+        position = match.end()
+
+        if depth == 0:
+            return position
+
+
+class ArrayStream:
+    """
+    Iterate over the elements of the array found at a path of object keys in a JSON document read in chunks,
+    e.g. path ('result', 'tx') for the transactions of a getblock JSON-RPC response.
+    Everything else in the document is decoded into rest once iteration ends, with the array left empty.
+    """
+    def __init__(self, chunks, path, fields=None):
+        """
+        :param chunks: iterable of bytes, required
+        :param path: tuple of strings, required, keys of the objects that lead to the array
+        :param fields: iterable of strings, optional, default=all fields, fields of each element to decode,
+            see src.bitcaviar.decoder
+        """
+        self.chunks = iter(chunks)
+        self.path = [key.encode() for key in path]
+        self.fields = fields
+        self.count = 0
+        self.rest = None
+
+    def __iter__(self):
+        return self._parse()
+
+    def _read(self, buffer):
+        chunk = next(self.chunks, None)
+
+        if chunk is None:
+            return False
+
+        buffer += chunk
+
+        return True
+
+    def _parse(self):
+        buffer = bytearray()
+        position = 0
+        skeleton = bytearray()  # The document without the elements of the array
+        containers = []
+        keys = []
+        string = None
+        in_array = False
+        wanted = 0  # Buffer size needed before looking for the end of an element again
+        exhausted = False
+
+        while True:
+            if in_array:
+                match = _ELEMENT.search(buffer, position)
+                end = None
+
+                if match is not None and buffer[match.start()] == _CLOSE_ARRAY:
+                    skeleton += b']'
+                    position = match.end()
+                    containers.pop()
+                    keys.pop()
+                    in_array = False
+                    continue
+
+                if match is not None and (len(buffer) >= wanted or exhausted):
+                    position = match.start()
+                    end = element_end(buffer, position)
+
+                    if end is None:  # Look again once the buffer doubled, so long elements are scanned in O(n)
+                        wanted = 2 * (len(buffer) - position)
+
+                if end is None:
+                    del buffer[:position]
+                    position = 0
+
+                    if not self._read(buffer):
+                        if exhausted:
+                            raise ValueError('JSON document ended inside the array')
+
+                        exhausted = True
+
+                    continue
+
+                yield decoder.loads(bytes(buffer[position:end]), self.fields)
+                self.count += 1
+                del buffer[:end]
+                position = 0
+                wanted = 0
+                continue
+
+            match = _TOKEN.search(buffer, position)
+
+            if match is None:
+                skeleton += buffer[position:]
+                buffer.clear()
+                position = 0
+
+                if not self._read(buffer):
+                    break
+
+                continue
+
+            token = buffer[match.start()]
+            end = match.end()
+
+            if token == _QUOTE:
+                string_end = _STRING_END.match(buffer, end)
+
+                if string_end is None:  # The string continues in the next chunk
+                    skeleton += buffer[position:match.start()]
+                    del buffer[:match.start()]
+                    position = 0
+
+                    if not self._read(buffer):
+                        raise ValueError('JSON document ended inside a string')
+
+                    continue
+
+                string = bytes(buffer[end:string_end.end() - 1]) if string_end.end() - end <= 256 else None
+                end = string_end.end()
+            elif token == _COLON:
+                keys[-1] = string
+            elif token == _OPEN_ARRAY and keys == self.path and all(c == _OPEN_OBJECT for c in containers):
+                in_array = True
+                containers.append(token)
+                keys.append(None)
+            elif token in _OPENERS:
+                containers.append(token)
+                keys.append(None)
+            elif containers:
+                containers.pop()
+                keys.pop()
+
+            skeleton += buffer[position:end]
+            position = end
+
+        if containers:
+            raise ValueError('JSON document ended before it was complete')
+
+        self.rest = decoder.loads(bytes(skeleton)) if skeleton.strip() else None
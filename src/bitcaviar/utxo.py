@@ -0,0 +1,493 @@
+"""
+UTXO set
+Local copy of the unspent transaction outputs, built from raw blocks and kept in SQLite: statistics,
+script and descriptor scans and lookups of many outpoints are answered locally, instead of running gettxoutsetinfo
+or scantxoutset on the node. Each block is applied in order and its changes are kept for undo_depth blocks,
+so blocks that are reorganized away can be undone.
+More info: https://developer.bitcoin.org/reference/rpc/gettxoutsetinfo.html
+More info: https://developer.bitcoin.org/reference/rpc/scantxoutset.html
+"""
+
+import hashlib
+import sqlite3
+import struct
+import threading
+from bitcaviar import blocks
+from bitcaviar import raw
+
+MAX_SCRIPT_SIZE = 10000
+OP_RETURN = 0x6a
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS utxos (
+    outpoint BLOB PRIMARY KEY,  -- txid in internal byte order and vout as 4 bytes little endian
+    value INTEGER NOT NULL,
+    script BLOB NOT NULL,
+    code INTEGER NOT NULL,  -- height * 2 + coinbase
+    script_key INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS utxos_script ON utxos (script_key);
+CREATE TABLE IF NOT EXISTS blocks (
+    height INTEGER PRIMARY KEY,
+    hash BLOB NOT NULL,
+    txouts INTEGER NOT NULL,
+    bogosize INTEGER NOT NULL,
+    amount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS undo (
+    height INTEGER NOT NULL,
+    outpoint BLOB NOT NULL,
+    value INTEGER,  -- NULL for outputs created by the block, else the output it spent or replaced
+    script BLOB,
+    code INTEGER
+);
+CREATE INDEX IF NOT EXISTS undo_height ON undo (height);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+'''
+
+# Addresses
+BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+BECH32_CONSTANTS = {0: 1, 1: 0x2bc830a3}  # bech32 for witness version 0, bech32m for the others
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+P2PKH_VERSIONS = (0x00, 0x6f)  # mainnet, testnet and regtest
+P2SH_VERSIONS = (0x05, 0xc4)
+
+
+def _bech32_polymod(values):
+    generator = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+    checksum = 1
+
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+
+        for i in range(5):
+            checksum ^= generator[i] if (top >> i) & 1 else 0
+
+    return checksum
+
+
+def _segwit_script(address):
+    address = address.lower()
+    separator = address.rfind('1')
+    hrp, data = address[:separator], [BECH32_CHARSET.find(c) for c in address[separator + 1:]]
+
+    if separator < 1 or len(data) < 7 or -1 in data:
+        raise ValueError('Invalid address: {}'.format(address))
+
+    version = data[0]
+    expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+
+    if version > 16 or _bech32_polymod(expanded + data) != BECH32_CONSTANTS[min(version, 1)]:
+        raise ValueError('Invalid address checksum: {}'.format(address))
+
+    bits = ''.join('{:05b}'.format(value) for value in data[1:-6])
+    program = bytes(int(bits[i:i + 8], 2) for i in range(0, len(bits) - len(bits) % 8, 8))
+
+    if not 2 <= len(program) <= 40 or (version == 0 and len(program) not in (20, 32)):
+        raise ValueError('Invalid witness program: {}'.format(address))
+
+    return bytes([0x50 + version if version else 0, len(program)]) + program
+
+
+def _base58_script(address):
+    number = 0
+
+    for c in address:
+        if c not in BASE58_ALPHABET:
+            raise ValueError('Invalid address: {}'.format(address))
+
+        number = number * 58 + BASE58_ALPHABET.index(c)
+
+    data = b'\x00' * (len(address) - len(address.lstrip('1'))) + number.to_bytes((number.bit_length() + 7) // 8, 'big')
+
+    if len(data) != 25 or raw.double_sha256(data[:21])[:4] != data[21:]:
+        raise ValueError('Invalid address checksum: {}'.format(address))
+
+    if data[0] in P2PKH_VERSIONS:
+        return b'\x76\xa9\x14' + data[1:21] + b'\x88\xac'
+    elif data[0] in P2SH_VERSIONS:
+        return b'\xa9\x14' + data[1:21] + b'\x87'
+    else:
+        raise ValueError('Unknown address version: {}'.format(address))
+
+
+def address_script(address):
+    """
+    Get the output script an address pays to
+    :param address: string, required, base58 (P2PKH, P2SH) or bech32/bech32m (segwit)
+    :return: bytes
+    """
+
+    if address.lower().startswith(('bc1', 'tb1', 'bcrt1')):
+        return _segwit_script(address)
+
+    return _base58_script(address)
+
+
+def descriptor_script(descriptor):
+    """
+    Get the output script of a raw() or addr() descriptor
+    Descriptors with keys have to be expanded into scripts first, e.g. with deriveaddresses.
+    :param descriptor: string, required, e.g. addr(bc1q...) or raw(0014...), with or without checksum
+    :return: bytes
+    """
+
+    descriptor = descriptor.split('#')[0].strip()
+
+    if descriptor.startswith('raw(') and descriptor.endswith(')'):
+        return bytes.fromhex(descriptor[4:-1])
+    elif descriptor.startswith('addr(') and descriptor.endswith(')'):
+        return address_script(descriptor[5:-1])
+    else:
+        raise ValueError('Only raw() and addr() descriptors are supported: {}'.format(descriptor))
+
+
+def script_key(script):
+    """
+    Get the key scripts are indexed by: the first 8 bytes of their SHA-256, as a signed 64-bit integer
+    :param script: bytes, required
+    :return: int
+    """
+
+    return int.from_bytes(hashlib.sha256(script).digest()[:8], 'little', signed=True)
+
+
+def is_unspendable(script):
+    """
+    Check if an output can never be spent, so it is left out of the set like bitcoind does
+    :param script: bytes, required
+    :return: boolean
+    """
+
+    return (len(script) > 0 and script[0] == OP_RETURN) or len(script) > MAX_SCRIPT_SIZE
+
+
+def outpoint_key(txid, n):
+    """
+    Get the key of an outpoint, as it is serialized in transaction inputs
+    :param txid: string, required
+    :param n: int, required
+    :return: bytes, 36 bytes
+    """
+
+    return bytes.fromhex(txid)[::-1] + struct.pack('<I', n)
+
+
+class UTXOSet:
+    """
+    UTXO set in a SQLite database, kept in sync with the node with sync()
+    Writes are batched in transactions, so an interrupted sync resumes from the last committed block.
+    """
+    def __init__(self, path, undo_depth=100):
+        """
+        :param path: string, required, database file, created if it does not exist
+        :param undo_depth: int, optional, default=100, blocks that can be undone
+        """
+        self.path = path
+        self.undo_depth = undo_depth
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+
+    def __len__(self):
+        return self.stats()['txouts']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def height(self):
+        """Height of the last applied block, -1 if the set is empty"""
+        row = self._db.execute('SELECT MAX(height) FROM blocks').fetchone()
+        return -1 if row[0] is None else row[0]
+
+    def block_hash(self, height):
+        """
+        Get the hash of an applied block
+        :param height: int, required
+        :return: string, or None if there is no block at height
+        """
+
+        row = self._db.execute('SELECT hash FROM blocks WHERE height = ?', (height,)).fetchone()
+
+        return None if row is None else raw.hash_to_hex(row[0])
+
+    @property
+    def tip(self):
+        """Hash of the last applied block, or None if the set is empty"""
+        return self.block_hash(self.height)
+
+    def _meta(self, key, default=None):
+        row = self._db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return default if row is None else row[0]
+
+    def commit(self):
+        """
+        Commit the blocks applied or undone with commit=False
+        :return: None
+        """
+
+        with self._lock:
+            self._db.commit()
+
+        return None
+
+    def apply(self, block, height, commit=True):
+        """
+        Apply a block on top of the set
+        :param block: src.bitcaviar.raw.Block, required
+        :param height: int, required, must be the next height
+        :param commit: boolean, optional, default=True
+        :return: None
+        """
+
+        with self._lock:
+            tip_height = self.height
+
+            if height != tip_height + 1:
+                raise ValueError('Block at height {} does not follow height {}'.format(height, tip_height))
+            elif tip_height >= 0 and block.header.previous_block_hash != self.tip:
+                raise ValueError('Block {} does not extend {}'.format(block.hash, self.tip))
+
+            created = []
+            spent = []
+
+            for tx in block if height else ():  # The genesis coinbase is not in the set, as in bitcoind
+                coinbase = tx.is_coinbase
+                txid = bytes.fromhex(tx.txid)[::-1]
+
+                if not coinbase:
+                    spent.extend(bytes(tx_in.data[tx_in.offset:tx_in.offset + 36]) for tx_in in tx.inputs)
+
+                for n, tx_out in enumerate(tx.outputs):
+                    script = bytes(tx_out.script_pubkey)
+
+                    if not is_unspendable(script):
+                        created.append((txid + struct.pack('<I', n), tx_out.value, script, height << 1 | coinbase,
+                                        script_key(script)))
+
+            db = self._db
+            in_block = {c[0]: c[1:4] for c in created}  # Outputs spent in the block that created them
+            coins = []
+            restored = []  # Coins to put back on undo, not those created by the block
+
+            for outpoint in spent:
+                row = in_block.get(outpoint) or db.execute(
+                    'SELECT value, script, code FROM utxos WHERE outpoint = ?', (outpoint,)
+                ).fetchone()
+
+                if row is None:
+                    raise ValueError('Block {} spends {}:{}, which is not in the set'.format(
+                        block.hash, raw.hash_to_hex(outpoint[:32]), struct.unpack('<I', outpoint[32:])[0]))
+
+                coins.append((height, outpoint) + tuple(row))
+
+                if outpoint not in in_block:
+                    restored.append(coins[-1])
+
+            # BIP30: a coinbase repeating an earlier txid overwrites its unspent outputs, which are then lost
+            first = [c[0] for c in created if c[3] & 1]
+            query = 'SELECT outpoint, value, script, code FROM utxos WHERE outpoint IN ({})'
+            replaced = db.execute(query.format(','.join('?' * len(first))), first).fetchall() if first else []
+            coins.extend((height,) + tuple(row) for row in replaced)
+            restored.extend((height,) + tuple(row) for row in replaced)
+
+            db.executemany('INSERT OR REPLACE INTO utxos VALUES (?, ?, ?, ?, ?)', created)
+            db.executemany('DELETE FROM utxos WHERE outpoint = ?', ((outpoint,) for outpoint in spent))
+            db.executemany('INSERT INTO undo VALUES (?, ?, NULL, NULL, NULL)', ((height, c[0]) for c in created))
+            db.executemany('INSERT INTO undo VALUES (?, ?, ?, ?, ?)', restored)
+
+            txouts, bogosize, amount = db.execute(
+                'SELECT txouts, bogosize, amount FROM blocks WHERE height = ?', (tip_height,)
+            ).fetchone() or (0, 0, 0)
+            txouts += len(created) - len(coins)
+            bogosize += sum(50 + len(c[2]) for c in created) - sum(50 + len(c[3]) for c in coins)
+            amount += sum(c[1] for c in created) - sum(c[2] for c in coins)
+            db.execute('INSERT INTO blocks VALUES (?, ?, ?, ?, ?)',
+                       (height, bytes.fromhex(block.hash)[::-1], txouts, bogosize, amount))
+
+            if height - self.undo_depth >= 0:
+                db.execute('DELETE FROM undo WHERE height <= ?', (height - self.undo_depth,))
+                db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                           ('undo_from', max(self._meta('undo_from', 0), height - self.undo_depth + 1)))
+
+            if commit:
+                db.commit()
+
+        return None
+
+    def undo(self, commit=True):
+        """
+        Undo the last applied block
+        :param commit: boolean, optional, default=True
+        :return: None
+        """
+
+        with self._lock:
+            height = self.height
+
+            if height < 0:
+                raise ValueError('The set is empty')
+            elif height < self._meta('undo_from', 0):
+                raise ValueError('No undo data for height {}, the set has to be built again'.format(height))
+
+            db = self._db
+            rows = db.execute('SELECT outpoint, value, script, code FROM undo WHERE height = ?', (height,)).fetchall()
+            db.executemany('DELETE FROM utxos WHERE outpoint = ?',
+                           ((outpoint,) for outpoint, value, script, code in rows if value is None))
+            db.executemany('INSERT OR REPLACE INTO utxos VALUES (?, ?, ?, ?, ?)',
+                           ((outpoint, value, script, code, script_key(script))
+                            for outpoint, value, script, code in rows if value is not None))
+            db.execute('DELETE FROM undo WHERE height = ?', (height,))
+            db.execute('DELETE FROM blocks WHERE height = ?', (height,))
+
+            if commit:
+                db.commit()
+
+        return None
+
+    def rollback(self, bitcoin):
+        """
+        Undo the blocks that are no longer in the active chain of the node
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :return: int, number of blocks undone
+        """
+
+        undone = 0
+
+        with self._lock:
+            height = blocks.fork_height(bitcoin, self.height, 0, self.block_hash)
+
+            while self.height > height:
+                self.undo(commit=False)
+                undone += 1
+
+            self._db.commit()
+
+        return undone
+
+    def sync(self, bitcoin, stop=None, workers=8, commit_every=100, rest=False):
+        """
+        Undo blocks that were reorganized away and apply the new ones, fetched as raw blocks
+        :param bitcoin: src.bitcaviar.config.Bitcoin, required
+        :param stop: int, optional, default=up to the tip, height not included
+        :param workers: int, optional, default=8 blocks fetched at a time
+        :param commit_every: int, optional, default=100 blocks per transaction
+        :param rest: boolean, optional, default=False, fetch blocks from the REST interface
+        :return: int, number of blocks applied
+        """
+
+        # apply, commit and rollback lock on their own, so lookups only wait for the block being applied
+        return blocks.sync_raw_blocks(bitcoin, self, stop, workers, commit_every, rest)
+
+    def stats(self):
+        """
+        Get statistics about the set, as gettxoutsetinfo does, from the totals kept for every block
+        :return: dict
+        """
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT height, hash, txouts, bogosize, amount FROM blocks ORDER BY height DESC LIMIT 1'
+            ).fetchone()
+
+        if row is None:
+            return {'height': -1, 'bestblock': None, 'txouts': 0, 'bogosize': 0, 'total_amount': 0}
+
+        height, block_hash, txouts, bogosize, amount = row
+
+        return {
+            'height': height,
+            'bestblock': raw.hash_to_hex(block_hash),
+            'txouts': txouts,
+            'bogosize': bogosize,
+            'total_amount': amount / 100000000
+        }
+
+    def _coin(self, outpoint, value, script, code, tip_height):
+        return {
+            'txid': raw.hash_to_hex(outpoint[:32]),
+            'vout': struct.unpack('<I', outpoint[32:])[0],
+            'value': value / 100000000,
+            'scriptPubKey': {'hex': script.hex()},
+            'height': code >> 1,
+            'confirmations': tip_height - (code >> 1) + 1,
+            'coinbase': bool(code & 1)
+        }
+
+    def get(self, txid, n):
+        """
+        Get an unspent output, as get_tx_out with include_mempool=False does
+        :param txid: string, required
+        :param n: int, required
+        :return: dict, or None if the output is spent or does not exist
+        """
+
+        return self.get_many([(txid, n)])[0]
+
+    def get_many(self, outpoints, chunk_size=500):
+        """
+        Get many unspent outputs in a few queries
+        :param outpoints: iterable of tuples (string txid, int n), required
+        :param chunk_size: int, optional, default=500 outpoints per query
+        :return: list of dicts, in the same order, with None in place of each spent or missing output
+        """
+
+        keys = [outpoint_key(txid, n) for txid, n in outpoints]
+        found = {}
+
+        with self._lock:
+            tip_height = self.height
+
+            for i in range(0, len(keys), chunk_size):
+                chunk = keys[i:i + chunk_size]
+                rows = self._db.execute(
+                    'SELECT outpoint, value, script, code FROM utxos WHERE outpoint IN ({})'.format(
+                        ','.join('?' * len(chunk))), chunk
+                ).fetchall()
+                found.update((row[0], self._coin(*row, tip_height)) for row in rows)
+
+        return [found.get(key) for key in keys]
+
+    def scan(self, scripts):
+        """
+        Find the unspent outputs paying to scripts, as scantxoutset does
+        :param scripts: iterable of bytes scripts or string raw() and addr() descriptors, required
+        :return: dict with height, bestblock, unspents (list of dicts) and total_amount
+        """
+
+        scripts = {descriptor_script(s) if isinstance(s, str) else bytes(s) for s in scripts}
+        unspents = []
+
+        with self._lock:
+            stats = self.stats()
+
+            for script in scripts:
+                rows = self._db.execute('SELECT outpoint, value, script, code FROM utxos WHERE script_key = ?',
+                                        (script_key(script),)).fetchall()
+                unspents.extend(self._coin(*row, stats['height']) for row in rows if row[2] == script)
+
+        unspents.sort(key=lambda coin: (coin['height'], coin['txid'], coin['vout']))
+
+        return {
+            'height': stats['height'],
+            'bestblock': stats['bestblock'],
+            'unspents': unspents,
+            'total_amount': sum(round(coin['value'] * 100000000) for coin in unspents) / 100000000
+        }
+
+    def close(self):
+        """
+        Close the database
+        :return: None
+        """
+
+        self._db.close()
+
+        return None
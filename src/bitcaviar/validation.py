@@ -0,0 +1,378 @@
+"""
+Header chain validation
+Checks raw 80-byte headers locally, in bulk: linkage, proof of work against the target of their bits, difficulty
+retargets (including the testnet minimum difficulty rule), median time past, time too far in the future and the
+minimum versions of BIP34, BIP65 and BIP66. Headers are double-SHA256 hashed from one contiguous buffer, split in
+chunks across processes, and the checks are vectorized with numpy if installed. Unlike verifychain, it reports the
+first height that fails and why, with the reject reason bitcoind would give.
+More info: https://developer.bitcoin.org/reference/block_chain.html#block-headers
+More info: https://en.bitcoin.it/wiki/Difficulty
+"""
+
+import hashlib
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from bitcaviar import raw
+from bitcaviar.headers import HEADER_SIZE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MEDIAN_TIME_SPAN = 11
+MAX_FUTURE_BLOCK_TIME = 2 * 60 * 60
+
+# Consensus parameters by chain, as named by getblockchaininfo
+NETWORKS = {
+    'main': {'pow_limit': 0xffff << 208, 'interval': 2016, 'timespan': 14 * 24 * 60 * 60, 'spacing': 600,
+             'min_difficulty': False, 'no_retargeting': False, 'bip34_height': 227931, 'bip65_height': 388381,
+             'bip66_height': 363725},
+    'test': {'pow_limit': 0xffff << 208, 'interval': 2016, 'timespan': 14 * 24 * 60 * 60, 'spacing': 600,
+             'min_difficulty': True, 'no_retargeting': False, 'bip34_height': 21111, 'bip65_height': 581885,
+             'bip66_height': 330776},
+    'signet': {'pow_limit': 0x377ae << 216, 'interval': 2016, 'timespan': 14 * 24 * 60 * 60, 'spacing': 600,
+               'min_difficulty': False, 'no_retargeting': False, 'bip34_height': 1, 'bip65_height': 1,
+               'bip66_height': 1},
+    'regtest': {'pow_limit': 0x7fffff << 232, 'interval': 2016, 'timespan': 14 * 24 * 60 * 60, 'spacing': 600,
+                'min_difficulty': True, 'no_retargeting': True, 'bip34_height': 1, 'bip65_height': 1,
+                'bip66_height': 1}
+}
+
+
+def bits_to_target(bits):
+    """
+    Decode the compact target of a header
+    :param bits: int, required
+    :return: int, or None if the encoding is negative or overflows 256 bits
+    """
+
+    size, mantissa = bits >> 24, bits & 0x7fffff
+
+    if mantissa and (bits & 0x800000 or size > 34 or (mantissa > 0xff and size > 33) or
+                     (mantissa > 0xffff and size > 32)):
+        return None
+
+    return mantissa >> 8 * (3 - size) if size <= 3 else mantissa << 8 * (size - 3)
+
+
+def target_to_bits(target):
+    """
+    Encode a target in compact form, as bitcoind does
+    :param target: int, required
+    :return: int
+    """
+
+    size = (target.bit_length() + 7) // 8
+    mantissa = target << 8 * (3 - size) if size <= 3 else target >> 8 * (size - 3)
+
+    if mantissa & 0x800000:  # The sign bit
+        mantissa >>= 8
+        size += 1
+
+    return mantissa | size << 24
+
+
+def _hash_chunk(data):
+    """Hash contiguous headers in a worker process"""
+
+    sha256 = hashlib.sha256
+    view = memoryview(data)
+
+    return b''.join(sha256(sha256(view[i:i + HEADER_SIZE]).digest()).digest()
+                    for i in range(0, len(view), HEADER_SIZE))
+
+
+def _contiguous(headers):
+    """Headers as one buffer of 80-byte headers"""
+
+    if isinstance(headers, (bytes, bytearray, memoryview)):
+        data = bytes(headers)
+    else:
+        data = b''.join(bytes.fromhex(header.strip()) if isinstance(header, str) else bytes(header)
+                        for header in headers)
+
+    if len(data) % HEADER_SIZE:
+        raise ValueError('Headers are not a multiple of {} bytes'.format(HEADER_SIZE))
+
+    return data
+
+
+def hash_headers(headers, workers=None, chunk_size=50000):
+    """
+    Double-SHA256 many headers, splitting them across processes
+    :param headers: bytes-like object of contiguous 80-byte headers, or list of bytes or hex strings, required
+    :param workers: int, optional, default=number of CPUs, 1 to hash in this process
+    :param chunk_size: int, optional, default=50000 headers per task
+    :return: bytes, the 32-byte hashes one after the other, in internal byte order
+    """
+
+    data = _contiguous(headers)
+    workers = workers or os.cpu_count() or 1
+    step = chunk_size * HEADER_SIZE
+
+    if workers == 1 or len(data) <= step:
+        return _hash_chunk(data)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return b''.join(executor.map(_hash_chunk, [data[i:i + step] for i in range(0, len(data), step)]))
+
+
+def _first(mask, offset=0):
+    """First index where a numpy boolean mask is set, plus offset, or None"""
+
+    indexes = numpy.flatnonzero(mask)
+
+    return int(indexes[0]) + offset if len(indexes) else None
+
+
+def _check_linkage(data, hashes, count, begin):
+    if numpy is not None:
+        headers = numpy.frombuffer(data, dtype=numpy.uint8).reshape(count, HEADER_SIZE)
+        previous = numpy.frombuffer(hashes, dtype=numpy.uint8).reshape(count, 32)
+        start = max(begin, 1)
+        return _first((headers[start:, 4:36] != previous[start - 1:-1]).any(axis=1), start)
+
+    for i in range(max(begin, 1), count):
+        if data[i * HEADER_SIZE + 4:i * HEADER_SIZE + 36] != hashes[(i - 1) * 32:i * 32]:
+            return i
+
+    return None
+
+
+def _check_pow(hashes, bits, count, begin, pow_limit):
+    unique = sorted(set(bits[begin:].tolist() if numpy is not None else bits[begin:]))
+    targets = {value: bits_to_target(value) for value in unique}
+    targets = {value: target if target and target <= pow_limit else None for value, target in targets.items()}
+
+    if numpy is None:
+        for i in range(begin, count):
+            target = targets[bits[i]]
+
+            if target is None or int.from_bytes(hashes[i * 32:i * 32 + 32], 'little') > target:
+                return i
+
+        return None
+
+    # Compare hashes to targets as 4 big endian 64-bit limbs, looking at the first limb that differs
+    limbs = numpy.frombuffer(hashes, dtype=numpy.uint8).reshape(count, 32)[begin:, ::-1].copy().view('>u8')
+    target_limbs = numpy.frombuffer(b''.join((targets[value] or 0).to_bytes(32, 'big') for value in unique),
+                                    dtype='>u8').reshape(len(unique), 4)
+    invalid = numpy.array([targets[value] is None for value in unique], dtype=bool)
+    which = numpy.searchsorted(numpy.array(unique, dtype=numpy.int64), bits[begin:])
+    expected = target_limbs[which]
+    differ = limbs != expected
+    column = differ.argmax(axis=1)
+    rows = numpy.arange(len(limbs))
+    above = differ.any(axis=1) & (limbs[rows, column] > expected[rows, column])
+
+    return _first(above | invalid[which], begin)
+
+
+def _next_bits(params, i, height, times, bits, anchor):
+    """Bits the header at index i must have, as bitcoind's GetNextWorkRequired, or None if it cannot be known"""
+
+    interval = params['interval']
+    limit_bits = target_to_bits(params['pow_limit'])
+
+    if (height + i) % interval:
+        if params['min_difficulty']:
+            if times[i] > times[i - 1] + 2 * params['spacing']:
+                return limit_bits
+
+            return anchor  # Last block that is not a minimum difficulty one, or the first of the period
+
+        return bits[i - 1]
+    elif params['no_retargeting']:
+        return bits[i - 1]
+    elif i < interval:  # The first block of the period is not in the buffer
+        return None
+
+    timespan = params['timespan']
+    actual = min(max(int(times[i - 1]) - int(times[i - interval]), timespan // 4), timespan * 4)
+
+    return target_to_bits(min(bits_to_target(int(bits[i - 1])) * actual // timespan, params['pow_limit']))
+
+
+def _check_bits(params, height, times, bits, count, begin):
+    interval = params['interval']
+
+    if params['min_difficulty']:
+        limit_bits = target_to_bits(params['pow_limit'])
+        anchor = None
+
+        for i in range(count):
+            if i >= max(begin, 1):
+                expected = _next_bits(params, i, height, times, bits, anchor)
+
+                if expected is not None and bits[i] != expected:
+                    return i
+
+            if (height + i) % interval == 0 or bits[i] != limit_bits:
+                anchor = bits[i]
+
+        return None
+
+    start = max(begin, 1)
+
+    if numpy is not None:  # Within a period bits do not change
+        unchanged = bits[start:] == bits[start - 1:-1]
+        retarget = numpy.arange(height + start, height + count) % interval == 0
+
+        if params['no_retargeting']:
+            retarget[:] = False
+
+        first = _first(~unchanged & ~retarget, start)
+        retargets = [int(i) for i in numpy.flatnonzero(retarget) + start]
+    else:
+        first = next((i for i in range(start, count)
+                      if (params['no_retargeting'] or (height + i) % interval) and bits[i] != bits[i - 1]), None)
+        retargets = [i for i in range(start, count) if (height + i) % interval == 0 and not params['no_retargeting']]
+
+    for i in retargets:
+        if first is not None and i > first:
+            break
+
+        expected = _next_bits(params, i, height, times, bits, None)
+
+        if expected is not None and bits[i] != expected:
+            return i
+
+    return first
+
+
+def _check_median_time(height, times, count, begin):
+    def median(i):
+        previous = sorted(times[max(i - MEDIAN_TIME_SPAN, 0):i])
+        return previous[len(previous) // 2]
+
+    start = max(begin, 1)
+    early = range(start, min(MEDIAN_TIME_SPAN, count)) if height == 0 else ()
+
+    for i in early:  # Fewer than 11 blocks before them
+        if times[i] <= median(i):
+            return i
+
+    start = max(start, MEDIAN_TIME_SPAN)
+
+    if numpy is None:
+        return next((i for i in range(start, count) if times[i] <= median(i)), None)
+    elif start >= count:
+        return None
+
+    first = None
+
+    for chunk in range(start, count, 100000):  # Bounded memory for the windows
+        stop = min(chunk + 100000, count)
+        windows = numpy.lib.stride_tricks.sliding_window_view(times[chunk - MEDIAN_TIME_SPAN:stop - 1],
+                                                              MEDIAN_TIME_SPAN)
+        medians = numpy.partition(windows, MEDIAN_TIME_SPAN // 2, axis=1)[:, MEDIAN_TIME_SPAN // 2]
+        first = _first(times[chunk:stop] <= medians, chunk)
+
+        if first is not None:
+            break
+
+    return first
+
+
+def _check_versions(params, height, versions, count, begin):
+    minimums = ((params['bip34_height'], 2), (params['bip66_height'], 3), (params['bip65_height'], 4))
+    failures = []
+
+    for activation, minimum in minimums:
+        start = max(begin, activation - height, 0)
+
+        if numpy is not None:
+            failures.append(_first(versions[start:] < minimum, start))
+        else:
+            failures.append(next((i for i in range(start, count) if versions[i] < minimum), None))
+
+    return min((failure for failure in failures if failure is not None), default=None)
+
+
+def validate_headers(headers, height=0, network='main', begin=0, workers=None, chunk_size=50000,
+                     max_future=MAX_FUTURE_BLOCK_TIME):
+    """
+    Validate a chain of headers locally
+    Checks that need earlier headers are skipped for the first ones: to check from a height, start the headers one
+    retarget interval (2016) before it and pass begin.
+    :param headers: bytes-like object of contiguous 80-byte headers, or list of bytes or hex strings, required,
+        e.g. from get_block_header(verbose=False)
+    :param height: int, optional, default=0, height of the first header
+    :param network: string or dict, optional, default=main, a key of NETWORKS or consensus parameters like its values
+    :param begin: int, optional, default=0, index of the first header to check, the ones before only give context
+    :param workers: int, optional, default=number of CPUs, 1 to hash in this process
+    :param chunk_size: int, optional, default=50000 headers hashed per task
+    :param max_future: int, optional, default=7200 seconds a header time can be ahead of now, None to skip
+    :return: dict with valid (boolean), checked (int), height, hash and reason of the first failing header or None
+    """
+
+    params = NETWORKS[network] if isinstance(network, str) else network
+    data = _contiguous(headers)
+    count = len(data) // HEADER_SIZE
+    hashes = hash_headers(data, workers, chunk_size)
+
+    if numpy is not None:
+        fields = numpy.frombuffer(data, dtype=numpy.uint8).reshape(count, HEADER_SIZE)
+        versions = fields[:, 0:4].copy().view('<i4').ravel().astype(numpy.int64)
+        times = fields[:, 68:72].copy().view('<u4').ravel().astype(numpy.int64)
+        bits = fields[:, 72:76].copy().view('<u4').ravel().astype(numpy.int64)
+    else:
+        unpacked = list(struct.iter_unpack('<i32s32sIII', data))
+        versions = [header[0] for header in unpacked]
+        times = [header[3] for header in unpacked]
+        bits = [header[4] for header in unpacked]
+
+    if numpy is not None and params['min_difficulty']:  # Checked one by one, as plain ints
+        times_list, bits_list = times.tolist(), bits.tolist()
+    else:
+        times_list, bits_list = times, bits
+
+    failures = (
+        (_check_linkage(data, hashes, count, begin), 'bad-prevblk'),
+        (_check_pow(hashes, bits, count, begin, params['pow_limit']), 'high-hash'),
+        (_check_bits(params, height, times_list, bits_list, count, begin), 'bad-diffbits'),
+        (_check_median_time(height, times, count, begin), 'time-too-old'),
+        (_check_versions(params, height, versions, count, begin), 'bad-version'),
+    )
+
+    if max_future is not None:
+        limit = int(time.time()) + max_future
+
+        if numpy is not None:
+            failures += ((_first(times[begin:] > limit, begin), 'time-too-new'),)
+        else:
+            failures += ((next((i for i in range(begin, count) if times[i] > limit), None), 'time-too-new'),)
+
+    failed = [(index, reason) for index, reason in failures if index is not None]
+    result = {'valid': not failed, 'checked': max(count - begin, 0), 'height': None, 'hash': None, 'reason': None}
+
+    if failed:
+        index, reason = min(failed, key=lambda failure: failure[0])  # The first check wins at the same height
+        result.update(height=height + index, hash=raw.hash_to_hex(hashes[index * 32:index * 32 + 32]), reason=reason)
+
+    return result
+
+
+def validate_store(store, start=0, stop=None, network='main', workers=None, chunk_size=50000,
+                   max_future=MAX_FUTURE_BLOCK_TIME):
+    """
+    Validate the headers of a header store from height start to stop (not included)
+    :param store: src.bitcaviar.headers.HeaderStore, required
+    :param start: int, optional, default=0
+    :param stop: int, optional, default=up to the last stored header
+    :param network: string or dict, optional, default=main, see validate_headers
+    :param workers: int, optional, default=number of CPUs, 1 to hash in this process
+    :param chunk_size: int, optional, default=50000 headers hashed per task
+    :param max_future: int, optional, default=7200 seconds a header time can be ahead of now, None to skip
+    :return: dict, see validate_headers
+    """
+
+    params = NETWORKS[network] if isinstance(network, str) else network
+    stop = len(store) if stop is None else min(stop, len(store))
+    first = max(start - params['interval'], 0)
+
+    return validate_headers(store.read(first, stop), height=first, network=params, begin=start - first,
+                            workers=workers, chunk_size=chunk_size, max_future=max_future)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Fake bitcoin-cli
+Reads rpcport from bitcoin.conf and the cookie from the data directory, like bitcoin-cli, sends one JSON-RPC
+request and prints the result the same way. Used with tests/fake_bitcoind.py.
+Usage: fake_bitcoin_cli.py -datadir=<dir> <method> [args...]
+"""
+
+import base64
+import http.client
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from bitcaviar.rpc import convert_params  # noqa: E402
+
+
+def main(argv):
+    data_dir = '.'
+    args = []
+
+    for arg in argv:
+        if arg.startswith('-datadir='):
+            data_dir = arg[len('-datadir='):]
+        else:
+            args.append(arg)
+
+    with open(os.path.join(data_dir, 'bitcoin.conf')) as f:
+        conf = dict(line.strip().split('=', 1) for line in f if '=' in line)
+
+    with open(os.path.join(data_dir, '.cookie')) as f:
+        cookie = f.read().strip()
+
+    method, params = args[0], convert_params(args[0], args[1:])
+    connection = http.client.HTTPConnection('127.0.0.1', int(conf['rpcport']))
+    body = json.dumps({'jsonrpc': '1.0', 'id': 1, 'method': method, 'params': params})
+    headers = {'Authorization': 'Basic ' + base64.b64encode(cookie.encode()).decode()}
+    connection.request('POST', '/', body, headers)
+    response = json.loads(connection.getresponse().read())
+
+    if response['error']:
+        sys.stderr.write('error code: {}\nerror message:\n{}\n'.format(
+            response['error']['code'], response['error']['message']))
+        return abs(response['error']['code'])
+
+    result = response['result']
+
+    if result is None:
+        pass
+    elif isinstance(result, str):
+        sys.stdout.write(result + '\n')
+    else:
+        sys.stdout.write(json.dumps(result, indent=2) + '\n')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
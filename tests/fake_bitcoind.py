@@ -0,0 +1,1020 @@
+"""
+Fake bitcoind
+In-process JSON-RPC server serving a deterministic synthetic chain and mempool, for tests and benchmarks.
+Blocks are real serialized blocks (regtest difficulty, correct merkle roots and txids), so the raw parser,
+header store and validators can run on them. It writes a data directory with bitcoin.conf and .cookie,
+which the fake bitcoin-cli (tests/fake_bitcoin_cli.py) and the cookie authentication read.
+Hashing, block filters and merkle proofs are implemented here from the BIPs, not imported from bitcaviar, so the
+library is checked against an independent implementation.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_bitcoin_cli.py')
+REGTEST_BITS = 0x207fffff
+SUBSIDY = 50 * 100000000
+FILTER_P = 19  # BIP 158 basic filter parameters
+FILTER_M = 784931
+
+
+class RPCError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def varint(n):
+    if n < 0xfd:
+        return bytes([n])
+    elif n <= 0xffff:
+        return b'\xfd' + struct.pack('<H', n)
+    elif n <= 0xffffffff:
+        return b'\xfe' + struct.pack('<I', n)
+    else:
+        return b'\xff' + struct.pack('<Q', n)
+
+
+def read_varint(data, offset):
+    """Value of the CompactSize at offset and the offset after it"""
+    prefix = data[offset]
+
+    if prefix < 0xfd:
+        return prefix, offset + 1
+
+    size = {0xfd: 2, 0xfe: 4, 0xff: 8}[prefix]
+
+    return int.from_bytes(data[offset + 1:offset + 1 + size], 'little'), offset + 1 + size
+
+
+def double_sha256(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+def hash_to_hex(digest):
+    """Hash in internal byte order to the reversed hex of RPC results"""
+    return digest[::-1].hex()
+
+
+def siphash24(key, data):
+    """SipHash-2-4 of data with a 16-byte key"""
+    mask = (1 << 64) - 1
+    k0, k1 = struct.unpack('<QQ', key)
+    v = [k0 ^ 0x736f6d6570736575, k1 ^ 0x646f72616e646f6d, k0 ^ 0x6c7967656e657261, k1 ^ 0x7465646279746573]
+
+    def rotl(x, b):
+        return (x << b | x >> (64 - b)) & mask
+
+    def sip_round():
+        v[0] = (v[0] + v[1]) & mask
+        v[2] = (v[2] + v[3]) & mask
+        v[1] = rotl(v[1], 13) ^ v[0]
+        v[3] = rotl(v[3], 16) ^ v[2]
+        v[0] = rotl(v[0], 32)
+        v[2] = (v[2] + v[1]) & mask
+        v[0] = (v[0] + v[3]) & mask
+        v[1] = rotl(v[1], 17) ^ v[2]
+        v[3] = rotl(v[3], 21) ^ v[0]
+        v[2] = rotl(v[2], 32)
+
+    padded = data + bytes(7 - len(data) % 8) + bytes([len(data) & 0xff])
+
+    for (word,) in struct.iter_unpack('<Q', padded):
+        v[3] ^= word
+        sip_round()
+        sip_round()
+        v[0] ^= word
+
+    v[2] ^= 0xff
+
+    for _ in range(4):
+        sip_round()
+
+    return v[0] ^ v[1] ^ v[2] ^ v[3]
+
+
+def gcs_filter(elements, block_hash):
+    """BIP 158 basic filter of a set of scripts, for a block hash in internal byte order"""
+    elements = set(elements)
+    f = len(elements) * FILTER_M
+    values = sorted(siphash24(block_hash[:16], element) * f >> 64 for element in elements)
+    bits = 0
+    size = 0
+    previous = 0
+
+    for value in values:  # Golomb-Rice: quotient in unary, then the remainder in FILTER_P bits
+        quotient, remainder = divmod(value - previous, 1 << FILTER_P)
+        bits = (bits << quotient + 1 | (1 << quotient + 1) - 2) << FILTER_P | remainder
+        size += quotient + 1 + FILTER_P
+        previous = value
+
+    bits <<= -size % 8
+
+    return varint(len(elements)) + bits.to_bytes((size + 7) // 8, 'big')
+
+
+def gcs_filter_header(data, previous_header):
+    """BIP 157 filter header, hex strings of RPC results"""
+    return hash_to_hex(double_sha256(double_sha256(data) + bytes.fromhex(previous_header)[::-1]))
+
+
+def bits_to_target(bits):
+    return (bits & 0xffffff) << (8 * ((bits >> 24) - 3))
+
+
+def merkle_root(hashes):
+    """Merkle root of hashes in internal byte order"""
+    while len(hashes) > 1:
+        if len(hashes) % 2:
+            hashes = hashes + hashes[-1:]
+
+        hashes = [double_sha256(hashes[i] + hashes[i + 1]) for i in range(0, len(hashes), 2)]
+
+    return hashes[0]
+
+
+def script_for(*seed):
+    """Made up P2WPKH output script"""
+    return b'\x00\x14' + hashlib.sha256(repr(seed).encode()).digest()[:20]
+
+
+class Tx:
+    """Synthetic transaction"""
+    def __init__(self, inputs, outputs, witness=None, locktime=0):
+        """
+        :param inputs: list of (prev txid bytes, vout, script_sig bytes)
+        :param outputs: list of (value, script bytes)
+        :param witness: list of lists of bytes, optional
+        """
+        self.inputs = inputs
+        self.outputs = outputs
+        self.witness = witness
+        self.locktime = locktime
+        body_in = varint(len(inputs)) + b''.join(
+            txid + struct.pack('<I', vout) + varint(len(script)) + script + b'\xff\xff\xff\xff'
+            for txid, vout, script in inputs
+        )
+        body_out = varint(len(outputs)) + b''.join(
+            struct.pack('<q', value) + varint(len(script)) + script for value, script in outputs
+        )
+        version = struct.pack('<i', 2)
+        tail = struct.pack('<I', locktime)
+        self.stripped = version + body_in + body_out + tail
+
+        if witness:
+            stacks = b''.join(varint(len(stack)) + b''.join(varint(len(item)) + item for item in stack)
+                              for stack in witness)
+            self.raw = version + b'\x00\x01' + body_in + body_out + stacks + tail
+        else:
+            self.raw = self.stripped
+
+        self.txid = double_sha256(self.stripped)
+        self.wtxid = double_sha256(self.raw)
+        self.size = len(self.raw)
+        self.weight = len(self.stripped) * 3 + len(self.raw)
+        self.vsize = (self.weight + 3) // 4
+        self.fee = 0
+
+    @property
+    def is_coinbase(self):
+        return self.inputs[0][0] == bytes(32)
+
+
+class FakeBlock:
+    def __init__(self, height, previous, time_, txs, nonce_seed=0):
+        self.height = height
+        self.previous = previous
+        self.time = time_
+        self.txs = txs
+        root = merkle_root([tx.txid for tx in txs])
+        target = bits_to_target(REGTEST_BITS)
+        nonce = nonce_seed * 1000
+
+        while True:
+            header = struct.pack('<i32s32sIII', 0x20000000, previous, root, time_, REGTEST_BITS, nonce)
+            block_hash = double_sha256(header)
+
+            if int.from_bytes(block_hash, 'little') <= target:
+                break
+
+            nonce += 1
+
+        self.header = header
+        self.nonce = nonce
+        self.hash = block_hash
+        self.merkle_root = root
+        self.raw = header + varint(len(txs)) + b''.join(tx.raw for tx in txs)
+
+
+def partial_merkle_tree(block, matches):
+    """Serialized CMerkleBlock of a block, built the way bitcoind does"""
+    leaves = [tx.txid for tx in block.txs]
+    bits = []
+    hashes = []
+
+    def width(height):
+        return (len(leaves) + (1 << height) - 1) >> height
+
+    def node(height, position):
+        if height == 0:
+            return leaves[position]
+
+        left = node(height - 1, position * 2)
+        right = node(height - 1, position * 2 + 1) if position * 2 + 1 < width(height - 1) else left
+
+        return double_sha256(left + right)
+
+    def build(height, position):
+        parent_of_match = any(matches[position << height:(position + 1) << height])
+        bits.append(parent_of_match)
+
+        if height == 0 or not parent_of_match:
+            hashes.append(node(height, position))
+        else:
+            build(height - 1, position * 2)
+
+            if position * 2 + 1 < width(height - 1):
+                build(height - 1, position * 2 + 1)
+
+    height = 0
+
+    while width(height) > 1:
+        height += 1
+
+    build(height, 0)
+    flags = bytes(sum(bit << j for j, bit in enumerate(bits[i:i + 8])) for i in range(0, len(bits), 8))
+
+    return (block.raw[:80] + struct.pack('<I', len(leaves)) + varint(len(hashes)) + b''.join(hashes)
+            + varint(len(flags)) + flags)
+
+
+def parse_partial_merkle_tree(proof):
+    """Block hash, merkle root and matched txids of a serialized CMerkleBlock, rejected the way bitcoind does"""
+    total, = struct.unpack_from('<I', proof, 80)
+    count, offset = read_varint(proof, 84)
+    hashes = [proof[offset + 32 * i:offset + 32 * i + 32] for i in range(count)]
+    flag_count, offset = read_varint(proof, offset + 32 * count)
+    flags = proof[offset:offset + flag_count]
+
+    if offset + flag_count != len(proof) or total == 0 or count > total or len(flags) * 8 < count:
+        raise ValueError('Invalid proof')
+
+    bits = [flags[i >> 3] >> (i & 7) & 1 for i in range(len(flags) * 8)]
+    used = {'bits': 0, 'hashes': 0}
+    matched = []
+
+    def width(height):
+        return (total + (1 << height) - 1) >> height
+
+    def traverse(height, position):
+        if used['bits'] >= len(bits):
+            raise ValueError('Proof overflowed its bits')
+
+        flag = bits[used['bits']]
+        used['bits'] += 1
+
+        if height == 0 or not flag:
+            if used['hashes'] >= len(hashes):
+                raise ValueError('Proof overflowed its hashes')
+
+            digest = hashes[used['hashes']]
+            used['hashes'] += 1
+
+            if height == 0 and flag:
+                matched.append(hash_to_hex(digest))
+
+            return digest
+
+        left = traverse(height - 1, position * 2)
+
+        if position * 2 + 1 < width(height - 1):
+            right = traverse(height - 1, position * 2 + 1)
+
+            if right == left:
+                raise ValueError('Proof has identical children')
+        else:
+            right = left
+
+        return double_sha256(left + right)
+
+    height = 0
+
+    while width(height) > 1:
+        height += 1
+
+    root = traverse(height, 0)
+
+    if used['hashes'] != len(hashes) or (used['bits'] + 7) // 8 != len(flags):
+        raise ValueError('Proof has unused hashes or bits')
+
+    return hash_to_hex(double_sha256(proof[:80])), root, matched
+
+
+class FakeChain:
+    """
+    Deterministic chain: each block has a coinbase with one output per lane, and lane transactions
+    spending the matching coinbase output of the previous block from height 2 on (odd lanes with witness data)
+    """
+    def __init__(self, blocks=200, lanes=4, mempool_size=100):
+        self.lanes = lanes
+        self.blocks = []
+        self.by_hash = {}
+        self.txs = {}
+        self.tx_heights = {}
+        self.known_txs = {}  # Also the transactions of blocks reorganized away
+        self.mempool = {}
+        self.mempool_sequence = 1
+        self._reorgs = 0
+        self.mine(blocks)
+        self.fill_mempool(mempool_size)
+
+    def _make_block(self, height, seed):
+        previous = self.blocks[height - 1] if height else None
+        coinbase_script = varint(4) + struct.pack('<I', height) + repr(seed).encode()
+        lane_value = SUBSIDY // self.lanes
+        txs = []
+        fees = 0
+
+        for lane in range(self.lanes if height > 1 else 0):  # The genesis coinbase cannot be spent
+            fee = 1000 * (lane + 1) * (1 + height % 7)
+            coinbase = previous.txs[0]
+            value = lane_value - fee
+            outputs = [(value // 3, script_for(height, lane, 0, seed)),
+                       (value - value // 3, script_for(height, lane, 1))]
+            witness = [[bytes([lane]) * 71, bytes([height % 256]) * 33]] if lane % 2 else None
+            tx = Tx([(coinbase.txid, lane, b'' if witness else b'\x01' * 107)], outputs, witness)
+            tx.fee = fee
+            fees += fee
+            txs.append(tx)
+
+        coinbase_outputs = [(lane_value + (fees if lane == 0 else 0), script_for('coinbase', height, lane, seed))
+                            for lane in range(self.lanes)]
+        coinbase = Tx([(bytes(32), 0xffffffff, coinbase_script)], coinbase_outputs)
+        time_ = 1600000000 + height * 600
+
+        return FakeBlock(height, previous.hash if previous else bytes(32), time_, [coinbase] + txs, seed)
+
+    def _connect(self, block):
+        self.blocks.append(block)
+        self.by_hash[block.hash] = block
+
+        for tx in block.txs:
+            self.txs[tx.txid] = tx
+            self.known_txs[tx.txid] = tx
+            self.tx_heights[tx.txid] = block.height
+            self.mempool.pop(tx.txid, None)
+
+    def mine(self, count=1):
+        """Append count blocks"""
+        for _ in range(count):
+            self._connect(self._make_block(len(self.blocks), self._reorgs))
+
+    def reorg(self, depth, extra=0):
+        """Replace the last depth blocks with depth + extra different ones"""
+        self._reorgs += 1
+
+        for block in self.blocks[-depth:]:
+            for tx in block.txs:
+                self.txs.pop(tx.txid, None)
+                self.tx_heights.pop(tx.txid, None)
+
+        del self.blocks[-depth:]
+        self.mine(depth + extra)
+
+    def fill_mempool(self, size):
+        """Add size synthetic transactions to the mempool, in chains of five spending each other"""
+        tip = self.blocks[-1]
+        previous = None
+
+        for i in range(len(self.mempool), len(self.mempool) + size):
+            if previous is not None and i % 5:
+                spent = (previous.txid, 0, b'\x02' * 107)
+            else:
+                spent = (hashlib.sha256(b'unconfirmed' + str(i).encode()).digest(), 0, b'\x02' * 107)
+
+            tx = Tx([spent], [(10000 + i, script_for('mempool', i))])
+            tx.fee = tx.vsize * (1 + (i * 7) % 100)
+            tx.time = tip.time + i
+            tx.height = tip.height
+            tx.depends = [previous.txid] if previous is not None and i % 5 else []
+            self.mempool[tx.txid] = tx
+            self.mempool_sequence += 1
+            previous = tx
+
+    @property
+    def tip(self):
+        return self.blocks[-1]
+
+    def block(self, block_hash):
+        block = self.by_hash.get(bytes.fromhex(block_hash)[::-1]) if len(block_hash) == 64 else None
+
+        if block is None:
+            raise RPCError(-5, 'Block not found')
+
+        return block
+
+
+def btc(satoshis):
+    return satoshis / 100000000
+
+
+class FakeNode:
+    """RPC methods of the fake node"""
+    def __init__(self, chain):
+        self.chain = chain
+        self.filter_headers = {}
+
+    def call(self, method, params):
+        function = getattr(self, 'rpc_' + method, None)
+
+        if function is None:
+            raise RPCError(-32601, 'Method not found')
+
+        return function(*params)
+
+    # Blocks
+
+    def median_time(self, block):
+        return int(statistics.median(b.time for b in self.chain.blocks[max(0, block.height - 10):block.height + 1]))
+
+    def chain_work(self, block):
+        work = (2 ** 256 // (bits_to_target(REGTEST_BITS) + 1)) * (block.height + 1)
+        return '{:064x}'.format(work)
+
+    def difficulty(self):
+        return bits_to_target(0x1d00ffff) / bits_to_target(REGTEST_BITS)
+
+    def header_json(self, block):
+        active = self.chain.blocks[block.height] is block if block.height < len(self.chain.blocks) else False
+        header = {
+            'hash': hash_to_hex(block.hash),
+            'confirmations': len(self.chain.blocks) - block.height if active else -1,
+            'height': block.height,
+            'version': 0x20000000,
+            'versionHex': '20000000',
+            'merkleroot': hash_to_hex(block.merkle_root),
+            'time': block.time,
+            'mediantime': self.median_time(block),
+            'nonce': block.nonce,
+            'bits': '{:08x}'.format(REGTEST_BITS),
+            'difficulty': self.difficulty(),
+            'chainwork': self.chain_work(block),
+            'nTx': len(block.txs),
+        }
+
+        if block.height:
+            header['previousblockhash'] = hash_to_hex(block.previous)
+
+        if active and block.height + 1 < len(self.chain.blocks):
+            header['nextblockhash'] = hash_to_hex(self.chain.blocks[block.height + 1].hash)
+
+        return header
+
+    def tx_json(self, tx, block=None):
+        vin = []
+
+        for i, (txid, vout, script) in enumerate(tx.inputs):
+            if tx.is_coinbase:
+                vin.append({'coinbase': script.hex(), 'sequence': 4294967295})
+            else:
+                item = {'txid': hash_to_hex(txid), 'vout': vout, 'scriptSig': {'asm': '', 'hex': script.hex()}}
+
+                if tx.witness:
+                    item['txinwitness'] = [data.hex() for data in tx.witness[i]]
+
+                item['sequence'] = 4294967295
+                vin.append(item)
+
+        vout = [{'value': btc(value), 'n': n, 'scriptPubKey': {'asm': '0 ' + script[2:].hex(), 'hex': script.hex(),
+                                                                 'type': 'witness_v0_keyhash'}}
+                for n, (value, script) in enumerate(tx.outputs)]
+        result = {
+            'txid': hash_to_hex(tx.txid),
+            'hash': hash_to_hex(tx.wtxid),
+            'version': 2,
+            'size': tx.size,
+            'vsize': tx.vsize,
+            'weight': tx.weight,
+            'locktime': tx.locktime,
+            'vin': vin,
+            'vout': vout,
+        }
+
+        if block is not None and not tx.is_coinbase:
+            result['fee'] = btc(tx.fee)
+
+        result['hex'] = tx.raw.hex()
+
+        return result
+
+    def rpc_getbestblockhash(self):
+        return hash_to_hex(self.chain.tip.hash)
+
+    def rpc_getblock(self, blockhash, verbosity=1):
+        block = self.chain.block(blockhash)
+
+        if verbosity == 0:
+            return block.raw.hex()
+
+        result = self.header_json(block)
+        stripped = len(block.raw) - sum(len(tx.raw) - len(tx.stripped) for tx in block.txs)
+        result.update({
+            'size': len(block.raw),
+            'strippedsize': stripped,
+            'weight': stripped * 3 + len(block.raw),
+        })
+
+        if verbosity == 1:
+            result['tx'] = [hash_to_hex(tx.txid) for tx in block.txs]
+        else:
+            result['tx'] = [self.tx_json(tx, block) for tx in block.txs]
+
+        return result
+
+    def block_filter(self, block):
+        elements = []
+
+        for tx in block.txs:
+            elements.extend(script for value, script in tx.outputs if script and script[0] != 0x6a)
+
+            if not tx.is_coinbase:
+                elements.extend(self.chain.known_txs[txid].outputs[vout][1] for txid, vout, script_sig in tx.inputs)
+
+        return gcs_filter(elements, block.hash)
+
+    def filter_header(self, block):
+        missing = []
+
+        while block is not None and block.hash not in self.filter_headers:
+            missing.append(block)
+            block = self.chain.by_hash.get(block.previous)
+
+        header = self.filter_headers[block.hash] if block is not None else '00' * 32
+
+        for block in reversed(missing):
+            header = self.filter_headers[block.hash] = gcs_filter_header(self.block_filter(block), header)
+
+        return header
+
+    def rpc_getblockfilter(self, blockhash, filtertype='basic'):
+        if filtertype != 'basic':
+            raise RPCError(-5, 'Unknown filtertype')
+
+        block = self.chain.block(blockhash)
+
+        return {'filter': self.block_filter(block).hex(), 'header': self.filter_header(block)}
+
+    def rpc_getblockchaininfo(self):
+        tip = self.chain.tip
+        return {
+            'chain': 'regtest',
+            'blocks': tip.height,
+            'headers': tip.height,
+            'bestblockhash': hash_to_hex(tip.hash),
+            'difficulty': self.difficulty(),
+            'time': tip.time,
+            'mediantime': self.median_time(tip),
+            'verificationprogress': 1,
+            'initialblockdownload': False,
+            'chainwork': self.chain_work(tip),
+            'size_on_disk': sum(len(block.raw) for block in self.chain.blocks),
+            'pruned': False,
+            'warnings': '',
+        }
+
+    def rpc_getblockcount(self):
+        return self.chain.tip.height
+
+    def rpc_getblockhash(self, height):
+        if not 0 <= height < len(self.chain.blocks):
+            raise RPCError(-8, 'Block height out of range')
+
+        return hash_to_hex(self.chain.blocks[height].hash)
+
+    def rpc_getblockheader(self, blockhash, verbose=True):
+        block = self.chain.block(blockhash)
+
+        if not verbose:
+            return block.header.hex()
+
+        return self.header_json(block)
+
+    def rpc_getblockstats(self, hash_or_height, stats=None):
+        if isinstance(hash_or_height, int):
+            if not 0 <= hash_or_height < len(self.chain.blocks):
+                raise RPCError(-8, 'Target block height {} after current tip'.format(hash_or_height))
+
+            block = self.chain.blocks[hash_or_height]
+        else:
+            block = self.chain.block(hash_or_height)
+
+        txs = block.txs[1:]
+        fees = [tx.fee for tx in txs] or [0]
+        feerates = sorted(tx.fee // tx.vsize for tx in txs) or [0]
+        sizes = [tx.size for tx in txs] or [0]
+
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+        result = {
+            'avgfee': sum(fees) // max(len(txs), 1),
+            'avgfeerate': sum(fees) // max(sum(tx.vsize for tx in txs), 1),
+            'avgtxsize': sum(sizes) // max(len(txs), 1),
+            'blockhash': hash_to_hex(block.hash),
+            'feerate_percentiles': [percentile(feerates, p) for p in (10, 25, 50, 75, 90)],
+            'height': block.height,
+            'ins': sum(len(tx.inputs) for tx in txs),
+            'maxfee': max(fees),
+            'maxfeerate': max(feerates),
+            'maxtxsize': max(sizes),
+            'medianfee': int(statistics.median(fees)),
+            'mediantime': self.median_time(block),
+            'mediantxsize': int(statistics.median(sizes)),
+            'minfee': min(fees),
+            'minfeerate': min(feerates),
+            'mintxsize': min(sizes),
+            'outs': sum(len(tx.outputs) for tx in block.txs),
+            'subsidy': SUBSIDY,
+            'swtotal_size': sum(tx.size for tx in txs if tx.witness),
+            'swtotal_weight': sum(tx.weight for tx in txs if tx.witness),
+            'swtxs': sum(1 for tx in txs if tx.witness),
+            'time': block.time,
+            'total_out': sum(value for tx in txs for value, script in tx.outputs),
+            'total_size': sum(sizes) if txs else 0,
+            'total_weight': sum(tx.weight for tx in txs),
+            'totalfee': sum(fees),
+            'txs': len(block.txs),
+            'utxo_increase': sum(len(tx.outputs) for tx in block.txs) - len(txs),
+            'utxo_size_inc': 0,
+        }
+
+        if stats is not None:
+            for stat in stats:
+                if stat not in result:
+                    raise RPCError(-8, 'Invalid selected statistic {}'.format(stat))
+
+            result = {stat: result[stat] for stat in stats}
+
+        return result
+
+    def rpc_getchaintips(self):
+        tip = self.chain.tip
+        return [{'height': tip.height, 'hash': hash_to_hex(tip.hash), 'branchlen': 0, 'status': 'active'}]
+
+    def rpc_getchaintxstats(self, nblocks=None):
+        tip = self.chain.tip
+        nblocks = min(nblocks or 4320, tip.height)
+        start = self.chain.blocks[tip.height - nblocks]
+        window_tx_count = sum(len(block.txs) for block in self.chain.blocks[start.height + 1:])
+        interval = tip.time - start.time
+        return {
+            'time': tip.time,
+            'txcount': sum(len(block.txs) for block in self.chain.blocks),
+            'window_final_block_hash': hash_to_hex(tip.hash),
+            'window_final_block_height': tip.height,
+            'window_block_count': nblocks,
+            'window_tx_count': window_tx_count,
+            'window_interval': interval,
+            'txrate': window_tx_count / interval if interval else 0,
+        }
+
+    def rpc_getdifficulty(self):
+        return self.difficulty()
+
+    # Mempool
+
+    def mempool_tx(self, txid):
+        tx = self.chain.mempool.get(bytes.fromhex(txid)[::-1]) if len(txid) == 64 else None
+
+        if tx is None:
+            raise RPCError(-5, 'Transaction not in mempool')
+
+        return tx
+
+    def relatives(self, tx, direction):
+        found = []
+        pending = [tx]
+
+        while pending:
+            current = pending.pop()
+
+            if direction == 'ancestors':
+                related = [self.chain.mempool[txid] for txid in current.depends if txid in self.chain.mempool]
+            else:
+                related = [other for other in self.chain.mempool.values() if current.txid in other.depends]
+
+            for other in related:
+                if other not in found:
+                    found.append(other)
+                    pending.append(other)
+
+        return found
+
+    def entry_json(self, tx):
+        ancestors = self.relatives(tx, 'ancestors')
+        descendants = self.relatives(tx, 'descendants')
+        return {
+            'vsize': tx.vsize,
+            'weight': tx.weight,
+            'time': tx.time,
+            'height': tx.height,
+            'descendantcount': len(descendants) + 1,
+            'descendantsize': tx.vsize + sum(other.vsize for other in descendants),
+            'ancestorcount': len(ancestors) + 1,
+            'ancestorsize': tx.vsize + sum(other.vsize for other in ancestors),
+            'wtxid': hash_to_hex(tx.wtxid),
+            'fees': {
+                'base': btc(tx.fee),
+                'modified': btc(tx.fee),
+                'ancestor': btc(tx.fee + sum(other.fee for other in ancestors)),
+                'descendant': btc(tx.fee + sum(other.fee for other in descendants)),
+            },
+            'depends': [hash_to_hex(txid) for txid in tx.depends if txid in self.chain.mempool],
+            'spentby': [hash_to_hex(other.txid) for other in self.chain.mempool.values() if tx.txid in other.depends],
+            'bip125-replaceable': False,
+            'unbroadcast': False,
+        }
+
+    def rpc_getmempoolancestors(self, txid, verbose=False):
+        ancestors = self.relatives(self.mempool_tx(txid), 'ancestors')
+
+        if verbose:
+            return {hash_to_hex(tx.txid): self.entry_json(tx) for tx in ancestors}
+
+        return [hash_to_hex(tx.txid) for tx in ancestors]
+
+    def rpc_getmempooldescendants(self, txid, verbose=False):
+        descendants = self.relatives(self.mempool_tx(txid), 'descendants')
+
+        if verbose:
+            return {hash_to_hex(tx.txid): self.entry_json(tx) for tx in descendants}
+
+        return [hash_to_hex(tx.txid) for tx in descendants]
+
+    def rpc_getmempoolentry(self, txid):
+        return self.entry_json(self.mempool_tx(txid))
+
+    def rpc_getmempoolinfo(self):
+        mempool = self.chain.mempool.values()
+        return {
+            'loaded': True,
+            'size': len(self.chain.mempool),
+            'bytes': sum(tx.vsize for tx in mempool),
+            'usage': sum(tx.size * 4 for tx in mempool),
+            'total_fee': btc(sum(tx.fee for tx in mempool)),
+            'maxmempool': 300000000,
+            'mempoolminfee': 0.00001,
+            'minrelaytxfee': 0.00001,
+            'unbroadcastcount': 0,
+        }
+
+    def rpc_getrawmempool(self, verbose=False, mempool_sequence=False):
+        if verbose and mempool_sequence:
+            raise RPCError(-8, 'Verbose results cannot contain mempool sequence values.')
+
+        if verbose:
+            return {hash_to_hex(tx.txid): self.entry_json(tx) for tx in self.chain.mempool.values()}
+
+        txids = [hash_to_hex(txid) for txid in self.chain.mempool]
+
+        if mempool_sequence:
+            return {'txids': txids, 'mempool_sequence': self.chain.mempool_sequence}
+
+        return txids
+
+    # UTXO set
+
+    def spent(self):
+        return {(txid, vout) for block in self.chain.blocks for tx in block.txs[1:] for txid, vout, script in tx.inputs}
+
+    def rpc_gettxout(self, txid, n, include_mempool=True):
+        key = bytes.fromhex(txid)[::-1] if len(txid) == 64 else None
+        tx = self.chain.txs.get(key)
+
+        if tx is None or n >= len(tx.outputs) or (key, n) in self.spent() or self.chain.tx_heights[key] == 0:
+            return None
+
+        if include_mempool and any((key, n) == (spent, vout) for other in self.chain.mempool.values()
+                                   for spent, vout, script in other.inputs):
+            return None
+
+        value, script = tx.outputs[n]
+        return {
+            'bestblock': hash_to_hex(self.chain.tip.hash),
+            'confirmations': len(self.chain.blocks) - self.chain.tx_heights[key],
+            'value': btc(value),
+            'scriptPubKey': {'asm': '0 ' + script[2:].hex(), 'hex': script.hex(), 'type': 'witness_v0_keyhash'},
+            'coinbase': tx.is_coinbase,
+        }
+
+    def rpc_gettxoutproof(self, txids, blockhash=None):
+        keys = [bytes.fromhex(txid)[::-1] for txid in txids]
+
+        if blockhash is None:
+            heights = {self.chain.tx_heights.get(key) for key in keys}
+            block = self.chain.blocks[heights.pop()] if len(heights) == 1 and None not in heights else None
+        else:
+            block = self.chain.block(blockhash)
+
+        leaves = [tx.txid for tx in block.txs] if block is not None else []
+
+        if not keys or any(key not in leaves for key in keys):
+            raise RPCError(-5, 'Not all transactions found in specified or retrieved block')
+
+        return partial_merkle_tree(block, [leaf in keys for leaf in leaves]).hex()
+
+    def rpc_verifytxoutproof(self, proof):
+        try:
+            block_hash, root, txids = parse_partial_merkle_tree(bytes.fromhex(proof))
+        except (ValueError, IndexError, KeyError, struct.error):
+            raise RPCError(-22, 'TX decode failed')
+
+        block = self.chain.block(block_hash)
+
+        if root != block.merkle_root:
+            return []
+
+        return txids
+
+    def rpc_gettxoutsetinfo(self, hash_type='hash_serialized_2'):
+        spent = self.spent()
+        utxos = [(tx.txid, n, value) for block in self.chain.blocks[1:] for tx in block.txs
+                 for n, (value, script) in enumerate(tx.outputs) if (tx.txid, n) not in spent]
+        return {
+            'height': self.chain.tip.height,
+            'bestblock': hash_to_hex(self.chain.tip.hash),
+            'transactions': len({txid for txid, n, value in utxos}),
+            'txouts': len(utxos),
+            'bogosize': len(utxos) * 81,
+            'hash_serialized_2': hashlib.sha256(repr(sorted(utxos)).encode()).hexdigest(),
+            'disk_size': len(utxos) * 40,
+            'total_amount': btc(sum(value for txid, n, value in utxos)),
+        }
+
+    # Node
+
+    def rpc_preciousblock(self, blockhash):
+        self.chain.block(blockhash)
+        return None
+
+    def rpc_pruneblockchain(self, height):
+        raise RPCError(-1, 'Cannot prune blocks because node is not in prune mode.')
+
+    def rpc_savemempool(self):
+        return None
+
+    def rpc_verifychain(self, checklevel=3, nblocks=6):
+        return True
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # Async clients open many connections at once
+
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):  # Clients may hang up while streaming
+            super().handle_error(request, client_address)
+
+
+class FakeBitcoind:
+    """
+    Fake node served over HTTP on 127.0.0.1, with a data directory for the fake bitcoin-cli
+    """
+    def __init__(self, blocks=200, lanes=4, mempool_size=100, latency=0.0, rest=True):
+        """
+        :param blocks: int, optional, default=200, chain length
+        :param lanes: int, optional, default=4, non-coinbase transactions per block
+        :param mempool_size: int, optional, default=100
+        :param latency: float, optional, default=0, seconds added to every HTTP request
+        :param rest: boolean, optional, default=True, serve the REST interface
+        """
+        self.chain = FakeChain(blocks=blocks, lanes=lanes, mempool_size=mempool_size)
+        self.node = FakeNode(self.chain)
+        self.latency = latency
+        self.rest = rest
+        self.requests = 0
+        self.calls = []
+        self.lock = threading.Lock()
+        self.data_dir = tempfile.mkdtemp(prefix='fake-bitcoind-')
+        self.cookie = '__cookie__:' + hashlib.sha256(os.urandom(16)).hexdigest()
+        self.server = _Server(('127.0.0.1', 0), self._handler())
+        self.port = self.server.server_address[1]
+
+        with open(os.path.join(self.data_dir, '.cookie'), 'w') as f:
+            f.write(self.cookie)
+
+        with open(os.path.join(self.data_dir, 'bitcoin.conf'), 'w') as f:
+            f.write('rpcport={}\n'.format(self.port))
+
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def bitcoin(self, transport='http', **kwargs):
+        """
+        Get a config for this node
+        :param transport: string, optional, default=http, or cli to use the fake bitcoin-cli
+        """
+        from bitcaviar import config
+
+        if transport == 'cli':
+            return config.Bitcoin(cli_dir=CLI, data_dir=self.data_dir, **kwargs)
+        else:
+            return config.Bitcoin(data_dir=self.data_dir, rpc_host='127.0.0.1', rpc_port=self.port, **kwargs)
+
+    def execute(self, request):
+        with self.lock:
+            self.calls.append(request.get('method'))
+
+            try:
+                return {'result': self.node.call(request['method'], request.get('params', [])), 'error': None,
+                        'id': request.get('id')}
+            except RPCError as error:
+                return {'result': None, 'error': {'code': error.code, 'message': error.message},
+                        'id': request.get('id')}
+            except TypeError as error:
+                return {'result': None, 'error': {'code': -1, 'message': str(error)}, 'id': request.get('id')}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Headers and body are written separately
+
+            def reply(self, status, body, content_type='application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                fake.requests += 1
+
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                expected = 'Basic ' + base64.b64encode(fake.cookie.encode()).decode()
+
+                if self.headers.get('Authorization') != expected:
+                    return self.reply(401, b'')
+
+                request = json.loads(body)
+
+                if isinstance(request, list):
+                    status, response = 200, [fake.execute(item) for item in request]
+                else:
+                    response = fake.execute(request)
+                    error = response['error']
+                    status = 200 if error is None else 404 if error['code'] == -32601 else 500
+
+                self.reply(status, json.dumps(response).encode())
+
+            def do_GET(self):
+                fake.requests += 1
+
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                prefix = '/rest/block/'
+
+                if not fake.rest or not self.path.startswith(prefix) or not self.path.endswith('.bin'):
+                    return self.reply(404, b'Not found', 'text/plain')
+
+                try:
+                    with fake.lock:
+                        block = fake.chain.block(self.path[len(prefix):-len('.bin')])
+                except RPCError:
+                    return self.reply(404, b'Block not found', 'text/plain')
+
+                self.reply(200, block.raw, 'application/octet-stream')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer
+from unittest import IsolatedAsyncioTestCase
+from bitcaviar import aio
+from bitcaviar import config
+from tests.test_rpc import Handler
+
+
+class TestAio(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.authorizations = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.bitcoin = config.Bitcoin(
+            rpc_host='127.0.0.1',
+            rpc_port=self.server.server_address[1],
+            rpc_user='user',
+            rpc_password='password'
+        )
+
+    async def asyncTearDown(self):
+        aio.pool(self.bitcoin).close()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    async def test_get_block_count(self):
+        block_count = await aio.get_block_count(bitcoin=self.bitcoin)
+        self.assertEqual(block_count, 1000)
+
+    async def test_concurrent_calls(self):
+        pool = aio.pool(self.bitcoin, limit=4)
+        block_hashes = await asyncio.gather(*[aio.get_block_hash(self.bitcoin, height) for height in range(50)])
+
+        self.assertEqual(len(block_hashes), 50)
+        self.assertLessEqual(len(pool._idle), 4)
+
+    async def test_error(self):
+        with self.assertRaises(ValueError):
+            await aio.get_difficulty(bitcoin=self.bitcoin)
+
+    async def test_timeout(self):
+        server = await asyncio.start_server(lambda reader, writer: None, '127.0.0.1', 0)  # Never answers
+        bitcoin = config.Bitcoin(rpc_host='127.0.0.1', rpc_port=server.sockets[0].getsockname()[1], rpc_user='user',
+                                 rpc_password='password')
+        bitcoin.transport.timeout = 0.1
+
+        try:
+            with self.assertRaises(asyncio.TimeoutError):
+                await aio.get_block_count(bitcoin=bitcoin)
+
+            self.assertEqual(aio.pool(bitcoin)._idle, [])
+        finally:
+            aio.pool(bitcoin).close()
+            server.close()
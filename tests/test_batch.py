@@ -0,0 +1,51 @@
+import threading
+from http.server import ThreadingHTTPServer
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar import config
+from tests.test_rpc import Handler
+
+
+class TestBatch(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.authorizations = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.bitcoin = config.Bitcoin(
+            rpc_host='127.0.0.1',
+            rpc_port=self.server.server_address[1],
+            rpc_user='user',
+            rpc_password='password'
+        )
+
+    def tearDown(self):
+        self.bitcoin.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_batch(self):
+        with blockchain.batch(bitcoin=self.bitcoin) as b:
+            block_count = b.get_block_count()
+            block_hash = b.get_block_hash(height=1000)
+            difficulty = b.get_difficulty()
+            verification = b.verify_chain()
+
+        self.assertEqual(len(self.server.authorizations), 1)
+        self.assertEqual(block_count.result(), 1000)
+        self.assertIsInstance(block_hash.result(), str)
+        self.assertIs(verification.result(), True)
+
+        with self.assertRaises(ValueError):
+            difficulty.result()
+
+        results = b.results()
+        self.assertEqual(results[0], 1000)
+        self.assertIsInstance(results[2], ValueError)
+
+    def test_batch_size(self):
+        with blockchain.batch(bitcoin=self.bitcoin, size=2) as b:
+            for height in range(5):
+                b.get_block_hash(height=height)
+
+        self.assertEqual(len(self.server.authorizations), 3)
+        self.assertEqual(len(b.results()), 5)
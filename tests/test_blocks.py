@@ -0,0 +1,56 @@
+import random
+import threading
+import time
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar.blocks import fork_height, iter_blocks
+from tests.fake_bitcoind import FakeBitcoind
+
+
+class TestBlocks(TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.fetched = []
+
+    def fetch(self, bitcoin, height, verbosity):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.fetched.append(height)
+
+        time.sleep(random.random() / 1000)
+
+        with self.lock:
+            self.in_flight -= 1
+
+        return {'height': height, 'verbosity': verbosity}
+
+    def test_iter_blocks(self):
+        blocks = list(iter_blocks(bitcoin=None, start=10, stop=110, workers=4, fetch=self.fetch))
+
+        self.assertEqual([block['height'] for block in blocks], list(range(10, 110)))
+        self.assertLessEqual(self.max_in_flight, 4)
+
+    def test_backpressure(self):
+        blocks = iter_blocks(bitcoin=None, start=0, stop=1000, workers=2, prefetch=5, fetch=self.fetch)
+        next(blocks)
+        time.sleep(0.05)
+
+        self.assertLessEqual(len(self.fetched), 6)
+        blocks.close()
+
+    def test_fork_height(self):
+        node = FakeBitcoind(blocks=30, mempool_size=0).start()
+
+        try:
+            bitcoin = node.bitcoin('http')
+            stored = {height: blockchain.get_block_hash(bitcoin=bitcoin, height=height) for height in range(30)}
+            node.chain.reorg(depth=5, extra=-2)
+
+            self.assertEqual(fork_height(bitcoin, 29, 0, stored.get), 24)
+            self.assertEqual(fork_height(bitcoin, 29, 26, stored.get), 25)  # Nothing in common above first
+            self.assertEqual(fork_height(bitcoin, 20, 10, stored.get, block_count=30), 20)
+        finally:
+            node.stop()
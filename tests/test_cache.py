@@ -0,0 +1,111 @@
+import threading
+from unittest import TestCase
+from bitcaviar import config
+from bitcaviar.cache import BlockCache
+
+
+class ChainTransport:
+    """Transport serving a chain of made up hashes, which can be reorganized"""
+    def __init__(self, length):
+        self.chain = ['{:064x}'.format(height) for height in range(length)]
+        self.calls = []
+
+    def reorg(self, depth, extra=0):
+        fork = len(self.chain) - depth
+        branch = ['{:064x}'.format(0xf00000 + height) for height in range(fork, fork + depth + extra)]
+        self.chain = self.chain[:fork] + branch
+
+    def run(self, command):
+        method, args = command[2], command[3:]
+        self.calls.append(method)
+
+        if method == 'getblockhash':
+            return self.chain[int(args[0])]
+        elif method == 'getbestblockhash':
+            return self.chain[-1]
+        elif method == 'getblockheader':
+            return {'hash': args[0], 'height': self.chain.index(args[0])}
+        elif method == 'getblock':
+            return {'hash': args[0], 'tx': ['00' * 32] * 10}
+
+
+class TestCache(TestCase):
+    def setUp(self):
+        self.bitcoin = config.Bitcoin()
+        self.bitcoin.transport = ChainTransport(100)
+
+    def test_hits(self):
+        cache = BlockCache()
+        block_hash = cache.get_block_hash(self.bitcoin, 10)
+        cache.get_block_hash(self.bitcoin, '10')
+        cache.get_block(self.bitcoin, block_hash)
+        cache.get_block(self.bitcoin, block_hash)
+
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(self.bitcoin.transport.calls, ['getblockhash', 'getblock'])
+
+    def test_eviction(self):
+        cache = BlockCache(max_entries=10)
+
+        for height in range(20):
+            cache.get_block_hash(self.bitcoin, height)
+
+        self.assertEqual(cache.stats()['entries'], 10)
+        self.assertIsNone(cache.get(('getblockhash', 0)))
+
+        cache = BlockCache(max_bytes=1000)
+
+        for height in range(20):
+            cache.get_block(self.bitcoin, cache.get_block_hash(self.bitcoin, height))
+
+        self.assertLessEqual(cache.stats()['bytes'], 1000)
+
+    def test_reorg(self):
+        cache = BlockCache()
+        cache.get_best_block_hash(self.bitcoin)
+
+        for height in range(90, 100):
+            cache.get_block_hash(self.bitcoin, height)
+
+        self.bitcoin.transport.reorg(depth=3, extra=1)
+        cache.get_best_block_hash(self.bitcoin)
+
+        for height in range(90, 101):
+            self.assertEqual(cache.get_block_hash(self.bitcoin, height), self.bitcoin.transport.chain[height])
+
+        self.assertEqual(self.bitcoin.transport.calls.count('getblockhash'), 10 + 3 + 1 + 4)
+
+    def test_extension(self):
+        cache = BlockCache()
+        cache.get_best_block_hash(self.bitcoin)
+        cache.get_block_hash(self.bitcoin, 99)
+        self.bitcoin.transport.chain.append('ff' * 32)
+        cache.get_best_block_hash(self.bitcoin)
+
+        self.assertEqual(cache.get(('getblockhash', 99)), self.bitcoin.transport.chain[99])
+
+    def test_reorg_is_atomic(self):
+        cache = BlockCache()
+        cache.get_best_block_hash(self.bitcoin)
+        cache.get_block_hash(self.bitcoin, 98)
+        cache.get_block_hash(self.bitcoin, 99)
+        self.bitcoin.transport.reorg(depth=2)
+        run = self.bitcoin.transport.run
+        seen = []
+        readers = []
+
+        def run_and_read(command):  # Lookups while update_tip checks the mappings
+            if command[2] == 'getblockhash' and not readers:
+                readers.append(threading.Thread(target=lambda: seen.append(
+                    (cache.get(('getblockhash', 98)), cache.get(('getblockhash', 99)), cache.tip))))
+                readers[0].start()
+                readers[0].join(0.2)
+
+            return run(command)
+
+        self.bitcoin.transport.run = run_and_read
+        cache.get_best_block_hash(self.bitcoin)
+        readers[0].join()
+
+        self.assertEqual(seen, [(None, None, self.bitcoin.transport.chain[99])])
@@ -0,0 +1,92 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from bitcaviar import aio
+from bitcaviar import blockchain
+from bitcaviar import metrics
+from bitcaviar.cache import BlockCache
+from bitcaviar.client import Client, default_client
+from tests.fake_bitcoind import FakeBitcoind
+
+
+class TestClient(TestCase):
+    def setUp(self):
+        self.node = FakeBitcoind(blocks=30, mempool_size=5).start()
+        self.bitcoin = self.node.bitcoin('http')
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+        self.node.stop()
+
+    def test_methods(self):
+        client = Client(data_dir=self.node.data_dir, rpc_host='127.0.0.1', rpc_port=self.node.port)
+        block_hash = client.get_block_hash(10)
+
+        self.assertEqual(client.get_block_count(), 29)
+        self.assertEqual(client.get_block(block_hash)['height'], 10)
+        self.assertEqual(client.get_block_header(block_hash, typed=True).height, 10)
+        self.assertEqual(len(client.get_raw_mempool()), 5)
+        self.assertEqual(blockchain.get_block_hash(client, 10), block_hash)  # Clients work as configs too
+
+    def test_typed_with_fields(self):
+        block_hash = blockchain.get_block_hash(self.bitcoin, 10)
+        txid = blockchain.get_raw_mempool(self.bitcoin)[0]
+        self.node.calls.clear()
+
+        for call in (lambda: blockchain.get_block(self.bitcoin, block_hash, typed=True, fields=('height',)),
+                     lambda: blockchain.get_block_header(self.bitcoin, block_hash, typed=True, fields=('height',)),
+                     lambda: blockchain.get_mempool_entry(self.bitcoin, txid, typed=True, fields=('vsize',)),
+                     lambda: blockchain.get_raw_mempool(self.bitcoin, verbose=True, typed=True, fields=('vsize',))):
+            with self.assertRaisesRegex(ValueError, 'typed=True'):
+                call()
+
+        self.assertEqual(self.node.calls, [])
+        self.assertEqual(len(blockchain.get_raw_mempool(self.bitcoin, typed=True, fields=('vsize',))), 5)
+
+    def test_default_client(self):
+        client = default_client(self.bitcoin)
+
+        self.assertIs(default_client(self.bitcoin), client)
+        self.assertIs(default_client(client), client)
+        self.assertIsNot(default_client(self.node.bitcoin('http')), client)
+
+    def test_threads(self):
+        client = Client(self.bitcoin)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            hashes = list(executor.map(client.get_block_hash, range(30)))
+
+        self.assertEqual(hashes, [blockchain.get_block_hash(self.bitcoin, height) for height in range(30)])
+
+    def test_cache(self):
+        client = Client(self.bitcoin, cache=BlockCache())
+        metrics.enable()
+        block_hash = client.get_block_hash(5)
+        self.node.calls.clear()
+
+        for _ in range(3):
+            self.assertEqual(client.get_block_hash(5), block_hash)
+            client.get_block(block_hash)
+
+        self.assertEqual(self.node.calls, ['getblock'])
+        self.assertEqual(metrics.snapshot()['getblock']['total']['count'], 1)  # Not counted twice on the miss
+
+        self.node.chain.reorg(depth=26)
+        client.get_best_block_hash()
+
+        self.assertNotEqual(client.get_block_hash(5), block_hash)
+
+    def test_batch_and_aio(self):
+        client = Client(self.bitcoin)
+
+        with client.batch() as b:
+            calls = [b.get_block_hash(height=height) for height in range(3)]
+
+        async def main():
+            try:
+                return await asyncio.gather(*[aio.get_block_hash(client, height) for height in range(3)])
+            finally:
+                client.pool().close()
+
+        self.assertEqual(asyncio.run(main()), [call.result() for call in calls])
@@ -0,0 +1,159 @@
+import asyncio
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from bitcaviar import aio
+from bitcaviar import blockchain
+from bitcaviar import config
+from bitcaviar.cluster import ClusterTransport, is_pinned
+from tests.fake_bitcoind import FakeBitcoind
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def endpoint(node):
+    return {'data_dir': node.data_dir, 'rpc_host': '127.0.0.1', 'rpc_port': node.port}
+
+
+class TestCluster(TestCase):
+    def setUp(self):
+        self.nodes = [FakeBitcoind(blocks=50, mempool_size=10, latency=0.005).start() for _ in range(3)]
+        self.bitcoin = config.Bitcoin(endpoints=[endpoint(node) for node in self.nodes])
+
+    def tearDown(self):
+        self.bitcoin.transport.stop()
+
+        for node in self.nodes:
+            node.stop()
+
+    def test_is_pinned(self):
+        self.assertTrue(is_pinned([None, None, 'getrawmempool']))
+        self.assertTrue(is_pinned([None, None, 'gettxout', 'ab', '0']))
+        self.assertTrue(is_pinned([None, None, 'gettxout', 'ab', '0', 'true']))
+        self.assertFalse(is_pinned([None, None, 'gettxout', 'ab', '0', 'false']))
+        self.assertFalse(is_pinned([None, None, 'getblock', 'ab']))
+
+    def test_spread(self):
+        block_hash = blockchain.get_block_hash(bitcoin=self.bitcoin, height=0)
+
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            headers = list(executor.map(
+                lambda _: blockchain.get_block_header(bitcoin=self.bitcoin, block_hash=block_hash), range(60)
+            ))
+
+        self.assertTrue(all(header['hash'] == block_hash for header in headers))
+        self.assertTrue(all(node.calls.count('getblockheader') > 5 for node in self.nodes))
+        self.assertTrue(all(node.outstanding == 0 for node in self.bitcoin.transport.nodes))
+
+    def test_pinned(self):
+        for _ in range(6):
+            blockchain.get_raw_mempool(bitcoin=self.bitcoin)
+            blockchain.save_mempool(bitcoin=self.bitcoin)
+
+        self.assertEqual([node.calls.count('getrawmempool') for node in self.nodes], [6, 0, 0])
+        self.assertEqual([node.calls.count('savemempool') for node in self.nodes], [6, 0, 0])
+
+    def test_failover(self):
+        bitcoin = config.Bitcoin(endpoints=[{'rpc_host': '127.0.0.1', 'rpc_port': free_port(), 'rpc_user': 'user',
+                                             'rpc_password': 'password'}, endpoint(self.nodes[1])])
+        down, up = bitcoin.transport.nodes
+
+        for _ in range(3):  # Read-only calls fail over to the healthy node
+            self.assertEqual(blockchain.get_block_count(bitcoin=bitcoin), 49)
+
+        self.assertFalse(down.healthy)
+        self.assertEqual(down.failures, 1)
+
+        # The pinned node was down: the call fails, and the next one goes to a healthy node
+        bitcoin.transport.pinned = down
+        down.retry_at = 0
+
+        with self.assertRaises(OSError):
+            blockchain.get_mempool_info(bitcoin=bitcoin)
+
+        self.assertEqual(blockchain.get_mempool_info(bitcoin=bitcoin)['size'], 10)
+        self.assertIs(bitcoin.transport.pinned, up)
+
+    def test_lagging(self):
+        for node in self.nodes[:2]:
+            node.chain.mine(5)
+
+        heights = self.bitcoin.transport.check()
+
+        self.assertEqual(sorted(heights.values()), [49, 54, 54])
+
+        for _ in range(10):
+            blockchain.get_block_count(bitcoin=self.bitcoin)
+
+        self.assertEqual(self.nodes[2].calls.count('getblockcount'), 1)  # Only the health check
+
+    def test_not_found_elsewhere(self):
+        for node in self.nodes[:2]:  # The third node has not seen them yet
+            node.chain.mine(2)
+
+        hashes = [blockchain.get_block_hash(bitcoin=self.nodes[0].bitcoin('http'), height=height)
+                  for height in (50, 51)]
+
+        for _ in range(6):
+            self.assertEqual([blockchain.get_block_header(bitcoin=self.bitcoin, block_hash=block_hash)['height']
+                              for block_hash in hashes], [50, 51])
+
+        with blockchain.batch(self.bitcoin) as b:
+            calls = [b.get_block_header(block_hash=block_hash) for block_hash in hashes * 3]
+
+        self.assertEqual([call.result()['height'] for call in calls], [50, 51] * 3)
+        self.assertGreater(self.nodes[2].calls.count('getblockheader'), 0)
+
+        with self.assertRaisesRegex(ValueError, 'Block not found'):  # Nowhere
+            blockchain.get_block_header(bitcoin=self.bitcoin, block_hash='00' * 32)
+
+    def test_background_checks(self):
+        self.nodes[0].chain.mine(5)
+        bitcoin = config.Bitcoin(endpoints=[endpoint(node) for node in self.nodes], health_interval=0.05)
+
+        try:
+            deadline = time.monotonic() + 5
+
+            while bitcoin.transport.nodes[-1].blocks is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            self.assertEqual([node.blocks for node in bitcoin.transport.nodes], [54, 49, 49])  # With no call of ours
+        finally:
+            bitcoin.transport.stop()
+
+    def test_batch_and_cli(self):
+        bitcoin = config.Bitcoin(endpoints=[{'cli_dir': node.bitcoin('cli').cli_dir, 'data_dir': node.data_dir}
+                                            for node in self.nodes[:2]])
+
+        expected = [blockchain.get_block_hash(bitcoin=self.bitcoin, height=height) for height in range(3)]
+
+        for node in self.nodes:
+            node.calls.clear()
+
+        with blockchain.batch(bitcoin) as b:
+            calls = [b.get_block_hash(height=height) for height in range(3)]
+
+        self.assertEqual([call.result() for call in calls], expected)
+        self.assertEqual(sum(node.calls.count('getblockhash') for node in self.nodes[:2]), 3)
+
+    def test_aio(self):
+        async def main():
+            try:
+                return await asyncio.gather(*[aio.get_block_hash(self.bitcoin, height) for height in range(20)])
+            finally:
+                aio.pool(self.bitcoin).close()
+
+        self.assertIs(asyncio.run(self._pool_type()), aio.AsyncThreadTransport)
+        self.assertEqual(len(set(asyncio.run(main()))), 20)
+
+    async def _pool_type(self):
+        return type(aio.pool(self.bitcoin))
+
+    def test_no_nodes(self):
+        with self.assertRaises(ValueError):
+            ClusterTransport([])
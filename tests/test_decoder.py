@@ -0,0 +1,84 @@
+import json
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar import decoder
+from tests.fake_bitcoind import FakeBitcoind
+
+BLOCK = json.dumps({
+    'hash': 'ab' * 32,
+    'height': 5,
+    'tx': [{'txid': '01' * 32, 'vin': [{'coinbase': '00'}]}, {'txid': '02' * 32, 'vin': []}],
+    'in': 3,
+})
+
+MEMPOOL = json.dumps({
+    'aa': {'fees': {'base': 0.0001, 'modified': 0.0001}, 'vsize': 141},
+    'bb': {'fees': {'base': 0.0002, 'modified': 0.0002}, 'vsize': 110},
+})
+
+
+def installed():
+    """Backends that can be used here"""
+    return [name for name in decoder.BACKENDS if (name != 'msgspec' or decoder.msgspec is not None) and
+            (name != 'orjson' or decoder.orjson is not None)]
+
+
+class TestDecoder(TestCase):
+    def setUp(self):
+        self.backend = decoder.backend
+
+    def tearDown(self):
+        decoder.use(self.backend)
+
+    def test_fields(self):
+        for backend in installed():
+            with self.subTest(backend=backend):
+                decoder.use(backend)
+
+                self.assertEqual(decoder.loads(BLOCK), json.loads(BLOCK))
+                self.assertEqual(decoder.loads(BLOCK, ('height', 'tx.txid', 'in', 'missing')),
+                                 {'height': 5, 'in': 3, 'tx': [{'txid': '01' * 32}, {'txid': '02' * 32}]})
+                self.assertEqual(decoder.loads(BLOCK, ('tx.txid', 'tx')), {'tx': json.loads(BLOCK)['tx']})
+                self.assertEqual(decoder.loads(MEMPOOL, ('*.fees.base',)),
+                                 {'aa': {'fees': {'base': 0.0001}}, 'bb': {'fees': {'base': 0.0002}}})
+                self.assertEqual(decoder.loads('[1, 2]', ('height',)), [1, 2])
+
+    def test_select(self):
+        self.assertEqual(decoder.select(json.loads(BLOCK), ('hash',)), {'hash': 'ab' * 32})
+
+    def test_responses(self):
+        for backend in installed():
+            with self.subTest(backend=backend):
+                decoder.use(backend)
+                response = decoder.loads_response(b'{"result": {"height": 5}, "error": null, "id": 1}')
+                result = response['result']
+
+                self.assertEqual(decoder.loads(result) if decoder.is_raw(result) else result, {'height': 5})
+                self.assertEqual(decoder.loads_response(b'[{"result": 5, "error": null, "id": 1}]')[0]['result'], 5)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            decoder.use('simplejson')
+
+
+class TestFields(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.node = FakeBitcoind(blocks=20, mempool_size=5).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.node.stop()
+
+    def test_transports(self):
+        for transport in ('http', 'cli'):
+            bitcoin = self.node.bitcoin(transport)
+            block_hash = blockchain.get_block_hash(bitcoin=bitcoin, height=10)
+            block = blockchain.get_block(bitcoin=bitcoin, blockhash=block_hash, verbosity=2)
+            selected = blockchain.get_block(bitcoin=bitcoin, blockhash=block_hash, verbosity=2,
+                                            fields=('height', 'tx.txid'))
+            mempool = blockchain.get_raw_mempool(bitcoin=bitcoin, verbose=True, fields=('vsize',))
+
+            self.assertEqual(selected, {'height': 10, 'tx': [{'txid': tx['txid']} for tx in block['tx']]})
+            self.assertEqual(len(mempool), 5)
+            self.assertTrue(all(entry.keys() == {'vsize'} for entry in mempool.values()))
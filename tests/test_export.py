@@ -0,0 +1,119 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipIf
+from bitcaviar import blockchain
+from bitcaviar import export
+from bitcaviar.__main__ import main
+from tests.fake_bitcoind import FakeBitcoind
+
+
+class Interrupted(Exception):
+    pass
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.node = FakeBitcoind(blocks=30, mempool_size=0).start()
+        self.bitcoin = self.node.bitcoin('http')
+        self.config = {'data_dir': self.node.data_dir, 'rpc_host': '127.0.0.1', 'rpc_port': self.node.port}
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.node.stop()
+        shutil.rmtree(self.path)
+
+    def read(self, table):
+        rows = []
+
+        for name in sorted(os.listdir(os.path.join(self.path, table))):
+            with gzip.open(os.path.join(self.path, table, name), 'rt') as f:
+                rows.extend(json.loads(line) for line in f)
+
+        return rows
+
+    def test_export(self):
+        self.assertEqual(export.export(self.config, self.path, start=3, stop=15, shard_size=5, file_format='ndjson',
+                                       workers=2), 3)
+
+        blocks = self.read('blocks')
+        block = blockchain.get_block(bitcoin=self.bitcoin, blockhash=blocks[5]['hash'], verbosity=2)
+        txs = [tx for tx in self.read('transactions') if tx['height'] == 8]
+        inputs = [tx_in for tx_in in self.read('inputs') if tx_in['height'] == 8]
+        outputs = [tx_out for tx_out in self.read('outputs') if tx_out['height'] == 8]
+
+        self.assertEqual([row['height'] for row in blocks], list(range(3, 15)))
+        self.assertEqual((block['height'], block['size'], block['nTx']), (8, blocks[5]['size'], blocks[5]['tx_count']))
+        self.assertEqual([(tx['txid'], tx['size'], tx['weight']) for tx in txs],
+                         [(tx['txid'], tx['size'], tx['weight']) for tx in block['tx']])
+        self.assertEqual([(tx_in['txid'], tx_in['previous_txid'], tx_in['previous_vout']) for tx_in in inputs[1:]],
+                         [(tx['txid'], tx_in['txid'], tx_in['vout']) for tx in block['tx'][1:] for tx_in in tx['vin']])
+        self.assertEqual([(tx_out['txid'], tx_out['value'], tx_out['script_pubkey']) for tx_out in outputs],
+                         [(tx['txid'], round(tx_out['value'] * 100000000), tx_out['scriptPubKey']['hex'])
+                          for tx in block['tx'] for tx_out in tx['vout']])
+
+    def test_resume(self):
+        finished = []
+
+        def progress(start, stop):
+            finished.append(start)
+
+            if len(finished) == 2:
+                raise Interrupted()
+
+        with self.assertRaises(Interrupted):
+            export.export(self.config, self.path, stop=23, shard_size=10, file_format='ndjson', workers=1,
+                          progress=progress)
+
+        self.assertEqual(export.read_checkpoint(self.path)['done'], [[0, 10], [10, 20]])
+        self.assertEqual(export.export(self.config, self.path, stop=23, shard_size=10, file_format='ndjson'), 1)
+        self.assertEqual(export.export(self.config, self.path, shard_size=10, file_format='ndjson', workers=1), 1)
+        self.assertEqual([row['height'] for row in self.read('blocks')], list(range(30)))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path, 'outputs')))[-1],
+                         'part-000000020-000000030.ndjson.gz')  # Replaced the one cut at height 23
+
+        with self.assertRaises(ValueError):
+            export.export(self.config, self.path, shard_size=5, file_format='ndjson')
+
+    def test_batches(self):
+        for table in export.TABLES:
+            os.makedirs(os.path.join(self.path, table))
+
+        export.export_shard(self.config, self.path, 0, 7, 'ndjson', batch_size=3)
+        rows = self.read('outputs')
+        shutil.rmtree(os.path.join(self.path, 'outputs'))
+        os.makedirs(os.path.join(self.path, 'outputs'))
+        export.export_shard(self.config, self.path, 0, 7, 'ndjson', batch_size=100)
+
+        self.assertEqual(self.read('outputs'), rows)
+        self.assertEqual(sorted({row['height'] for row in rows}), list(range(7)))
+
+    def test_failed_shard(self):
+        with self.assertRaises(ValueError):  # The last shard is past the tip
+            export.export(self.config, self.path, stop=33, shard_size=5, file_format='ndjson', workers=2)
+
+        done = export.read_checkpoint(self.path)['done']
+        names = sorted(os.listdir(os.path.join(self.path, 'blocks')))
+
+        self.assertNotIn([30, 33], done)
+        self.assertEqual(names, sorted(os.path.basename(export.shard_path(self.path, 'blocks', first, last, 'ndjson'))
+                                       for first, last in done))  # Nothing unrecorded or half written
+        self.assertEqual(export.export(self.config, self.path, stop=30, shard_size=5, file_format='ndjson'),
+                         6 - len(done))
+
+    @skipIf(export.pyarrow is None, 'pyarrow is not installed')
+    def test_parquet(self):
+        export.export(self.config, self.path, stop=10, shard_size=5, file_format='parquet', workers=1)
+        table = export.pyarrow.parquet.read_table(os.path.join(self.path, 'blocks'))
+
+        self.assertEqual(sorted(table.column('height').to_pylist()), list(range(10)))
+
+    def test_command_line(self):
+        argv = ['export', self.path, '--stop', '6', '--shard-size', '3', '--format', 'ndjson', '--workers', '1',
+                '--data-dir', self.node.data_dir, '--rpc-host', '127.0.0.1', '--rpc-port', str(self.node.port)]
+
+        self.assertEqual(main(argv), 0)
+        self.assertEqual(len(self.read('blocks')), 6)
+        self.assertEqual(main(argv[:-6] + ['--shard-size', '2']), 1)  # Does not match the checkpoint
@@ -0,0 +1,87 @@
+from unittest import TestCase, mock
+from bitcaviar import blockchain
+from bitcaviar import fees
+from bitcaviar.fees import FeeEstimator
+from bitcaviar.mempool import MempoolMirror
+from tests.fake_bitcoind import FakeBitcoind
+
+
+class TestFeeEstimator(TestCase):
+    def setUp(self):
+        self.node = FakeBitcoind(blocks=40, mempool_size=60).start()
+        self.bitcoin = self.node.bitcoin('http')
+
+    def tearDown(self):
+        self.node.stop()
+
+    def floors(self, heights):
+        return sorted(blockchain.get_block_stats(self.bitcoin, str(height), ['feerate_percentiles'])
+                      ['feerate_percentiles'][0] for height in heights)
+
+    def test_blocks(self):
+        estimator = FeeEstimator(self.bitcoin, window=10)
+
+        self.assertIsNone(estimator.from_blocks(1))
+        self.assertEqual(estimator.update_blocks(), 10)
+        self.assertEqual(estimator.height, 39)
+        self.assertEqual(estimator._floors, self.floors(range(30, 40)))
+
+        self.node.chain.mine(3)
+        self.node.calls.clear()
+
+        self.assertEqual(estimator.update_blocks(), 3)
+        self.assertEqual(self.node.calls.count('getblockstats'), 3)  # Only the new blocks
+        self.assertEqual([block[0] for block in estimator.blocks], list(range(33, 43)))
+
+        self.node.chain.reorg(depth=4, extra=1)
+
+        self.assertEqual(estimator.update_blocks(), 5)
+        self.assertEqual(estimator.blocks[-1][1], blockchain.get_best_block_hash(bitcoin=self.bitcoin))
+        self.assertEqual(estimator._floors, self.floors(range(34, 44)))
+
+        estimates = [estimator.from_blocks(blocks) for blocks in (1, 2, 6, 25)]
+
+        self.assertEqual(estimates[0], max(estimator._floors))
+        self.assertEqual(estimates, sorted(estimates, reverse=True))
+
+    def test_mempool(self):
+        entries = blockchain.get_raw_mempool(bitcoin=self.bitcoin, verbose=True).values()
+        feerates = sorted((entry['fees']['modified'] * 100000000 / entry['vsize'], entry['vsize'])
+                          for entry in entries)
+        estimator = FeeEstimator(self.bitcoin)
+        estimator.update_mempool()
+        histogram = estimator.histogram()
+
+        self.assertEqual(sum(vsize for feerate, vsize in histogram), sum(vsize for feerate, vsize in feerates))
+        self.assertEqual(histogram, sorted(histogram, reverse=True))
+        self.assertEqual(estimator.from_mempool(1), fees.MIN_FEERATE)  # Everything fits in a block
+
+        with mock.patch.object(fees, 'MAX_BLOCK_VSIZE', 2000):
+            for blocks in (1, 2, 4):
+                total = 0
+
+                for feerate, vsize in reversed(feerates):  # Fee rate where blocks full blocks end
+                    total += vsize
+
+                    if total >= blocks * 2000:
+                        break
+
+                self.assertTrue(feerate < estimator.from_mempool(blocks) <= feerate * fees.BUCKET_SPACING ** 2)
+
+    def test_estimate(self):
+        mirror = MempoolMirror(self.bitcoin)
+        mirror.snapshot()
+        estimator = FeeEstimator(self.bitcoin, window=20, mirror=mirror)
+        estimator.update()
+        self.node.calls.clear()
+
+        with mock.patch.object(fees, 'MAX_BLOCK_VSIZE', 2000):
+            estimate = estimator.estimate(2)
+
+        self.assertEqual(self.node.calls, [])  # From memory
+        self.assertEqual(estimate['feerate'], max(estimate['from_blocks'], estimate['from_mempool']))
+        self.assertEqual(estimate['from_blocks'], estimator.from_blocks(2))
+        self.assertEqual(mirror.get_raw_mempool(), list(mirror.entries))
+
+        with self.assertRaises(ValueError):
+            estimator.estimate(0)
@@ -0,0 +1,184 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar import filters
+from bitcaviar.filters import FilterStore
+from tests import fake_bitcoind
+from tests.fake_bitcoind import FakeBitcoind, script_for
+
+# BIP 158 test vector: testnet genesis block
+GENESIS_HASH = '000000000933ea01ad0ee984209779baaec3ced90fa3f408719526f8d77f4943'
+GENESIS_SCRIPT = bytes.fromhex(
+    '4104678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b8d5'
+    '78a4c702b6bf11d5fac'
+)
+
+
+class TestFilters(TestCase):
+    def test_siphash(self):
+        k0 = int.from_bytes(bytes(range(8)), 'little')
+        k1 = int.from_bytes(bytes(range(8, 16)), 'little')
+
+        self.assertEqual(filters.siphash(k0, k1, bytes(range(15))), 0xa129ca6149be45e5)
+        self.assertEqual(filters.siphash(k0, k1, b''), 0x726fdb47dd0e0e31)
+
+    def test_hash_to_range(self):
+        items = [bytes([i]) * (i % 40) for i in range(200)]
+        f = len(items) * filters.M
+        expected = {(filters.siphash(1, 2, item) * f) >> 64 for item in items}
+
+        self.assertEqual(filters.hash_to_range(1, 2, items, f), expected)
+
+    def test_genesis(self):
+        data = filters.encode_filter([GENESIS_SCRIPT], GENESIS_HASH)
+
+        self.assertEqual(data.hex(), '019dfca8')
+        self.assertEqual(filters.filter_header(data, '00' * 32),
+                         '21584579b7eb08997773e5aeff3a7f932700042d0ed2a6129012b7d7ae81b750')
+        self.assertTrue(filters.match_any(data, GENESIS_HASH, [b'\x00' * 22, GENESIS_SCRIPT]))
+        self.assertFalse(filters.match_any(data, GENESIS_HASH, [b'\x00' * 22]))
+
+    def test_fake_node(self):  # The fake node builds its filters on its own, it has to match the BIP too
+        data = fake_bitcoind.gcs_filter([GENESIS_SCRIPT], bytes.fromhex(GENESIS_HASH)[::-1])
+
+        self.assertEqual(data.hex(), '019dfca8')
+        self.assertEqual(fake_bitcoind.gcs_filter_header(data, '00' * 32),
+                         '21584579b7eb08997773e5aeff3a7f932700042d0ed2a6129012b7d7ae81b750')
+        self.assertEqual(fake_bitcoind.gcs_filter([], bytes(32)), b'\x00')
+
+        elements = [script_for(i) for i in range(300)]
+        self.assertEqual(fake_bitcoind.gcs_filter(elements, bytes(range(32))),
+                         filters.encode_filter(elements, bytes(range(32))[::-1].hex()))
+
+    def test_round_trip(self):
+        elements = [script_for(i) for i in range(1000)]
+        n, values = filters.decode_filter(filters.encode_filter(elements, 'ab' * 32))
+
+        self.assertEqual(n, 1000)
+        self.assertEqual(values, sorted(filters.hash_to_range(*filters.filter_key('ab' * 32), elements, n * filters.M)))
+        self.assertEqual(filters.decode_filter(filters.encode_filter([], 'ab' * 32)), (0, []))
+
+
+class TestFilterStore(TestCase):
+    def setUp(self):
+        self.node = FakeBitcoind(blocks=60, mempool_size=0).start()
+        self.bitcoin = self.node.bitcoin('http')
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.node.stop()
+        shutil.rmtree(self.path)
+
+    def test_sync(self):
+        with FilterStore(self.path) as store:
+            self.assertEqual(store.sync(self.bitcoin, batch_size=25), 60)
+            self.assertEqual(store.sync(self.bitcoin), 0)
+
+            block_hash = blockchain.get_block_hash(bitcoin=self.bitcoin, height=42)
+            block_filter = blockchain.get_block_filter(bitcoin=self.bitcoin, block_hash=block_hash)
+
+            self.assertEqual(store.filter(42).hex(), block_filter['filter'])
+            self.assertEqual(store.header(42), block_filter['header'])
+            self.assertEqual(store.block_hash(42), block_hash)
+
+        self.node.chain.reorg(depth=3, extra=1)
+
+        with FilterStore(self.path) as store:
+            self.assertEqual(len(store), 60)
+            self.assertEqual(store.sync(self.bitcoin), 4)
+            self.assertEqual(store.block_hash(60), blockchain.get_block_hash(bitcoin=self.bitcoin, height=60))
+
+    def test_reorg_between_batches(self):
+        get_best_block_hash = self.node.node.rpc_getbestblockhash
+
+        def reorg_once():  # Right before the hashes of the batch, to a shorter chain
+            del self.node.node.rpc_getbestblockhash
+            tip = get_best_block_hash()
+            self.node.chain.reorg(depth=5, extra=-3)
+            return tip
+
+        self.node.node.rpc_getbestblockhash = reorg_once
+
+        with FilterStore(self.path) as store:
+            self.assertEqual(store.sync(self.bitcoin, batch_size=100), 57)
+            self.assertEqual(store.block_hash(56), blockchain.get_best_block_hash(bitcoin=self.bitcoin))
+
+    def test_bad_filters(self):
+        get_block_filter = self.node.node.rpc_getblockfilter
+
+        def wrong_header(blockhash, filtertype='basic'):
+            return dict(get_block_filter(blockhash, filtertype), header='00' * 32)
+
+        self.node.node.rpc_getblockfilter = wrong_header
+
+        with FilterStore(self.path) as store:
+            with self.assertRaises(ValueError):
+                store.sync(self.bitcoin, batch_size=100)
+
+        self.assertEqual(self.node.calls.count('getblockfilter'), 60)  # Not fetched again, it would not help
+
+    def test_append_checks_headers(self):
+        with FilterStore(self.path) as store:
+            store.sync(self.bitcoin)
+            store.truncate(30)
+            block_hash = blockchain.get_block_hash(bitcoin=self.bitcoin, height=30)
+            header = blockchain.get_block_filter(bitcoin=self.bitcoin, block_hash=block_hash)['header']
+
+            with self.assertRaises(ValueError):
+                store.append([b'\x00'], [block_hash], [header])
+
+    def test_first_header(self):
+        get_block_filter = self.node.node.rpc_getblockfilter
+        wrong = blockchain.get_block_hash(bitcoin=self.bitcoin, height=10)
+
+        def wrong_header(blockhash, filtertype='basic'):
+            block_filter = get_block_filter(blockhash, filtertype)
+            return dict(block_filter, header='00' * 32) if blockhash == wrong else block_filter
+
+        self.node.node.rpc_getblockfilter = wrong_header
+
+        with FilterStore(self.path) as store:
+            block_hash = blockchain.get_block_hash(bitcoin=self.bitcoin, height=0)
+            block_filter = get_block_filter(block_hash)
+
+            with self.assertRaises(ValueError):  # Chained to zeros
+                store.append([bytes.fromhex(block_filter['filter'])], [block_hash], ['11' * 32], first=0)
+
+            with self.assertRaises(ValueError):  # Chained to the header of the height before
+                store.sync(self.bitcoin, start=10)
+
+            self.assertEqual(store.sync(self.bitcoin, start=12), 48)
+            self.assertEqual(store.first, 12)
+
+    def test_readonly(self):
+        with FilterStore(self.path) as store:
+            store.sync(self.bitcoin)
+
+        with open(os.path.join(self.path, 'filters.bin'), 'ab') as f:  # Being appended by another process
+            f.write(b'\x00' * 10)
+
+        size = os.path.getsize(os.path.join(self.path, 'filters.bin'))
+
+        with FilterStore(self.path, readonly=True) as store:
+            self.assertEqual(len(store), 60)
+            self.assertEqual(store.scan([script_for('coinbase', 20, 0, 0)], workers=2, chunk_size=7), [20, 21])
+
+        self.assertEqual(os.path.getsize(os.path.join(self.path, 'filters.bin')), size)
+
+    def test_rescan(self):
+        # Lane 0 of block 20 pays to this script, and it is spent in block 21
+        script = script_for('coinbase', 20, 0, 0)
+
+        with FilterStore(self.path) as store:
+            store.sync(self.bitcoin)
+
+            self.assertEqual(store.scan([script], workers=1), [20, 21])
+            self.assertEqual(store.scan([script], workers=2, chunk_size=7), [20, 21])
+            self.assertEqual(store.scan([script_for('nowhere')], workers=1), [])
+
+            matches = list(filters.rescan(self.bitcoin, store, [script], workers=1, verbosity=1))
+
+        self.assertEqual([height for height, block in matches], [20, 21])
+        self.assertEqual(matches[0][1]['height'], 20)
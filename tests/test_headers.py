@@ -0,0 +1,117 @@
+import os
+import struct
+import tempfile
+from unittest import TestCase
+from bitcaviar import config
+from bitcaviar.headers import HeaderStore
+from bitcaviar.raw import double_sha256, hash_to_hex
+
+
+def make_chain(length, previous=bytes(32), nonce=0):
+    headers = []
+
+    for height in range(length):
+        header = struct.pack('<i32s32sIII', 1, previous, bytes(32), 1231006505 + height * 600, 0x1d00ffff, nonce)
+        headers.append(header)
+        previous = double_sha256(header)
+
+    return headers
+
+
+class HeaderTransport:
+    """Transport serving a chain of made up headers, switching to the other chain before the headers of a batch"""
+    def __init__(self, headers):
+        self.headers = headers
+        self.other = None
+        self.switches = 0
+        self.armed = False
+        self.calls = []
+
+    def run(self, command):
+        method, args = command[2], command[3:]
+        self.calls.append(method)
+
+        if method == 'getblockcount':
+            return str(len(self.headers) - 1)
+        elif method == 'getbestblockhash':
+            self.armed = True
+            return hash_to_hex(double_sha256(self.headers[-1]))
+        elif method == 'getblockhash':
+            return hash_to_hex(double_sha256(self.headers[int(args[0])]))
+        elif method == 'getblockheader':
+            if self.armed and self.switches:
+                self.armed = False
+                self.switches -= 1
+                self.headers, self.other = self.other, self.headers
+
+            for header in self.headers:
+                if hash_to_hex(double_sha256(header)) == args[0]:
+                    return header.hex()
+
+            raise ValueError('error code: -5\nerror message:\nBlock not found\n')
+
+
+class TestHeaders(TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'headers.dat')
+        self.bitcoin = config.Bitcoin()
+        self.bitcoin.transport = HeaderTransport(make_chain(50))
+
+    def test_sync(self):
+        with HeaderStore(self.path) as store:
+            self.assertEqual(store.sync(self.bitcoin, batch_size=16), 50)
+            self.assertEqual(store.sync(self.bitcoin), 0)
+
+        with HeaderStore(self.path) as store:
+            block_hash = self.bitcoin.transport.run([None, None, 'getblockhash', '42'])
+            self.assertEqual(len(store), 50)
+            self.assertEqual(store.block_hash(42), block_hash)
+            self.assertEqual(store.height(block_hash), 42)
+            self.assertEqual(store.get(42).nonce, 0)
+
+    def test_reorg(self):
+        with HeaderStore(self.path) as store:
+            store.sync(self.bitcoin)
+            headers = self.bitcoin.transport.headers
+            fork = double_sha256(headers[44])
+            self.bitcoin.transport.headers = headers[:45] + make_chain(10, previous=fork, nonce=1)
+            old_hash = store.block_hash(49)
+            self.assertEqual(store.height(old_hash), 49)
+
+            self.assertEqual(store.sync(self.bitcoin), 10)
+            self.assertEqual(len(store), 55)
+            self.assertEqual(store.get(45).nonce, 1)
+            self.assertIsNone(store.height(old_hash))
+            self.assertEqual(store.height(store.tip), 54)
+
+    def test_reorg_between_batches(self):
+        headers = self.bitcoin.transport.headers
+        fork = headers[:40] + make_chain(15, previous=double_sha256(headers[39]), nonce=1)
+        self.bitcoin.transport.other = fork
+        self.bitcoin.transport.switches = 1
+
+        with HeaderStore(self.path) as store:
+            self.assertEqual(store.sync(self.bitcoin, batch_size=100), 55)
+            self.assertEqual(store.block_hash(54), hash_to_hex(double_sha256(fork[-1])))
+
+    def test_retries(self):
+        headers = self.bitcoin.transport.headers
+        self.bitcoin.transport.other = headers[:40] + make_chain(15, previous=double_sha256(headers[39]), nonce=1)
+        self.bitcoin.transport.switches = 100
+
+        with HeaderStore(self.path) as store:
+            with self.assertRaises(ValueError):  # Switches chains before the headers of every batch
+                store.sync(self.bitcoin, batch_size=100, retries=3)
+
+        self.assertEqual(self.bitcoin.transport.switches, 96)  # Fetched 4 times
+
+    def test_bad_headers(self):
+        headers = self.bitcoin.transport.headers
+        headers[30] = headers[30][:4] + bytes(32) + headers[30][36:]  # Does not connect, whatever happens
+
+        with HeaderStore(self.path) as store:
+            with self.assertRaises(ValueError):
+                store.sync(self.bitcoin, batch_size=100)
+
+            self.assertEqual(len(store), 0)
+            self.assertEqual(self.bitcoin.transport.calls.count('getbestblockhash'), 2)  # Not fetched again
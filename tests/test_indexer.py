@@ -0,0 +1,83 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar.indexer import Indexer
+from tests.fake_bitcoind import FakeBitcoind, script_for
+
+
+class TestIndexer(TestCase):
+    def setUp(self):
+        self.node = FakeBitcoind(blocks=30, mempool_size=0).start()
+        self.bitcoin = self.node.bitcoin('http')
+        self.path = tempfile.mkdtemp()
+        self.db = os.path.join(self.path, 'index.sqlite')
+
+    def tearDown(self):
+        self.node.stop()
+        shutil.rmtree(self.path)
+
+    def test_sync(self):
+        with Indexer(self.db) as index:
+            self.assertEqual(index.sync(self.bitcoin, stop=12, commit_every=5), 12)
+
+        with Indexer(self.db) as index:  # Resumed
+            self.assertEqual(index.height, 11)
+            self.assertEqual(index.sync(self.bitcoin, workers=2), 18)
+            self.assertEqual(index.sync(self.bitcoin), 0)
+            self.assertEqual(index.tip, blockchain.get_best_block_hash(bitcoin=self.bitcoin))
+
+    def test_get(self):
+        with Indexer(self.db) as index:
+            index.sync(self.bitcoin)
+            expected = []
+
+            for height in (0, 14, 29):
+                block_hash = blockchain.get_block_hash(bitcoin=self.bitcoin, height=height)
+                block = blockchain.get_block(bitcoin=self.bitcoin, blockhash=block_hash)
+                expected.extend({'txid': txid, 'height': height, 'position': position, 'blockhash': block['hash']}
+                                for position, txid in enumerate(block['tx']))
+
+            txids = [tx['txid'] for tx in expected] + ['00' * 32]
+
+            self.assertEqual(index.get_many(txids, chunk_size=4), expected + [None])
+            self.assertEqual(index.get(expected[-1]['txid']), expected[-1])
+
+    def test_history(self):
+        with Indexer(self.db) as index:
+            index.sync(self.bitcoin)
+            script = script_for('coinbase', 20, 3, 0)
+            history = index.history(script)
+            scripthash = hashlib.sha256(script).digest()[::-1].hex()
+
+            self.assertEqual([(tx['height'], tx['position']) for tx in history], [(20, 0), (21, 4)])  # Paid, spent
+            self.assertEqual(index.history({'scripthash': scripthash}), history)
+            self.assertEqual(index.history('raw({})'.format(script.hex()), start=21), history[1:])
+            self.assertEqual(index.history(script, stop=21), history[:1])
+            self.assertEqual(index.history(script_for('nothing')), [])
+
+    def test_history_collision(self):
+        with Indexer(self.db) as index:
+            index.sync(self.bitcoin)
+            script = script_for('coinbase', 20, 3, 0)
+            history = index.history(script)
+            other = hashlib.sha256(script).digest()[:8] + bytes(24)  # Another script with the same key
+            key = int.from_bytes(other[:8], 'little', signed=True)
+            index._db.execute('INSERT INTO history VALUES (?, ?, ?)', (key, 0, other))
+
+            self.assertEqual(index.history(script), history)
+            self.assertEqual([tx['height'] for tx in index.history({'scripthash': other[::-1].hex()})], [0])
+
+    def test_reorg(self):
+        with Indexer(self.db) as index:
+            index.sync(self.bitcoin)
+            stale = blockchain.get_block(bitcoin=self.bitcoin, blockhash=index.tip)['tx'][0]
+            self.node.chain.reorg(depth=15, extra=2)
+
+            self.assertEqual(index.sync(self.bitcoin), 17)
+            self.assertIsNone(index.get(stale))
+            self.assertEqual(index.tip, blockchain.get_best_block_hash(bitcoin=self.bitcoin))
+            self.assertEqual([tx['height'] for tx in index.history(script_for('coinbase', 20, 3, 1))], [20, 21])
+            self.assertEqual(index.history(script_for('coinbase', 20, 3, 0)), [])
@@ -0,0 +1,116 @@
+import struct
+from unittest import TestCase, mock
+from bitcaviar import config
+from bitcaviar import notifications
+from bitcaviar.mempool import MempoolMirror
+
+
+class MempoolTransport:
+    """Transport serving a made up mempool given as {txid: [parent txids]}"""
+    def __init__(self, mempool):
+        self.mempool = mempool
+        self.sequence = 1
+        self.blocks = {}
+        self.mirror = None
+        self.locked = []
+        self.calls = []
+
+    def run(self, command):
+        method, args = command[2], command[3:]
+        self.calls.append(method)
+
+        if method == 'getrawmempool':
+            return {'txids': list(self.mempool), 'mempool_sequence': self.sequence}
+        elif method == 'getblock':
+            return {'hash': args[0], 'tx': self.blocks[args[0]]}
+        elif method == 'getmempoolentry':
+            if self.mirror is not None:
+                self.locked.append(self.mirror._lock._is_owned())
+
+            if args[0] not in self.mempool:
+                raise ValueError('error code: -5\nerror message:\nTransaction not in mempool\n')
+
+            spent_by = [txid for txid, parents in self.mempool.items() if args[0] in parents]
+
+            return {'vsize': 100, 'depends': self.mempool[args[0]], 'spentby': spent_by}
+
+
+class TestMempool(TestCase):
+    def setUp(self):
+        self.bitcoin = config.Bitcoin()
+        self.bitcoin.transport = MempoolTransport({'a': [], 'b': ['a'], 'c': ['b'], 'd': []})
+
+    def test_snapshot(self):
+        mirror = MempoolMirror(self.bitcoin)
+        mirror.snapshot()
+
+        self.assertEqual(len(mirror), 4)
+        self.assertEqual(sorted(mirror.get_mempool_ancestors('c')), ['a', 'b'])
+        self.assertEqual(sorted(mirror.get_mempool_descendants('a', verbose=True)), ['b', 'c'])
+        self.assertEqual(mirror.get_mempool_descendants('d'), [])
+
+    def test_update(self):
+        mirror = MempoolMirror(self.bitcoin)
+        mirror.snapshot()
+        self.bitcoin.transport.calls.clear()
+
+        self.assertEqual(mirror.update(), (set(), set()))
+
+        self.bitcoin.transport.mempool = {'c': [], 'd': [], 'e': ['d']}
+        self.bitcoin.transport.sequence = 2
+        added, removed = mirror.update()
+
+        self.assertEqual((added, removed), ({'e'}, {'a', 'b'}))
+        self.assertEqual(self.bitcoin.transport.calls.count('getmempoolentry'), 1)
+        self.assertEqual(mirror.get_mempool_ancestors('c'), [])
+        self.assertEqual(mirror.get_mempool_ancestors('e'), ['d'])
+
+        with self.assertRaises(ValueError):
+            mirror.get_mempool_ancestors('a')
+
+    def test_no_lock_during_calls(self):
+        mirror = MempoolMirror(self.bitcoin)
+        self.bitcoin.transport.mirror = mirror
+        mirror.snapshot()
+        self.bitcoin.transport.mempool['e'] = ['d']
+        self.bitcoin.transport.sequence = 2
+        mirror.update()
+        mirror.add(['f'])
+
+        self.assertEqual(self.bitcoin.transport.locked, [False] * 6)
+
+    def test_follow_mempool(self):
+        transport = self.bitcoin.transport
+        mirror = MempoolMirror(self.bitcoin)
+        mirror.snapshot()
+        transport.calls.clear()
+        callbacks = {}
+        subscriber = mock.Mock()
+        subscriber.on.side_effect = callbacks.__setitem__
+        notifications.follow_mempool(subscriber, mirror)
+        new, block = 'e' * 64, 'f' * 64
+
+        def publish(hash_, label, sequence=None):
+            body = bytes.fromhex(hash_) + label.encode() + (b'' if sequence is None else struct.pack('<Q', sequence))
+            callbacks['sequence'](notifications.Notification('sequence', body, 0))
+
+        transport.mempool[new] = ['d']
+        publish(new, 'A', 2)
+        publish(new, 'A', 2)  # Already applied
+
+        self.assertEqual(mirror.get_mempool_ancestors(new), ['d'])
+        self.assertEqual(transport.calls.count('getmempoolentry'), 1)
+
+        transport.blocks[block] = ['coinbase', 'a', 'b']
+        publish(block, 'C')
+
+        self.assertEqual(sorted(mirror.entries), ['c', 'd', new])
+        self.assertEqual(mirror.get_mempool_ancestors('c'), [])
+
+        publish(new, 'R', 1)  # Older than the mirror
+        self.assertIn(new, mirror)
+
+        publish(new, 'R', 3)
+        self.assertNotIn(new, mirror)
+        self.assertEqual(mirror.sequence, 3)
+        self.assertNotIn('getrawmempool', transport.calls)
@@ -0,0 +1,93 @@
+import os
+import shutil
+import struct
+import tempfile
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar import merkle
+from bitcaviar.headers import HeaderStore
+from bitcaviar.raw import double_sha256
+from tests.fake_bitcoind import FakeBitcoind
+
+
+class TestMerkle(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.node = FakeBitcoind(blocks=12, lanes=6, mempool_size=0).start()
+        cls.bitcoin = cls.node.bitcoin('http')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.node.stop()
+
+    def block(self, height):
+        return blockchain.get_block(bitcoin=self.bitcoin, blockhash=blockchain.get_block_hash(self.bitcoin, height))
+
+    def test_verify_proof(self):
+        for height, picks in ((0, [0]), (1, [0]), (3, [6]), (5, [1, 2, 5]), (7, range(7))):
+            block = self.block(height)
+            txids = [block['tx'][i] for i in picks]
+            proof = blockchain.get_tx_out_proof(bitcoin=self.bitcoin, txids=txids)
+            header = blockchain.get_block_header(bitcoin=self.bitcoin, block_hash=block['hash'], verbose=False)
+
+            self.assertEqual(merkle.verify_proof(proof, header=header.rstrip()), txids)
+            self.assertEqual(merkle.verify_proof(bytes.fromhex(proof)), txids)
+            self.assertEqual(blockchain.verify_tx_out_proof(bitcoin=self.bitcoin, proof=proof), txids)
+
+    def test_invalid_proofs(self):
+        block = self.block(4)
+        proof = bytes.fromhex(blockchain.get_tx_out_proof(bitcoin=self.bitcoin, txids=block['tx'][2:3]))
+        tampered = bytearray(proof)
+        tampered[90] ^= 1  # First hash of the tree
+        other_header = bytes.fromhex(blockchain.get_block_header(self.bitcoin, self.block(5)['hash'], verbose=False))
+
+        for invalid in (bytes(tampered), proof[:-1], proof + b'\x00', proof[:80]):
+            with self.assertRaises(ValueError):
+                merkle.verify_proof(invalid)
+
+        with self.assertRaises(ValueError):
+            merkle.verify_proof(proof, header=other_header)
+
+        for invalid in (proof[:-1], proof + b'\x00', proof[:80]):  # The fake node parses proofs on its own
+            with self.assertRaisesRegex(ValueError, 'TX decode failed'):
+                blockchain.verify_tx_out_proof(bitcoin=self.bitcoin, proof=invalid.hex())
+
+        self.assertEqual(blockchain.verify_tx_out_proof(bitcoin=self.bitcoin, proof=bytes(tampered).hex()), [])
+
+    def test_duplicate_children(self):
+        leaf = double_sha256(b'leaf')
+        header = struct.pack('<i32s32sIII', 1, bytes(32), double_sha256(leaf + leaf), 0, 0, 0)
+        proof = header + struct.pack('<I', 2) + b'\x02' + leaf + leaf + b'\x01\x07'
+
+        with self.assertRaisesRegex(ValueError, 'identical'):
+            merkle.MerkleBlock(proof).extract()
+
+    def test_verify_proofs(self):
+        path = tempfile.mkdtemp()
+
+        try:
+            proofs = []
+            expected = []
+
+            for height in range(12):
+                block = self.block(height)
+                proofs.append(blockchain.get_tx_out_proof(bitcoin=self.bitcoin, txids=block['tx'][-1:]))
+                expected.append(block['tx'][-1:])
+
+            proofs[3] = proofs[3][:-2]
+
+            with HeaderStore(os.path.join(path, 'headers')) as store:
+                store.sync(self.bitcoin)
+                results = merkle.verify_proofs(proofs, store=store, workers=2, chunk_size=5)
+
+            self.assertIsInstance(results[3], ValueError)
+            self.assertEqual(results[:3] + results[4:], expected[:3] + expected[4:])
+
+            headers = {block_hash: blockchain.get_block_header(self.bitcoin, block_hash, verbose=False).rstrip()
+                       for block_hash in (self.block(h)['hash'] for h in range(6))}
+            results = merkle.verify_proofs(proofs, headers=headers, workers=1)
+
+            self.assertEqual(results[:3] + results[4:6], expected[:3] + expected[4:6])
+            self.assertTrue(all(isinstance(result, ValueError) for result in results[3:4] + results[6:]))
+        finally:
+            shutil.rmtree(path)
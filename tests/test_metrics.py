@@ -0,0 +1,108 @@
+import asyncio
+from unittest import TestCase
+from bitcaviar import aio
+from bitcaviar import blockchain
+from bitcaviar import metrics
+from tests.fake_bitcoind import FakeBitcoind
+
+
+class TestMetrics(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.node = FakeBitcoind(blocks=20, mempool_size=5).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.node.stop()
+
+    def setUp(self):
+        metrics.reset()
+        metrics.enable()
+
+    def tearDown(self):
+        metrics.disable()
+        metrics.reset()
+
+    def test_histogram(self):
+        histogram = metrics.Histogram((1, 10, 100))
+
+        for value in (0.5, 1, 5, 50, 500):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.cumulative(), [(1, 2), (10, 3), (100, 4), (float('inf'), 5)])
+        self.assertEqual(histogram.quantile(0.5), 10)
+        self.assertIsNone(metrics.Histogram((1,)).quantile(0.5))
+
+    def test_http(self):
+        bitcoin = self.node.bitcoin('http')
+        block_hash = blockchain.get_block_hash(bitcoin=bitcoin, height=10)
+        blockchain.get_block(bitcoin=bitcoin, blockhash=block_hash, verbosity=2)
+
+        with self.assertRaises(ValueError):
+            blockchain.get_block(bitcoin=bitcoin, blockhash='00' * 32)
+
+        snapshot = metrics.snapshot()
+
+        self.assertEqual(snapshot['getblock']['total']['count'], 2)
+        self.assertEqual(snapshot['getblock']['wire']['count'], 2)
+        self.assertEqual(snapshot['getblock']['errors'], 1)
+        self.assertGreater(snapshot['getblock']['bytes']['sum'], 1000)
+        self.assertEqual(snapshot['getblockhash']['errors'], 0)
+        self.assertNotIn('spawn', snapshot['getblockhash'])
+
+    def test_cli(self):
+        bitcoin = self.node.bitcoin('cli')
+        blockchain.get_block(bitcoin=bitcoin, blockhash=blockchain.get_best_block_hash(bitcoin=bitcoin))
+        snapshot = metrics.snapshot()
+
+        for phase in ('spawn', 'wire', 'parse', 'total', 'bytes'):
+            self.assertEqual(snapshot['getblock'][phase]['count'], 1)
+
+        self.assertNotIn('parse', snapshot['getbestblockhash'])
+
+    def test_batch_and_aio(self):
+        bitcoin = self.node.bitcoin('http')
+
+        with blockchain.batch(bitcoin) as b:
+            b.get_block_hash(height=1)
+            b.get_block_hash(height=1000)
+
+        self.assertEqual(metrics.snapshot()['batch']['wire']['count'], 1)
+        self.assertEqual(metrics.snapshot()['getblockhash']['errors'], 1)
+        self.assertNotIn('total', metrics.snapshot()['getblockhash'])
+
+        async def main():
+            await asyncio.gather(*[aio.get_block_count(bitcoin) for _ in range(5)])
+            aio.pool(bitcoin).close()
+
+        asyncio.run(main())
+
+        self.assertEqual(metrics.snapshot()['getblockcount']['total']['count'], 5)
+        self.assertEqual(metrics.snapshot()['getblockcount']['wire']['count'], 5)
+
+    def test_disabled(self):
+        metrics.disable()
+        blockchain.get_block_count(bitcoin=self.node.bitcoin('http'))
+
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_hooks(self):
+        recorded = []
+
+        def hook(method, phase, value):
+            recorded.append((method, phase))
+
+        metrics.add_hook(hook)
+        blockchain.get_block_count(bitcoin=self.node.bitcoin('http'))
+        metrics.remove_hook(hook)
+
+        self.assertIn(('getblockcount', 'total'), recorded)
+
+    def test_prometheus(self):
+        blockchain.get_block_count(bitcoin=self.node.bitcoin('http'))
+        text = metrics.prometheus()
+
+        self.assertIn('# TYPE bitcaviar_rpc_seconds histogram', text)
+        self.assertIn('bitcaviar_rpc_seconds_count{method="getblockcount",phase="total"} 1', text)
+        self.assertIn('bitcaviar_rpc_seconds_bucket{method="getblockcount",phase="wire",le="+Inf"} 1', text)
+        self.assertIn('bitcaviar_rpc_response_bytes_count{method="getblockcount"} 1', text)
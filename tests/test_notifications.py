@@ -0,0 +1,98 @@
+import socket
+import struct
+import threading
+from unittest import TestCase
+from bitcaviar import config
+from bitcaviar.notifications import Subscriber, decode_frames, encode_frame, greeting, ready_command
+
+
+class FakePublisher:
+    """Publisher speaking ZMTP 3.0 to a single subscriber, like bitcoind with -zmqpub<topic>"""
+    def __init__(self):
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.address = 'tcp://127.0.0.1:{}'.format(self.server.getsockname()[1])
+        self.subscribed = threading.Event()
+        self.topics = []
+        self.connection = None
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        self.connection, _ = self.server.accept()
+        self.connection.sendall(greeting(as_server=True) + ready_command('PUB'))
+        buffer = bytearray()
+
+        while len(self.topics) < 1:
+            buffer += self.connection.recv(4096)
+
+            if len(buffer) >= 64 and buffer[0] == 0xff:
+                del buffer[:64]
+
+            for command, frames in decode_frames(buffer):
+                if not command and frames[0][:1] == b'\x01':
+                    self.topics.append(frames[0][1:].decode())
+
+        self.subscribed.set()
+
+    def publish(self, topic, body, sequence):
+        self.subscribed.wait(5)
+        self.connection.sendall(
+            encode_frame(topic.encode(), more=True) + encode_frame(body, more=True) +
+            encode_frame(struct.pack('<I', sequence))
+        )
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+        self.server.close()
+
+
+class TipTransport:
+    def run(self, command):
+        if command[2] == 'getbestblockhash':
+            return 'ab' * 32
+
+
+class TestNotifications(TestCase):
+    def setUp(self):
+        self.publisher = FakePublisher()
+
+    def tearDown(self):
+        self.publisher.close()
+
+    def test_receive(self):
+        with Subscriber({'hashblock': self.publisher.address}) as subscriber:
+            self.publisher.publish('hashblock', b'\x01' * 32, 0)
+            self.publisher.publish('hashblock', bytes(300), 1)
+
+            notification = subscriber.receive(timeout=5)
+            self.assertEqual(notification.topic, 'hashblock')
+            self.assertEqual(notification.hash, '01' * 32)
+            self.assertEqual(notification.sequence, 0)
+            self.assertEqual(len(subscriber.receive(timeout=5).body), 300)
+            self.assertEqual(self.publisher.topics, ['hashblock'])
+
+    def test_gap(self):
+        bitcoin = config.Bitcoin()
+        bitcoin.transport = TipTransport()
+        gaps = []
+        received = []
+
+        with Subscriber({'hashblock': self.publisher.address}, bitcoin=bitcoin) as subscriber:
+            subscriber.on_gap(lambda *gap: gaps.append(gap))
+            subscriber.on('hashblock', received.append)
+            self.publisher.publish('hashblock', b'\x01' * 32, 7)
+            self.publisher.publish('hashblock', b'\x02' * 32, 9)
+            subscriber.run(count=3)
+
+        self.assertEqual(gaps, [('hashblock', 8, 9)])
+        self.assertEqual([notification.recovered for notification in received], [False, True, False])
+        self.assertEqual(received[1].hash, 'ab' * 32)
+
+    def test_sequence(self):
+        with Subscriber({'sequence': self.publisher.address}) as subscriber:
+            self.publisher.publish('sequence', b'\x03' * 32 + b'A' + struct.pack('<Q', 42), 0)
+            notification = subscriber.receive(timeout=5)
+
+        self.assertEqual(notification.label, 'A')
+        self.assertEqual(notification.mempool_sequence, 42)
@@ -0,0 +1,53 @@
+from unittest import TestCase
+from bitcaviar.raw import Block, Transaction, double_sha256, hash_to_hex
+
+GENESIS_BLOCK = (
+    '0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc8'
+    '1bc3888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c01010000000100000000000000000000000000000000000000000000'
+    '00000000000000000000ffffffff4d04ffff001d0104455468652054696d65732030332f4a616e2f32303039204368616e63656c6c6f'
+    '72206f6e206272696e6b206f66207365636f6e64206261696c6f757420666f722062616e6b73ffffffff0100f2052a01000000434104'
+    '678afdb0fe5548271967f1a67130b7105cd6a828e03909a67962e0ea1f61deb649f6bc3f4cef38c4f35504e51ec112de5c384df7ba0b'
+    '8d578a4c702b6bf11d5fac00000000'
+)
+
+
+class TestRaw(TestCase):
+    def test_block(self):
+        block = Block(bytes.fromhex(GENESIS_BLOCK))
+
+        self.assertEqual(block.hash, '000000000019d6689c085ae165831e934ff763ae46a2a6c172b3f1b60a8ce26f')
+        self.assertEqual(block.header.previous_block_hash, '00' * 32)
+        self.assertEqual(block.header.time, 1231006505)
+        self.assertEqual(block.header.bits, 0x1d00ffff)
+        self.assertEqual(block.header.nonce, 2083236893)
+        self.assertEqual(len(block), 1)
+        self.assertEqual(block.txids, [block.header.merkle_root])
+
+    def test_transaction(self):
+        transaction = Block(bytes.fromhex(GENESIS_BLOCK)).transactions[0]
+
+        self.assertTrue(transaction.is_coinbase)
+        self.assertFalse(transaction.segwit)
+        self.assertEqual(transaction.outputs[0].value, 50 * 100000000)
+        self.assertEqual(len(transaction.outputs[0].script_pubkey), 67)
+        self.assertEqual(transaction.txid, transaction.wtxid)
+
+    def test_segwit_transaction(self):
+        version, locktime = bytes.fromhex('02000000'), bytes.fromhex('11000000')
+        tx_in = bytes(range(32)) + bytes.fromhex('01000000') + b'\x00' + bytes.fromhex('fdffffff')
+        tx_out = (1234).to_bytes(8, 'little') + b'\x16' + bytes.fromhex('0014') + bytes(20)
+        witness = b'\x02' + b'\x03abc' + b'\x01d'
+        data = version + b'\x00\x01' + b'\x01' + tx_in + b'\x01' + tx_out + witness + locktime
+
+        transaction = Transaction(data)
+
+        self.assertTrue(transaction.segwit)
+        self.assertEqual(transaction.size, len(data))
+        self.assertEqual(transaction.locktime, 17)
+        self.assertEqual(transaction.inputs[0].vout, 1)
+        self.assertEqual(transaction.inputs[0].sequence, 0xfffffffd)
+        self.assertEqual(transaction.outputs[0].value, 1234)
+        self.assertEqual([bytes(item) for item in transaction.witnesses[0]], [b'abc', b'd'])
+        stripped = version + b'\x01' + tx_in + b'\x01' + tx_out + locktime
+        self.assertEqual(transaction.txid, hash_to_hex(double_sha256(stripped)))
+        self.assertEqual(transaction.wtxid, hash_to_hex(double_sha256(data)))
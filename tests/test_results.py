@@ -0,0 +1,63 @@
+from unittest import TestCase
+from bitcaviar.results import Block, BlockHeader, MempoolEntry, to_mempool
+
+HEADER = {
+    'hash': '00000000c937983704a73af28acdec37b049d214adbda81d7e2a3dd146f6ed09',
+    'confirmations': 700000,
+    'height': 1000,
+    'version': 1,
+    'versionHex': '00000001',
+    'merkleroot': 'fe28050b93faea61fa88c4c630f0e1f0a1c24d0082dd0e10d369e13212128f33',
+    'time': 1232346882,
+    'mediantime': 1232344831,
+    'nonce': 2595206198,
+    'bits': '1d00ffff',
+    'difficulty': 1,
+    'chainwork': '000000000000000000000000000000000000000000000000000003e903e903e9',
+    'nTx': 1,
+    'previousblockhash': '0000000008e647742775a230787d66fdf92c46a48c896bfbc85cdc8acc67e87d',
+    'nextblockhash': '00000000a2887344f8db859e372e7e4bc26b23b9de340f725afbf2edb265b4c6'
+}
+
+ENTRY = {
+    'vsize': 141,
+    'weight': 561,
+    'time': 1634000000,
+    'height': 704000,
+    'descendantcount': 1,
+    'descendantsize': 141,
+    'ancestorcount': 1,
+    'ancestorsize': 141,
+    'wtxid': 'aa' * 32,
+    'fees': {'base': 0.00001410, 'modified': 0.00001410, 'ancestor': 0.00001410, 'descendant': 0.00001410},
+    'depends': ['bb' * 32],
+    'spentby': [],
+    'bip125-replaceable': False,
+    'unbroadcast': False
+}
+
+
+class TestResults(TestCase):
+    def test_block_header(self):
+        header = BlockHeader(HEADER)
+
+        self.assertEqual(header.hash, bytes.fromhex(HEADER['hash']))
+        self.assertEqual(header.bits, 0x1d00ffff)
+        self.assertEqual(header.height, 1000)
+        self.assertFalse(hasattr(header, '__dict__'))
+
+    def test_block(self):
+        block = Block(dict(HEADER, size=216, strippedsize=216, weight=864, tx=[HEADER['merkleroot']]))
+
+        self.assertEqual(block.tx, [bytes.fromhex(HEADER['merkleroot'])])
+        self.assertIsNone(Block(dict(HEADER, size=1, strippedsize=1, weight=4, tx=[], previousblockhash=None))
+                          .previous_block_hash)
+
+    def test_mempool_entry(self):
+        entry = MempoolEntry(ENTRY)
+
+        self.assertEqual(entry.base_fee, 1410)
+        self.assertEqual(entry.depends, [b'\xbb' * 32])
+
+        mempool = to_mempool({'cc' * 32: ENTRY})
+        self.assertIsInstance(mempool[b'\xcc' * 32], MempoolEntry)
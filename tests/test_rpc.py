@@ -0,0 +1,88 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar import config
+from bitcaviar.rpc import convert_params, format_result
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    results = {
+        'getblockcount': 1000,
+        'getblockhash': '00000000c937983704a73af28acdec37b049d214adbda81d7e2a3dd146f6ed09',
+        'getblockchaininfo': {'chain': 'main', 'blocks': 1000},
+        'verifychain': True,
+        'gettxout': None,
+    }
+
+    def respond(self, request):
+        if request['method'] in self.results:
+            return 200, {'result': self.results[request['method']], 'error': None, 'id': request['id']}
+        else:
+            return 404, {'result': None, 'error': {'code': -32601, 'message': 'Method not found'}, 'id': request['id']}
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.authorizations.append(self.headers['Authorization'])
+
+        if isinstance(request, list):
+            status, response = 200, [self.respond(item)[1] for item in request]
+        else:
+            status, response = self.respond(request)
+
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRPC(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.authorizations = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.bitcoin = config.Bitcoin(
+            rpc_host='127.0.0.1',
+            rpc_port=self.server.server_address[1],
+            rpc_user='user',
+            rpc_password='password'
+        )
+
+    def tearDown(self):
+        self.bitcoin.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_convert_params(self):
+        self.assertEqual(convert_params('getblock', ['abc', '2']), ['abc', 2])
+        self.assertEqual(convert_params('getblockstats', ['"abc"', '["avgfeerate"]']), ['abc', ['avgfeerate']])
+        self.assertEqual(convert_params('getblockfilter', ['abc', 'basic']), ['abc', 'basic'])
+
+    def test_format_result(self):
+        self.assertEqual(format_result(None), '')
+        self.assertEqual(format_result(True), 'true')
+        self.assertEqual(format_result(12), '12')
+        self.assertEqual(format_result({'a': 1}), {'a': 1})
+
+    def test_result_types(self):
+        self.assertIsInstance(blockchain.get_block_count(bitcoin=self.bitcoin), int)
+        self.assertIsInstance(blockchain.get_block_hash(bitcoin=self.bitcoin, height='1000'), str)
+        self.assertIsInstance(blockchain.get_blockchain_info(bitcoin=self.bitcoin), dict)
+        self.assertIs(blockchain.verify_chain(bitcoin=self.bitcoin), True)
+        tx_out = blockchain.get_tx_out(bitcoin=self.bitcoin, txid='00', n=0)
+        self.assertEqual(tx_out, {'message': 'no unspent transaction'})
+        self.assertEqual(self.server.authorizations[0], 'Basic dXNlcjpwYXNzd29yZA==')
+
+    def test_error(self):
+        with self.assertRaises(ValueError) as context:
+            blockchain.get_difficulty(bitcoin=self.bitcoin)
+
+        self.assertIn('error code: -32601', str(context.exception))
@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar.singleflight import SingleFlight
+from tests.fake_bitcoind import FakeBitcoind
+
+
+class TestSingleFlight(TestCase):
+    def test_shared_run(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        runs = []
+
+        def function():
+            runs.append(1)
+            started.set()
+            release.wait()
+            return 'output'
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            first = executor.submit(flights.run, ['cli', 'dir', 'getbestblockhash'], function)
+            started.wait()
+            others = [executor.submit(flights.run, ['cli', 'dir', 'getbestblockhash'], function) for _ in range(7)]
+
+            while flights.stats()['shared'] < 7:
+                time.sleep(0.001)
+
+            release.set()
+            outputs = [first.result()] + [future.result() for future in others]
+
+        self.assertEqual(outputs, ['output'] * 8)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(flights.stats(), {'runs': 1, 'shared': 7, 'hits': 0, 'in_flight': 0})
+
+        flights.run(['cli', 'dir', 'getbestblockhash'], function)  # Not kept without a ttl
+        self.assertEqual(len(runs), 2)
+
+    def test_shared_error(self):
+        flights = SingleFlight()
+        release = threading.Event()
+
+        def function():
+            release.wait()
+            raise ValueError('error code: -1')
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(flights.run, ['getdifficulty'] * 3, function) for _ in range(2)]
+
+            while flights.stats()['runs'] + flights.stats()['shared'] < 2:
+                time.sleep(0.001)
+
+            release.set()
+
+            for future in futures:
+                with self.assertRaises(ValueError):
+                    future.result()
+
+        self.assertEqual(flights.stats()['in_flight'], 0)
+
+    def test_ttl(self):
+        flights = SingleFlight(ttl={'getmempoolinfo': 0.05})
+        outputs = iter(range(10))
+
+        def function():
+            return next(outputs)
+
+        self.assertEqual(flights.run([None, None, 'getmempoolinfo'], function), 0)
+        self.assertEqual(flights.run([None, None, 'getmempoolinfo'], function), 0)
+        self.assertEqual(flights.run([None, None, 'getblockcount'], function), 1)
+        self.assertEqual(flights.run([None, None, 'getblockcount'], function), 2)
+        time.sleep(0.06)
+        self.assertEqual(flights.run([None, None, 'getmempoolinfo'], function), 3)
+        self.assertEqual(flights.stats()['hits'], 1)
+
+    def test_blockchain(self):
+        with FakeBitcoind(blocks=20, latency=0.05) as node:
+            for transport in ('http', 'cli'):
+                node.calls.clear()
+                bitcoin = node.bitcoin(transport, coalesce=True)
+
+                with ThreadPoolExecutor(max_workers=10) as executor:
+                    hashes = list(executor.map(lambda _: blockchain.get_best_block_hash(bitcoin=bitcoin), range(10)))
+
+                self.assertEqual(len(set(hashes)), 1)
+                self.assertLess(node.calls.count('getbestblockhash'), 10)
+                self.assertEqual(bitcoin.flights.stats()['runs'], node.calls.count('getbestblockhash'))
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+from bitcaviar import blockchain
+from bitcaviar import stats
+from bitcaviar.stats import StatsStore, block_stats_range
+from tests.fake_bitcoind import FakeBitcoind
+
+
+class TestStats(TestCase):
+    def setUp(self):
+        self.node = FakeBitcoind(blocks=120, mempool_size=0).start()
+        self.bitcoin = self.node.bitcoin('http')
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.node.stop()
+        shutil.rmtree(self.path)
+
+    def test_columns(self):
+        result = block_stats_range(self.bitcoin, 10, 60, stats=('txs', 'feerate_percentiles'), batch_size=7)
+
+        self.assertEqual(list(result['height']), list(range(10, 60)))
+        percentiles = {'feerate_percentiles_{}'.format(p) for p in stats.PERCENTILES}
+        self.assertEqual(set(result), {'height', 'txs'} | percentiles)
+
+        for i in (0, 25, 49):
+            expected = blockchain.get_block_stats(bitcoin=self.bitcoin, hash_or_height=str(10 + i))
+            self.assertEqual(result['txs'][i], expected['txs'])
+            self.assertEqual(result['feerate_percentiles_50'][i], expected['feerate_percentiles'][2])
+
+        self.assertEqual(len(block_stats_range(self.bitcoin, 100, 500)['height']), 20)  # Stops at the tip
+
+        with self.assertRaises(ValueError):
+            block_stats_range(self.bitcoin, 0, 10, stats=('blockhash',))
+
+    def test_store(self):
+        first = block_stats_range(self.bitcoin, 0, 50, path=self.path)
+        self.node.calls.clear()
+        second = block_stats_range(self.bitcoin, 0, 80, path=self.path)
+
+        self.assertEqual({name: column[:50] for name, column in second.items()}, first)
+        self.assertEqual(self.node.calls.count('getblockstats'), 30)
+        self.assertEqual(len(StatsStore(self.path)), 80)
+
+        with self.assertRaises(ValueError):
+            StatsStore(self.path, stats=('txs',))
+
+    def test_reorg(self):
+        block_stats_range(self.bitcoin, 0, 120, stats=('time',), path=self.path)
+        self.node.chain.reorg(depth=5, extra=2)
+        result = block_stats_range(self.bitcoin, 0, 200, stats=('time',), path=self.path)
+        store = StatsStore(self.path, stats=('time',))
+
+        self.assertEqual(len(result['time']), 122)
+        self.assertEqual(store.block_hash(118), blockchain.get_block_hash(bitcoin=self.bitcoin, height=118))
+
+    def test_interrupted_write(self):
+        block_stats_range(self.bitcoin, 0, 10, stats=('txs',), path=self.path)
+
+        with open(os.path.join(self.path, 'txs.bin'), 'ab') as f:
+            f.write(b'\x01' * 12)
+
+        store = StatsStore(self.path, stats=('txs',))
+
+        self.assertEqual(os.path.getsize(os.path.join(self.path, 'txs.bin')), 80)
+        self.assertEqual(len(store.read()['txs']), 10)
+
+    def test_ranges(self):
+        expected = block_stats_range(self.bitcoin, 0, 120, stats=('txs', 'time'))
+        block_stats_range(self.bitcoin, 20, 40, stats=('txs', 'time'), path=self.path)
+
+        for start, stop, calls, stored in ((10, 30, 10, (10, 40)), (0, 10, 10, (0, 40)), (60, 70, 10, (0, 40)),
+                                           (30, 50, 10, (0, 50)), (5, 45, 0, (0, 50))):
+            self.node.calls.clear()
+            result = block_stats_range(self.bitcoin, start, stop, stats=('txs', 'time'), path=self.path)
+            store = StatsStore(self.path, stats=('txs', 'time'))
+
+            self.assertEqual(result, {name: column[start:stop] for name, column in expected.items()})
+            self.assertEqual(self.node.calls.count('getblockstats'), calls)
+            self.assertEqual((store.first, store.stop), stored)
+            self.assertEqual(store.block_hash(store.first), blockchain.get_block_hash(self.bitcoin, store.first))
+
+    def test_interrupted_prepend(self):
+        block_stats_range(self.bitcoin, 10, 20, stats=('txs',), path=self.path)
+        expected = block_stats_range(self.bitcoin, 0, 20, stats=('txs',))
+
+        with mock.patch.object(StatsStore, '_finish_prepend', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                block_stats_range(self.bitcoin, 0, 20, stats=('txs',), path=self.path)
+
+        os.replace(os.path.join(self.path, 'txs.bin.tmp'), os.path.join(self.path, 'txs.bin'))  # One of two moved
+        store = StatsStore(self.path, stats=('txs',))
+
+        self.assertEqual((store.first, store.count), (0, 20))
+        self.assertEqual(store.read()['txs'], expected['txs'])
+        self.assertEqual(store.block_hash(0), blockchain.get_block_hash(self.bitcoin, 0))
+
+    def test_numpy(self):
+        if stats.numpy is None:
+            with self.assertRaises(ValueError):
+                block_stats_range(self.bitcoin, 0, 10, as_numpy=True)
+        else:
+            self.assertEqual(block_stats_range(self.bitcoin, 0, 10, as_numpy=True)['height'].sum(), 45)
@@ -0,0 +1,86 @@
+import json
+import tracemalloc
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar import blocks
+from bitcaviar.streaming import ArrayStream
+from tests.fake_bitcoind import FakeBitcoind
+
+DOCUMENT = {
+    'result': {
+        'hash': 'x"\\]',
+        'tx': [{'txid': 'a', 'asm': '[ALL] "q\\" }'}, 5, -1.5e3, 'str]"', [1, [2]], None, True, {}],
+        'size': 3,
+    },
+    'error': None,
+    'id': 1,
+}
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestArrayStream(TestCase):
+    def test_chunks(self):
+        for indent in (None, 2):
+            data = json.dumps(DOCUMENT, indent=indent).encode()
+
+            for size in (1, 3, 7, len(data)):
+                stream = ArrayStream(split(data, size), ('result', 'tx'))
+
+                self.assertEqual(list(stream), DOCUMENT['result']['tx'])
+                self.assertEqual(stream.rest['result'], {'hash': 'x"\\]', 'tx': [], 'size': 3})
+                self.assertEqual(stream.count, 8)
+
+    def test_missing(self):
+        stream = ArrayStream([b'{"result": null, "error": {"code": -5}, "id": 1}'], ('result', 'tx'))
+
+        self.assertEqual(list(stream), [])
+        self.assertEqual(stream.rest['error'], {'code': -5})
+
+        with self.assertRaises(ValueError):
+            list(ArrayStream([b'{"tx": [1, {"a"'], ('tx',)))
+
+    def test_bounded_memory(self):
+        element = json.dumps({'txid': '00' * 32, 'hex': 'ab' * 5000}).encode()
+
+        def chunks():
+            yield b'{"tx": ['
+
+            for i in range(2000):  # About 20 MB
+                yield element + (b', ' if i < 1999 else b']}')
+
+        tracemalloc.start()
+        count = sum(1 for _ in ArrayStream(chunks(), ('tx',)))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        self.assertEqual(count, 2000)
+        self.assertLess(peak, 1 << 20)
+
+
+class TestBlockTransactions(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.node = FakeBitcoind(blocks=5, lanes=50).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.node.stop()
+
+    def test_transports(self):
+        for transport in ('http', 'cli'):
+            with self.subTest(transport=transport):
+                bitcoin = self.node.bitcoin(transport)
+                block_hash = blockchain.get_block_hash(bitcoin=bitcoin, height=3)
+                block = blockchain.get_block(bitcoin=bitcoin, blockhash=block_hash, verbosity=2)
+
+                self.assertEqual(list(blocks.iter_block_transactions(bitcoin, block_hash, chunk_size=100)), block['tx'])
+
+                transactions = blocks.iter_block_transactions(bitcoin, block_hash, fields=('txid',))
+                self.assertEqual(next(transactions), {'txid': block['tx'][0]['txid']})
+                transactions.close()
+
+                with self.assertRaises(ValueError):
+                    list(blocks.iter_block_transactions(bitcoin, '00' * 32))
@@ -0,0 +1,89 @@
+import asyncio
+from unittest import TestCase
+from bitcaviar import aio
+from bitcaviar import blockchain
+from bitcaviar import blocks
+from tests.fake_bitcoind import FakeBitcoind
+
+
+def calls(bitcoin):
+    """Call every blockchain function with arguments taken from the fake node"""
+    block_hash = blockchain.get_block_hash(bitcoin=bitcoin, height=100)
+    block = blockchain.get_block(bitcoin=bitcoin, blockhash=block_hash)
+    txid = blockchain.get_raw_mempool(bitcoin=bitcoin)[3]
+
+    return {
+        'get_best_block_hash': blockchain.get_best_block_hash(bitcoin=bitcoin),
+        'get_block_0': blockchain.get_block(bitcoin=bitcoin, blockhash=block_hash, verbosity=0).rstrip(),
+        'get_block_1': block,
+        'get_block_2': blockchain.get_block(bitcoin=bitcoin, blockhash=block_hash, verbosity=2),
+        'get_blockchain_info': blockchain.get_blockchain_info(bitcoin=bitcoin),
+        'get_block_count': blockchain.get_block_count(bitcoin=bitcoin),
+        'get_block_hash': block_hash,
+        'get_block_header': blockchain.get_block_header(bitcoin=bitcoin, block_hash=block_hash),
+        'get_block_header_raw': blockchain.get_block_header(bitcoin=bitcoin, block_hash=block_hash,
+                                                            verbose=False).rstrip(),
+        'get_block_stats_hash': blockchain.get_block_stats(bitcoin=bitcoin, hash_or_height=block_hash),
+        'get_block_stats_height': blockchain.get_block_stats(bitcoin=bitcoin, hash_or_height='100',
+                                                             stats=['avgfeerate']),
+        'get_chain_tips': blockchain.get_chain_tips(bitcoin=bitcoin),
+        'get_chain_tx_stats': blockchain.get_chain_tx_stats(bitcoin=bitcoin, nblocks=10),
+        'get_difficulty': float(blockchain.get_difficulty(bitcoin=bitcoin)),
+        'get_mempool_ancestors': blockchain.get_mempool_ancestors(bitcoin=bitcoin, txid=txid, verbose=True),
+        'get_mempool_descendants': blockchain.get_mempool_descendants(bitcoin=bitcoin, txid=txid),
+        'get_mempool_entry': blockchain.get_mempool_entry(bitcoin=bitcoin, txid=txid),
+        'get_mempool_info': blockchain.get_mempool_info(bitcoin=bitcoin),
+        'get_raw_mempool': blockchain.get_raw_mempool(bitcoin=bitcoin, mempool_sequence=True),
+        'get_tx_out': blockchain.get_tx_out(bitcoin=bitcoin, txid=block['tx'][1], n=0),
+        'get_tx_out_spent': blockchain.get_tx_out(bitcoin=bitcoin, txid=block['tx'][0], n=0),
+        'get_tx_out_set_info': blockchain.get_tx_out_set_info(bitcoin=bitcoin),
+        'get_precious_block': blockchain.get_precious_block(bitcoin=bitcoin, blockhash=block_hash),
+        'save_mempool': blockchain.save_mempool(bitcoin=bitcoin),
+        'verify_chain': blockchain.verify_chain(bitcoin=bitcoin),
+    }
+
+
+class TestTransports(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fake = FakeBitcoind().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fake.stop()
+
+    def test_same_results(self):
+        cli = calls(self.fake.bitcoin('cli'))
+        http = calls(self.fake.bitcoin('http'))
+
+        for name in cli:
+            self.assertEqual(cli[name], http[name], name)
+            self.assertIs(type(cli[name]), type(http[name]), name)
+
+    def test_errors(self):
+        for transport in ('cli', 'http'):
+            with self.assertRaises(ValueError) as context:
+                blockchain.prune_blockchain(bitcoin=self.fake.bitcoin(transport), height=10)
+
+            self.assertIn('error code: -1', str(context.exception))
+
+    def test_raw_blocks(self):
+        bitcoin = self.fake.bitcoin()
+        block_hash = blockchain.get_block_hash(bitcoin=bitcoin, height=50)
+        rest = blocks.get_raw_block(bitcoin=bitcoin, blockhash=block_hash, rest=True)
+
+        self.assertEqual(rest, blocks.get_raw_block(bitcoin=bitcoin, blockhash=block_hash))
+
+        heights = [block.header.time for block in blocks.iter_raw_blocks(bitcoin=bitcoin, start=10, stop=20)]
+        self.assertEqual(heights, sorted(heights))
+
+
+class TestAioTransports(TestCase):
+    def test_cli(self):
+        with FakeBitcoind() as fake:
+            bitcoin = fake.bitcoin('cli')
+
+            async def main():
+                return await asyncio.gather(*[aio.get_block_hash(bitcoin, height) for height in range(5)])
+
+            self.assertEqual(asyncio.run(main()), [fake.node.rpc_getblockhash(height) for height in range(5)])
@@ -0,0 +1,200 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+from bitcaviar import blockchain
+from bitcaviar import utxo
+from bitcaviar.utxo import UTXOSet
+from tests.fake_bitcoind import FakeBitcoind, FakeBlock, Tx, script_for
+
+
+class TestAddresses(TestCase):
+    def test_address_script(self):
+        vectors = {
+            'BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4': '0014751e76e8199196d454941c45d1b3a323f1433bd6',
+            'bc1p0xlxvlhemja6c4dqv22uapctqupfhlxm9h8z3k2e72q4k9hcz7vqzk5jj0':
+                '512079be667ef9dcbbac55a06295ce870b07029bfcdb2dce28d959f2815b16f81798',
+            '1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2': '76a91477bff20c60e522dfaa3350c39b030a5d004e839a88ac',
+            '3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy': 'a914b472a266d0bd89c13706a4132ccfb16f7c3b9fcb87',
+        }
+
+        for address, script in vectors.items():
+            self.assertEqual(utxo.address_script(address).hex(), script)
+
+        for invalid in ('bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5', '1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN3'):
+            with self.assertRaises(ValueError):
+                utxo.address_script(invalid)
+
+    def test_descriptor_script(self):
+        self.assertEqual(utxo.descriptor_script('raw(6a00)#abcdefgh'), b'\x6a\x00')
+        self.assertEqual(utxo.descriptor_script('addr(1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2)'),
+                         utxo.address_script('1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2'))
+
+        with self.assertRaises(ValueError):
+            utxo.descriptor_script('wpkh(02...)')
+
+
+class TestUTXOSet(TestCase):
+    def setUp(self):
+        self.node = FakeBitcoind(blocks=40, mempool_size=0).start()
+        self.bitcoin = self.node.bitcoin('http')
+        self.path = tempfile.mkdtemp()
+        self.db = os.path.join(self.path, 'utxo.sqlite')
+
+    def tearDown(self):
+        self.node.stop()
+        shutil.rmtree(self.path)
+
+    def assertMatchesNode(self, utxos):
+        expected = blockchain.get_tx_out_set_info(bitcoin=self.bitcoin)
+        stats = utxos.stats()
+
+        self.assertEqual(stats['bestblock'], expected['bestblock'])
+        self.assertEqual(stats['txouts'], expected['txouts'])
+        self.assertAlmostEqual(stats['total_amount'], expected['total_amount'])
+
+    def test_sync(self):
+        with UTXOSet(self.db) as utxos:
+            self.assertEqual(utxos.sync(self.bitcoin, stop=25, commit_every=7), 25)
+            self.assertEqual(utxos.sync(self.bitcoin, workers=2), 15)
+            self.assertEqual(utxos.sync(self.bitcoin), 0)
+            self.assertMatchesNode(utxos)
+
+        with UTXOSet(self.db) as utxos:  # Reopened
+            self.assertEqual(utxos.height, 39)
+
+    def test_lookups_while_syncing(self):
+        with UTXOSet(self.db) as utxos:
+            apply = utxos.apply
+            heights = []
+
+            def slow_apply(block, height, commit=True):
+                apply(block, height, commit)
+                reader = threading.Thread(target=lambda: heights.append(utxos.stats()['height']))
+                reader.start()
+                reader.join(5)
+                self.assertFalse(reader.is_alive())  # Not waiting for the whole sync
+
+            utxos.apply = slow_apply
+            utxos.sync(self.bitcoin, stop=10, commit_every=4)
+
+            self.assertEqual(heights, list(range(10)))
+
+    def test_lookups(self):
+        with UTXOSet(self.db) as utxos:
+            utxos.sync(self.bitcoin)
+            outpoints = []
+
+            for height in (20, 39):
+                block = blockchain.get_block(bitcoin=self.bitcoin, blockhash=utxos.block_hash(height))
+                outpoints.extend((txid, n) for txid in block['tx'] for n in range(4))
+
+            coins = utxos.get_many(outpoints, chunk_size=7)
+
+            for (txid, n), coin in zip(outpoints, coins):
+                expected = blockchain.get_tx_out(bitcoin=self.bitcoin, txid=txid, n=n, include_mempool=False)
+
+                if 'message' in expected:  # Spent, or no such output
+                    self.assertIsNone(coin)
+                else:
+                    self.assertEqual(coin['value'], expected['value'])
+                    self.assertEqual(coin['scriptPubKey']['hex'], expected['scriptPubKey']['hex'])
+                    self.assertEqual(coin['confirmations'], expected['confirmations'])
+                    self.assertEqual(coin['coinbase'], expected['coinbase'])
+
+            self.assertEqual(utxos.get(*outpoints[-1]), coins[-1])
+
+    def test_scan(self):
+        with UTXOSet(self.db) as utxos:
+            utxos.sync(self.bitcoin)
+            tip = utxos.scan([script_for('coinbase', 39, 1, 0)])
+            spent = utxos.scan([script_for('coinbase', 20, 1, 0)])
+            lane = script_for(30, 2, 1)
+            by_descriptor = utxos.scan(['raw({})'.format(lane.hex())])
+
+        self.assertEqual(len(tip['unspents']), 1)
+        self.assertEqual(tip['unspents'][0]['height'], 39)
+        self.assertEqual(tip['total_amount'], tip['unspents'][0]['value'])
+        self.assertEqual(spent['unspents'], [])
+        self.assertEqual([(coin['height'], coin['scriptPubKey']['hex']) for coin in by_descriptor['unspents']],
+                         [(30, lane.hex())])
+
+    def test_reorg(self):
+        with UTXOSet(self.db, undo_depth=10) as utxos:
+            utxos.sync(self.bitcoin)
+            self.node.chain.reorg(depth=4, extra=2)
+
+            self.assertEqual(utxos.sync(self.bitcoin), 6)
+            self.assertMatchesNode(utxos)
+
+            self.node.chain.reorg(depth=12)
+
+            with self.assertRaises(ValueError):
+                utxos.sync(self.bitcoin)
+
+    def test_apply_checks(self):
+        with UTXOSet(self.db) as utxos:
+            utxos.sync(self.bitcoin, stop=10)
+            block = blockchain.get_block(bitcoin=self.bitcoin, blockhash=utxos.block_hash(5), verbosity=0)
+
+            with self.assertRaises(ValueError):
+                utxos.apply(utxo.raw.Block(bytes.fromhex(block)), 10)
+
+            utxos.undo()
+
+            self.assertEqual(utxos.height, 8)
+            self.assertEqual(utxos.sync(self.bitcoin, stop=10), 1)
+
+    def test_genesis(self):
+        with UTXOSet(self.db) as utxos:
+            self.assertEqual(utxos.sync(self.bitcoin, stop=1), 1)
+            genesis = blockchain.get_block(bitcoin=self.bitcoin, blockhash=utxos.block_hash(0))
+
+            self.assertEqual(utxos.stats()['txouts'], 0)
+            self.assertEqual(utxos.scan([script_for('coinbase', 0, 0, 0)])['unspents'], [])
+            self.assertIsNone(utxos.get(genesis['tx'][0], 0))
+
+            utxos.sync(self.bitcoin)
+            self.assertMatchesNode(utxos)
+
+    def test_duplicate_coinbase(self):
+        with UTXOSet(self.db) as utxos:
+            utxos.sync(self.bitcoin, stop=11)
+            before = utxos.stats()
+            coinbase = self.node.chain.blocks[10].txs[0]
+            block = FakeBlock(11, bytes.fromhex(utxos.tip)[::-1], 1600000000 + 11 * 600, [coinbase])
+            utxos.apply(utxo.raw.Block(block.raw), 11)  # Overwrites the unspent outputs of the same txid, BIP30
+            after = utxos.stats()
+            coin = utxos.get(utxo.raw.hash_to_hex(coinbase.txid), 0)
+
+            self.assertEqual((after['txouts'], after['total_amount']), (before['txouts'], before['total_amount']))
+            self.assertEqual(coin['confirmations'], 1)
+
+            utxos.undo()
+
+            self.assertEqual(utxos.stats()['txouts'], before['txouts'])
+            self.assertEqual(utxos.get(utxo.raw.hash_to_hex(coinbase.txid), 0)['confirmations'], 1)
+
+    def test_spent_in_same_block(self):
+        with UTXOSet(self.db) as utxos:
+            utxos.sync(self.bitcoin, stop=11)
+            before = utxos.stats()
+            rows = utxos._db.execute('SELECT * FROM utxos ORDER BY outpoint').fetchall()
+            funding = self.node.chain.blocks[10].txs[1]
+            value = funding.outputs[0][0]
+            self.assertIsNotNone(utxos.get(utxo.raw.hash_to_hex(funding.txid), 0))
+
+            coinbase = Tx([(bytes(32), 0xffffffff, b'\x01\x0b')], [(50 * 10 ** 8, script_for('miner', 11))])
+            first = Tx([(funding.txid, 0, b'')], [(value - 1000, script_for('first'))])
+            second = Tx([(first.txid, 0, b'')], [(value - 2000, script_for('second'))])
+            block = FakeBlock(11, bytes.fromhex(utxos.tip)[::-1], 1600000000 + 11 * 600, [coinbase, first, second])
+            utxos.apply(utxo.raw.Block(block.raw), 11)
+
+            self.assertIsNone(utxos.get(utxo.raw.hash_to_hex(first.txid), 0))
+            self.assertEqual(utxos.stats()['txouts'], before['txouts'] + 1)
+
+            utxos.undo()
+
+            self.assertEqual(utxos.stats(), before)
+            self.assertEqual(utxos._db.execute('SELECT * FROM utxos ORDER BY outpoint').fetchall(), rows)
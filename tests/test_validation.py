@@ -0,0 +1,147 @@
+import os
+import shutil
+import struct
+import tempfile
+from unittest import TestCase, mock
+from bitcaviar import validation
+from bitcaviar.headers import HeaderStore
+from bitcaviar.raw import double_sha256
+from tests.fake_bitcoind import FakeBitcoind
+
+MAINNET = [  # Genesis block and the two after it
+    '0100000000000000000000000000000000000000000000000000000000000000000000003ba3edfd7a7b12b27ac72c3e67768f617fc81bc3'
+    '888a51323a9fb8aa4b1e5e4a29ab5f49ffff001d1dac2b7c',
+    '010000006fe28c0ab6f1b372c1a6a246ae63f74f931e8365e15a089c68d6190000000000982051fd1e4ba744bbbe680e1fee14677ba1a3c3'
+    '540bf7b1cdb606e857233e0e61bc6649ffff001d01e36299',
+    '010000004860eb18bf1b1620e37e9490fc8a427514416fd75159ab86688e9a8300000000d5fdcc541e25de1c7a5addedf24858b8bb665c9f'
+    '36ef744ee42c316022c90f9bb0bc6649ffff001d08d2bd61',
+]
+
+# Retargets every 8 blocks of 600 seconds, with targets easy enough to mine in a test
+PARAMS = dict(validation.NETWORKS['main'], pow_limit=0x7fffff << 232, interval=8, timespan=8 * 600, bip34_height=4,
+              bip65_height=4, bip66_height=4)
+LIMIT_BITS = validation.target_to_bits(PARAMS['pow_limit'])
+
+
+def mine(version, previous, time_, bits):
+    target = validation.bits_to_target(bits)
+    nonce = 0
+
+    while True:
+        header = struct.pack('<i32s32sIII', version, previous, bytes(32), time_, bits, nonce)
+
+        if int.from_bytes(double_sha256(header), 'little') <= target:
+            return header
+
+        nonce += 1
+
+
+def make_chain(count, params=PARAMS, spacing=300, changes=None):
+    """Valid headers, blocks coming twice as fast as expected, with changes[height] = dict of fields to force"""
+    headers = []
+    times = []
+    bits = validation.target_to_bits(params['pow_limit'] >> 1)
+
+    for height in range(count):
+        if height and height % params['interval'] == 0:
+            actual = max(times[-1] - times[-params['interval']], params['timespan'] // 4)
+            target = validation.bits_to_target(bits) * actual // params['timespan']
+            bits = validation.target_to_bits(min(target, params['pow_limit']))
+
+        fields = {'version': 4, 'time': 1600000000 + height * spacing, 'bits': bits}
+        fields.update((changes or {}).get(height, {}))
+        previous = double_sha256(headers[-1]) if headers else bytes(32)
+        headers.append(mine(fields['version'], previous, fields['time'], fields['bits']))
+        times.append(fields['time'])
+
+    return headers
+
+
+class TestValidation(TestCase):
+    def assertFails(self, result, height, reason):
+        self.assertFalse(result['valid'])
+        self.assertEqual((result['height'], result['reason']), (height, reason))
+
+    def test_targets(self):
+        self.assertEqual(validation.bits_to_target(0x1d00ffff), 0xffff << 208)
+        self.assertEqual(validation.target_to_bits(0xffff << 208), 0x1d00ffff)
+        self.assertEqual(validation.target_to_bits(validation.bits_to_target(0x1b0404cb)), 0x1b0404cb)
+        self.assertIsNone(validation.bits_to_target(0x04923456))  # Negative
+        self.assertIsNone(validation.bits_to_target(0xff123456))  # Overflow
+        self.assertEqual(validation.target_to_bits(validation.NETWORKS['signet']['pow_limit']), 0x1e0377ae)
+        self.assertEqual(validation.target_to_bits(validation.NETWORKS['regtest']['pow_limit']), 0x207fffff)
+
+    def test_mainnet(self):
+        headers = [bytes.fromhex(header) for header in MAINNET]
+        tampered = headers[2][:4] + bytes(32) + headers[2][36:]
+
+        self.assertTrue(validation.validate_headers(MAINNET)['valid'])
+        self.assertFails(validation.validate_headers(headers[:2] + [tampered]), 2, 'bad-prevblk')
+        self.assertFails(validation.validate_headers(headers[:1] + [headers[1][:-1] + b'\x00']), 1, 'high-hash')
+        self.assertEqual(validation.validate_headers(b''.join(headers[1:]), height=1)['checked'], 2)
+
+    def test_hash_headers(self):
+        data = b''.join(make_chain(10))
+
+        self.assertEqual(validation.hash_headers(data, workers=2, chunk_size=3),
+                         validation.hash_headers(data, workers=1))
+
+        with self.assertRaises(ValueError):
+            validation.hash_headers(data[:-1])
+
+    def test_chain(self):
+        for numpy in (validation.numpy, None):
+            with self.subTest(numpy=numpy is not None), mock.patch.object(validation, 'numpy', numpy):
+                headers = make_chain(30)
+                result = validation.validate_headers(headers, network=PARAMS, workers=1)
+
+                self.assertEqual(result, {'valid': True, 'checked': 30, 'height': None, 'hash': None, 'reason': None})
+                self.assertNotEqual(headers[8][72:76], headers[7][72:76])  # Retargeted
+
+                self.assertFails(validation.validate_headers(make_chain(12, changes={8: {'bits': LIMIT_BITS}}),
+                                                             network=PARAMS), 8, 'bad-diffbits')
+                self.assertFails(validation.validate_headers(make_chain(12, changes={5: {'bits': LIMIT_BITS}}),
+                                                             network=PARAMS), 5, 'bad-diffbits')
+                self.assertFails(validation.validate_headers(make_chain(20, changes={15: {'time': 1600000000}}),
+                                                             network=PARAMS), 15, 'time-too-old')
+                self.assertFails(validation.validate_headers(make_chain(6, changes={3: {'time': 1600000000}}),
+                                                             network=PARAMS), 3, 'time-too-old')
+                self.assertFails(validation.validate_headers(make_chain(8, changes={6: {'version': 1}}),
+                                                             network=PARAMS), 6, 'bad-version')
+                self.assertFails(validation.validate_headers(make_chain(8, changes={7: {'time': 1 << 32 - 1}}),
+                                                             network=PARAMS), 7, 'time-too-new')
+
+                later = validation.validate_headers(headers[9:], height=9, network=PARAMS)  # No context for retargets
+                self.assertTrue(later['valid'])
+
+                bad = make_chain(20, changes={16: {'bits': LIMIT_BITS}})
+                self.assertFails(validation.validate_headers(bad[8:], height=8, network=PARAMS, begin=8), 16,
+                                 'bad-diffbits')
+
+    def test_min_difficulty(self):
+        params = dict(PARAMS, min_difficulty=True)
+        slow = make_chain(8, params, changes={5: {'time': 1600000000 + 5 * 300 + 1500, 'bits': LIMIT_BITS}})
+        fast = make_chain(8, params, changes={5: {'bits': LIMIT_BITS}})
+        after = make_chain(8, params, changes={5: {'time': 1600000000 + 5 * 300 + 1500, 'bits': LIMIT_BITS},
+                                               6: {'time': 1600000000 + 5 * 300 + 1600}})
+
+        self.assertTrue(validation.validate_headers(slow, network=params)['valid'])
+        self.assertFails(validation.validate_headers(fast, network=params), 5, 'bad-diffbits')
+        self.assertTrue(validation.validate_headers(after, network=params)['valid'])  # Back to the last real bits
+
+    def test_store(self):
+        node = FakeBitcoind(blocks=40, mempool_size=0).start()
+        path = tempfile.mkdtemp()
+
+        try:
+            with HeaderStore(os.path.join(path, 'headers')) as store:
+                store.sync(node.bitcoin('http'))
+                result = validation.validate_store(store, start=10, network='regtest')
+
+                self.assertEqual(store.read(38), store.header(38) + store.header(39))
+                self.assertEqual(result['checked'], 30)
+                self.assertTrue(result['valid'])
+                self.assertFails(validation.validate_store(store, network='main'), 0, 'high-hash')
+        finally:
+            node.stop()
+            shutil.rmtree(path)